@@ -4,6 +4,7 @@ from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from app.services.geoserver import GeoServerService
+from app.services.geoserver_rest import close_shared_client
 from app.config.settings import get_settings
 import logging
 from logging.handlers import RotatingFileHandler
@@ -146,6 +147,11 @@ app.add_middleware(
 async def startup_event():
     app_state.ready = True
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_shared_client()
+
 # @app.on_event("startup")
 # async def startup_event():
 #     geoserver = GeoServerService()
@@ -9,6 +9,7 @@ from pathlib import Path
 from dask.distributed import Client, LocalCluster
 from typing import Optional, Dict
 from app.config.settings import get_settings
+from app.services.consistency import history_files
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -149,11 +150,15 @@ def load_temperature_datasets():
             
             # EXPLICIT: Open with chunks to use the SHARED Dask client
             # When you open with chunks and a Dask client is active, xarray uses it automatically
-            ds = xr.open_dataset(
-                hist_file,
-                engine="netcdf4",
-                chunks={"time": -1, "latitude": 20, "longitude": 20},  # ← Triggers Dask usage
-            )
+            chunks = {"time": -1, "latitude": 20, "longitude": 20}  # ← Triggers Dask usage
+            files = history_files(hist_file)
+            if len(files) > 1:
+                # Backfills not compacted yet live in partitions/ next to the main file
+                ds = xr.open_mfdataset(
+                    files, engine="netcdf4", combine="nested", concat_dim="time", chunks=chunks,
+                ).sortby("time")
+            else:
+                ds = xr.open_dataset(hist_file, engine="netcdf4", chunks=chunks)
             
             # Verify the variable exists in the dataset
             if source not in ds.data_vars:
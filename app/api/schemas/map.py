@@ -1,6 +1,6 @@
 # app/schemas/map.py
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, conint
+from typing import Optional, List
 
 class MapRequest(BaseModel):
     source: str
@@ -34,4 +34,14 @@ class TriggerAreaRequest(BaseModel):
     start_date: str
     end_date: str
     trigger: float
-    radius: float
\ No newline at end of file
+    radius: float
+
+class AnimationRequest(BaseModel):
+    start_date: str
+    end_date: str
+    bbox: Optional[List[float]] = None  # [W, S, E, N], defaults to settings.latam_bbox_raster
+    width: conint(gt=0, le=4096) = 600
+    height: conint(gt=0, le=4096) = 780
+    format: Optional[str] = "webp"  # webp | apng | gif | mp4
+    fps: conint(gt=0, le=60) = 4
+    style: Optional[str] = "precipitation_style"
@@ -1,7 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,6 +20,37 @@ class Settings(BaseSettings):
     PRECIPITATION_STYLE: str = "precipitation_style"
     width: str = "1200" 
     height: str = "1560"
+
+    # Local rendering (animations, legends, cmaps)
+    RENDER_WORKERS: int = 4
+    RENDER_CACHE_MB: int = 256
+    ANIMATION_MAX_FRAMES: int = 366
+
+    # Ingestion pipeline (daily backfills)
+    DOWNLOADS_PER_HOST: int = 4
+    PROCESS_WORKERS: int = 4
+    MAX_IN_FLIGHT: int = 16
+    # Copernicus CDS: requests queued at once per account, initial poll interval,
+    # overall limit per request from submission to downloaded file
+    CDS_MAX_ACTIVE: int = 4
+    CDS_POLL_SECONDS: float = 30.0
+    CDS_REQUEST_TIMEOUT_SECONDS: float = 7200.0
+
+    # COG creation profile (see app/services/cog.py), optionally per source/mosaic
+    COG_PROFILE: str = "lzw"
+    COG_PROFILES: Dict[str, str] = {}
+    # Concurrent COG writes for multi-day batches (ERA5, NDVI)
+    COG_WRITE_WORKERS: int = 4
+
+    # NDVI compositing: output tile edge in pixels, "max" or "median"
+    NDVI_TILE_SIZE: int = 2048
+    NDVI_COMPOSITE: str = "max"
+    # Concurrent scene/band reads and retries per asset
+    NDVI_READ_WORKERS: int = 8
+    NDVI_READ_RETRIES: int = 3
+    # STAC search cache: ranges ending within SETTLED_DAYS are re-searched after TTL
+    STAC_CACHE_TTL_HOURS: float = 6.0
+    STAC_CACHE_SETTLED_DAYS: int = 30
     
     ALLOWED_ORIGINS: List[str] = [
         "https://seki-tech.com",
@@ -0,0 +1,251 @@
+"""
+Prefix-sum (cumulative) precipitation cubes
+For each source and year we keep the running within-year sum of daily
+precipitation, plus one checkpoint per year with the running total since the
+first year. Any [start, end] accumulation is then
+
+    A(t)  = K[latest cube year before year(t)] + C_year(t)[t]
+    total = A(end) - A(start - 1)
+
+i.e. a handful of single-day slice reads and a subtraction, instead of
+re-reading every daily grid in the period.
+
+Layout (under DATA_DIR/{source}_cumsum/):
+    {source}_cumsum_{year}.nc   precip_cumsum(time, latitude, longitude) float32
+    {source}_checkpoints.nc     total(year, latitude, longitude) float64
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CUMSUM_VAR = "precip_cumsum"
+CHECKPOINT_VAR = "total"
+
+HISTORICAL_SOURCES = {
+    "chirps": {"dir_suffix": "chirps_historical", "file_prefix": "brazil_chirps"},
+    "merge": {"dir_suffix": "merge_historical", "file_prefix": "brazil_merge"},
+}
+
+
+def cube_dir(source: str) -> Path:
+    return Path(settings.DATA_DIR) / f"{source}_cumsum"
+
+
+def year_file(source: str, year: int) -> Path:
+    return cube_dir(source) / f"{source}_cumsum_{year}.nc"
+
+
+def checkpoint_file(source: str) -> Path:
+    return cube_dir(source) / f"{source}_checkpoints.nc"
+
+
+def historical_file(source: str, year: int) -> Path:
+    config = HISTORICAL_SOURCES[source]
+    return Path(settings.DATA_DIR) / config["dir_suffix"] / f"{config['file_prefix']}_{year}.nc"
+
+
+def historical_years(source: str) -> List[int]:
+    config = HISTORICAL_SOURCES[source]
+    hist_dir = Path(settings.DATA_DIR) / config["dir_suffix"]
+    years = []
+    for path in hist_dir.glob(f"{config['file_prefix']}_*.nc"):
+        suffix = path.stem.rsplit("_", 1)[-1]
+        if suffix.isdigit() and len(suffix) == 4:
+            years.append(int(suffix))
+    return sorted(years)
+
+
+# ---------------------------------------------------------------------------
+# Building (pipeline side)
+# ---------------------------------------------------------------------------
+
+def build_year(source: str, year: int) -> Path:
+    """Write the within-year cumulative sum for one year. NaN days count as 0."""
+    hist_path = historical_file(source, year)
+    if not hist_path.exists():
+        raise FileNotFoundError(f"Historical file not found: {hist_path}")
+
+    with xr.open_dataset(hist_path) as ds:
+        precip = ds["precip"].sortby("time").load()
+
+    cumsum = precip.fillna(0).cumsum(dim="time").astype(np.float32)
+    cumsum.name = CUMSUM_VAR
+    cumsum.attrs = {"units": "mm", "long_name": f"running {year} precipitation total", "source": source}
+
+    out_path = year_file(source, year)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".nc.tmp")
+    n_lat, n_lon = cumsum.sizes["latitude"], cumsum.sizes["longitude"]
+    encoding = {
+        CUMSUM_VAR: {
+            # One chunk per day so a lookup is a single slice read
+            'chunksizes': (1, n_lat, n_lon),
+            'zlib': True,
+            'complevel': 4,
+            'dtype': 'float32'
+        }
+    }
+    cumsum.to_dataset().to_netcdf(tmp_path, mode="w", encoding=encoding, engine="netcdf4")
+    tmp_path.replace(out_path)
+    logger.info(f"Built cumulative cube for {source} {year}: {cumsum.sizes['time']} days -> {out_path}")
+    return out_path
+
+
+def build_checkpoints(source: str) -> Path:
+    """Running total at the end of every year, from the last slice of each year cube."""
+    years = sorted(
+        int(p.stem.rsplit("_", 1)[-1])
+        for p in cube_dir(source).glob(f"{source}_cumsum_*.nc")
+    )
+    if not years:
+        raise FileNotFoundError(f"No cumulative cubes for {source}")
+
+    totals = []
+    running = None
+    for year in years:
+        with xr.open_dataset(year_file(source, year)) as ds:
+            year_total = ds[CUMSUM_VAR].isel(time=-1).astype(np.float64).load()
+        running = year_total if running is None else running + year_total.values
+        totals.append(running.drop_vars("time", errors="ignore").expand_dims(year=[year]))
+
+    checkpoints = xr.concat(totals, dim="year")
+    checkpoints.name = CHECKPOINT_VAR
+    out_path = checkpoint_file(source)
+    tmp_path = out_path.with_suffix(".nc.tmp")
+    checkpoints.to_dataset().to_netcdf(tmp_path, mode="w", engine="netcdf4")
+    tmp_path.replace(out_path)
+    logger.info(f"Built checkpoints for {source}: {years[0]}-{years[-1]}")
+    return out_path
+
+
+def stale_years(source: str) -> List[int]:
+    """Years whose historical file is newer than their cumulative cube."""
+    stale = []
+    for year in historical_years(source):
+        cube = year_file(source, year)
+        if not cube.exists() or cube.stat().st_mtime < historical_file(source, year).stat().st_mtime:
+            stale.append(year)
+    return stale
+
+
+# ---------------------------------------------------------------------------
+# Reading (API side)
+# ---------------------------------------------------------------------------
+
+MAX_OPEN = 64
+_handles: "OrderedDict[str, Tuple[float, xr.Dataset]]" = OrderedDict()
+_handles_lock = threading.Lock()
+
+
+def _open_latest(path: Path) -> Optional[xr.Dataset]:
+    """
+    Shared handle per file, reopened when the file's mtime changes (rebuilt
+    cube). Superseded and evicted handles are closed; readers load the slices
+    they need right away, so no lazy array outlives its handle.
+    """
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    key = str(path)
+    with _handles_lock:
+        cached = _handles.get(key)
+        if cached is not None and cached[0] == mtime:
+            _handles.move_to_end(key)
+            return cached[1]
+        ds = xr.open_dataset(path, engine="netcdf4", cache=False)
+        _handles[key] = (mtime, ds)
+        _handles.move_to_end(key)
+        stale = [cached[1]] if cached is not None else []
+        while len(_handles) > MAX_OPEN:
+            stale.append(_handles.popitem(last=False)[1][1])
+    for old in stale:
+        old.close()
+    return ds
+
+
+def cube_version(source: str) -> float:
+    """mtime of the checkpoints (rebuilt last by every update), 0 if not built."""
+    try:
+        return checkpoint_file(source).stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _spatial_sel(da: xr.DataArray, bbox: Optional[Sequence[float]]) -> xr.DataArray:
+    if bbox is None:
+        return da
+    west, south, east, north = bbox
+    lat = da["latitude"].values
+    lat_slice = slice(south, north) if lat[0] < lat[-1] else slice(north, south)
+    return da.sel(longitude=slice(west, east), latitude=lat_slice)
+
+
+def running_total(source: str, day: date, bbox: Optional[Sequence[float]] = None) -> Optional[xr.DataArray]:
+    """A(day): total precipitation from the start of the cube through ``day`` (None before the cube starts)."""
+    checkpoints = _open_latest(checkpoint_file(source))
+    if checkpoints is None:
+        raise FileNotFoundError(f"Cumulative cube for {source} has not been built")
+
+    years = checkpoints["year"].values
+    if day.year < years[0]:
+        return None
+    if day.year > years[-1]:
+        return _spatial_sel(checkpoints[CHECKPOINT_VAR].sel(year=years[-1]), bbox).load()
+
+    # Latest checkpoint before this year: a missing year in between contributes nothing
+    total = None
+    earlier = years[years < day.year]
+    if len(earlier):
+        total = _spatial_sel(checkpoints[CHECKPOINT_VAR].sel(year=earlier[-1]), bbox).load()
+
+    ds = _open_latest(year_file(source, day.year))
+    if ds is not None:
+        times = ds["time"].values
+        if times[0] <= np.datetime64(pd.Timestamp(day)):
+            # Last available day on or before ``day``: missing days contribute nothing
+            within = _spatial_sel(
+                ds[CUMSUM_VAR].sel(time=pd.Timestamp(day), method="pad"), bbox
+            ).astype(np.float64).load()
+            within = within.drop_vars("time", errors="ignore")
+            total = within if total is None else total + within.values
+
+    return total
+
+
+def accumulate(
+    source: str,
+    start: date,
+    end: date,
+    bbox: Optional[Sequence[float]] = None,
+) -> xr.DataArray:
+    """Total precipitation over [start, end] (inclusive) from two prefix lookups."""
+    if start > end:
+        raise ValueError("start must be before end")
+
+    upper = running_total(source, end, bbox)
+    if upper is None:
+        raise FileNotFoundError(f"No {source} data on or before {end}")
+    lower = running_total(source, start - timedelta(days=1), bbox)
+
+    result = upper if lower is None else upper - lower.values
+    result = result.clip(min=0).astype(np.float32)
+    result.name = "precip"
+    result.attrs = {"units": "mm", "start_date": str(start), "end_date": str(end), "source": source}
+    return result
+
+
+def cube_available(source: str) -> bool:
+    return source in HISTORICAL_SOURCES and checkpoint_file(source).exists()
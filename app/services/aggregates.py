@@ -0,0 +1,254 @@
+"""
+Monthly and annual aggregate mosaics
+Derived COGs built from the daily granules, so long-period and zoomed-out maps
+read one granule instead of compositing hundreds of days:
+
+    {source}_monthly/{source}_monthly_YYYYMM01.tif
+    {source}_annual/{source}_annual_YYYY0101.tif
+    {source}_monthly_anomaly/..., {source}_annual_anomaly/...
+
+Precipitation is summed and temperature averaged. An anomaly is the aggregate
+minus the mean of the same calendar period over all complete years on disk.
+Only periods touched by new days are recomputed; when one of them is complete
+it is a climatology member, so the anomalies of every year of that calendar
+month (or every year, for annual) are refreshed against the new baseline.
+"""
+import logging
+from calendar import monthrange
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.config.settings import get_settings
+from app.services import cog
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Daily mosaic -> aggregation method
+AGGREGATES = {
+    "chirps": "sum",
+    "merge": "sum",
+    "temp": "mean",
+}
+PERIODS = ("monthly", "annual")
+NODATA = -9999.0
+
+Period = Tuple[str, date]  # ("monthly" | "annual", first day)
+
+
+def period_start(kind: str, day: date) -> date:
+    return day.replace(day=1) if kind == "monthly" else day.replace(month=1, day=1)
+
+
+def period_end(kind: str, start: date) -> date:
+    if kind == "monthly":
+        return start.replace(day=monthrange(start.year, start.month)[1])
+    return start.replace(month=12, day=31)
+
+
+def touched_periods(days: Iterable[date]) -> Set[Period]:
+    """Monthly and annual periods containing any of ``days``."""
+    return {(kind, period_start(kind, d)) for d in days for kind in PERIODS}
+
+
+def aggregate_dir(source: str, kind: str, anomaly: bool = False) -> Path:
+    suffix = f"{kind}_anomaly" if anomaly else kind
+    return Path(settings.DATA_DIR) / f"{source}_{suffix}"
+
+
+def aggregate_path(source: str, kind: str, start: date, anomaly: bool = False) -> Path:
+    out_dir = aggregate_dir(source, kind, anomaly)
+    return out_dir / f"{out_dir.name}_{start.strftime('%Y%m%d')}.tif"
+
+
+def daily_paths(source: str, start: date, end: date) -> List[Path]:
+    mosaic_dir = Path(settings.DATA_DIR) / source
+    paths = []
+    current = start
+    while current <= end:
+        path = mosaic_dir / f"{source}_{current.strftime('%Y%m%d')}.tif"
+        if path.exists():
+            paths.append(path)
+        current += timedelta(days=1)
+    return paths
+
+
+def _read(path: Path):
+    import rioxarray
+    return rioxarray.open_rasterio(path, masked=True).squeeze("band", drop=True)
+
+
+def _write_cog(da, path: Path, tags: Dict[str, str]):
+    """COG with internal overviews so zoomed-out WMS reads stay small."""
+    da = da.astype(np.float32).fillna(NODATA).rio.write_nodata(NODATA)
+    cog.write_cog(da, path, source=path.parent.name, tags=tags)
+
+
+def _accumulate(paths: List[Path], weights: Optional[List[float]] = None):
+    """Running per-pixel weighted sum and weight, one grid in memory at a time."""
+    template = _read(paths[0])
+    total = np.zeros(template.shape, dtype=np.float64)
+    weight = np.zeros(template.shape, dtype=np.float64)
+    for i, path in enumerate(paths):
+        values = template.values if i == 0 else _read(path).values
+        w = 1.0 if weights is None else weights[i]
+        valid = np.isfinite(values)
+        total[valid] += values[valid] * w
+        weight[valid] += w
+    return template, total, weight
+
+
+def compute_period(source: str, kind: str, start: date) -> Optional[Path]:
+    """
+    (Re)build one aggregate COG. Monthly values come from the daily granules,
+    annual values from the monthly COGs. Partial periods are written too and
+    tagged with the number of days used.
+    """
+    import rasterio
+
+    method = AGGREGATES[source]
+    end = min(period_end(kind, start), date.today())
+    expected = (period_end(kind, start) - start).days + 1
+
+    if kind == "monthly":
+        paths = daily_paths(source, start, end)
+        if not paths:
+            return None
+        n_days = len(paths)
+        template, total, weight = _accumulate(paths)
+    else:
+        paths = [
+            aggregate_path(source, "monthly", date(start.year, m, 1)) for m in range(1, 13)
+        ]
+        paths = [p for p in paths if p.exists()]
+        if not paths:
+            return None
+        days = []
+        for p in paths:
+            with rasterio.open(p) as src:
+                days.append(float(src.tags().get("days", 0)))
+        n_days = int(sum(days))
+        # Sums add up; means are weighted by the days behind each month
+        template, total, weight = _accumulate(paths, None if method == "sum" else days)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = total if method == "sum" else total / weight
+    values = np.where(weight > 0, values, np.nan).astype(np.float32)
+
+    out_path = aggregate_path(source, kind, start)
+    _write_cog(template.copy(data=values), out_path, {
+        "method": method,
+        "days": str(n_days),
+        "complete": str(n_days == expected),
+        "period_start": start.isoformat(),
+    })
+    logger.info(f"{source} {kind} {start}: {method} of {n_days}/{expected} days -> {out_path.name}")
+    return out_path
+
+
+def _is_complete(path: Path) -> bool:
+    import rasterio
+    with rasterio.open(path) as src:
+        return src.tags().get("complete") == "True"
+
+
+def _calendar_pattern(source: str, kind: str, start: date) -> str:
+    name = aggregate_dir(source, kind).name
+    return f"{name}_????{start.strftime('%m')}01.tif" if kind == "monthly" else f"{name}_????0101.tif"
+
+
+def calendar_members(source: str, kind: str, start: date) -> List[date]:
+    """Starts of every aggregate on disk for the same calendar month (or any year)."""
+    out_dir = aggregate_dir(source, kind)
+    starts = []
+    for p in sorted(out_dir.glob(_calendar_pattern(source, kind, start))):
+        try:
+            starts.append(date(int(p.stem[-8:-4]), int(p.stem[-4:-2]), 1))
+        except ValueError:
+            continue
+    return starts
+
+
+def climatology(source: str, kind: str, start: date):
+    """Mean of the same calendar month (or of all years) over complete aggregates."""
+    out_dir = aggregate_dir(source, kind)
+    members = [p for p in sorted(out_dir.glob(_calendar_pattern(source, kind, start))) if _is_complete(p)]
+    if not members:
+        return None, 0
+    stack = np.stack([_read(p).values for p in members]).astype(np.float32)
+    with np.errstate(invalid="ignore"):
+        return np.nanmean(stack, axis=0), len(members)
+
+
+def compute_anomaly(source: str, kind: str, start: date, clim: Optional[tuple] = None) -> Optional[Path]:
+    """Aggregate minus climatology; ``clim`` is a precomputed climatology() result."""
+    value_path = aggregate_path(source, kind, start)
+    if not value_path.exists():
+        return None
+    values, n_years = clim if clim is not None else climatology(source, kind, start)
+    if values is None:
+        return None
+
+    current = _read(value_path)
+    out_path = aggregate_path(source, kind, start, anomaly=True)
+    _write_cog(current.copy(data=current.values - values), out_path, {
+        "method": f"{AGGREGATES[source]} anomaly",
+        "climatology_years": str(n_years),
+        "period_start": start.isoformat(),
+    })
+    return out_path
+
+
+def _calendar_key(period: Period) -> tuple:
+    kind, start = period
+    return (kind, start.month if kind == "monthly" else None)
+
+
+def update_aggregates(source: str, days: Iterable[date]) -> List[Path]:
+    """
+    Recompute the aggregates of every period touched by ``days``, then the
+    anomalies of those periods and, where a touched period is complete (and so
+    moved the climatology), of every other year of the same calendar period.
+    """
+    if source not in AGGREGATES:
+        raise ValueError(f"No aggregates configured for {source}")
+
+    written = []
+    stale: Set[Period] = set()
+    # Sorted so each year's months are rebuilt before the year itself
+    for kind, start in sorted(touched_periods(days), key=lambda p: (p[0] == "annual", p[1])):
+        path = compute_period(source, kind, start)
+        if path is None:
+            continue
+        written.append(path)
+        stale.add((kind, start))
+        if _is_complete(path):
+            stale.update((kind, s) for s in calendar_members(source, kind, start))
+
+    # One climatology per calendar period, shared by all of its anomalies
+    climatologies: Dict[tuple, tuple] = {}
+    for kind, start in sorted(stale, key=lambda p: (p[0] == "annual", p[1])):
+        key = _calendar_key((kind, start))
+        if key not in climatologies:
+            climatologies[key] = climatology(source, kind, start)
+        anomaly = compute_anomaly(source, kind, start, climatologies[key])
+        if anomaly is not None:
+            written.append(anomaly)
+    return written
+
+
+def index_aggregates(paths: List[Path]):
+    """Add the written COGs to their mosaics' GeoPackage indexes (created on first use)."""
+    from app.services import mosaic_index
+
+    by_dir: Dict[Path, List[Path]] = {}
+    for path in paths:
+        by_dir.setdefault(path.parent, []).append(path)
+    for mosaic_dir, files in by_dir.items():
+        if mosaic_index.index_exists(mosaic_dir):
+            mosaic_index.add_granules(mosaic_dir, files)
+        else:
+            mosaic_index.build_index(mosaic_dir)
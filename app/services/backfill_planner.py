@@ -0,0 +1,271 @@
+"""
+Backfill request planner for ERA5 (CDS) and NDVI
+Turns the missing-date set from check_missing_dates into download batches
+shaped for each backend, instead of fixed ``batch_days`` slices of contiguous
+runs:
+
+    CDS    a request is the year x month x day cross product, so a slice that
+           crosses a month boundary also fetches the other month's days.
+           Batches are one calendar month with the exact missing days; months
+           of the same year are merged when the cost model
+           (REQUEST_OVERHEAD_DAYS per request + days fetched) says so and the
+           merged request stays under max_days.
+    MODIS  MOD13Q1 is a 16-day composite starting on day-of-year 1, 17, 33...
+           Batches cover whole composite periods, so a search window never
+           cuts into a composite it would fetch anyway.
+    other  contiguous runs chopped into batch_days (the previous behaviour).
+
+Dry run (expected requests, over-fetch and bytes, current vs planned):
+
+    python -m app.services.backfill_planner temp_max 2024-01-01 2024-06-30
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Cost of one extra request, in fetched-day equivalents (queue wait dominates)
+REQUEST_OVERHEAD_DAYS = 5.0
+MODIS_PERIOD_DAYS = 16
+
+
+@dataclass
+class PlannedBatch:
+    start: date
+    end: date
+    dates: List[date]           # missing dates this batch fills
+    fetched: int                # days (CDS/contiguous) or composites (MODIS) downloaded
+    est_bytes: Optional[int] = None
+    request: Dict[str, List[str]] = field(default_factory=dict)
+
+    @property
+    def overfetch(self) -> int:
+        return max(0, self.fetched - len(self.dates))
+
+
+@dataclass
+class BackfillPlan:
+    strategy: str
+    batches: List[PlannedBatch]
+
+    @property
+    def requests(self) -> int:
+        return len(self.batches)
+
+    @property
+    def missing(self) -> int:
+        return sum(len(b.dates) for b in self.batches)
+
+    @property
+    def fetched(self) -> int:
+        return sum(b.fetched for b in self.batches)
+
+    @property
+    def est_bytes(self) -> Optional[int]:
+        sizes = [b.est_bytes for b in self.batches]
+        return None if any(s is None for s in sizes) else sum(sizes)
+
+    def report(self) -> str:
+        size = "unknown" if self.est_bytes is None else f"{self.est_bytes / 1024 ** 2:,.1f} MB"
+        lines = [
+            f"{self.strategy}: {self.requests} request(s) for {self.missing} missing date(s), "
+            f"{self.fetched} fetched, {self.fetched - self.missing} over-fetched, ~{size}"
+        ]
+        for b in self.batches:
+            lines.append(f"  {b.start} .. {b.end}  {len(b.dates):4d} missing  {b.fetched:4d} fetched")
+        return "\n".join(lines)
+
+
+def grid_bytes(area: Sequence[float], resolution: float, max_pixels: Optional[int] = None, itemsize: int = 4) -> int:
+    """Uncompressed size of one grid over area [N, W, S, E] at ``resolution`` degrees."""
+    north, west, south, east = area
+    n_lat = int(round((north - south) / resolution)) + 1
+    n_lon = int(round((east - west) / resolution)) + 1
+    if max_pixels:
+        n_lat, n_lon = min(n_lat, max_pixels), min(n_lon, max_pixels)
+    return n_lat * n_lon * itemsize
+
+
+# ---------------------------------------------------------------------------
+# CDS (year x month x day cross product)
+# ---------------------------------------------------------------------------
+
+def _cross_product(year: int, months: Iterable[int], days: Iterable[int]) -> List[date]:
+    """Valid dates a CDS request for one year, these months and these days returns."""
+    out = []
+    days = sorted(set(days))
+    for m in sorted(set(months)):
+        for d in days:
+            try:
+                out.append(date(year, m, d))
+            except ValueError:  # e.g. 31 February is simply not returned
+                pass
+    return out
+
+
+def cds_request_fields(dates: Iterable[date]) -> Dict[str, List[str]]:
+    """year/month/day lists of the CDS request covering ``dates``."""
+    dates = list(dates)
+    return {
+        "year": sorted({d.strftime("%Y") for d in dates}),
+        "month": sorted({d.strftime("%m") for d in dates}),
+        "day": sorted({d.strftime("%d") for d in dates}),
+    }
+
+
+def _cds_batch(dates: List[date], bytes_per_day: Optional[int]) -> PlannedBatch:
+    dates = sorted(dates)
+    fetched = len(_cross_product(dates[0].year, {d.month for d in dates}, {d.day for d in dates}))
+    return PlannedBatch(
+        start=dates[0], end=dates[-1], dates=dates, fetched=fetched,
+        est_bytes=None if bytes_per_day is None else fetched * bytes_per_day,
+        request=cds_request_fields(dates),
+    )
+
+
+def plan_cds(
+    missing: Iterable[date],
+    max_days: int = 31,
+    bytes_per_day: Optional[int] = None,
+    overhead_days: float = REQUEST_OVERHEAD_DAYS,
+) -> BackfillPlan:
+    """
+    One batch per (year, month), days exact; adjacent months of a year are
+    merged while that lowers overhead + fetched days and fetches <= max_days.
+    A month with more than max_days missing dates is split into day ranges.
+    """
+    by_month: Dict[tuple, List[date]] = {}
+    for d in sorted(set(missing)):
+        by_month.setdefault((d.year, d.month), []).append(d)
+
+    batches: List[PlannedBatch] = []
+    for (year, _), dates in sorted(by_month.items()):
+        chunks = [dates[i:i + max_days] for i in range(0, len(dates), max_days)]
+        for chunk in chunks:
+            candidate = _cds_batch(chunk, bytes_per_day)
+            prev = batches[-1] if batches else None
+            if prev is not None and prev.start.year == year and len(chunks) == 1:
+                merged = _cds_batch(prev.dates + chunk, bytes_per_day)
+                separate = 2 * overhead_days + prev.fetched + candidate.fetched
+                if merged.fetched <= max_days and overhead_days + merged.fetched < separate:
+                    batches[-1] = merged
+                    continue
+            batches.append(candidate)
+    return BackfillPlan("cds-monthly", batches)
+
+
+# ---------------------------------------------------------------------------
+# MODIS 16-day composites
+# ---------------------------------------------------------------------------
+
+def modis_period(day: date) -> tuple:
+    """(start, end) of the MOD13Q1 composite containing ``day``; periods restart each year."""
+    doy = day.timetuple().tm_yday
+    start = date(day.year, 1, 1) + timedelta(days=(doy - 1) // MODIS_PERIOD_DAYS * MODIS_PERIOD_DAYS)
+    end = min(start + timedelta(days=MODIS_PERIOD_DAYS - 1), date(day.year, 12, 31))
+    return start, end
+
+
+def plan_modis(
+    missing: Iterable[date],
+    max_composites: int = 1,
+    bytes_per_composite: Optional[int] = None,
+) -> BackfillPlan:
+    """Batches of up to max_composites consecutive composite periods, aligned to their bounds."""
+    periods: Dict[tuple, List[date]] = {}
+    for d in sorted(set(missing)):
+        periods.setdefault(modis_period(d), []).append(d)
+
+    groups: List[List[tuple]] = []
+    for period in sorted(periods):
+        last = groups[-1][-1] if groups else None
+        if last and len(groups[-1]) < max_composites and period[0] == last[1] + timedelta(days=1):
+            groups[-1].append(period)
+        else:
+            groups.append([period])
+
+    batches = [
+        PlannedBatch(
+            start=group[0][0], end=group[-1][1],
+            dates=[d for p in group for d in periods[p]],
+            fetched=len(group),
+            est_bytes=None if bytes_per_composite is None else len(group) * bytes_per_composite,
+        )
+        for group in groups
+    ]
+    return BackfillPlan("modis-16day", batches)
+
+
+# ---------------------------------------------------------------------------
+# Contiguous runs (previous behaviour)
+# ---------------------------------------------------------------------------
+
+def plan_contiguous(
+    missing: Iterable[date],
+    batch_days: int,
+    bytes_per_day: Optional[int] = None,
+    cross_product: bool = False,
+) -> BackfillPlan:
+    """
+    Contiguous runs of missing dates chopped into batch_days. With
+    ``cross_product`` the fetched count is what CDS would return for the slice.
+    """
+    runs: List[List[date]] = []
+    for d in sorted(set(missing)):
+        if runs and d == runs[-1][-1] + timedelta(days=1):
+            runs[-1].append(d)
+        else:
+            runs.append([d])
+
+    batches = []
+    for run in runs:
+        for i in range(0, len(run), batch_days):
+            chunk = run[i:i + batch_days]
+            fetched = len(chunk)
+            if cross_product:
+                fields = cds_request_fields(chunk)
+                fetched = sum(
+                    len(_cross_product(int(y), map(int, fields["month"]), map(int, fields["day"])))
+                    for y in fields["year"]
+                )
+            batches.append(PlannedBatch(
+                start=chunk[0], end=chunk[-1], dates=chunk, fetched=fetched,
+                est_bytes=None if bytes_per_day is None else fetched * bytes_per_day,
+            ))
+    return BackfillPlan("contiguous", batches)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app.config.settings import get_settings
+    from app.services.manifest import manifest_for
+
+    parser = argparse.ArgumentParser(description="Dry-run a backfill plan from the ingestion manifest")
+    parser.add_argument("source", help="temp_max, temp_min, temp, precipitation, ndvi_modis or ndvi_s2")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat)
+    parser.add_argument("--batch-days", type=int, help="Current batch size / CDS max days per request")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    manifest = manifest_for(args.source, settings.DATA_DIR)
+    missing = sorted(set(manifest.missing(args.start, args.end)) | set(manifest.missing_in_cube(args.start, args.end)))
+    print(f"{args.source}: {len(missing)} missing date(s) between {args.start} and {args.end}\n")
+
+    if args.source == "ndvi_modis":
+        batch_days = args.batch_days or 16
+        per_grid = grid_bytes(settings.latam_bbox_cds, 0.0025, max_pixels=20000)
+        current = plan_contiguous(missing, batch_days)
+        planned = plan_modis(missing, max(1, batch_days // MODIS_PERIOD_DAYS), per_grid)
+    elif args.source.startswith("ndvi"):
+        batch_days = args.batch_days or 16
+        per_grid = grid_bytes(settings.latam_bbox_cds, 0.0001, max_pixels=50000)
+        current = planned = plan_contiguous(missing, batch_days, per_grid)
+    else:
+        batch_days = args.batch_days or 31
+        per_grid = grid_bytes(settings.latam_bbox_cds, 0.1)
+        current = plan_contiguous(missing, batch_days, per_grid, cross_product=True)
+        planned = plan_cds(missing, batch_days, per_grid)
+
+    print(current.report(), end="\n\n")
+    print(planned.report())
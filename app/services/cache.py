@@ -0,0 +1,62 @@
+"""
+Small in-process caches for rendered API outputs (images, legends, vectors)
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by total payload size in bytes.
+
+    Values are stored as (payload, metadata) pairs; only ``len(payload)`` counts
+    towards the budget, so payloads should be bytes-like.
+    """
+
+    def __init__(self, max_bytes: int, max_items: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[tuple]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item
+
+    def set(self, key: Hashable, payload: bytes, metadata: Any = None):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._size -= len(self._data.pop(key)[0])
+            self._data[key] = (payload, metadata)
+            self._size += size
+            while self._data and (self._size > self.max_bytes or len(self._data) > self.max_items):
+                _, (old_payload, _) = self._data.popitem(last=False)
+                self._size -= len(old_payload)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._data),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,207 @@
+"""
+Concurrent Copernicus CDS request scheduler
+A CDS retrieve spends most of its time queued server-side. The scheduler keeps
+up to settings.CDS_MAX_ACTIVE requests submitted at once (the per-account
+limit), polls them asynchronously and, as each one completes, downloads the
+result and hands it to a processing callback, so downloads and processing of
+finished batches overlap with the queue time of the others. Each attempt is
+limited to settings.CDS_REQUEST_TIMEOUT_SECONDS from submission to download.
+
+The CDS is reached through a small client protocol (submit / status /
+download). CdsApiClient adapts the blocking ``cdsapi`` client; tests and local
+runs can pass any object with the same three coroutines.
+"""
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Protocol
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Job states reported by CDSClient.status
+PENDING, COMPLETED, FAILED = "pending", "completed", "failed"
+
+
+class CDSRequestError(Exception):
+    """The CDS rejected or failed a request."""
+
+
+class CDSClient(Protocol):
+    async def submit(self, dataset: str, request: Dict[str, Any]) -> str:
+        """Queue a request and return its job id."""
+
+    async def status(self, job_id: str) -> str:
+        """PENDING, COMPLETED or FAILED (raise CDSRequestError with the reason instead of FAILED when known)."""
+
+    async def download(self, job_id: str, dest: Path) -> None:
+        """Write the result of a completed job to ``dest``."""
+
+
+@dataclass
+class CDSRequest:
+    key: Hashable
+    dataset: str
+    request: Dict[str, Any]
+    target: Path
+
+
+@dataclass
+class CDSOutcome:
+    request: CDSRequest
+    path: Optional[Path] = None
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CDSScheduler:
+    client: CDSClient
+    max_active: int = field(default_factory=lambda: settings.CDS_MAX_ACTIVE)
+    poll_interval: float = field(default_factory=lambda: settings.CDS_POLL_SECONDS)
+    max_poll_interval: float = 300.0
+    process_concurrency: int = 1
+    retries: int = 2
+    retry_delay: float = 600.0
+    request_timeout: float = field(default_factory=lambda: settings.CDS_REQUEST_TIMEOUT_SECONDS)
+
+    async def _wait_for_job(self, req: CDSRequest) -> str:
+        job_id = await self.client.submit(req.dataset, req.request)
+        logger.info(f"CDS job {job_id} submitted for {req.key}")
+        delay = self.poll_interval
+        while True:
+            state = await self.client.status(job_id)
+            if state == COMPLETED:
+                return job_id
+            if state == FAILED:
+                raise CDSRequestError(f"CDS job {job_id} failed for {req.key}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.5, self.max_poll_interval)
+
+    async def _retrieve(self, req: CDSRequest, active: asyncio.Semaphore) -> Path:
+        # request_timeout bounds each attempt from submission to downloaded
+        # file; a job stuck in the CDS queue would otherwise be polled forever
+        loop = asyncio.get_running_loop()
+        async with active:
+            deadline = loop.time() + self.request_timeout
+            try:
+                job_id = await asyncio.wait_for(self._wait_for_job(req), self.request_timeout)
+            except asyncio.TimeoutError:
+                raise CDSRequestError(f"CDS request {req.key} not completed after {self.request_timeout:.0f}s")
+
+        # Completed jobs no longer count against the account limit
+        req.target.parent.mkdir(parents=True, exist_ok=True)
+        part = req.target.with_name(req.target.name + ".part")
+        try:
+            await asyncio.wait_for(self.client.download(job_id, part), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise CDSRequestError(f"CDS job {job_id} not downloaded after {self.request_timeout:.0f}s")
+        os.replace(part, req.target)
+        logger.info(f"✓ CDS job {job_id} downloaded to {req.target}")
+        return req.target
+
+    async def _run_one(
+        self,
+        req: CDSRequest,
+        active: asyncio.Semaphore,
+        processing: asyncio.Semaphore,
+        process: Optional[Callable[[CDSRequest, Path], Any]],
+    ) -> CDSOutcome:
+        outcome = CDSOutcome(req)
+        try:
+            if req.target.exists():
+                logger.info(f"Already downloaded: {req.target}")
+                outcome.path = req.target
+            else:
+                for attempt in range(self.retries + 1):
+                    try:
+                        outcome.path = await self._retrieve(req, active)
+                        break
+                    except Exception as e:
+                        if attempt == self.retries:
+                            raise
+                        logger.warning(f"CDS request {req.key} failed ({e}); retrying in {self.retry_delay:.0f}s")
+                        await asyncio.sleep(self.retry_delay)
+            if process is not None:
+                async with processing:
+                    if inspect.iscoroutinefunction(process):
+                        outcome.result = await process(req, outcome.path)
+                    else:
+                        outcome.result = await asyncio.to_thread(process, req, outcome.path)
+        except Exception as e:
+            logger.error(f"✗ CDS request {req.key} failed: {e}")
+            outcome.error = e
+        return outcome
+
+    async def run(
+        self,
+        requests: Iterable[CDSRequest],
+        process: Optional[Callable[[CDSRequest, Path], Any]] = None,
+    ) -> List[CDSOutcome]:
+        """
+        Retrieve every request (at most max_active submitted at once) and call
+        ``process(request, path)`` as each download lands. Sync callbacks run
+        in a thread. Failures are returned in the outcomes, not raised.
+        """
+        active = asyncio.Semaphore(max(1, self.max_active))
+        processing = asyncio.Semaphore(max(1, self.process_concurrency))
+        return list(await asyncio.gather(
+            *(self._run_one(req, active, processing, process) for req in requests)
+        ))
+
+    def run_sync(
+        self,
+        requests: Iterable[CDSRequest],
+        process: Optional[Callable[[CDSRequest, Path], Any]] = None,
+    ) -> List[CDSOutcome]:
+        """``run`` from synchronous code (a Prefect flow), in the caller's context."""
+        coro = self.run(list(requests), process)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        # Already inside an event loop: run on a private one in a worker thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+
+class CdsApiClient:
+    """CDSClient over ``cdsapi`` (submits without waiting, polls the reply state)."""
+
+    def __init__(self, **client_kwargs):
+        import cdsapi
+
+        self._client = cdsapi.Client(wait_until_complete=False, delete=False, **client_kwargs)
+        self._jobs: Dict[str, Any] = {}
+
+    async def submit(self, dataset: str, request: Dict[str, Any]) -> str:
+        result = await asyncio.to_thread(self._client.retrieve, dataset, request)
+        job_id = result.reply.get("request_id") or str(id(result))
+        self._jobs[job_id] = result
+        return job_id
+
+    async def status(self, job_id: str) -> str:
+        result = self._jobs[job_id]
+        await asyncio.to_thread(result.update)
+        state = result.reply.get("state")
+        if state in ("completed", "successful"):
+            return COMPLETED
+        if state == "failed":
+            error = result.reply.get("error", {})
+            raise CDSRequestError(f"{error.get('message', 'failed')}: {error.get('reason', '')}")
+        return PENDING
+
+    async def download(self, job_id: str, dest: Path) -> None:
+        result = self._jobs.pop(job_id)
+        await asyncio.to_thread(result.download, str(dest))
@@ -0,0 +1,258 @@
+"""
+Shared Cloud-Optimized GeoTIFF writer
+Every daily/aggregate COG goes through ``write_cog`` with a named profile, so
+compression, predictor, block size and overview resampling are chosen in one
+place (settings.COG_PROFILE, per-source overrides in settings.COG_PROFILES):
+
+    lzw        default: LZW, no predictor, 512 blocks, nearest overviews
+    deflate    DEFLATE + predictor, 512 blocks, averaged overviews
+    zstd       ZSTD level 9 + predictor, 512 blocks, averaged overviews
+    zstd-fast  ZSTD level 1 + predictor, 256 blocks, averaged overviews
+
+Multi-day batches go through ``write_cogs``, which fans the writes out over a
+bounded thread pool (settings.COG_WRITE_WORKERS); GDAL releases the GIL while
+encoding, so threads scale with cores.
+
+Pick a profile from data with the benchmark, which writes one sample day under
+each profile and reports size, write time and windowed/overview read latency:
+
+    python -m app.services.cog benchmark /path/to/chirps_20240101.tif
+"""
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class CogProfile:
+    name: str
+    compress: str
+    predictor: str = "NO"       # YES picks floating-point (3) for float bands
+    level: Optional[int] = None
+    blocksize: int = 512
+    overview_resampling: str = "average"
+    num_threads: str = "ALL_CPUS"
+
+    def creation_options(self) -> Dict[str, object]:
+        options = {
+            "compress": self.compress,
+            "predictor": self.predictor,
+            "blocksize": self.blocksize,
+            "overview_resampling": self.overview_resampling,
+            "num_threads": self.num_threads,
+        }
+        if self.level is not None:
+            options["level"] = self.level
+        return options
+
+
+PROFILES: Dict[str, CogProfile] = {
+    "lzw": CogProfile("lzw", "LZW", overview_resampling="nearest"),
+    "deflate": CogProfile("deflate", "DEFLATE", predictor="YES", level=6),
+    "zstd": CogProfile("zstd", "ZSTD", predictor="YES", level=9),
+    "zstd-fast": CogProfile("zstd-fast", "ZSTD", predictor="YES", level=1, blocksize=256),
+}
+
+
+def get_profile(name: Optional[str] = None, source: Optional[str] = None) -> CogProfile:
+    """Profile by name, else the one configured for ``source``, else the default."""
+    if name is None:
+        name = settings.COG_PROFILES.get(source, settings.COG_PROFILE) if source else settings.COG_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown COG profile '{name}'. Available: {', '.join(PROFILES)}")
+
+
+def _tmp_path(path: Path) -> Path:
+    # Not *.tif: mosaic indexes glob the directory for granules
+    return path.with_name(f"{path.name}.tmp")
+
+
+def write_cog(
+    da,
+    path: Path,
+    profile: Optional[CogProfile] = None,
+    source: Optional[str] = None,
+    tags: Optional[Dict[str, str]] = None,
+) -> Path:
+    """
+    Write a rioxarray DataArray as a COG. The file is written next to the
+    target and renamed into place, so readers never see a partial granule.
+    """
+    import rasterio
+
+    profile = profile or get_profile(source=source)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    if tags:
+        da = da.copy()
+        da.attrs.update(tags)
+    with rasterio.Env(GDAL_NUM_THREADS=profile.num_threads):
+        da.rio.to_raster(tmp_path, driver="COG", **profile.creation_options())
+    tmp_path.replace(path)
+    return path
+
+
+def write_cogs(
+    jobs: Iterable[Tuple[object, Path]],
+    source: Optional[str] = None,
+    profile: Optional[CogProfile] = None,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[Path, Optional[Exception]]]:
+    """
+    Write (DataArray, path) jobs on a thread pool and yield (path, error) as
+    each finishes. ``jobs`` is consumed lazily in the calling thread with at
+    most 2 x workers writes pending, so a generator that reads one day at a
+    time never holds more than that many grids in memory.
+    """
+    workers = max(1, workers or settings.COG_WRITE_WORKERS)
+    profile = profile or get_profile(source=source)
+    if workers > 1:
+        # Parallelism comes from the pool; GDAL threads per file would oversubscribe
+        profile = replace(profile, num_threads="1")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cog") as pool:
+        pending = {}
+
+        def finished(done):
+            for future in done:
+                yield pending.pop(future), future.exception()
+
+        for da, path in jobs:
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            pending[pool.submit(write_cog, da, path, profile)] = Path(path)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+
+
+def write_array(
+    values,
+    transform,
+    path: Path,
+    crs: str = "EPSG:4326",
+    nodata: Optional[float] = None,
+    profile: Optional[CogProfile] = None,
+    source: Optional[str] = None,
+) -> Path:
+    """Write a single-band numpy array (north-up) as a COG."""
+    import rasterio
+
+    profile = profile or get_profile(source=source)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _tmp_path(path)
+    height, width = values.shape
+    options = {
+        "driver": "COG",
+        "width": width,
+        "height": height,
+        "count": 1,
+        "dtype": str(values.dtype),
+        "crs": crs,
+        "transform": transform,
+        "nodata": nodata,
+        **profile.creation_options(),
+    }
+    with rasterio.Env(GDAL_NUM_THREADS=profile.num_threads):
+        with rasterio.open(tmp_path, "w", **options) as dst:
+            dst.write(values, 1)
+    tmp_path.replace(path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _median_ms(samples: List[float]) -> float:
+    ordered = sorted(samples)
+    return ordered[len(ordered) // 2] * 1000
+
+
+def _read_latency(path: Path, reads: int, window_size: int = 256) -> Dict[str, float]:
+    """Median latency of random full-resolution windows and of a decimated (overview) read."""
+    import random
+
+    import rasterio
+    from rasterio.windows import Window
+
+    rng = random.Random(0)
+    window_times, overview_times = [], []
+    with rasterio.open(path) as src:
+        size = min(window_size, src.width, src.height)
+        for _ in range(reads):
+            col = rng.randrange(0, src.width - size + 1)
+            row = rng.randrange(0, src.height - size + 1)
+            started = time.perf_counter()
+            src.read(1, window=Window(col, row, size, size))
+            window_times.append(time.perf_counter() - started)
+        out_shape = (max(1, src.height // 8), max(1, src.width // 8))
+        for _ in range(reads):
+            started = time.perf_counter()
+            src.read(1, out_shape=out_shape)
+            overview_times.append(time.perf_counter() - started)
+    return {"window_ms": _median_ms(window_times), "overview_ms": _median_ms(overview_times)}
+
+
+def benchmark(sample: Path, out_dir: Path, profiles: Optional[List[str]] = None, reads: int = 20) -> List[Dict]:
+    """Write ``sample`` under each profile and measure size, write time and read latency."""
+    import rioxarray
+
+    da = rioxarray.open_rasterio(sample, masked=True).squeeze("band", drop=True).load()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for name in profiles or list(PROFILES):
+        profile = get_profile(name)
+        path = out_dir / f"{sample.stem}.{name}.tif"
+        started = time.perf_counter()
+        write_cog(da, path, profile)
+        write_s = time.perf_counter() - started
+        results.append({
+            "profile": name,
+            "size_kb": os.path.getsize(path) / 1024,
+            "write_ms": write_s * 1000,
+            **_read_latency(path, reads),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="COG profiles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("benchmark", help="Write a sample under each profile and time reads")
+    bench.add_argument("sample", type=Path, help="A representative daily GeoTIFF")
+    bench.add_argument("--profiles", nargs="*", choices=list(PROFILES), help="Profiles to compare (default: all)")
+    bench.add_argument("--reads", type=int, default=20, help="Reads per latency measurement")
+    bench.add_argument("--out-dir", type=Path, help="Keep the written files here")
+    sub.add_parser("profiles", help="List profiles and their creation options")
+    args = parser.parse_args()
+
+    if args.command == "profiles":
+        for p in PROFILES.values():
+            print(f"{p.name:10s} {p.creation_options()}")
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            rows = benchmark(args.sample, args.out_dir or Path(tmp), args.profiles, args.reads)
+        print(f"{'profile':10s} {'size KB':>10s} {'write ms':>10s} {'window ms':>10s} {'overview ms':>12s}")
+        for r in rows:
+            print(
+                f"{r['profile']:10s} {r['size_kb']:10.1f} {r['write_ms']:10.1f} "
+                f"{r['window_ms']:10.2f} {r['overview_ms']:12.2f}"
+            )
@@ -0,0 +1,138 @@
+"""
+Colormaps parsed from SLD ColorMap definitions
+Lets the API render rasters, legends and contours locally with the exact
+breakpoints GeoServer uses, without a WMS round trip.
+"""
+import logging
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# geoserver/*.sld in the repository root
+STYLES_DIR = Path(__file__).resolve().parent.parent.parent / "geoserver"
+
+
+def _hex_to_rgb(color: str) -> List[int]:
+    color = color.strip().lstrip("#")
+    if len(color) != 6:
+        raise ValueError(f"Invalid hex color: #{color}")
+    return [int(color[i:i + 2], 16) for i in (0, 2, 4)]
+
+
+def parse_sld_colormap(sld_text: str) -> Dict:
+    """
+    Extract the first RasterSymbolizer ColorMap from an SLD document.
+
+    Returns:
+        {"type": "ramp" | "intervals" | "values",
+         "entries": [{"color", "quantity", "label", "opacity"}, ...]}
+        with entries sorted by quantity.
+    """
+    root = ET.fromstring(sld_text.strip())
+
+    colormap_el = None
+    for el in root.iter():
+        if el.tag.split("}")[-1] == "ColorMap":
+            colormap_el = el
+            break
+
+    if colormap_el is None:
+        raise ValueError("No ColorMap found in SLD")
+
+    entries = []
+    for el in colormap_el:
+        if not isinstance(el.tag, str) or el.tag.split("}")[-1] != "ColorMapEntry":
+            continue
+        quantity = float(el.get("quantity"))
+        entries.append({
+            "color": el.get("color", "#000000").upper(),
+            "quantity": quantity,
+            "label": el.get("label") or f"{quantity:g}",
+            "opacity": float(el.get("opacity", 1.0)),
+        })
+
+    if not entries:
+        raise ValueError("ColorMap has no ColorMapEntry elements")
+
+    entries.sort(key=lambda e: e["quantity"])
+    return {"type": colormap_el.get("type", "ramp"), "entries": entries}
+
+
+def style_path(style_name: str) -> Optional[Path]:
+    """Return the SLD file for a style name, or None if it is not on disk."""
+    if not style_name.replace("_", "").replace("-", "").isalnum():
+        return None
+    path = STYLES_DIR / f"{style_name}.sld"
+    return path if path.exists() else None
+
+
+@lru_cache(maxsize=32)
+def load_style(style_name: str) -> Dict:
+    """
+    Load a style's colormap by name.
+
+    ``precipitation_style`` resolves to the SLD that GeoServerService uploads
+    (create_precipitation_sld); every other name is looked up in geoserver/*.sld.
+    """
+    if style_name == "precipitation_style":
+        from app.services.geoserver import PRECIPITATION_SLD
+        return parse_sld_colormap(PRECIPITATION_SLD)
+
+    path = style_path(style_name)
+    if path is None:
+        raise KeyError(f"Unknown style: {style_name}")
+
+    logger.debug(f"Parsing colormap from {path}")
+    return parse_sld_colormap(path.read_text())
+
+
+def colormap_arrays(colormap: Dict):
+    """Return (quantities, rgba) arrays, rgba as float in 0-255."""
+    entries = colormap["entries"]
+    quantities = np.array([e["quantity"] for e in entries], dtype=np.float64)
+    rgba = np.array(
+        [_hex_to_rgb(e["color"]) + [round(255 * e["opacity"])] for e in entries],
+        dtype=np.float64,
+    )
+    return quantities, rgba
+
+
+def apply_colormap(data: np.ndarray, colormap: Dict) -> np.ndarray:
+    """
+    Vectorized LUT: map a 2D float array to an (H, W, 4) uint8 RGBA image.
+
+    Follows GeoServer ColorMap semantics:
+      - ramp: linear interpolation between entries, clamped at both ends
+      - intervals: entry i colors values in [q[i-1], q[i]); above the last entry is transparent
+      - values: exact matches only
+    NaN pixels are always transparent.
+    """
+    quantities, rgba = colormap_arrays(colormap)
+    values = np.asarray(data, dtype=np.float64)
+    nan_mask = np.isnan(values)
+    out = np.zeros(values.shape + (4,), dtype=np.uint8)
+
+    cmap_type = colormap.get("type", "ramp")
+    if cmap_type == "ramp":
+        filled = np.where(nan_mask, quantities[0], values)
+        for channel in range(4):
+            out[..., channel] = np.interp(filled, quantities, rgba[:, channel]).round().astype(np.uint8)
+    elif cmap_type == "intervals":
+        idx = np.searchsorted(quantities, np.where(nan_mask, np.inf, values), side="right")
+        valid = idx < len(quantities)
+        out[valid] = rgba[idx[valid]].astype(np.uint8)
+    elif cmap_type == "values":
+        idx = np.searchsorted(quantities, np.where(nan_mask, np.inf, values), side="left")
+        idx_clipped = np.minimum(idx, len(quantities) - 1)
+        valid = (idx < len(quantities)) & (quantities[idx_clipped] == values)
+        out[valid] = rgba[idx_clipped[valid]].astype(np.uint8)
+    else:
+        raise ValueError(f"Unsupported ColorMap type: {cmap_type}")
+
+    out[nan_mask] = 0
+    return out
@@ -0,0 +1,278 @@
+"""
+Mosaic consistency checks and delta repair
+For each mosaic we compare three views of the same daily series:
+
+    granule index   (GeoPackage from app.services.mosaic_index, or GeoServer's shapefile)
+    COG directory   (one os.scandir)
+    historical cube (time coordinate only)
+
+and report missing granules, orphaned index rows and dates missing from the
+cube. Each view is loaded once and compared with set operations, so a full
+check of all mosaics takes milliseconds. Repairs touch only the delta.
+
+    python -m app.services.consistency [--repair] [mosaic ...]
+"""
+import logging
+import os
+import re
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Mosaics with one NetCDF per year; everything else has {name}_hist/historical.nc
+YEARLY_CUBES = {
+    "chirps": ("chirps_historical", "brazil_chirps", "precip"),
+    "merge": ("merge_historical", "brazil_merge", "precip"),
+}
+DEFAULT_MOSAICS = ["chirps", "merge", "temp_max", "temp_min", "temp", "precipitation"]
+# Out-of-order backfills of a single-file store, pending compaction
+PARTITION_DIRNAME = "partitions"
+
+
+@dataclass
+class ConsistencyReport:
+    mosaic: str
+    index_kind: str
+    granules: int = 0
+    missing_granules: List[str] = field(default_factory=list)   # on disk, not indexed
+    orphaned_rows: List[str] = field(default_factory=list)      # indexed, file gone
+    missing_in_cube: List[date] = field(default_factory=list)   # COG exists, cube lacks the day
+    cube_only: List[date] = field(default_factory=list)         # cube has the day, no COG
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing_granules or self.orphaned_rows or self.missing_in_cube)
+
+    def summary(self) -> str:
+        status = "✓" if self.ok else "✗"
+        return (
+            f"{status} {self.mosaic} [{self.index_kind}]: {self.granules} granules, "
+            f"{len(self.missing_granules)} unindexed, {len(self.orphaned_rows)} orphaned, "
+            f"{len(self.missing_in_cube)} missing from cube, {len(self.cube_only)} cube-only"
+        )
+
+
+# ---------------------------------------------------------------------------
+# Loading each view
+# ---------------------------------------------------------------------------
+
+def list_granules(mosaic_dir: Path) -> Dict[str, date]:
+    """{file name: date} for every {name}_YYYYMMDD.tif in the directory."""
+    pattern = re.compile(rf"^{re.escape(mosaic_dir.name)}_(\d{{8}})\.tif$")
+    granules = {}
+    try:
+        entries = os.scandir(mosaic_dir)
+    except FileNotFoundError:
+        return granules
+    with entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match:
+                try:
+                    granules[entry.name] = datetime.strptime(match.group(1), "%Y%m%d").date()
+                except ValueError:
+                    continue
+    return granules
+
+
+def index_locations(mosaic_dir: Path) -> Tuple[str, Optional[Set[str]]]:
+    """
+    Granule file names in the mosaic index.
+
+    Returns:
+        (kind, names) with kind 'gpkg', 'shapefile' or 'none' (names is None)
+    """
+    name = mosaic_dir.name
+    gpkg = mosaic_dir / f"{name}.gpkg"
+    if gpkg.exists():
+        with closing(sqlite3.connect(f"file:{gpkg}?mode=ro", uri=True)) as conn:
+            rows = conn.execute(f'SELECT location FROM "{name}"').fetchall()
+        return "gpkg", {os.path.basename(r[0]) for r in rows}
+
+    dbf = mosaic_dir / f"{name}.dbf"
+    if dbf.exists():
+        import shapefile
+        with open(dbf, "rb") as fh:
+            reader = shapefile.Reader(dbf=fh)
+            fields = [f[0] for f in reader.fields[1:]]
+            idx = fields.index("location")
+            return "shapefile", {os.path.basename(rec[idx]) for rec in reader.iterRecords()}
+
+    return "none", None
+
+
+def history_files(hist_file: Path) -> List[Path]:
+    """A single-file store: the main file plus any backfill partitions."""
+    files = [hist_file] if hist_file.exists() else []
+    return files + sorted((hist_file.parent / PARTITION_DIRNAME).glob("*.nc"))
+
+
+def cube_files(data_dir: Path, name: str) -> Tuple[List[Path], str]:
+    """Historical NetCDF files and variable name backing a mosaic."""
+    if name in YEARLY_CUBES:
+        subdir, prefix, var = YEARLY_CUBES[name]
+        return sorted((data_dir / subdir).glob(f"{prefix}_*.nc")), var
+    return history_files(data_dir / f"{name}_hist" / "historical.nc"), name
+
+
+def cube_dates(paths: Iterable[Path]) -> Set[date]:
+    """Dates on the time axis of the given NetCDFs (reads the coordinate only)."""
+    dates: Set[date] = set()
+    try:
+        import netCDF4
+    except ImportError:
+        netCDF4 = None
+
+    for path in paths:
+        if netCDF4 is not None:
+            with netCDF4.Dataset(path) as nc:
+                t = nc.variables["time"]
+                values = netCDF4.num2date(
+                    t[:], t.units, getattr(t, "calendar", "standard"),
+                    only_use_cftime_datetimes=False, only_use_python_datetimes=True,
+                )
+                dates.update(v.date() for v in values)
+        else:
+            import pandas as pd
+            import xarray as xr
+            with xr.open_dataset(path) as ds:
+                dates.update(pd.to_datetime(ds["time"].values).date)
+    return dates
+
+
+# ---------------------------------------------------------------------------
+# Diff
+# ---------------------------------------------------------------------------
+
+def diff_views(
+    mosaic: str,
+    granules: Dict[str, date],
+    index_kind: str,
+    indexed: Optional[Set[str]],
+    cube: Optional[Set[date]],
+) -> ConsistencyReport:
+    """Pure set comparison of the three views."""
+    report = ConsistencyReport(mosaic=mosaic, index_kind=index_kind, granules=len(granules))
+    on_disk = set(granules)
+    if indexed is not None:
+        report.missing_granules = sorted(on_disk - indexed)
+        report.orphaned_rows = sorted(indexed - on_disk)
+    if cube is not None:
+        cog_dates = set(granules.values())
+        report.missing_in_cube = sorted(cog_dates - cube)
+        report.cube_only = sorted(cube - cog_dates)
+    return report
+
+
+def check_mosaic(data_dir: Path, name: str) -> ConsistencyReport:
+    mosaic_dir = Path(data_dir) / name
+    granules = list_granules(mosaic_dir)
+    kind, indexed = index_locations(mosaic_dir)
+    files, _ = cube_files(Path(data_dir), name)
+    cube = cube_dates(files) if files else None
+    return diff_views(name, granules, kind, indexed, cube)
+
+
+def check_all(data_dir: Path, names: Optional[List[str]] = None) -> List[ConsistencyReport]:
+    data_dir = Path(data_dir)
+    names = names or [n for n in DEFAULT_MOSAICS if (data_dir / n).is_dir()]
+    return [check_mosaic(data_dir, name) for name in names]
+
+
+# ---------------------------------------------------------------------------
+# Repair
+# ---------------------------------------------------------------------------
+
+def index_delta_paths(data_dir: Path, report: ConsistencyReport) -> List[Path]:
+    """Paths to (re)index: new granules to add, orphans to remove."""
+    mosaic_dir = Path(data_dir) / report.mosaic
+    return [mosaic_dir / n for n in report.missing_granules + report.orphaned_rows]
+
+
+def repair_index(data_dir: Path, report: ConsistencyReport) -> int:
+    """
+    Apply the index delta directly for GeoPackage indexes. Shapefile indexes are
+    owned by GeoServer and must go through the harvest task instead.
+    """
+    if report.index_kind != "gpkg":
+        return 0
+    paths = index_delta_paths(data_dir, report)
+    if not paths:
+        return 0
+    from app.services import mosaic_index
+    return mosaic_index.add_granules(Path(data_dir) / report.mosaic, paths)
+
+
+def repair_cube(data_dir: Path, report: ConsistencyReport) -> int:
+    """
+    Write the days that have a COG but are missing from the cube, through the
+    same locked, in-place appenders the flows use (app.services.cube_store).
+    """
+    if not report.missing_in_cube:
+        return 0
+    from app.services import cube_store
+    from app.services.manifest import manifest_for
+
+    data_dir = Path(data_dir)
+    mosaic_dir = data_dir / report.mosaic
+    pairs = [(d, mosaic_dir / f"{report.mosaic}_{d.strftime('%Y%m%d')}.tif") for d in sorted(report.missing_in_cube)]
+    pairs = [(d, p) for d, p in pairs if p.exists()]
+    if not pairs:
+        return 0
+
+    if report.mosaic in YEARLY_CUBES:
+        written = cube_store.append_days(report.mosaic, pairs, data_dir)
+    else:
+        hist = data_dir / f"{report.mosaic}_hist" / "historical.nc"
+        if not hist.exists():
+            logger.warning(f"No cube file for {report.mosaic}; skipping {len(pairs)} day(s)")
+            return 0
+        _, var = cube_files(data_dir, report.mosaic)
+        appended, backfilled = cube_store.append_history_cogs(hist, var, pairs)
+        written = appended + backfilled
+        if backfilled:
+            cube_store.compact_history(hist, var)
+
+    # Days already present count as in the cube too
+    manifest_for(report.mosaic, data_dir).mark_in_cube([d for d, _ in pairs])
+    return len(written)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Check mosaic index / COG / cube consistency")
+    parser.add_argument("mosaics", nargs="*", help=f"Mosaics to check (default: {', '.join(DEFAULT_MOSAICS)})")
+    parser.add_argument("--data-dir", help="Override settings.DATA_DIR")
+    parser.add_argument("--repair", action="store_true", help="Repair GeoPackage indexes and cube gaps")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.data_dir:
+        base = Path(args.data_dir)
+    else:
+        from app.config.settings import get_settings
+        base = Path(get_settings().DATA_DIR)
+
+    started = time.perf_counter()
+    reports = check_all(base, args.mosaics or None)
+    elapsed = time.perf_counter() - started
+    for r in reports:
+        print(r.summary())
+    print(f"Checked {len(reports)} mosaics in {elapsed * 1000:.0f} ms")
+
+    if args.repair:
+        for r in reports:
+            if r.ok:
+                continue
+            fixed = repair_index(base, r)
+            if r.index_kind == "shapefile" and (r.missing_granules or r.orphaned_rows):
+                print(f"  {r.mosaic}: shapefile index, run the consistency flow to harvest the delta")
+            fixed += repair_cube(base, r)
+            print(f"  {r.mosaic}: repaired {fixed} item(s)")
@@ -0,0 +1,238 @@
+"""
+Isohyet (filled contour) polygons from daily precipitation grids
+Polygons are built per breakpoint band, simplified per zoom level and served as
+GeoJSON or Mapbox Vector Tiles, which are far smaller than high-res PNGs.
+"""
+import logging
+import math
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.colormap import load_style
+from app.services.raster_render import cog_path
+
+logger = logging.getLogger(__name__)
+
+# Optional MVT encoder
+try:
+    import mapbox_vector_tile
+    MVT_AVAILABLE = True
+except ImportError:
+    MVT_AVAILABLE = False
+
+MVT_EXTENT = 4096
+TILE_SIZE = 256
+
+
+def style_breaks(style: str) -> Tuple[float, ...]:
+    """Breakpoints matching the SLD quantities (transparent entries excluded)."""
+    entries = load_style(style)["entries"]
+    return tuple(e["quantity"] for e in entries if e["opacity"] > 0)
+
+
+def load_grid(source: str, start: date, end: Optional[date] = None):
+    """
+    Read a day's grid from the daily COGs, or the sum over [start, end]
+    (from the prefix-sum cube when it is built, else by summing the COGs).
+
+    Returns:
+        (data, transform) with NaN for nodata
+    """
+    import rasterio
+    from app.services import accumulation
+
+    end = end or start
+    if end > start and accumulation.cube_available(source):
+        import rioxarray  # noqa: F401  (registers the .rio accessor)
+        da = accumulation.accumulate(source, start, end)
+        if da["latitude"].values[0] < da["latitude"].values[-1]:
+            da = da.isel(latitude=slice(None, None, -1))
+        transform = da.rename({"longitude": "x", "latitude": "y"}).rio.transform()
+        return da.values.astype(np.float32), transform
+
+    total = None
+    transform = None
+    current = start
+    while current <= end:
+        path = cog_path(source, current)
+        if path.exists():
+            with rasterio.open(path) as src:
+                data = src.read(1, masked=True).astype(np.float32).filled(np.nan)
+                transform = src.transform
+            total = data if total is None else np.where(
+                np.isnan(total), data, total + np.nan_to_num(data)
+            )
+        current += timedelta(days=1)
+
+    if total is None:
+        raise FileNotFoundError(f"No {source} data between {start} and {end}")
+    return total, transform
+
+
+def band_polygons(
+    data: np.ndarray,
+    transform,
+    breaks: Sequence[float],
+) -> List[Dict]:
+    """
+    Polygonize the grid into one MultiPolygon per band [breaks[i], breaks[i+1]).
+    Values below the first break and NaN are left empty.
+    """
+    from rasterio import features
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
+
+    classes = np.digitize(np.nan_to_num(data, nan=-np.inf), breaks).astype(np.int16)
+    valid = classes > 0
+
+    by_class: Dict[int, list] = {}
+    for geom, value in features.shapes(classes, mask=valid, transform=transform, connectivity=4):
+        by_class.setdefault(int(value), []).append(shape(geom))
+
+    bands = []
+    for class_idx in sorted(by_class):
+        lower = float(breaks[class_idx - 1])
+        upper = float(breaks[class_idx]) if class_idx < len(breaks) else None
+        bands.append({
+            "band": class_idx,
+            "lower": lower,
+            "upper": upper,
+            "geometry": unary_union(by_class[class_idx]),
+        })
+    return bands
+
+
+def grid_version(source: str, start: date, end: Optional[date] = None) -> int:
+    """
+    Changes whenever an input of load_grid(source, start, end) is written or
+    deleted: the prefix-sum cube, or the mtime of every daily COG in range.
+    """
+    from app.services import accumulation
+
+    end = end or start
+    if end > start and accumulation.cube_available(source):
+        return hash(("cube", accumulation.cube_version(source)))
+    stamps = []
+    current = start
+    while current <= end:
+        try:
+            stamps.append(cog_path(source, current).stat().st_mtime_ns)
+        except FileNotFoundError:
+            stamps.append(None)
+        current += timedelta(days=1)
+    return hash(tuple(stamps))
+
+
+@lru_cache(maxsize=32)
+def cached_bands(
+    source: str,
+    start: date,
+    end: Optional[date],
+    breaks: Tuple[float, ...],
+    version: int,
+) -> Tuple[Dict, ...]:
+    """
+    Full-resolution band polygons, cached per (source, date range, breaks).
+    ``version`` is grid_version(source, start, end), so newly ingested or
+    rewritten days are polygonized again instead of served from the cache.
+    """
+    data, transform = load_grid(source, start, end)
+    bands = band_polygons(data, transform, breaks)
+    logger.info(f"Polygonized {source} {start}..{end or start}: {len(bands)} bands")
+    return tuple(bands)
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """Simplification tolerance in degrees: half a screen pixel at this zoom."""
+    return 360.0 / (TILE_SIZE * 2 ** zoom) / 2
+
+
+def _band_colors(style: str) -> Dict[float, str]:
+    return {e["quantity"]: e["color"] for e in load_style(style)["entries"]}
+
+
+def to_geojson(bands: Sequence[Dict], zoom: Optional[int], style: str) -> Dict:
+    from shapely.geometry import mapping
+
+    colors = _band_colors(style)
+    tolerance = zoom_tolerance(zoom) if zoom is not None else 0
+    features_out = []
+    for band in bands:
+        geom = band["geometry"]
+        if tolerance:
+            geom = geom.simplify(tolerance, preserve_topology=True)
+        if geom.is_empty:
+            continue
+        features_out.append({
+            "type": "Feature",
+            "geometry": mapping(geom),
+            "properties": {
+                "band": band["band"],
+                "lower": band["lower"],
+                "upper": band["upper"],
+                "color": colors.get(band["lower"]),
+            },
+        })
+    return {"type": "FeatureCollection", "features": features_out}
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Lon/lat bounds (W, S, E, N) of an XYZ web-mercator tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def _mercator_y(lat_deg: np.ndarray) -> np.ndarray:
+    lat_rad = np.radians(np.clip(lat_deg, -85.0511, 85.0511))
+    return np.log(np.tan(np.pi / 4 + lat_rad / 2))
+
+
+def to_mvt(bands: Sequence[Dict], z: int, x: int, y: int, style: str, layer_name: str = "isohyets") -> bytes:
+    """Encode the bands intersecting tile z/x/y as a Mapbox Vector Tile."""
+    if not MVT_AVAILABLE:
+        raise ImportError(
+            "Vector tiles require mapbox-vector-tile.\n"
+            "Install with: pip install mapbox-vector-tile"
+        )
+    from shapely.geometry import box
+    from shapely.ops import transform as shp_transform
+
+    west, south, east, north = tile_bounds(z, x, y)
+    # Small buffer avoids seams between neighbouring tiles
+    pad = (east - west) / TILE_SIZE * 4
+    clip_box = box(west - pad, south - pad, east + pad, north + pad)
+    y_min, y_max = _mercator_y(np.array(south)), _mercator_y(np.array(north))
+    tolerance = zoom_tolerance(z)
+    colors = _band_colors(style)
+
+    def to_tile(lon, lat, z_coord=None):
+        tx = (np.asarray(lon) - west) / (east - west) * MVT_EXTENT
+        ty = (_mercator_y(np.asarray(lat)) - y_min) / (y_max - y_min) * MVT_EXTENT
+        return tx, ty
+
+    features_out = []
+    for band in bands:
+        geom = band["geometry"]
+        if not geom.intersects(clip_box):
+            continue
+        geom = geom.intersection(clip_box).simplify(tolerance, preserve_topology=True)
+        if geom.is_empty:
+            continue
+        features_out.append({
+            "geometry": shp_transform(to_tile, geom).wkt,
+            "properties": {
+                "band": band["band"],
+                "lower": band["lower"],
+                "upper": band["upper"] if band["upper"] is not None else -1,
+                "color": colors.get(band["lower"], ""),
+            },
+        })
+
+    return mapbox_vector_tile.encode([{"name": layer_name, "features": features_out}])
@@ -0,0 +1,426 @@
+"""
+Daily append to the historical NetCDFs
+The API history/trigger endpoints read {source}_historical/brazil_{source}_{year}.nc.
+The CHIRPS/MERGE daily flows append each validated day to its year file:
+
+    - the new days are written to a copy of the year file that is renamed
+      over it (os.replace), never into the file itself: the API keeps every
+      year open, and HDF5's file locking refuses to open a file for writing
+      while another process has it open. Readers holding the old version
+      keep reading it until they notice the new one
+    - the copy gets an unlimited time dimension (files written by the
+      offline scripts have a fixed one), so a day is one slice write plus
+      one time value on top of the copy, never a re-encode of the year
+    - a year file that does not exist yet is created on the grid of the
+      latest existing year (or of the COG itself)
+    - a day older than the last one in the file (a backfill) is appended and
+      the copy is then rewritten in time order, so readers can keep slicing
+
+The ERA5/NDVI flows keep one {name}_hist/historical.nc per variable
+(append_history): days after the last stored day are appended to a new
+version of the main file, published the same way; older days (backfills)
+are published as a new file under partitions/ instead of rewriting the
+store, and compact_history folds the partitions back in once a flow is done.
+Readers open the main file plus any partitions (consistency.history_files).
+
+consistency.repair_cube writes through the same functions (append_days,
+append_history_cogs), so every file has a single appender. Writers take an
+exclusive lock per file. Readers notice new versions through the
+file's mtime (see map.refresh_historical).
+"""
+import fcntl
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import get_settings
+from app.services.consistency import PARTITION_DIRNAME, YEARLY_CUBES, cube_dates, history_files
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+TIME_UNITS = "days since 1970-01-01 00:00:00"
+CHUNK = 256
+
+
+def year_path(source: str, year: int, data_dir: Optional[Path] = None) -> Path:
+    subdir, prefix, _ = YEARLY_CUBES[source]
+    return Path(data_dir or settings.DATA_DIR) / subdir / f"{prefix}_{year}.nc"
+
+
+def cube_var(source: str) -> str:
+    return YEARLY_CUBES[source][2]
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    lock_path = path.with_name(path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+# ---------------------------------------------------------------------------
+# File layout
+# ---------------------------------------------------------------------------
+
+def _chunks(var) -> List[int]:
+    """One time step per chunk, spatial tiles of at most CHUNK cells."""
+    return [1 if d == "time" else min(CHUNK, var.shape[i]) for i, d in enumerate(var.dimensions)]
+
+
+def _write_appendable(path: Path, out_path: Path) -> bool:
+    """
+    Copy ``path`` to ``out_path`` with an unlimited time dimension.
+    Returns False (and writes nothing) if it already was appendable.
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(path) as src:
+        if src.dimensions["time"].isunlimited():
+            return False
+        with netCDF4.Dataset(out_path, "w", format="NETCDF4") as dst:
+            dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+            for name, dim in src.dimensions.items():
+                dst.createDimension(name, None if name == "time" else len(dim))
+            for name, var in src.variables.items():
+                attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+                fill = attrs.pop("_FillValue", None)
+                is_grid = "time" in var.dimensions and var.ndim > 1
+                # Keep the file's own tiling when it has one (the _hist stores use small tiles)
+                chunking = var.chunking() if is_grid else None
+                out = dst.createVariable(
+                    name, var.dtype, var.dimensions, zlib=var.ndim > 0, complevel=4, fill_value=fill,
+                    chunksizes=(chunking if isinstance(chunking, list) else _chunks(var)) if is_grid else None,
+                )
+                out.setncatts(attrs)
+                var.set_auto_maskandscale(False)
+                out.set_auto_maskandscale(False)
+                if var.ndim == 0:
+                    out.assignValue(var.getValue())
+                elif is_grid:
+                    # One day at a time keeps memory flat for a full year
+                    for i in range(var.shape[0]):
+                        out[i] = var[i]
+                else:
+                    out[:] = var[:]
+    return True
+
+
+def make_appendable(path: Path) -> bool:
+    """
+    Rewrite ``path`` once with an unlimited time dimension (atomic replace).
+    Returns False if it already was appendable.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    if not _write_appendable(path, tmp_path):
+        return False
+    os.replace(tmp_path, path)
+    logger.info(f"Converted {path.name} to an unlimited time dimension")
+    return True
+
+
+@contextmanager
+def _next_version(path: Path) -> Iterator[Path]:
+    """
+    Appendable working copy of ``path``, renamed over it when the block
+    completes and discarded if it raises. Callers hold _locked(path).
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        if not _write_appendable(path, tmp_path):
+            shutil.copyfile(path, tmp_path)
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def create_year_file(path: Path, var: str, latitudes: np.ndarray, longitudes: np.ndarray, attrs: Dict):
+    """Empty year file (time unlimited) on the given grid."""
+    import netCDF4
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with netCDF4.Dataset(tmp_path, "w", format="NETCDF4") as nc:
+        nc.createDimension("time", None)
+        nc.createDimension("latitude", len(latitudes))
+        nc.createDimension("longitude", len(longitudes))
+        t = nc.createVariable("time", "f8", ("time",))
+        t.units, t.calendar, t.standard_name = TIME_UNITS, "standard", "time"
+        lat = nc.createVariable("latitude", "f8", ("latitude",))
+        lat[:] = latitudes
+        lat.units, lat.standard_name = "degrees_north", "latitude"
+        lon = nc.createVariable("longitude", "f8", ("longitude",))
+        lon[:] = longitudes
+        lon.units, lon.standard_name = "degrees_east", "longitude"
+        data = nc.createVariable(
+            var, "f4", ("time", "latitude", "longitude"), zlib=True, complevel=4, fill_value=np.float32(np.nan),
+            chunksizes=(1, min(CHUNK, len(latitudes)), min(CHUNK, len(longitudes))),
+        )
+        data.setncatts({k: v for k, v in attrs.items() if k != "_FillValue"})
+    os.replace(tmp_path, path)
+    logger.info(f"Created {path}")
+
+
+def _template_grid(source: str, data_dir: Path, cog: Path) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """Grid (and variable attributes) for a new year file."""
+    import netCDF4
+
+    subdir, prefix, var = YEARLY_CUBES[source]
+    existing = sorted((data_dir / subdir).glob(f"{prefix}_*.nc"))
+    if existing:
+        with netCDF4.Dataset(existing[-1]) as nc:
+            attrs = {k: nc[var].getncattr(k) for k in nc[var].ncattrs()}
+            return nc["latitude"][:].data, nc["longitude"][:].data, attrs
+
+    import rasterio
+    with rasterio.open(cog) as src:
+        t = src.transform
+        lons = t.c + (np.arange(src.width) + 0.5) * t.a
+        lats = t.f + (np.arange(src.height) + 0.5) * t.e
+    # Ascending latitude, like the cubes built by the offline scripts
+    return lats[::-1], lons, {"units": "mm/day"}
+
+
+# ---------------------------------------------------------------------------
+# Appending
+# ---------------------------------------------------------------------------
+
+def _sample_indices(transform, width: int, height: int, lats: np.ndarray, lons: np.ndarray):
+    """Row/column of the COG cell containing each cube cell centre (-1 if outside)."""
+    cols = np.floor((lons - transform.c) / transform.a).astype(np.int64)
+    rows = np.floor((lats - transform.f) / transform.e).astype(np.int64)
+    cols[(cols < 0) | (cols >= width)] = -1
+    rows[(rows < 0) | (rows >= height)] = -1
+    return rows, cols
+
+
+def read_cog_on_grid(cog: Path, lats: np.ndarray, lons: np.ndarray, cache: Dict) -> np.ndarray:
+    """COG values sampled (nearest cell) on the cube grid; NaN outside or for nodata."""
+    import rasterio
+
+    with rasterio.open(cog) as src:
+        key = (tuple(src.transform), src.width, src.height)
+        if key not in cache:
+            cache[key] = _sample_indices(src.transform, src.width, src.height, lats, lons)
+        rows, cols = cache[key]
+        band = src.read(1, masked=True).astype(np.float32).filled(np.nan)
+
+    out = np.full((len(lats), len(lons)), np.nan, dtype=np.float32)
+    r_ok, c_ok = rows >= 0, cols >= 0
+    out[np.ix_(r_ok, c_ok)] = band[np.ix_(rows[r_ok], cols[c_ok])]
+    return out
+
+
+def _sort_by_time(path: Path, var: str):
+    """Rewrite a year file in time order (after an out-of-order append)."""
+    import xarray as xr
+
+    with xr.open_dataset(path) as ds:
+        ordered = ds.sortby("time").load()
+    tmp_path = path.with_name(path.name + ".tmp")
+    encoding = {var: {"zlib": True, "complevel": 4, "dtype": "float32"}}
+    ordered.to_netcdf(tmp_path, mode="w", encoding=encoding, engine="netcdf4", unlimited_dims=["time"])
+    os.replace(tmp_path, path)
+
+
+def append_year(path: Path, var: str, days: List[Tuple[date, Path]]) -> List[date]:
+    """
+    Append ``days`` (date, COG) to one year file, publishing the result as
+    a new version of the file. Returns the days written.
+    """
+    import netCDF4
+
+    with _locked(path):
+        present = cube_dates([path])
+        todo = {day: cog for day, cog in days if day not in present}
+        if not todo:
+            return []
+        written = sorted(todo)
+        reorder = bool(present) and written[0] < max(present)
+        with _next_version(path) as tmp_path:
+            with netCDF4.Dataset(tmp_path, "a") as nc:
+                t = nc["time"]
+                calendar = getattr(t, "calendar", "standard")
+                lats, lons = nc["latitude"][:].data, nc["longitude"][:].data
+                cache: Dict = {}
+                for day in written:
+                    n = len(t)
+                    nc[var][n] = read_cog_on_grid(todo[day], lats, lons, cache)
+                    t[n] = netCDF4.date2num(datetime(day.year, day.month, day.day), t.units, calendar)
+            if reorder:
+                _sort_by_time(tmp_path, var)
+    logger.info(f"Appended {len(written)} day(s) to {path.name}" + (" (reordered)" if reorder else ""))
+    return written
+
+
+def append_days(source: str, days: List[Tuple[date, Path]], data_dir: Optional[Path] = None) -> List[date]:
+    """
+    Append validated days (date, COG path) to the source's yearly files,
+    creating year files as needed. Returns the days written.
+    """
+    data_dir = Path(data_dir or settings.DATA_DIR)
+    var = cube_var(source)
+    by_year: Dict[int, List[Tuple[date, Path]]] = {}
+    for day, cog in days:
+        by_year.setdefault(day.year, []).append((day, Path(cog)))
+
+    written: List[date] = []
+    for year, year_days in sorted(by_year.items()):
+        path = year_path(source, year, data_dir)
+        if not path.exists():
+            with _locked(path):
+                if not path.exists():
+                    lats, lons, attrs = _template_grid(source, data_dir, year_days[0][1])
+                    create_year_file(path, var, lats, lons, attrs)
+        written += append_year(path, var, year_days)
+    return written
+
+
+# ---------------------------------------------------------------------------
+# Single-file stores (ERA5 / NDVI)
+# ---------------------------------------------------------------------------
+
+HISTORY_ENCODING = {"chunksizes": (1, 20, 20), "zlib": True, "complevel": 5, "dtype": "float32"}
+
+
+def _publish(ds, path: Path, var: str, encoding: Dict):
+    """Write a dataset next to ``path`` and rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    encoding = dict(encoding)
+    if "chunksizes" in encoding:
+        shape = ds[var].shape
+        encoding["chunksizes"] = tuple(min(c, n) for c, n in zip(encoding["chunksizes"], shape))
+    ds.to_netcdf(tmp_path, mode="w", encoding={var: encoding}, engine="netcdf4", unlimited_dims=["time"])
+    os.replace(tmp_path, path)
+
+
+def _check_grid(nc, da):
+    for dim in ("latitude", "longitude"):
+        stored = nc[dim][:].data
+        incoming = da[dim].values
+        if stored.shape != incoming.shape or not np.allclose(stored, incoming):
+            raise ValueError(f"{dim} of the new data does not match the grid of {nc.filepath()}")
+
+
+def append_history(
+    hist_file: Path, var: str, da, encoding: Optional[Dict] = None
+) -> Tuple[List[date], List[date]]:
+    """
+    Add the days of ``da`` (time, latitude, longitude) that are not stored yet.
+    Days after the last day of the main file go into a new version of it
+    (copy, append, rename); older ones go to a new partition file.
+    Returns (appended, backfilled).
+    """
+    import netCDF4
+    import pandas as pd
+
+    hist_file = Path(hist_file)
+    encoding = encoding or HISTORY_ENCODING
+    da = da.transpose("time", "latitude", "longitude").sortby("time")
+    days = [t.date() for t in pd.to_datetime(da["time"].values)]
+
+    with _locked(hist_file):
+        if not hist_file.exists():
+            _publish(da.astype(np.float32).to_dataset(name=var), hist_file, var, encoding)
+            logger.info(f"Created {hist_file} with {len(days)} day(s)")
+            return days, []
+
+        present = cube_dates(history_files(hist_file))
+        new: Dict[date, int] = {}
+        for i, day in enumerate(days):
+            if day not in present:
+                new.setdefault(day, i)
+        if new:
+            with netCDF4.Dataset(hist_file) as nc:
+                _check_grid(nc, da)
+
+        last = max(cube_dates([hist_file]), default=None)
+        appended = [day for day in sorted(new) if last is None or day > last]
+        if appended:
+            with _next_version(hist_file) as tmp_path, netCDF4.Dataset(tmp_path, "a") as nc:
+                t = nc["time"]
+                calendar = getattr(t, "calendar", "standard")
+                for day in appended:
+                    n = len(t)
+                    nc[var][n] = da.isel(time=new[day]).values.astype(np.float32)
+                    t[n] = netCDF4.date2num(datetime(day.year, day.month, day.day), t.units, calendar)
+
+        backfilled = sorted(set(new) - set(appended))
+        if backfilled:
+            part = da.isel(time=[new[d] for d in backfilled]).astype(np.float32).to_dataset(name=var)
+            name = f"{backfilled[0]:%Y%m%d}_{backfilled[-1]:%Y%m%d}_{time.time_ns()}.nc"
+            _publish(part, hist_file.parent / PARTITION_DIRNAME / name, var, encoding)
+
+    logger.info(f"{hist_file}: appended {len(appended)} day(s), {len(backfilled)} backfilled to a partition")
+    return appended, backfilled
+
+
+def append_history_cogs(
+    hist_file: Path, var: str, days: List[Tuple[date, Path]], batch_days: int = 31
+) -> Tuple[List[date], List[date]]:
+    """
+    append_history for days given as (date, COG): each COG is sampled onto the
+    store's grid, batch_days at a time. Returns (appended, backfilled).
+    """
+    import netCDF4
+    import pandas as pd
+    import xarray as xr
+
+    with netCDF4.Dataset(hist_file) as nc:
+        lats, lons = nc["latitude"][:].data, nc["longitude"][:].data
+
+    appended: List[date] = []
+    backfilled: List[date] = []
+    cache: Dict = {}
+    days = sorted(days)
+    for i in range(0, len(days), batch_days):
+        chunk = days[i:i + batch_days]
+        da = xr.DataArray(
+            np.stack([read_cog_on_grid(cog, lats, lons, cache) for _, cog in chunk]),
+            coords={"time": pd.to_datetime([d.isoformat() for d, _ in chunk]), "latitude": lats, "longitude": lons},
+            dims=("time", "latitude", "longitude"),
+        )
+        a, b = append_history(hist_file, var, da)
+        appended += a
+        backfilled += b
+    return appended, backfilled
+
+
+def compact_history(hist_file: Path, var: str, encoding: Optional[Dict] = None) -> int:
+    """
+    Fold the backfill partitions into the main file in time order (one
+    rewrite, atomic replace). Returns the number of partitions merged.
+    """
+    import xarray as xr
+
+    hist_file = Path(hist_file)
+    with _locked(hist_file):
+        files = history_files(hist_file)
+        partitions = [p for p in files if p != hist_file]
+        if not partitions:
+            return 0
+        parts = []
+        for path in files:
+            with xr.open_dataset(path) as ds:
+                parts.append(ds[[var]].load())
+        merged = xr.concat(parts, dim="time").sortby("time")
+        merged = merged.isel(time=~merged.get_index("time").duplicated())
+        _publish(merged, hist_file, var, encoding or HISTORY_ENCODING)
+        for path in partitions:
+            path.unlink()
+    logger.info(f"Compacted {len(partitions)} partition(s) into {hist_file}")
+    return len(partitions)
@@ -0,0 +1,187 @@
+"""
+Streaming, resumable HTTP downloads
+Files are streamed in fixed-size chunks to ``{dest}.part`` and renamed into
+place only after the size (Content-Length / Content-Range) and, when known,
+the sha256 digest check out. An interrupted transfer leaves the ``.part``
+file behind and the next attempt resumes it with an HTTP Range request, so a
+flaky connection does not restart large GRIB files from zero. Memory per
+download is one chunk.
+
+The first response's ETag (or Last-Modified) is kept next to the ``.part``
+file and sent as If-Range on resume: a file republished in between, even with
+the same length, comes back whole (200) and the download restarts instead of
+splicing two versions. A ``.part`` without a saved validator is not resumed.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+PART_SUFFIX = ".part"
+VALIDATOR_SUFFIX = ".validator"
+_CONTENT_RANGE = re.compile(r"bytes (?:\d+-\d+|\*)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    """Transfer finished but the file does not match what the server announced."""
+
+
+@dataclass
+class DownloadResult:
+    path: Path
+    size: int
+    sha256: str
+    resumed_from: int = 0
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def shared_session(pool_maxsize: int = 16):
+    """
+    One requests.Session (and urllib3 pool) shared by every download thread
+    in the process, so keep-alive connections are reused across tasks.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def part_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + PART_SUFFIX)
+
+
+def validator_path(dest: Path) -> Path:
+    return dest.with_name(dest.name + PART_SUFFIX + VALIDATOR_SUFFIX)
+
+
+def _validator(response) -> Optional[str]:
+    """Strong ETag, else Last-Modified: what If-Range may carry."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def _discard_part(dest: Path):
+    for path in (part_path(dest), validator_path(dest)):
+        path.unlink(missing_ok=True)
+
+
+def _hash_existing(path: Path, digest) -> int:
+    """Feed an existing partial file into ``digest``; returns its size."""
+    size = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return size
+
+
+def _expected_total(response, offset: int) -> Optional[int]:
+    """Full file size announced by the server, if any."""
+    content_range = response.headers.get("Content-Range")
+    if content_range:
+        match = _CONTENT_RANGE.match(content_range)
+        if match and match.group(1) != "*":
+            return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    if length is not None:
+        return int(length) + (offset if response.status_code == 206 else 0)
+    return None
+
+
+def stream_download(
+    url: str,
+    dest: Path,
+    session=None,
+    expected_sha256: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    timeout: float = 60,
+) -> DownloadResult:
+    """
+    Download ``url`` to ``dest``, resuming a previous ``.part`` file if present.
+    ``expected_sha256`` must be a digest published by the provider, not one
+    recorded from an earlier download: providers republish files.
+
+    Raises:
+        DownloadError: size or digest mismatch (a short file is kept for resuming)
+        requests.HTTPError: non-success HTTP status
+    """
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = part_path(dest)
+    session = session or shared_session()
+
+    digest = hashlib.sha256()
+    validator_file = validator_path(dest)
+    validator = validator_file.read_text().strip() if validator_file.exists() else ""
+    if part.exists() and not validator:
+        # Nothing to tell whether the server still has the same file
+        _discard_part(dest)
+    offset = _hash_existing(part, digest) if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-", "If-Range": validator} if offset else {}
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if offset and response.status_code == 416:
+            # The partial file already holds everything
+            total = _expected_total(response, 0)
+            if total is not None and total != offset:
+                _discard_part(dest)
+                raise DownloadError(f"{url}: server rejected resume at byte {offset} of {total}")
+        else:
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # Range ignored, or If-Range failed because the file changed: start over
+                logger.info(f"{url}: full response to a resume request, restarting download")
+                offset = 0
+                digest = hashlib.sha256()
+            if not offset:
+                validator = _validator(response)
+                if validator:
+                    validator_file.write_text(validator)
+                else:
+                    validator_file.unlink(missing_ok=True)
+            total = _expected_total(response, offset)
+            if offset:
+                logger.info(f"Resuming {url} at byte {offset}")
+            with open(part, "ab" if offset else "wb") as fh:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        fh.write(chunk)
+                        digest.update(chunk)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+    size = part.stat().st_size
+    if total is not None and size != total:
+        if size > total:
+            _discard_part(dest)
+        # A short file is kept so the next attempt resumes it
+        raise DownloadError(f"{url}: got {size} bytes, expected {total}")
+
+    sha256 = digest.hexdigest()
+    if expected_sha256 and sha256 != expected_sha256:
+        _discard_part(dest)
+        raise DownloadError(f"{url}: sha256 {sha256} does not match published {expected_sha256}")
+
+    os.replace(part, dest)
+    validator_file.unlink(missing_ok=True)
+    return DownloadResult(path=dest, size=size, sha256=sha256, resumed_from=offset)
@@ -0,0 +1,211 @@
+"""
+Rendering for /georisk/cmaps
+The decoded accumulation grid and the simplified Brazil border are cached per
+process, so the render pool workers decode the GRIB files and read the
+shapefile once instead of on every request.
+"""
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+from datetime import date
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.config.settings import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+GEORISK_DATA_DIR = "/mnt/workwork/GeoRisk/data"
+GEORISK_FILES = [
+    'MERGE_CPTEC_20240427.grib2',
+    'MERGE_CPTEC_20240428.grib2',
+    'MERGE_CPTEC_20240429.grib2',
+    'MERGE_CPTEC_20240501.grib2',
+    'MERGE_CPTEC_20240502.grib2',
+    'MERGE_CPTEC_20240503.grib2',
+    'MERGE_CPTEC_20240504.grib2',
+    'MERGE_CPTEC_20240505.grib2',
+]
+
+# Border simplification tolerance in degrees (~1 km)
+BORDER_TOLERANCE = 0.01
+
+
+def load_accumulation(
+    source: Optional[str] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sum 'rdp' over the GeoRisk event files, or, when source/start/end are
+    given, read the accumulation from that source's prefix-sum cube.
+
+    Returns:
+        (lons, lats, total_precip) with longitude normalized to [-180, 180] and sorted
+    """
+    version = 0.0
+    if source is not None:
+        from app.services import accumulation
+        version = accumulation.cube_version(source)
+    return _load_accumulation(source, start, end, version)
+
+
+@lru_cache(maxsize=8)
+def _load_accumulation(
+    source: Optional[str],
+    start: Optional[date],
+    end: Optional[date],
+    version: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # version (the cube's checkpoint mtime) is part of the key so a rebuilt cube is re-read
+    import xarray as xr
+
+    if source is not None:
+        from app.services import accumulation
+        da = accumulation.accumulate(source, start, end)
+        return da["longitude"].values, da["latitude"].values, da.values.astype(np.float32)
+
+    file_list = [os.path.join(GEORISK_DATA_DIR, f) for f in GEORISK_FILES]
+    for file in file_list:
+        if not os.path.exists(file):
+            raise FileNotFoundError(f"File not found: {file}")
+
+    ds = xr.open_mfdataset(file_list, combine='nested', concat_dim="time", engine="cfgrib")
+    if 'rdp' not in ds:
+        raise KeyError("Variable 'rdp' not found in dataset")
+
+    ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby('longitude')
+    total_precip = ds['rdp'].sum(dim="time").values.astype(np.float32)
+    lons = ds['longitude'].values
+    lats = ds['latitude'].values
+    ds.close()
+
+    logger.info(f"Decoded GeoRisk accumulation grid {total_precip.shape} from {len(file_list)} files")
+    return lons, lats, total_precip
+
+
+@lru_cache(maxsize=1)
+def load_border():
+    """Brazil border dissolved and simplified once per process."""
+    import geopandas as gpd
+
+    shapefile_path = settings.BRAZIL_SHAPEFILE
+    if not os.path.exists(shapefile_path):
+        raise FileNotFoundError(f"Shapefile not found: {shapefile_path}")
+    brazil = gpd.read_file(shapefile_path)
+    if brazil.empty:
+        raise ValueError("Brazil shapefile is empty")
+
+    border = brazil.to_crs("EPSG:4326").geometry.unary_union
+    logger.info(f"Loaded Brazil border from {shapefile_path}")
+    return border.simplify(BORDER_TOLERANCE, preserve_topology=True)
+
+
+def _border_rings(border) -> List[np.ndarray]:
+    polygons = getattr(border, "geoms", [border])
+    rings = []
+    for polygon in polygons:
+        rings.append(np.asarray(polygon.exterior.coords))
+        rings.extend(np.asarray(interior.coords) for interior in polygon.interiors)
+    return rings
+
+
+def apply_boundary_lut(data: np.ndarray, bounds: List[float], colors: List[str]) -> np.ndarray:
+    """
+    numpy equivalent of pcolormesh with ListedColormap + BoundaryNorm(clip=False):
+    values in bin i get colors[i] (bins spread over the colors when there are more
+    colors than bins), values below the first bound get the first color, values
+    from the last bound up get the last color, NaN is transparent.
+    """
+    def to_rgba(c: str) -> List[int]:
+        c = c.lstrip('#')
+        rgba = [int(c[i:i + 2], 16) for i in range(0, len(c), 2)]
+        return rgba if len(rgba) == 4 else rgba + [255]
+
+    lut = np.array([to_rgba(c) for c in colors], dtype=np.uint8)
+    values = np.asarray(data, dtype=np.float64)
+    nan_mask = np.isnan(values)
+    idx = np.digitize(np.where(nan_mask, -np.inf, values), bounds) - 1
+    n_bins = len(bounds) - 1
+    if len(lut) > n_bins:
+        # BoundaryNorm stretches the bin index over the colormap
+        if n_bins == 1:
+            idx = np.where(idx == 0, (len(lut) - 1) // 2, idx)
+        else:
+            idx = ((len(lut) - 1) / (n_bins - 1) * idx).astype(np.int16)
+    out = lut[np.clip(idx, 0, len(lut) - 1)]
+    out[values >= bounds[-1]] = lut[-1]
+    out[nan_mask] = 0
+    return out
+
+
+def render_fast(bounds: List[float], colors: List[str], dpi: int, period: Tuple = ()) -> bytes:
+    """Vectorized LUT renderer (numpy -> PIL) with the border drawn on top."""
+    lons, lats, total_precip = load_accumulation(*period)
+    border = load_border()
+
+    rgba = apply_boundary_lut(total_precip, bounds, colors)
+    if lats[0] < lats[-1]:
+        rgba = rgba[::-1]  # north-up
+
+    scale = max(1, round(dpi / 100))
+    height, width = rgba.shape[:2]
+    image = Image.fromarray(rgba, mode="RGBA").resize((width * scale, height * scale), Image.NEAREST)
+
+    lon_min, lon_max = float(lons.min()), float(lons.max())
+    lat_min, lat_max = float(lats.min()), float(lats.max())
+    px_w, px_h = image.size
+    draw = ImageDraw.Draw(image)
+    for ring in _border_rings(border):
+        x = (ring[:, 0] - lon_min) / (lon_max - lon_min) * (px_w - 1)
+        y = (lat_max - ring[:, 1]) / (lat_max - lat_min) * (px_h - 1)
+        draw.line(list(zip(x.tolist(), y.tolist())), fill=(0, 0, 0, 255), width=scale)
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_matplotlib(bounds: List[float], colors: List[str], dpi: int, period: Tuple = ()) -> bytes:
+    """Full figure with axes and colorbar, same layout as the original endpoint."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+    from matplotlib.colors import ListedColormap, BoundaryNorm
+    import geopandas as gpd
+
+    lons, lats, total_precip = load_accumulation(*period)
+    border = load_border()
+
+    cmap = ListedColormap(colors)
+    norm = BoundaryNorm(bounds, cmap.N, clip=False)  # Allow values <1 to be transparent
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    im = ax.pcolormesh(lons, lats, total_precip, cmap=cmap, norm=norm, zorder=1)
+    gpd.GeoSeries([border]).plot(ax=ax, edgecolor='black', facecolor='none', linewidth=1, zorder=2)
+
+    cbar = plt.colorbar(im, ax=ax, boundaries=bounds[1:], ticks=bounds[1:], shrink=0.7)  # Skip 0 for colorbar
+    cbar.set_label('Precipitation (mm)')
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.set_xlim(float(lons.min()), float(lons.max()))
+    ax.set_ylim(float(lats.min()), float(lats.max()))
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_cmap(bounds: List[float], colors: List[str], dpi: int, renderer: str, period: Tuple = ()) -> bytes:
+    """
+    Entry point for the render pool.
+    ``period`` is () for the GeoRisk event files or (source, start, end) for the prefix-sum cube.
+    """
+    if renderer == "fast":
+        return render_fast(bounds, colors, dpi, period)
+    return render_matplotlib(bounds, colors, dpi, period)
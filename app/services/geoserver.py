@@ -7,6 +7,7 @@ import textwrap
 from app.config.settings import get_settings
 import asyncio
 import platform
+from app.services.geoserver_rest import shared_client
 #from app.services.precipitation import update_shp_date_index_chirps
 
 settings = get_settings()
@@ -15,9 +16,9 @@ logger = logging.getLogger(__name__)
 def is_success(status_code: int) -> bool:
     return status_code in (200, 201, 202)
 
-# --- New: SLD Creation Function ---
-def create_precipitation_sld(path: Path):
-    sld_content = textwrap.dedent("""
+
+# --- Precipitation SLD (also parsed by app.services.colormap for local rendering) ---
+PRECIPITATION_SLD = textwrap.dedent("""
     <StyledLayerDescriptor version="1.0.0"
         xsi:schemaLocation="http://www.opengis.net/sld StyledLayerDescriptor.xsd"
         xmlns="http://www.opengis.net/sld"
@@ -66,7 +67,10 @@ def create_precipitation_sld(path: Path):
 
     """).strip()
 
-    path.write_text(sld_content)
+
+# --- New: SLD Creation Function ---
+def create_precipitation_sld(path: Path):
+    path.write_text(PRECIPITATION_SLD)
     path.chmod(0o644)
     return path
 
@@ -82,6 +86,11 @@ class GeoServerService:
         self.max_retries = 3
         logger.info(f"GeoServer configured at {self.base_url}")
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # The pool of the shared GeoServerRestClient; calls here use absolute URLs
+        return shared_client(self.base_url).http
+
     # async def reindex_time(self) -> bool:
     #     sudo rm /mnt/workwork/geoserver_data/merge/merge.* && \
     #     sudo systemctl restart geoserver && \
@@ -113,13 +122,12 @@ class GeoServerService:
                 f"{self.base_url}/rest/workspaces/{self.workspace}"
                 f"/coveragestores/merge/external.imagemosaic?recalculate=all"
             )
-            async with httpx.AsyncClient(auth=self.auth, timeout=self.timeout) as client:
-                logger.info(f"Calling reindex URL: {reindex_url}")
-                response = await client.post(reindex_url)
-                if not is_success(response.status_code):
-                    logger.error(f"Failed to reindex: {response.status_code} {response.text}")
-                    return False
-                logger.info("ImageMosaic reindex request submitted successfully.")
+            logger.info(f"Calling reindex URL: {reindex_url}")
+            response = await self.client.post(reindex_url, timeout=self.timeout)
+            if not is_success(response.status_code):
+                logger.error(f"Failed to reindex: {response.status_code} {response.text}")
+                return False
+            logger.info("ImageMosaic reindex request submitted successfully.")
 
             # Step 4 — Update shapefile index
             logger.info("Updating shapefile date index...")
@@ -141,16 +149,15 @@ class GeoServerService:
 
     # --- Upload SLD ---
     async def upload_sld(self, sld_path: Path, style_name: str):
-        async with httpx.AsyncClient(auth=self.auth) as client:
-            headers = {"Content-Type": "application/vnd.ogc.sld+xml"}
-            url = f"{self.base_url}/rest/styles?name={style_name}"
-            response = await client.post(url, headers=headers, content=sld_path.read_bytes())
-            if is_success(response.status_code):
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Failed to upload SLD {style_name}: {response.text}"
-                )
-            logger.info(f"SLD {style_name} uploaded successfully")
+        headers = {"Content-Type": "application/vnd.ogc.sld+xml"}
+        url = f"{self.base_url}/rest/styles?name={style_name}"
+        response = await self.client.post(url, headers=headers, content=sld_path.read_bytes())
+        if not is_success(response.status_code):
+            raise HTTPException(
+                status_code=502,
+                detail=f"Failed to upload SLD {style_name}: {response.text}"
+            )
+        logger.info(f"SLD {style_name} uploaded successfully")
 
     """If wanna create a new mosaic add at least two .tif files with different dates in the folder, then restart FastAPI.
         
@@ -220,12 +227,11 @@ class GeoServerService:
                 create_precipitation_sld(sld_file)
             await self.upload_sld(sld_file, style_name="precipitation_style")
 
-            async with httpx.AsyncClient(auth=self.auth) as client:
-                url = f"{self.base_url}/rest/layers/{self.workspace}:{layer_name}"
-                payload = {"layer": {"defaultStyle": {"name": "precipitation_style"}}}
-                response = await client.put(url, headers={"Content-Type": "application/json"}, json=payload)
-                if is_success(response.status_code):
-                    logger.warning(f"Failed to apply SLD to {layer_name}: {response.text}")
+            url = f"{self.base_url}/rest/layers/{self.workspace}:{layer_name}"
+            payload = {"layer": {"defaultStyle": {"name": "precipitation_style"}}}
+            response = await self.client.put(url, headers={"Content-Type": "application/json"}, json=payload)
+            if not is_success(response.status_code):
+                logger.warning(f"Failed to apply SLD to {layer_name}: {response.text}")
 
             logger.info(f"Layer {layer_name} ensured with {geotiff_file.name}")
             return f"{self.workspace}:{layer_name}"
@@ -235,97 +241,97 @@ class GeoServerService:
             raise HTTPException(status_code=500, detail=f"Failed to ensure layer exists: {str(e)}")
 
     async def _create_workspace(self):
-        async with httpx.AsyncClient(auth=self.auth) as client:
-            response = await client.get(f"{self.base_url}/rest/workspaces/{self.workspace}")
-            if response.status_code == 404:
-                create_res = await client.post(
-                    f"{self.base_url}/rest/workspaces",
-                    headers={"Content-Type": "application/json"},
-                    json={"workspace": {"name": self.workspace}}
-                )
-                create_res.raise_for_status()
-
-    async def _create_coverage_store(self, store_name: str, source: str):
-        async with httpx.AsyncClient(auth=self.auth) as client:
-            response = await client.get(
-                f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}"
-            )
-            if response.status_code == 200:
-                return  # already exists
-
+        client = self.client
+        response = await client.get(f"{self.base_url}/rest/workspaces/{self.workspace}")
+        if response.status_code == 404:
             create_res = await client.post(
-                f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores",
-                params={"configure": "all"},
+                f"{self.base_url}/rest/workspaces",
                 headers={"Content-Type": "application/json"},
-                json={
-                    "coverageStore": {
-                        "name": store_name,
-                        "type": "ImageMosaic",
-                        "enabled": True,
-                        "workspace": {"name": self.workspace},
-                        "url": f"file:{self.get_geoserver_accessible_path(Path(self.data_dir) / source)}/"
-                    }
+                json={"workspace": {"name": self.workspace}}
+            )
+            create_res.raise_for_status()
+
+    async def _create_coverage_store(self, store_name: str, source: str):
+        client = self.client
+        response = await client.get(
+            f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}"
+        )
+        if response.status_code == 200:
+            return  # already exists
+
+        create_res = await client.post(
+            f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores",
+            params={"configure": "all"},
+            headers={"Content-Type": "application/json"},
+            json={
+                "coverageStore": {
+                    "name": store_name,
+                    "type": "ImageMosaic",
+                    "enabled": True,
+                    "workspace": {"name": self.workspace},
+                    "url": f"file:{self.get_geoserver_accessible_path(Path(self.data_dir) / source)}/"
                 }
+            }
+        )
+        if not is_success(create_res.status_code):
+            raise HTTPException(
+                status_code=502,
+                detail=f"Failed to create coverage store: {create_res.text}"
             )
-            if is_success(create_res.status_code):
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Failed to create coverage store: {create_res.text}"
-                )
 
     async def _publish_layer(self, store_name: str, layer_name: str, native_name: str = None):
         if native_name is None:
             native_name = layer_name.replace("_mosaic", "")
 
-        async with httpx.AsyncClient(auth=self.auth) as client:
-            response = await client.get(
-                f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages/{layer_name}"
-            )
-            if response.status_code == 200:
-                return
-
-            response = await client.post(
-                f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages",
-                headers={"Content-Type": "application/json"},
-                json={
-                    "coverage": {
-                        "name": layer_name,
-                        "nativeName": native_name,
-                        "title": layer_name,
-                        "enabled": True,
-                        "srs": "EPSG:4326",
-                        "nativeCRS": "EPSG:4326"
-                    }
+        client = self.client
+        response = await client.get(
+            f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages/{layer_name}"
+        )
+        if response.status_code == 200:
+            return
+
+        response = await client.post(
+            f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages",
+            headers={"Content-Type": "application/json"},
+            json={
+                "coverage": {
+                    "name": layer_name,
+                    "nativeName": native_name,
+                    "title": layer_name,
+                    "enabled": True,
+                    "srs": "EPSG:4326",
+                    "nativeCRS": "EPSG:4326"
                 }
+            }
+        )
+        if not is_success(response.status_code):
+            raise HTTPException(
+                status_code=502,
+                detail=f"Failed to publish layer: {response.text}"
             )
-            if is_success(response.status_code):
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Failed to publish layer: {response.text}"
-                )
 
-            # Enable time dimension
-            time_config = {
-                "coverage": {
-                    "metadata": {
-                        "entry": [{
-                            "@key": "time",
-                            "dimensionInfo": {
-                                "enabled": True,
-                                "presentation": "LIST",
-                                "resolution": "1 day",
-                                "defaultValue": "NEAREST"
-                            }
-                        }]
-                    }
+        # Enable time dimension
+        time_config = {
+            "coverage": {
+                "metadata": {
+                    "entry": [{
+                        "@key": "time",
+                        "dimensionInfo": {
+                            "enabled": True,
+                            "presentation": "LIST",
+                            "resolution": "1 day",
+                            "defaultValue": "NEAREST"
+                        }
+                    }]
                 }
             }
-            time_response = await client.put(
-                f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages/{layer_name}",
-                headers={"Content-Type": "application/json"},
-                json=time_config
-            )
-            time_response.raise_for_status()
+        }
+        time_response = await client.put(
+            f"{self.base_url}/rest/workspaces/{self.workspace}/coveragestores/{store_name}/coverages/{layer_name}",
+            headers={"Content-Type": "application/json"},
+            json=time_config
+        )
+        time_response.raise_for_status()
 
     async def get_wms_url(self, layer: str, bbox: str, time: str = None, size: str = "800x600"):
         params = {
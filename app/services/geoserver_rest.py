@@ -0,0 +1,435 @@
+"""
+Declarative GeoServer provisioning over one pooled async REST client
+The catalog (workspaces, styles, ImageMosaic stores, coverages, default styles
+and time dimensions) is described by a CatalogSpec. sync_catalog() reads the
+live catalog, works out what differs and applies only those changes,
+concurrently across resources, so reruns against an up-to-date server are
+read-only.
+
+    python -m app.services.geoserver_rest [--dry-run]
+
+GeoServerRestClient is the only GeoServer HTTP client in the backend: the API
+shares one per event loop (shared_client, also used for the WMS proxy), and
+the synchronous Prefect tasks run their calls through run_sync (granule
+harvests, catalog reloads).
+"""
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+# Connections of the API's shared client (REST calls and the WMS proxy)
+API_CONCURRENCY = 20
+
+T = TypeVar("T")
+
+
+@dataclass
+class TimeDimensionSpec:
+    attribute: str = "ingestion"
+    presentation: str = "LIST"
+    default_strategy: str = "MAXIMUM"
+    nearest_match: bool = False
+
+    def as_dimension_info(self) -> Dict:
+        return {
+            "enabled": True,
+            "attribute": self.attribute,
+            "presentation": self.presentation,
+            "units": "ISO8601",
+            "defaultValue": {"strategy": self.default_strategy},
+            "nearestMatchEnabled": self.nearest_match,
+        }
+
+
+@dataclass
+class StyleSpec:
+    name: str
+    sld: str
+
+
+@dataclass
+class MosaicSpec:
+    workspace: str
+    store: str
+    data_dir: str
+    layer: Optional[str] = None
+    title: Optional[str] = None
+    abstract: Optional[str] = None
+    default_style: Optional[str] = None
+    time: Optional[TimeDimensionSpec] = field(default_factory=TimeDimensionSpec)
+
+    @property
+    def layer_name(self) -> str:
+        return self.layer or self.store
+
+
+@dataclass
+class CatalogSpec:
+    workspaces: List[str] = field(default_factory=list)
+    styles: List[StyleSpec] = field(default_factory=list)
+    mosaics: List[MosaicSpec] = field(default_factory=list)
+
+
+class GeoServerRestClient:
+    """
+    Async GeoServer REST client sharing one connection pool.
+    At most ``concurrency`` requests are in flight at a time.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        auth,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        timeout: float = 60,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self._client = httpx.AsyncClient(
+            base_url=f"{self.base_url}/rest",
+            auth=auth,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """The pooled httpx client itself, for OGC requests (WMS) by absolute URL."""
+        return self._client
+
+    async def request(self, method: str, path: str, allow_missing: bool = False, **kwargs) -> httpx.Response:
+        """Send a REST request; raises unless it succeeded (or, with ``allow_missing``, returned 404)."""
+        async with self._semaphore:
+            response = await self._client.request(method, path, **kwargs)
+        if response.status_code not in (200, 201, 202) and not (allow_missing and response.status_code == 404):
+            raise RuntimeError(f"{method} {path} failed: {response.status_code} {response.text[:300]}")
+        return response
+
+    async def get_json(self, path: str) -> Optional[Dict]:
+        """GET a resource as JSON; None if it does not exist."""
+        async with self._semaphore:
+            response = await self._client.get(path if path.endswith(".json") else f"{path}.json")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def get_text(self, path: str) -> Optional[str]:
+        async with self._semaphore:
+            response = await self._client.get(path)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.text
+
+    async def reload(self):
+        """Reload the catalog and stores from the data directory."""
+        await self.request("POST", "/reload")
+
+    # -- ImageMosaic granules ------------------------------------------------
+
+    async def remove_granules(self, workspace: str, store: str, coverage: str, file_name: str):
+        """Delete the index entries of a granule, matched by file name (relative and absolute locations)."""
+        await self.request(
+            "DELETE", f"/workspaces/{workspace}/coveragestores/{store}/coverages/{coverage}/index/granules",
+            params={"filter": f"location LIKE '%{file_name}'"}, allow_missing=True,
+        )
+
+    async def harvest_granule(self, workspace: str, store: str, granule: Path, timeout: float = 120):
+        await self.request(
+            "POST", f"/workspaces/{workspace}/coveragestores/{store}/external.imagemosaic",
+            content=f"file://{granule}", headers={"Content-Type": "text/plain"}, timeout=timeout,
+        )
+
+
+def client_from_settings(
+    base_url: Optional[str] = None, concurrency: int = DEFAULT_CONCURRENCY, timeout: float = 60
+) -> GeoServerRestClient:
+    from app.config.settings import get_settings
+    settings = get_settings()
+
+    return GeoServerRestClient(
+        base_url or settings.geoserver_local_url,
+        (settings.GEOSERVER_ADMIN_USER, settings.GEOSERVER_ADMIN_PASSWORD),
+        concurrency=concurrency,
+        timeout=timeout,
+    )
+
+
+_shared: Optional[Tuple[asyncio.AbstractEventLoop, GeoServerRestClient]] = None
+
+
+def shared_client(base_url: Optional[str] = None) -> GeoServerRestClient:
+    """One pooled client per running event loop, shared by the API's routers and services."""
+    global _shared
+    loop = asyncio.get_running_loop()
+    if _shared is None or _shared[0] is not loop or _shared[1].is_closed:
+        _shared = (loop, client_from_settings(base_url, concurrency=API_CONCURRENCY, timeout=30))
+    return _shared[1]
+
+
+async def close_shared_client():
+    global _shared
+    if _shared is not None:
+        loop, client = _shared
+        _shared = None
+        if loop is asyncio.get_running_loop():
+            await client.close()
+
+
+def run_sync(operation: Callable[[GeoServerRestClient], Awaitable[T]]) -> T:
+    """
+    Run ``operation(client)`` from synchronous code (Prefect tasks) on a
+    client opened for the call; every request it makes shares one pool.
+    """
+    async def main() -> T:
+        async with client_from_settings() as client:
+            return await operation(client)
+
+    return asyncio.run(main())
+
+
+# ---------------------------------------------------------------------------
+# Reconciliation
+# ---------------------------------------------------------------------------
+
+def _normalize_xml(text: str) -> str:
+    return "".join(text.split())
+
+
+def _url_path(url: str) -> str:
+    """'file:/a/b/', 'file:///a/b' -> '/a/b' (GeoServer rewrites store URLs)."""
+    return "/" + url.split("file:", 1)[-1].strip("/")
+
+
+class CatalogSync:
+    """Diffs a CatalogSpec against the live catalog and applies the changes."""
+
+    def __init__(self, client: GeoServerRestClient, dry_run: bool = False):
+        self.client = client
+        self.dry_run = dry_run
+        self.changes: List[str] = []
+
+    async def _apply(self, description: str, method: str, path: str, **kwargs):
+        self.changes.append(description)
+        if self.dry_run:
+            logger.info(f"[dry-run] {description}")
+            return
+        await self.client.request(method, path, **kwargs)
+        logger.info(f"✓ {description}")
+
+    async def ensure_workspace(self, name: str):
+        if await self.client.get_json(f"/workspaces/{name}") is None:
+            await self._apply(f"create workspace {name}", "POST", "/workspaces", json={"workspace": {"name": name}})
+
+    async def ensure_style(self, style: StyleSpec):
+        live = await self.client.get_text(f"/styles/{style.name}.sld")
+        headers = {"Content-Type": "application/vnd.ogc.sld+xml"}
+        if live is None:
+            await self._apply(
+                f"create style {style.name}", "POST", "/styles",
+                params={"name": style.name}, content=style.sld, headers=headers,
+            )
+        elif _normalize_xml(live) != _normalize_xml(style.sld):
+            await self._apply(f"update style {style.name}", "PUT", f"/styles/{style.name}", content=style.sld, headers=headers)
+
+    async def ensure_mosaic(self, mosaic: MosaicSpec):
+        ws, store, layer = mosaic.workspace, mosaic.store, mosaic.layer_name
+        store_path = f"/workspaces/{ws}/coveragestores/{store}"
+        url = f"file://{mosaic.data_dir}"
+
+        live_store = await self.client.get_json(store_path)
+        if live_store is None:
+            await self._apply(
+                f"create store {ws}:{store}", "POST", f"/workspaces/{ws}/coveragestores",
+                json={"coverageStore": {
+                    "name": store, "type": "ImageMosaic", "enabled": True,
+                    "workspace": {"name": ws}, "url": url,
+                }},
+            )
+        elif _url_path(live_store["coverageStore"].get("url", "")) != _url_path(url):
+            await self._apply(
+                f"update store {ws}:{store} url", "PUT", store_path,
+                json={"coverageStore": {"url": url}},
+            )
+
+        coverage_path = f"{store_path}/coverages/{layer}"
+        coverage = None if live_store is None else await self.client.get_json(coverage_path)
+        if coverage is None:
+            await self._apply(
+                f"create coverage {ws}:{layer}", "POST", f"{store_path}/coverages",
+                json={"coverage": {
+                    "name": layer,
+                    "title": mosaic.title or layer,
+                    "abstract": mosaic.abstract or f"Time-enabled mosaic layer for {layer}",
+                    "enabled": True,
+                }},
+            )
+            if self.dry_run:
+                # Nothing to diff against yet; the remaining settings would all be applied
+                if mosaic.time:
+                    self.changes.append(f"enable time dimension on {ws}:{layer}")
+                if mosaic.default_style:
+                    self.changes.append(f"set default style {mosaic.default_style} on {ws}:{layer}")
+                return
+            coverage = await self.client.get_json(coverage_path)
+
+        await asyncio.gather(
+            self._ensure_time(mosaic, coverage_path, coverage),
+            self._ensure_default_style(mosaic),
+        )
+
+    async def _ensure_time(self, mosaic: MosaicSpec, coverage_path: str, coverage: Dict):
+        if mosaic.time is None:
+            return
+        wanted = mosaic.time.as_dimension_info()
+        entries = (coverage["coverage"].get("metadata") or {}).get("entry", [])
+        if isinstance(entries, dict):
+            entries = [entries]
+        live = next((e.get("dimensionInfo") for e in entries if isinstance(e, dict) and e.get("@key") == "time"), None)
+        if live and all(live.get(k) == v for k, v in wanted.items()):
+            return
+
+        other = [e for e in entries if not (isinstance(e, dict) and e.get("@key") == "time")]
+        await self._apply(
+            f"configure time dimension on {mosaic.workspace}:{mosaic.layer_name}", "PUT", coverage_path,
+            json={"coverage": {"metadata": {"entry": other + [{"@key": "time", "dimensionInfo": wanted}]}}},
+        )
+
+    async def _ensure_default_style(self, mosaic: MosaicSpec):
+        if not mosaic.default_style:
+            return
+        layer_path = f"/layers/{mosaic.workspace}:{mosaic.layer_name}"
+        layer = await self.client.get_json(layer_path)
+        if layer is not None and (layer["layer"].get("defaultStyle") or {}).get("name") == mosaic.default_style:
+            return
+        await self._apply(
+            f"set default style {mosaic.default_style} on {mosaic.workspace}:{mosaic.layer_name}", "PUT", layer_path,
+            json={"layer": {"defaultStyle": {"name": mosaic.default_style}}},
+        )
+
+    async def run(self, spec: CatalogSpec) -> List[str]:
+        # Workspaces and global styles first; every mosaic depends on them
+        await asyncio.gather(
+            *(self.ensure_workspace(ws) for ws in spec.workspaces),
+            *(self.ensure_style(style) for style in spec.styles),
+        )
+        results = await asyncio.gather(*(self.ensure_mosaic(m) for m in spec.mosaics), return_exceptions=True)
+        failures = [(m, r) for m, r in zip(spec.mosaics, results) if isinstance(r, Exception)]
+        for mosaic, error in failures:
+            logger.error(f"✗ {mosaic.workspace}:{mosaic.layer_name}: {error}")
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(spec.mosaics)} mosaics failed to provision")
+        return self.changes
+
+
+async def sync_catalog(spec: CatalogSpec, dry_run: bool = False, concurrency: int = DEFAULT_CONCURRENCY) -> List[str]:
+    """Bring GeoServer in line with ``spec``. Returns the applied (or planned) changes."""
+    async with client_from_settings(concurrency=concurrency) as client:
+        changes = await CatalogSync(client, dry_run=dry_run).run(spec)
+
+    logger.info(f"GeoServer catalog: {len(changes)} change(s){' planned' if dry_run else ''}")
+    return changes
+
+
+# geoserver/*.sld styles scaled for the aggregate mosaics (app.services.aggregates)
+AGGREGATE_STYLES = (
+    "precipitation_monthly_style",
+    "precipitation_annual_style",
+    "precipitation_monthly_anomaly_style",
+    "precipitation_annual_anomaly_style",
+    "temperature_anomaly_style",
+)
+
+
+def aggregate_style(source: str, kind: str, anomaly: bool) -> str:
+    """
+    Default style of a monthly/annual aggregate or anomaly mosaic. Precipitation
+    totals grow with the period, so each period has its own breakpoints;
+    temperature means keep the daily scale and their anomalies share one
+    diverging style.
+    """
+    if source.startswith("temp"):
+        return "temperature_anomaly_style" if anomaly else "temperature_style"
+    return f"precipitation_{kind}_anomaly_style" if anomaly else f"precipitation_{kind}_style"
+
+
+def default_spec() -> CatalogSpec:
+    """The catalog this backend serves (mirrors geoserver/create_time_enabled_mosaic.py)."""
+    from app.config.settings import get_settings
+    from app.services.geoserver import PRECIPITATION_SLD
+
+    settings = get_settings()
+    data_dir = settings.DATA_DIR.rstrip("/")
+    precip_ws = settings.GEOSERVER_WORKSPACE
+    styles_dir = Path(__file__).resolve().parent.parent.parent / "geoserver"
+
+    styles = [StyleSpec("precipitation_style", PRECIPITATION_SLD)]
+    for name in AGGREGATE_STYLES + ("temperature_style",):
+        sld = styles_dir / f"{name}.sld"
+        if sld.exists():
+            styles.append(StyleSpec(name, sld.read_text()))
+
+    mosaics = [
+        MosaicSpec("era5_ws", "temp_max", f"{data_dir}/temp_max",
+                   title="Maximum Temperature (ERA5 Land)", default_style="temperature_style"),
+        MosaicSpec("era5_ws", "temp_min", f"{data_dir}/temp_min",
+                   title="Minimum Temperature (ERA5 Land)", default_style="temperature_style"),
+        MosaicSpec("era5_ws", "temp_mean", f"{data_dir}/temp",
+                   title="Mean Temperature (ERA5 Land)", default_style="temperature_style"),
+        MosaicSpec(precip_ws, "chirps", f"{data_dir}/chirps",
+                   title="CHIRPS Precipitation", default_style="precipitation_style"),
+        MosaicSpec(precip_ws, "merge", f"{data_dir}/merge",
+                   title="MERGE Precipitation", default_style="precipitation_style"),
+    ]
+    # Monthly/annual aggregates and anomalies (app.services.aggregates)
+    from app.services.aggregates import AGGREGATES
+    for source, method in AGGREGATES.items():
+        ws = "era5_ws" if source.startswith("temp") else precip_ws
+        for kind in ("monthly", "annual"):
+            for anomaly in (False, True):
+                name = f"{source}_{kind}_anomaly" if anomaly else f"{source}_{kind}"
+                mosaics.append(MosaicSpec(
+                    ws, name, f"{data_dir}/{name}",
+                    title=f"{source.upper()} {kind} {method}{' anomaly' if anomaly else ''}",
+                    default_style=aggregate_style(source, kind, anomaly),
+                ))
+
+    return CatalogSpec(workspaces=sorted({m.workspace for m in mosaics}), styles=styles, mosaics=mosaics)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Provision GeoServer from the declarative catalog spec")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the changes that would be made")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    planned = asyncio.run(sync_catalog(default_spec(), dry_run=args.dry_run, concurrency=args.concurrency))
+    for change in planned:
+        print(f"  - {change}")
+    print(f"{len(planned)} change(s){' planned' if args.dry_run else ' applied'}")
@@ -0,0 +1,167 @@
+"""
+Legend (colorbar) rendering from SLD ColorMap definitions
+Entries are laid out at equal spacing, as in geoserver/create_colorbar.py, so
+dense low-end breakpoints stay readable. Output is PNG (PIL) or SVG (plain text).
+"""
+import logging
+from io import BytesIO
+from xml.sax.saxutils import escape
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.colormap import apply_colormap, colormap_arrays
+
+logger = logging.getLogger(__name__)
+
+ORIENTATIONS = ("horizontal", "vertical")
+LEGEND_MEDIA_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+# Room reserved for tick labels (px)
+LABEL_SPACE_H = 16
+LABEL_SPACE_V = 40
+
+
+def _visible_entries(colormap: Dict) -> List[Dict]:
+    """Drop fully transparent entries (e.g. the 'no rain' class)."""
+    entries = [e for e in colormap["entries"] if e["opacity"] > 0]
+    if not entries:
+        raise ValueError("ColorMap has no visible entries")
+    return entries
+
+
+def _layout(width: int, height: int, orientation: str) -> Tuple[int, int]:
+    """Return (bar length, bar thickness) in pixels."""
+    if orientation not in ORIENTATIONS:
+        raise ValueError(f"orientation must be one of {ORIENTATIONS}")
+    if orientation == "horizontal":
+        return width, max(1, height - LABEL_SPACE_H)
+    return height, max(1, width - LABEL_SPACE_V)
+
+
+def legend_colors(colormap: Dict, length: int) -> np.ndarray:
+    """
+    RGBA colors (length, 4) along the bar, low values first.
+    Each visible entry gets an equal share of the bar.
+    """
+    entries = _visible_entries(colormap)
+    visible_map = {"type": colormap.get("type", "ramp"), "entries": entries}
+    if visible_map["type"] != "ramp":
+        # Discrete classes: one solid block per entry
+        _, rgba = colormap_arrays(visible_map)
+        return rgba[np.arange(length) * len(entries) // length].astype(np.uint8)
+
+    quantities = np.array([e["quantity"] for e in entries], dtype=np.float64)
+    if len(quantities) == 1:
+        samples = np.full(length, quantities[0])
+    else:
+        positions = np.linspace(0, len(quantities) - 1, length)
+        samples = np.interp(positions, np.arange(len(quantities)), quantities)
+    return apply_colormap(samples[np.newaxis, :], visible_map)[0]
+
+
+def _ticks(colormap: Dict, length: int) -> List[Tuple[float, str]]:
+    """
+    (pixel offset along the bar, label) for every visible entry: at the entry's
+    stop for ramps, at the upper edge of its block for intervals (the quantity
+    is the class's upper bound) and mid-block for values.
+    """
+    entries = _visible_entries(colormap)
+    cmap_type = colormap.get("type", "ramp")
+    if cmap_type != "ramp":
+        shift = 1.0 if cmap_type == "intervals" else 0.5
+        block = length / len(entries)
+        return [(min((i + shift) * block, length - 1), e["label"]) for i, e in enumerate(entries)]
+    if len(entries) == 1:
+        return [(0.0, entries[0]["label"])]
+    step = (length - 1) / (len(entries) - 1)
+    return [(i * step, e["label"]) for i, e in enumerate(entries)]
+
+
+def render_png(colormap: Dict, orientation: str = "vertical", width: int = 60, height: int = 300) -> bytes:
+    from PIL import Image, ImageDraw, ImageFont
+
+    length, thickness = _layout(width, height, orientation)
+    colors = legend_colors(colormap, length)
+
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    if orientation == "horizontal":
+        bar = np.broadcast_to(colors[np.newaxis, :, :], (thickness, length, 4))
+        image.paste(Image.fromarray(np.ascontiguousarray(bar), mode="RGBA"), (0, 0))
+    else:
+        # High values on top
+        bar = np.broadcast_to(colors[::-1, np.newaxis, :], (length, thickness, 4))
+        image.paste(Image.fromarray(np.ascontiguousarray(bar), mode="RGBA"), (0, 0))
+
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    ticks = _ticks(colormap, length)
+    # Skip labels so they are at least ~12 px apart
+    label_step = max(1, -(-len(ticks) * 12 // length))
+    for i, (offset, label) in enumerate(ticks):
+        if i % label_step:
+            continue
+        if orientation == "horizontal":
+            x = min(max(0, offset - 3 * len(label)), width - 6 * len(label))
+            draw.line([(offset, thickness - 3), (offset, thickness)], fill=(0, 0, 0, 255))
+            draw.text((x, thickness + 2), label, fill=(0, 0, 0, 255), font=font)
+        else:
+            y = length - 1 - offset
+            draw.line([(thickness, y), (thickness + 3, y)], fill=(0, 0, 0, 255))
+            draw.text((thickness + 5, min(max(0, y - 5), height - 11)), label, fill=(0, 0, 0, 255), font=font)
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def render_svg(colormap: Dict, orientation: str = "vertical", width: int = 60, height: int = 300) -> bytes:
+    length, thickness = _layout(width, height, orientation)
+    entries = _visible_entries(colormap)
+    ticks = _ticks(colormap, length)
+
+    if orientation == "horizontal":
+        gradient = '<linearGradient id="bar" x1="0" y1="0" x2="1" y2="0">'
+        rect = f'<rect x="0" y="0" width="{length}" height="{thickness}" fill="url(#bar)"/>'
+    else:
+        gradient = '<linearGradient id="bar" x1="0" y1="1" x2="0" y2="0">'
+        rect = f'<rect x="0" y="0" width="{thickness}" height="{length}" fill="url(#bar)"/>'
+
+    # Intervals are drawn as hard steps (two stops per color, equal blocks), ramps as gradients
+    stops = []
+    discrete = colormap.get("type") in ("intervals", "values")
+    denom = len(entries) if discrete else max(len(entries) - 1, 1)
+    for i, e in enumerate(entries):
+        offsets = (i / denom, (i + 1) / denom) if discrete else (i / denom,)
+        for offset in offsets:
+            stops.append(f'<stop offset="{offset:.4f}" stop-color="{e["color"]}" stop-opacity="{e["opacity"]:g}"/>')
+
+    labels = []
+    for offset, label in ticks:
+        if orientation == "horizontal":
+            labels.append(
+                f'<text x="{offset:.1f}" y="{thickness + 12}" text-anchor="middle">{escape(label)}</text>'
+            )
+        else:
+            labels.append(
+                f'<text x="{thickness + 5}" y="{length - 1 - offset + 4:.1f}">{escape(label)}</text>'
+            )
+
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="10">'
+        f'<defs>{gradient}{"".join(stops)}</linearGradient></defs>'
+        f'{rect}{"".join(labels)}</svg>'
+    )
+    return svg.encode("utf-8")
+
+
+def render_legend(colormap: Dict, fmt: str, orientation: str, width: int, height: int) -> bytes:
+    if fmt == "png":
+        return render_png(colormap, orientation, width, height)
+    if fmt == "svg":
+        return render_svg(colormap, orientation, width, height)
+    raise ValueError(f"Unsupported legend format: {fmt}")
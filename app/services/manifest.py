@@ -0,0 +1,420 @@
+"""
+Per-source ingestion manifest
+One small SQLite file per source records what has been ingested for each day:
+
+    DATA_DIR/.manifest/{source}.sqlite
+
+    day | raw_url | raw_checksum | cog_path | checksum | size | min | max | mean | valid_fraction | nan_count | in_cube | updated_at
+
+Flows ask the manifest which days are missing instead of globbing COG
+directories and opening historical cubes, so planning a 10-year range is one
+indexed range query. On first use a manifest is seeded from the files already
+on disk and the historical cube's time axis.
+
+The COG directory's mtime is stored with the manifest and moved along by
+record_cog/forget, so a range query costs one stat() of the directory. Only
+when the directory changed outside the flows (COGs copied in or deleted by
+hand) is it scanned again (reconcile), once. The consistency flow and
+``--reconcile`` force that scan.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIRNAME = ".manifest"
+STAT_FIELDS = ("min", "max", "mean", "valid_fraction", "nan_count")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    day TEXT PRIMARY KEY,
+    raw_url TEXT,
+    raw_checksum TEXT,
+    cog_path TEXT,
+    checksum TEXT,
+    size INTEGER,
+    min REAL,
+    max REAL,
+    mean REAL,
+    valid_fraction REAL,
+    nan_count INTEGER,
+    in_cube INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_in_cube ON entries (in_cube, day);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Columns added after the first release: name -> type
+_ADDED_COLUMNS = {"raw_checksum": "TEXT", "nan_count": "INTEGER"}
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def date_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class Manifest:
+    """Ingestion state of one source. Safe to share between task threads."""
+
+    def __init__(self, db_path: Path, mosaic_dir: Optional[Path] = None):
+        self.db_path = Path(db_path)
+        # COG directory scanned again when its mtime changes (see reconcile)
+        self.mosaic_dir = Path(mosaic_dir) if mosaic_dir is not None else None
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {r[1] for r in self._conn.execute("PRAGMA table_info(entries)")}
+        for name, kind in _ADDED_COLUMNS.items():
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE entries ADD COLUMN {name} {kind}")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    # -- writes --------------------------------------------------------------
+
+    def record_cog(
+        self,
+        day: date,
+        cog_path: Path,
+        raw_url: Optional[str] = None,
+        checksum: Optional[str] = None,
+        stats: Optional[Dict[str, float]] = None,
+    ):
+        """Upsert the COG of one day; ``in_cube`` is left as it was."""
+        cog_path = Path(cog_path)
+        size = cog_path.stat().st_size if cog_path.exists() else None
+        if checksum is None and cog_path.exists():
+            checksum = file_checksum(cog_path)
+        stats = stats or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO entries (day, raw_url, cog_path, checksum, size, min, max, mean, valid_fraction, nan_count, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    raw_url = COALESCE(excluded.raw_url, raw_url),
+                    cog_path = excluded.cog_path,
+                    checksum = excluded.checksum,
+                    size = excluded.size,
+                    min = COALESCE(excluded.min, min),
+                    max = COALESCE(excluded.max, max),
+                    mean = COALESCE(excluded.mean, mean),
+                    valid_fraction = COALESCE(excluded.valid_fraction, valid_fraction),
+                    nan_count = COALESCE(excluded.nan_count, nan_count),
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    day.isoformat(), raw_url, str(cog_path), checksum, size,
+                    *(stats.get(k) for k in STAT_FIELDS), _now(),
+                ),
+            )
+        if self.mosaic_dir is not None and cog_path.parent == self.mosaic_dir:
+            self._mark_dir_seen()
+
+    def record_raw(self, day: date, raw_url: str, raw_checksum: str):
+        """Remember the upstream file and its sha256 so republished files can be detected."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO entries (day, raw_url, raw_checksum, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    raw_url = excluded.raw_url,
+                    raw_checksum = excluded.raw_checksum,
+                    updated_at = excluded.updated_at
+                """,
+                (day.isoformat(), raw_url, raw_checksum, _now()),
+            )
+
+    def mark_in_cube(self, days: Iterable[date], in_cube: bool = True):
+        """Flag days as present in (or removed from) the historical cube."""
+        now = _now()
+        rows = [(day.isoformat(), int(in_cube), now) for day in days]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO entries (day, in_cube, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET in_cube = excluded.in_cube, updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+
+    def forget(self, days: Iterable[date]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM entries WHERE day = ?", [(d.isoformat(),) for d in days])
+        if self.mosaic_dir is not None:
+            self._mark_dir_seen()
+
+    # -- COG directory -------------------------------------------------------
+
+    def _dir_mtime(self) -> Optional[int]:
+        try:
+            return self.mosaic_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _seen_mtime(self) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'mosaic_mtime'").fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+    def _mark_dir_seen(self, mtime: Optional[int] = None):
+        """Record the directory mtime the manifest is in step with."""
+        mtime = self._dir_mtime() if mtime is None else mtime
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('mosaic_mtime', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (None if mtime is None else str(mtime),),
+            )
+
+    def reconcile(self, force: bool = False) -> int:
+        """
+        Catch up with COGs added or deleted outside the flows: scan the COG
+        directory once, record files that are not in the manifest and clear the
+        COG of days whose file is gone. Skipped (one stat) while the directory
+        mtime is the one last seen, unless ``force``. Returns the rows changed.
+        """
+        if self.mosaic_dir is None:
+            return 0
+        mtime = self._dir_mtime()
+        if mtime is None or (not force and mtime == self._seen_mtime()):
+            return 0
+
+        from app.services.consistency import list_granules
+
+        on_disk = {str(self.mosaic_dir / name): day for name, day in list_granules(self.mosaic_dir).items()}
+        prefix = str(self.mosaic_dir) + os.sep
+        with self._lock:
+            recorded = dict(self._conn.execute(
+                "SELECT cog_path, day FROM entries WHERE cog_path IS NOT NULL"
+            ).fetchall())
+        added = [(day.isoformat(), path) for path, day in on_disk.items() if path not in recorded]
+        gone = [day for path, day in recorded.items() if path.startswith(prefix) and path not in on_disk]
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO entries (day, cog_path, size, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    cog_path = excluded.cog_path, checksum = NULL, size = excluded.size,
+                    updated_at = excluded.updated_at
+                """,
+                [(day, path, os.path.getsize(path), now) for day, path in added],
+            )
+            self._conn.executemany(
+                "UPDATE entries SET cog_path = NULL, checksum = NULL, size = NULL, updated_at = ? WHERE day = ?",
+                [(now, day) for day in gone],
+            )
+        self._mark_dir_seen(mtime)
+        if added or gone:
+            logger.warning(
+                f"Manifest {self.db_path.name}: {len(added)} COG(s) added and {len(gone)} removed outside the flows"
+            )
+        return len(added) + len(gone)
+
+    # -- reads ---------------------------------------------------------------
+
+    def _days(self, sql: str, start: date, end: date) -> Set[date]:
+        with self._lock:
+            rows = self._conn.execute(sql, (start.isoformat(), end.isoformat())).fetchall()
+        return {date.fromisoformat(r[0]) for r in rows}
+
+    def cog_dates(self, start: date, end: date) -> Set[date]:
+        self.reconcile()
+        return self._days(
+            "SELECT day FROM entries WHERE day BETWEEN ? AND ? AND cog_path IS NOT NULL", start, end
+        )
+
+    def cube_dates(self, start: date, end: date) -> Set[date]:
+        return self._days(
+            "SELECT day FROM entries WHERE in_cube = 1 AND day BETWEEN ? AND ?", start, end
+        )
+
+    def missing(self, start: date, end: date) -> List[date]:
+        """Days in [start, end] without a recorded COG."""
+        have = self.cog_dates(start, end)
+        return [d for d in date_range(start, end) if d not in have]
+
+    def missing_in_cube(self, start: date, end: date) -> List[date]:
+        """Days in [start, end] not yet appended to the historical cube."""
+        have = self.cube_dates(start, end)
+        return [d for d in date_range(start, end) if d not in have]
+
+    def get(self, day: date) -> Optional[Dict]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM entries WHERE day = ?", (day.isoformat(),))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        if row is None:
+            return None
+        entry = dict(zip(columns, row))
+        entry["in_cube"] = bool(entry["in_cube"])
+        return entry
+
+    def stats_between(self, start: date, end: date) -> List[Dict]:
+        """Recorded per-day statistics in [start, end], oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, {', '.join(STAT_FIELDS)} FROM entries "
+                "WHERE day BETWEEN ? AND ? AND valid_fraction IS NOT NULL ORDER BY day",
+                (start.isoformat(), end.isoformat()),
+            ).fetchall()
+        return [dict(zip(("day",) + STAT_FIELDS, row)) for row in rows]
+
+    def summary(self, start: date, end: date) -> Dict:
+        """
+        Range statistics from the per-day rows: overall min/max, mean weighted by
+        each day's valid fraction, and the number of days with stats.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT COUNT(*), MIN(min), MAX(max),
+                       SUM(mean * valid_fraction) / NULLIF(SUM(valid_fraction), 0),
+                       AVG(valid_fraction)
+                FROM entries WHERE day BETWEEN ? AND ? AND valid_fraction IS NOT NULL
+                """,
+                (start.isoformat(), end.isoformat()),
+            ).fetchone()
+        return dict(zip(("days", "min", "max", "mean", "valid_fraction"), row))
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is None
+
+    # -- seeding -------------------------------------------------------------
+
+    def bootstrap(
+        self,
+        mosaic_dir: Path,
+        cube_days: Optional[Iterable[date]] = None,
+        checksums: bool = False,
+    ) -> int:
+        """
+        Seed the manifest from COGs already on disk ({name}_YYYYMMDD.tif in
+        ``mosaic_dir``) and, optionally, from the dates of an existing cube.
+        Checksums are skipped by default since hashing years of COGs is slow.
+        """
+        from app.services.consistency import list_granules
+
+        mosaic_dir = Path(mosaic_dir)
+        now = _now()
+        rows = []
+        for name, day in list_granules(mosaic_dir).items():
+            path = mosaic_dir / name
+            rows.append((
+                day.isoformat(), str(path),
+                file_checksum(path) if checksums else None,
+                os.path.getsize(path), now,
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO entries (day, cog_path, checksum, size, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(day) DO UPDATE SET
+                    cog_path = excluded.cog_path,
+                    checksum = COALESCE(excluded.checksum, checksum),
+                    size = excluded.size
+                """,
+                rows,
+            )
+        if cube_days:
+            self.mark_in_cube(cube_days)
+        if self.mosaic_dir is not None and mosaic_dir == self.mosaic_dir:
+            self._mark_dir_seen()
+        logger.info(f"Manifest {self.db_path.name}: seeded {len(rows)} COG(s) from {mosaic_dir}")
+        return len(rows)
+
+
+_manifests: Dict[str, Manifest] = {}
+_manifests_lock = threading.Lock()
+
+
+def manifest_path(source: str, data_dir: Optional[Path] = None) -> Path:
+    if data_dir is None:
+        from app.config.settings import get_settings
+        data_dir = get_settings().DATA_DIR
+    return Path(data_dir) / MANIFEST_DIRNAME / f"{source}.sqlite"
+
+
+def manifest_for(source: str, data_dir: Optional[Path] = None) -> Manifest:
+    """
+    Shared Manifest per source (one connection per process). A new, empty
+    manifest is seeded from DATA_DIR/{source} and that source's historical cube.
+    """
+    path = manifest_path(source, data_dir)
+    key = str(path)
+    with _manifests_lock:
+        if key not in _manifests:
+            manifest = Manifest(path, mosaic_dir=path.parent.parent / source)
+            if manifest.is_empty():
+                _seed(manifest, path.parent.parent, source)
+            _manifests[key] = manifest
+        return _manifests[key]
+
+
+def _seed(manifest: Manifest, data_dir: Path, source: str):
+    from app.services.consistency import cube_dates, cube_files
+
+    cube_days = None
+    files, _ = cube_files(data_dir, source)
+    if files:
+        try:
+            cube_days = cube_dates(files)
+        except Exception as e:
+            logger.warning(f"Could not read cube dates for {source}: {e}")
+    manifest.bootstrap(data_dir / source, cube_days)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or seed an ingestion manifest")
+    parser.add_argument("source", help="Source / mosaic directory name, e.g. chirps")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat)
+    parser.add_argument("--data-dir", help="Override settings.DATA_DIR")
+    parser.add_argument("--bootstrap", action="store_true", help="Re-seed from the COG directory first")
+    parser.add_argument("--reconcile", action="store_true", help="Scan the COG directory for files added or removed by hand")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.data_dir:
+        base = Path(args.data_dir)
+    else:
+        from app.config.settings import get_settings
+        base = Path(get_settings().DATA_DIR)
+
+    m = manifest_for(args.source, base)
+    if args.bootstrap:
+        m.bootstrap(base / args.source)
+    if args.reconcile:
+        print(f"{args.source}: {m.reconcile(force=True)} row(s) reconciled")
+    print(f"{args.source}: {len(m.missing(args.start, args.end))} day(s) without COG, "
+          f"{len(m.missing_in_cube(args.start, args.end))} day(s) not in cube")
+    m.close()
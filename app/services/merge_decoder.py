@@ -0,0 +1,208 @@
+"""
+Batched MERGE GRIB2 decoding
+MERGE daily files are single-grid GRIB2 on a 0-360 longitude grid. Instead of
+opening each file through cfgrib (which writes a .idx file, re-sorts the
+longitudes, searches for the variable and flips latitude every time), messages
+are read with eccodes and cropped with a precomputed index:
+
+    grid definition + bbox  ->  (row indices, column indices, transform)
+
+The index is computed once per grid definition and process (lru_cache) and
+applied as plain array indexing, which also performs the longitude wrap and the
+north-up flip. Files are decoded in a process pool and written straight to COGs
+or to the yearly historical cube.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import eccodes
+    ECCODES_AVAILABLE = True
+except ImportError:
+    ECCODES_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Short names the precipitation field has carried across MERGE versions
+PRECIP_SHORT_NAMES = ("prec", "rdp", "pr")
+NODATA = -9999.0
+
+BBox = Tuple[float, float, float, float]  # (W, S, E, N)
+
+
+@dataclass(frozen=True)
+class GridDef:
+    """Regular lat/lon grid as described by the GRIB section 3 keys."""
+    ni: int
+    nj: int
+    lon_first: float
+    lat_first: float
+    di: float
+    dj: float
+    j_positive: bool  # rows run south -> north
+
+    @classmethod
+    def from_message(cls, gid) -> "GridDef":
+        return cls(
+            ni=eccodes.codes_get(gid, "Ni"),
+            nj=eccodes.codes_get(gid, "Nj"),
+            lon_first=round(eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees"), 6),
+            lat_first=round(eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees"), 6),
+            di=round(eccodes.codes_get(gid, "iDirectionIncrementInDegrees"), 6),
+            dj=round(eccodes.codes_get(gid, "jDirectionIncrementInDegrees"), 6),
+            j_positive=bool(eccodes.codes_get(gid, "jScansPositively")),
+        )
+
+
+@dataclass(frozen=True)
+class GridWindow:
+    rows: np.ndarray       # source row per output row, north first
+    cols: np.ndarray       # source column per output column, west first
+    latitudes: np.ndarray  # cell centres, north first
+    longitudes: np.ndarray  # cell centres in -180..180, west first
+    transform: Tuple[float, float, float, float, float, float]  # GDAL geotransform
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.rows), len(self.cols)
+
+
+@lru_cache(maxsize=16)
+def grid_window(grid: GridDef, bbox: BBox) -> GridWindow:
+    """
+    Rows/columns of ``grid`` inside ``bbox`` ordered north->south and
+    west->east, with longitudes wrapped to -180..180.
+    """
+    west, south, east, north = bbox
+    lons = grid.lon_first + np.arange(grid.ni) * grid.di
+    lons = ((lons + 180.0) % 360.0) - 180.0
+    lat_step = grid.dj if grid.j_positive else -grid.dj
+    lats = grid.lat_first + np.arange(grid.nj) * lat_step
+
+    # Same inclusive selection as clip_box on cell centres
+    col_order = np.argsort(lons, kind="stable")
+    cols = col_order[(lons[col_order] >= west) & (lons[col_order] <= east)]
+    row_order = np.argsort(-lats, kind="stable")
+    rows = row_order[(lats[row_order] >= south) & (lats[row_order] <= north)]
+    if not len(rows) or not len(cols):
+        raise ValueError(f"bbox {bbox} does not intersect the grid {grid}")
+
+    out_lons = lons[cols]
+    out_lats = lats[rows]
+    transform = (
+        float(out_lons[0] - grid.di / 2), grid.di, 0.0,
+        float(out_lats[0] + grid.dj / 2), 0.0, -grid.dj,
+    )
+    return GridWindow(rows=rows, cols=cols, latitudes=out_lats, longitudes=out_lons, transform=transform)
+
+
+@dataclass
+class DecodedField:
+    day: date
+    values: np.ndarray  # float32, NaN where missing
+    window: GridWindow
+    short_name: str
+
+
+def decode_file(path: Path, bbox: BBox, short_names: Sequence[str] = PRECIP_SHORT_NAMES) -> DecodedField:
+    """Decode the precipitation message of one MERGE file, cropped to ``bbox``."""
+    if not ECCODES_AVAILABLE:
+        raise ImportError("eccodes is required for batched MERGE decoding")
+
+    with open(path, "rb") as fh:
+        while True:
+            gid = eccodes.codes_grib_new_from_file(fh)
+            if gid is None:
+                break
+            try:
+                short_name = eccodes.codes_get(gid, "shortName")
+                if short_name not in short_names:
+                    continue
+                grid = GridDef.from_message(gid)
+                window = grid_window(grid, tuple(bbox))
+                values = eccodes.codes_get_values(gid).reshape(grid.nj, grid.ni)
+                missing = eccodes.codes_get(gid, "missingValue")
+                day = datetime.strptime(str(eccodes.codes_get(gid, "dataDate")), "%Y%m%d").date()
+            finally:
+                eccodes.codes_release(gid)
+
+            cropped = values[np.ix_(window.rows, window.cols)].astype(np.float32)
+            cropped[cropped == missing] = np.nan
+            return DecodedField(day=day, values=cropped, window=window, short_name=short_name)
+
+    raise ValueError(f"No precipitation message ({', '.join(short_names)}) in {path}")
+
+
+def _decode_or_none(path: Path, bbox: BBox) -> Optional[DecodedField]:
+    try:
+        return decode_file(path, bbox)
+    except Exception as e:
+        logger.warning(f"Could not decode {path}: {e}")
+        return None
+
+
+def decode_many(paths: Iterable[Path], bbox: BBox, workers: Optional[int] = None) -> List[DecodedField]:
+    """Decode many files in a process pool; undecodable files are skipped. Sorted by date."""
+    paths = list(paths)
+    workers = workers or min(len(paths), os.cpu_count() or 1) or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fields = pool.map(_decode_or_none, paths, [tuple(bbox)] * len(paths), chunksize=chunksize)
+        return sorted((f for f in fields if f is not None), key=lambda f: f.day)
+
+
+def write_cog(field: DecodedField, output_path: Path) -> Path:
+    """Write one decoded day as a north-up COG with the merge COG profile."""
+    from rasterio.transform import Affine
+
+    from app.services import cog
+
+    values = np.where(np.isnan(field.values), NODATA, field.values).astype(np.float32)
+    return cog.write_array(
+        values, Affine.from_gdal(*field.window.transform), output_path,
+        nodata=NODATA, source="merge",
+    )
+
+
+def write_year_cube(fields: List[DecodedField], cube_path: Path, var: str = "precip") -> Path:
+    """
+    Write (or merge into) a yearly historical NetCDF. Latitude is stored
+    ascending, as in the cubes built from cfgrib.
+    """
+    import pandas as pd
+    import xarray as xr
+
+    if not fields:
+        raise ValueError("No fields to write")
+    window = fields[0].window
+    stack = np.stack([f.values for f in fields])[:, ::-1, :]
+    new = xr.Dataset(
+        {var: (("time", "latitude", "longitude"), stack)},
+        coords={
+            "time": pd.to_datetime([f.day for f in fields]),
+            "latitude": window.latitudes[::-1],
+            "longitude": window.longitudes,
+        },
+    )
+
+    if cube_path.exists():
+        with xr.open_dataset(cube_path) as ds:
+            existing = ds[[var]].load()
+        keep = ~existing.time.isin(new.time.values)
+        new = xr.concat([existing.sel(time=keep), new], dim="time").sortby("time")
+
+    cube_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cube_path.with_suffix(".nc.tmp")
+    encoding = {var: {"zlib": True, "complevel": 4, "dtype": "float32"}}
+    new.to_netcdf(tmp_path, mode="w", encoding=encoding, engine="netcdf4")
+    tmp_path.replace(cube_path)
+    logger.info(f"Wrote {len(fields)} day(s) to {cube_path}")
+    return cube_path
@@ -0,0 +1,350 @@
+"""
+GeoPackage granule index for ImageMosaic stores
+Replaces the GeoServer-generated shapefile index (and the scripts that patch
+its dates) with a SQLite/GeoPackage table per mosaic:
+
+    fid, the_geom (footprint), location (file name), ingestion (date)
+
+with an R-tree on the footprint and a B-tree on ingestion, so time lookups
+stay fast past tens of thousands of granules. The index is written with
+sqlite3 only; GeoServer reads it through datastore.properties.
+
+Writes go through this module (build_index / upsert_granules / remove_granules),
+which keeps the R-tree in step itself instead of relying on GeoPackage triggers.
+"""
+import logging
+import re
+import sqlite3
+import struct
+from contextlib import closing
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+GEOM_COLUMN = "the_geom"
+SRS_ID = 4326
+DATE_REGEX = re.compile(r"(\d{8})")
+
+# 'GPKG' and GeoPackage 1.3
+GPKG_APPLICATION_ID = 0x47504B47
+GPKG_USER_VERSION = 10300
+
+Bounds = Tuple[float, float, float, float]  # (minx, miny, maxx, maxy)
+
+
+def index_path(mosaic_dir: Path, name: Optional[str] = None) -> Path:
+    return Path(mosaic_dir) / f"{name or Path(mosaic_dir).name}.gpkg"
+
+
+def index_exists(mosaic_dir: Path, name: Optional[str] = None) -> bool:
+    return index_path(mosaic_dir, name).exists()
+
+
+def granule_date(location: str) -> Optional[date]:
+    """Ingestion date from a *_YYYYMMDD.tif file name."""
+    match = DATE_REGEX.search(Path(location).name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def granule_bounds(path: Path) -> Bounds:
+    import rasterio
+    with rasterio.open(path) as src:
+        b = src.bounds
+    return (b.left, b.bottom, b.right, b.top)
+
+
+# ---------------------------------------------------------------------------
+# GeoPackage encoding
+# ---------------------------------------------------------------------------
+
+def encode_polygon(bounds: Bounds, srs_id: int = SRS_ID) -> bytes:
+    """GeoPackage geometry blob (little-endian, XY envelope) for a bbox polygon."""
+    minx, miny, maxx, maxy = bounds
+    header = b"GP" + struct.pack("<BBi4d", 0, 0b011, srs_id, minx, maxx, miny, maxy)
+    ring = [(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)]
+    wkb = struct.pack("<BIII", 1, 3, 1, len(ring)) + b"".join(struct.pack("<2d", x, y) for x, y in ring)
+    return header + wkb
+
+
+def decode_envelope(blob: bytes) -> Bounds:
+    """Envelope (minx, miny, maxx, maxy) from a blob written by encode_polygon."""
+    minx, maxx, miny, maxy = struct.unpack_from("<4d", blob, 8)
+    return (minx, miny, maxx, maxy)
+
+
+def _timestamp(value) -> str:
+    if isinstance(value, datetime):
+        value = value.astimezone(timezone.utc) if value.tzinfo else value
+        return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return f"{value.isoformat()}T00:00:00.000Z"
+
+
+def _rtree(table: str) -> str:
+    return f"rtree_{table}_{GEOM_COLUMN}"
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(db_path), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def create_index(db_path: Path, table: str):
+    """Create an empty GeoPackage with the granule table and its indexes (idempotent)."""
+    if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table):
+        raise ValueError(f"Invalid table name: {table}")
+
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    with closing(_connect(db_path)) as conn, conn:
+        conn.execute(f"PRAGMA application_id = {GPKG_APPLICATION_ID}")
+        conn.execute(f"PRAGMA user_version = {GPKG_USER_VERSION}")
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+                srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+                organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+            CREATE TABLE IF NOT EXISTS gpkg_contents (
+                table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+                description TEXT DEFAULT '', last_change DATETIME NOT NULL,
+                min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE,
+                srs_id INTEGER REFERENCES gpkg_spatial_ref_sys(srs_id));
+            CREATE TABLE IF NOT EXISTS gpkg_geometry_columns (
+                table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+                srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+                CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name));
+            CREATE TABLE IF NOT EXISTS gpkg_extensions (
+                table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+                definition TEXT NOT NULL, scope TEXT NOT NULL,
+                CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name));
+
+            CREATE TABLE IF NOT EXISTS "{table}" (
+                fid INTEGER PRIMARY KEY AUTOINCREMENT,
+                {GEOM_COLUMN} POLYGON,
+                location TEXT NOT NULL UNIQUE,
+                ingestion DATETIME);
+            CREATE INDEX IF NOT EXISTS "idx_{table}_ingestion" ON "{table}" (ingestion);
+            CREATE VIRTUAL TABLE IF NOT EXISTS "{_rtree(table)}" USING rtree(id, minx, maxx, miny, maxy);
+        """)
+        conn.executemany(
+            "INSERT OR IGNORE INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                ("Undefined cartesian SRS", -1, "NONE", -1, "undefined", None),
+                ("Undefined geographic SRS", 0, "NONE", 0, "undefined", None),
+                ("WGS 84 geodetic", 4326, "EPSG", 4326,
+                 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],'
+                 'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433],AUTHORITY["EPSG","4326"]]',
+                 None),
+            ],
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, identifier, last_change, srs_id) "
+            "VALUES (?, 'features', ?, ?, ?)",
+            (table, table, _timestamp(datetime.now(timezone.utc)), SRS_ID),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO gpkg_geometry_columns VALUES (?, ?, 'POLYGON', ?, 0, 0)",
+            (table, GEOM_COLUMN, SRS_ID),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO gpkg_extensions VALUES (?, ?, 'gpkg_rtree_index', "
+            "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')",
+            (table, GEOM_COLUMN),
+        )
+
+
+def _refresh_contents(conn: sqlite3.Connection, table: str):
+    extent = conn.execute(
+        f'SELECT min(minx), min(miny), max(maxx), max(maxy) FROM "{_rtree(table)}"'
+    ).fetchone()
+    conn.execute(
+        "UPDATE gpkg_contents SET last_change = ?, min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE table_name = ?",
+        (_timestamp(datetime.now(timezone.utc)), *extent, table),
+    )
+
+
+def upsert_granules(db_path: Path, table: str, granules: Iterable[Tuple[str, Optional[date], Bounds]]) -> int:
+    """
+    Insert or replace granules, given as (location, ingestion date, bounds),
+    in one transaction. Returns the number of rows written.
+    """
+    count = 0
+    with closing(_connect(db_path)) as conn, conn:
+        for location, ingestion, bounds in granules:
+            conn.execute(
+                f'INSERT INTO "{table}" ({GEOM_COLUMN}, location, ingestion) VALUES (?, ?, ?) '
+                f"ON CONFLICT(location) DO UPDATE SET {GEOM_COLUMN} = excluded.{GEOM_COLUMN}, "
+                f"ingestion = excluded.ingestion",
+                (encode_polygon(bounds), location, _timestamp(ingestion) if ingestion else None),
+            )
+            fid = conn.execute(f'SELECT fid FROM "{table}" WHERE location = ?', (location,)).fetchone()[0]
+            minx, miny, maxx, maxy = bounds
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{_rtree(table)}" VALUES (?, ?, ?, ?, ?)',
+                (fid, minx, maxx, miny, maxy),
+            )
+            count += 1
+        _refresh_contents(conn, table)
+    return count
+
+
+def remove_granules(db_path: Path, table: str, locations: Sequence[str]) -> int:
+    removed = 0
+    with closing(_connect(db_path)) as conn, conn:
+        for location in locations:
+            row = conn.execute(f'SELECT fid FROM "{table}" WHERE location = ?', (location,)).fetchone()
+            if row is None:
+                continue
+            conn.execute(f'DELETE FROM "{table}" WHERE fid = ?', row)
+            conn.execute(f'DELETE FROM "{_rtree(table)}" WHERE id = ?', row)
+            removed += 1
+        _refresh_contents(conn, table)
+    return removed
+
+
+def indexed_granules(db_path: Path, table: str) -> List[Tuple[str, Optional[str]]]:
+    """All (location, ingestion) rows, ordered by ingestion."""
+    with closing(_connect(db_path)) as conn:
+        return conn.execute(f'SELECT location, ingestion FROM "{table}" ORDER BY ingestion').fetchall()
+
+
+def granules_between(db_path: Path, table: str, start: date, end: date) -> List[str]:
+    """Locations with ingestion in [start, end] (uses the ingestion index)."""
+    with closing(_connect(db_path)) as conn:
+        rows = conn.execute(
+            f'SELECT location FROM "{table}" WHERE ingestion >= ? AND ingestion < ? ORDER BY ingestion',
+            (_timestamp(start), _timestamp(end + timedelta(days=1))),
+        ).fetchall()
+    return [r[0] for r in rows]
+
+
+# ---------------------------------------------------------------------------
+# Mosaic directory level
+# ---------------------------------------------------------------------------
+
+def write_datastore_properties(mosaic_dir: Path, db_path: Path) -> Path:
+    path = Path(mosaic_dir) / "datastore.properties"
+    path.write_text(
+        "SPI=org.geotools.geopkg.GeoPkgDataStoreFactory\n"
+        f"database={Path(db_path).resolve()}\n"
+        "dbtype=geopkg\n"
+    )
+    return path
+
+
+def write_indexer_properties(mosaic_dir: Path, name: str) -> Path:
+    """indexer.properties pointing the mosaic at the GeoPackage table, plus timeregex.properties."""
+    mosaic_dir = Path(mosaic_dir)
+    (mosaic_dir / "timeregex.properties").write_text(
+        "# timeregex.properties\n"
+        "# Extract date from filename pattern: *_YYYYMMDD.tif\n"
+        "regex=.*([0-9]{8}).*\n"
+        "format=yyyyMMdd\n"
+    )
+    path = mosaic_dir / "indexer.properties"
+    path.write_text(
+        "# indexer.properties\n"
+        "# Time-enabled mosaic backed by a GeoPackage index\n"
+        f"Name={name}\n"
+        f"TypeName={name}\n"
+        "TimeAttribute=ingestion\n"
+        f"Schema=*{GEOM_COLUMN}:Polygon,location:String,ingestion:java.util.Date\n"
+        "PropertyCollectors=TimestampFileNameExtractorSPI[timeregex](ingestion)\n"
+        "Wildcard=*.tif\n"
+        "AbsolutePath=false\n"
+        "Caching=false\n"
+        "CanBeEmpty=true\n"
+    )
+    return path
+
+
+def build_index(
+    mosaic_dir: Path,
+    name: Optional[str] = None,
+    bounds: Optional[Bounds] = None,
+    rebuild: bool = False,
+) -> Path:
+    """
+    Build (or top up) the GeoPackage index for every *.tif in ``mosaic_dir``
+    and write the datastore/indexer properties next to it.
+
+    Args:
+        mosaic_dir: Directory with the mosaic granules
+        name: Mosaic/table name (default: directory name)
+        bounds: Footprint shared by all granules; read per file with rasterio if None
+        rebuild: Drop the existing index first
+    """
+    mosaic_dir = Path(mosaic_dir)
+    name = name or mosaic_dir.name
+    db_path = index_path(mosaic_dir, name)
+    if rebuild and db_path.exists():
+        db_path.unlink()
+
+    create_index(db_path, name)
+    existing = {location for location, _ in indexed_granules(db_path, name)}
+    on_disk = sorted(p for p in mosaic_dir.glob("*.tif"))
+
+    new = [p for p in on_disk if p.name not in existing]
+    written = upsert_granules(
+        db_path, name,
+        ((p.name, granule_date(p.name), bounds or granule_bounds(p)) for p in new),
+    )
+    stale = sorted(existing - {p.name for p in on_disk})
+    removed = remove_granules(db_path, name, stale) if stale else 0
+
+    write_datastore_properties(mosaic_dir, db_path)
+    write_indexer_properties(mosaic_dir, name)
+    logger.info(f"Mosaic index {db_path}: {written} added, {removed} removed, {len(on_disk)} granules")
+    return db_path
+
+
+def add_granules(mosaic_dir: Path, paths: Sequence[Path], bounds: Optional[Bounds] = None) -> int:
+    """Incremental insert used by the ingestion flows; paths that no longer exist are removed."""
+    mosaic_dir = Path(mosaic_dir)
+    name = mosaic_dir.name
+    db_path = index_path(mosaic_dir, name)
+    present = [Path(p) for p in paths if Path(p).exists()]
+    missing = [Path(p).name for p in paths if not Path(p).exists()]
+
+    written = upsert_granules(
+        db_path, name,
+        ((p.name, granule_date(p.name), bounds or granule_bounds(p)) for p in present),
+    )
+    if missing:
+        written += remove_granules(db_path, name, missing)
+    return written
+
+
+def build_all(data_dir: Path, rebuild: bool = False) -> List[Path]:
+    """Build an index for every sub-directory of ``data_dir`` that holds *.tif granules."""
+    built = []
+    for mosaic_dir in sorted(p for p in Path(data_dir).iterdir() if p.is_dir()):
+        if mosaic_dir.name.startswith(".") or not any(mosaic_dir.glob("*.tif")):
+            continue
+        try:
+            built.append(build_index(mosaic_dir, rebuild=rebuild))
+        except Exception as e:
+            logger.error(f"Failed to index {mosaic_dir}: {e}")
+    return built
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build GeoPackage granule indexes for ImageMosaic directories")
+    parser.add_argument("paths", nargs="*", help="Mosaic directories (default: every mosaic under DATA_DIR)")
+    parser.add_argument("--rebuild", action="store_true", help="Drop existing indexes first")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.paths:
+        for p in args.paths:
+            build_index(Path(p), rebuild=args.rebuild)
+    else:
+        from app.config.settings import get_settings
+        build_all(Path(get_settings().DATA_DIR), rebuild=args.rebuild)
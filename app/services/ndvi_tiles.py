@@ -0,0 +1,444 @@
+"""
+Tiled, memory-bounded NDVI compositing
+The output grid (bbox at a fixed resolution) is split into square tiles. For
+each acquisition date, every tile is filled from only the scenes whose
+footprint intersects it, each band read through a WarpedVRT onto that tile (so
+only the source blocks under the tile are fetched), and the per-tile composite
+is written straight into its chunk of the output NetCDF. Band reads fan out
+over a thread pool with per-asset retries (GDAL_HTTP_ENV configures the
+remote reads). Peak memory is one tile x (bands + scenes for a
+median), independent of the extent of the bbox.
+
+    grid = TileGrid.from_resolution((west, south, east, north), 0.0025, tile_size=2048)
+    days = build_composites(items, grid, MODIS, out_path, method="max")
+"""
+import logging
+import os
+import time
+import warnings
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Bounds = Tuple[float, float, float, float]  # west, south, east, north
+
+# Remote COG reads: no directory listing on open, HTTP/2 multiplexing over one
+# connection per host, GDAL-level retries for transient HTTP errors and a
+# shared block/VSI cache so reopening an asset per tile does not refetch headers
+GDAL_HTTP_ENV = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MAX_RETRY": "3",
+    "GDAL_HTTP_RETRY_DELAY": "1",
+    "VSI_CACHE": "TRUE",
+    "VSI_CACHE_SIZE": str(64 * 1024 * 1024),
+    "GDAL_CACHEMAX": 512,  # MB; rasterio.Env only accepts an int here
+}
+
+
+# ---------------------------------------------------------------------------
+# Output tiling
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Tile:
+    row_off: int
+    col_off: int
+    height: int
+    width: int
+    bounds: Bounds
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    def intersects(self, other: Bounds) -> bool:
+        west, south, east, north = self.bounds
+        return other[0] < east and other[2] > west and other[1] < north and other[3] > south
+
+
+@dataclass(frozen=True)
+class TileGrid:
+    """North-up EPSG:4326 grid of width x height cells over bounds, cut into tiles."""
+    west: float
+    south: float
+    east: float
+    north: float
+    width: int
+    height: int
+    tile_size: int = 2048
+
+    @classmethod
+    def from_resolution(
+        cls, bounds: Bounds, resolution: float, max_pixels: Optional[int] = None, tile_size: int = 2048
+    ) -> "TileGrid":
+        west, south, east, north = bounds
+        width = max(1, int((east - west) / resolution))
+        height = max(1, int((north - south) / resolution))
+        if max_pixels:
+            width, height = min(width, max_pixels), min(height, max_pixels)
+        return cls(west, south, east, north, width, height, tile_size)
+
+    @property
+    def xres(self) -> float:
+        return (self.east - self.west) / self.width
+
+    @property
+    def yres(self) -> float:
+        return (self.north - self.south) / self.height
+
+    def transform(self, tile: Optional[Tile] = None):
+        from rasterio.transform import from_origin
+
+        row, col = (tile.row_off, tile.col_off) if tile else (0, 0)
+        return from_origin(self.west + col * self.xres, self.north - row * self.yres, self.xres, self.yres)
+
+    def latitudes(self) -> np.ndarray:
+        return self.north - (np.arange(self.height) + 0.5) * self.yres
+
+    def longitudes(self) -> np.ndarray:
+        return self.west + (np.arange(self.width) + 0.5) * self.xres
+
+    def tiles(self) -> Iterator[Tile]:
+        for row in range(0, self.height, self.tile_size):
+            for col in range(0, self.width, self.tile_size):
+                h = min(self.tile_size, self.height - row)
+                w = min(self.tile_size, self.width - col)
+                bounds = (
+                    self.west + col * self.xres, self.north - (row + h) * self.yres,
+                    self.west + (col + w) * self.xres, self.north - row * self.yres,
+                )
+                yield Tile(row, col, h, w, bounds)
+
+
+# ---------------------------------------------------------------------------
+# Compositing
+# ---------------------------------------------------------------------------
+
+class StreamingComposite:
+    """Temporal composite of one tile, fed one scene at a time."""
+
+    def __init__(self, shape: Tuple[int, int], method: str = "max"):
+        if method not in ("max", "median"):
+            raise ValueError(f"Unknown composite method '{method}'")
+        self.method = method
+        self.count = 0
+        self._max = np.full(shape, np.nan, dtype=np.float32) if method == "max" else None
+        self._stack: List[np.ndarray] = []
+
+    def add(self, values: np.ndarray):
+        if np.isnan(values).all():
+            return
+        self.count += 1
+        if self.method == "max":
+            np.fmax(self._max, values, out=self._max)
+        else:
+            self._stack.append(values.astype(np.float32, copy=False))
+
+    def result(self) -> Optional[np.ndarray]:
+        if not self.count:
+            return None
+        if self.method == "max":
+            return self._max
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN cells stay NaN
+            return np.nanmedian(np.stack(self._stack), axis=0).astype(np.float32)
+
+
+# ---------------------------------------------------------------------------
+# Products
+# ---------------------------------------------------------------------------
+
+def _sentinel2_ndvi(bands: Dict[str, np.ndarray]) -> np.ndarray:
+    nir, red = bands["B08"], bands["B04"]
+    total = nir + red
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ndvi = np.where(total != 0, (nir - red) / total, np.nan)
+    return np.clip(ndvi, -1, 1).astype(np.float32)
+
+
+def _modis_ndvi(bands: Dict[str, np.ndarray]) -> np.ndarray:
+    ndvi = bands["250m_16_days_NDVI"] * 0.0001
+    with np.errstate(invalid="ignore"):
+        return np.where((ndvi < -1) | (ndvi > 1), np.nan, ndvi).astype(np.float32)
+
+
+@dataclass(frozen=True)
+class NdviProduct:
+    name: str
+    assets: Tuple[str, ...]
+    compute: Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+
+SENTINEL2 = NdviProduct("sentinel2", ("B08", "B04"), _sentinel2_ndvi)
+MODIS = NdviProduct("modis", ("250m_16_days_NDVI",), _modis_ndvi)
+
+
+# ---------------------------------------------------------------------------
+# Reading and writing
+# ---------------------------------------------------------------------------
+
+def item_date(item) -> date:
+    """Acquisition date of a STAC item (composites only carry start_datetime)."""
+    when = item.datetime or item.properties.get("start_datetime")
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when.replace("Z", "+00:00"))
+    return when.date()
+
+
+def read_on_tile(src, grid: TileGrid, tile: Tile) -> np.ndarray:
+    """Band 1 of an open dataset resampled onto ``tile``; NaN for nodata/outside."""
+    from rasterio.enums import Resampling
+    from rasterio.vrt import WarpedVRT
+
+    with WarpedVRT(
+        src, crs="EPSG:4326", transform=grid.transform(tile), width=tile.width, height=tile.height,
+        resampling=Resampling.bilinear,
+    ) as vrt:
+        return vrt.read(1, masked=True).astype(np.float32).filled(np.nan)
+
+
+def _create_output(path: Path, grid: TileGrid, days: List[date], attrs: Dict[str, str]):
+    import netCDF4
+
+    nc = netCDF4.Dataset(path, "w", format="NETCDF4")
+    nc.setncatts(attrs)
+    nc.createDimension("time", len(days))
+    nc.createDimension("latitude", grid.height)
+    nc.createDimension("longitude", grid.width)
+    t = nc.createVariable("time", "i4", ("time",))
+    t.units, t.calendar = "days since 1970-01-01", "standard"
+    t[:] = [(d - date(1970, 1, 1)).days for d in days]
+    nc.createVariable("latitude", "f8", ("latitude",))[:] = grid.latitudes()
+    nc.createVariable("longitude", "f8", ("longitude",))[:] = grid.longitudes()
+    # One chunk per output tile and day, so each tile write touches one chunk
+    nc.createVariable(
+        "ndvi", "f4", ("time", "latitude", "longitude"), zlib=True, complevel=4,
+        fill_value=np.float32(np.nan),
+        chunksizes=(1, min(grid.tile_size, grid.height), min(grid.tile_size, grid.width)),
+    )
+    return nc
+
+
+def _copy_days(src_path: Path, dst_path: Path, grid: TileGrid, keep: List[int], days: List[date], attrs: Dict[str, str]):
+    """Copy time steps ``keep`` of a composite file into a new one, tile by tile."""
+    import netCDF4
+
+    dst = _create_output(dst_path, grid, days, attrs)
+    try:
+        with netCDF4.Dataset(src_path) as src:
+            for new_t, t in enumerate(keep):
+                for tile in grid.tiles():
+                    rows = slice(tile.row_off, tile.row_off + tile.height)
+                    cols = slice(tile.col_off, tile.col_off + tile.width)
+                    dst["ndvi"][new_t, rows, cols] = src["ndvi"][t, rows, cols]
+    finally:
+        dst.close()
+
+
+def read_asset(href: str, grid: TileGrid, tile: Tile, retries: int = 3, retry_delay: float = 2.0) -> np.ndarray:
+    """
+    Open ``href`` and read it onto ``tile``, retrying this asset alone on
+    failure. Runs in pool threads: each call opens its own handle (rasterio
+    datasets are not thread-safe) and GDAL's VSI cache makes reopening cheap.
+    """
+    import rasterio
+
+    for attempt in range(retries + 1):
+        try:
+            with rasterio.Env(**GDAL_HTTP_ENV), rasterio.open(href) as src:
+                return read_on_tile(src, grid, tile)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"  Read failed ({e}); retry {attempt + 1}/{retries} for {href.split('?')[0]}")
+            time.sleep(retry_delay * 2 ** attempt)
+
+
+# Tiles composited at once: the next tile's reads start while the last
+# scenes of the current one are still in flight
+OPEN_TILES = 2
+
+
+@dataclass
+class _TileJob:
+    t: int
+    tile: Tile
+    composite: StreamingComposite
+    scenes: Deque[Tuple[str, Dict[str, str]]]  # (scene id, band -> href) not yet submitted
+    reading: int = 0                            # scenes with reads in flight
+
+    @property
+    def done(self) -> bool:
+        return not self.scenes and self.reading == 0
+
+
+@dataclass
+class _SceneRead:
+    job: _TileJob
+    scene_id: str
+    remaining: int
+    bands: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[Exception] = None
+
+
+def build_composites(
+    items: Sequence,
+    grid: TileGrid,
+    product: NdviProduct,
+    output_path: Path,
+    method: str = "max",
+    sign: Callable[[str], str] = lambda href: href,
+    attrs: Optional[Dict[str, str]] = None,
+    workers: int = 8,
+    retries: int = 3,
+    retry_delay: float = 2.0,
+) -> List[date]:
+    """
+    Composite ``items`` per acquisition date onto ``grid`` tile by tile and
+    write them to a NetCDF (ndvi: time, latitude, longitude) at
+    ``output_path`` (tmp file + rename). Returns the dates written: a date
+    on which no scene could be read is dropped, and RuntimeError is raised
+    when that leaves none.
+
+    Scene x band reads run on a pool of ``workers`` threads, submitted one
+    scene at a time with at most 2 x workers reads in flight (never more than
+    OPEN_TILES tiles open). Each scene is folded into its tile's composite as
+    soon as all its bands arrive, so memory is bounded by the reads in flight,
+    not by the number of scenes over a tile. Compositing and NetCDF writes
+    stay on the calling thread.
+    """
+    by_day: Dict[date, list] = {}
+    for item in items:
+        by_day.setdefault(item_date(item), []).append(item)
+    days = sorted(by_day)
+    tiles = list(grid.tiles())
+    logger.info(f"{product.name}: {len(items)} scene(s) on {len(days)} date(s), {len(tiles)} tile(s) of {grid.tile_size}px")
+
+    def tile_jobs():
+        for t, day in enumerate(days):
+            scenes = []
+            for item in by_day[day]:
+                try:
+                    scenes.append((item.id, tuple(item.bbox), {a: sign(item.assets[a].href) for a in product.assets}))
+                except Exception as e:
+                    logger.warning(f"  Skipping scene {item.id}: {e}")
+            for tile in tiles:
+                yield t, tile, [s for s in scenes if tile.intersects(s[1])]
+
+    def finish(job: _TileJob):
+        values = job.composite.result()
+        if values is not None:
+            tile = job.tile
+            nc["ndvi"][job.t, tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width] = values
+            written[job.t] += 1
+
+    def fold(scene: _SceneRead):
+        job = scene.job
+        job.reading -= 1
+        if scene.error is not None:
+            logger.warning(f"  Dropped scene {scene.scene_id} on tile {job.tile.row_off},{job.tile.col_off}: {scene.error}")
+            return
+        try:
+            job.composite.add(product.compute(scene.bands))
+        except Exception as e:
+            logger.warning(f"  Dropped scene {scene.scene_id} on tile {job.tile.row_off},{job.tile.col_off}: {e}")
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    nc = _create_output(tmp_path, grid, days, attrs or {})
+    written = [0] * len(days)
+    workers = max(1, workers)
+    max_reads = max(2 * workers, len(product.assets))
+    jobs = tile_jobs()
+    exhausted = False
+    open_jobs: List[_TileJob] = []
+    in_flight: Dict[Any, Tuple[_SceneRead, str]] = {}
+
+    def next_scene() -> Optional[Tuple[_TileJob, Tuple[str, Dict[str, str]]]]:
+        nonlocal exhausted
+        while True:
+            for job in open_jobs:
+                if job.scenes:
+                    return job, job.scenes.popleft()
+            if exhausted or len(open_jobs) >= OPEN_TILES:
+                return None
+            nxt = next(jobs, None)
+            if nxt is None:
+                exhausted = True
+                return None
+            t, tile, scenes = nxt
+            open_jobs.append(_TileJob(
+                t, tile, StreamingComposite(tile.shape, method),
+                deque((scene_id, hrefs) for scene_id, _, hrefs in scenes),
+            ))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ndvi-read") as pool:
+            while True:
+                while len(in_flight) + len(product.assets) <= max_reads:
+                    picked = next_scene()
+                    if picked is None:
+                        break
+                    job, (scene_id, hrefs) = picked
+                    scene = _SceneRead(job, scene_id, remaining=len(hrefs))
+                    job.reading += 1
+                    for band, href in hrefs.items():
+                        in_flight[pool.submit(read_asset, href, grid, job.tile, retries, retry_delay)] = (scene, band)
+
+                for job in [j for j in open_jobs if j.done]:
+                    open_jobs.remove(job)
+                    finish(job)
+                if not in_flight:
+                    # Every open tile is finished; stop once no tile is left to open
+                    if exhausted:
+                        break
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scene, band = in_flight.pop(future)
+                    try:
+                        scene.bands[band] = future.result()
+                    except Exception as e:
+                        scene.error = scene.error or e
+                    scene.remaining -= 1
+                    if scene.remaining == 0:
+                        fold(scene)
+    except BaseException:
+        nc.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    nc.close()
+
+    # A date with no usable scene must not reach the COGs as an all-NaN day
+    keep = [t for t in range(len(days)) if written[t]]
+    if not keep:
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(f"All scenes failed: no {product.name} tile composited on {len(days)} date(s)")
+    if len(keep) < len(days):
+        empty = [str(day) for t, day in enumerate(days) if not written[t]]
+        logger.warning(f"  ✗ No usable scene on {', '.join(empty)}; dropped from {output_path.name}")
+        kept_path = output_path.with_name(output_path.name + ".kept.tmp")
+        try:
+            _copy_days(tmp_path, kept_path, grid, keep, [days[t] for t in keep], attrs or {})
+        except BaseException:
+            kept_path.unlink(missing_ok=True)
+            raise
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        tmp_path = kept_path
+
+    os.replace(tmp_path, output_path)
+    for t in keep:
+        logger.info(f"  ✓ {days[t]}: {len(by_day[days[t]])} scene(s) composited into {written[t]} tile(s)")
+    return [days[t] for t in keep]
@@ -0,0 +1,156 @@
+"""
+Local raster rendering from the daily COG mosaics
+Reads windows straight from the COGs (using their overviews), applies the SLD
+colormap LUT and encodes images/animations, so the API does not need one
+GeoServer GetMap round trip per frame.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.config.settings import get_settings
+from app.services.colormap import apply_colormap, load_style
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ANIMATION_MEDIA_TYPES = {
+    "webp": "image/webp",
+    "apng": "image/apng",
+    "gif": "image/gif",
+    "mp4": "video/mp4",
+}
+
+# Process pool shared by every CPU-heavy rendering endpoint
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool used for rendering."""
+    global _render_pool
+    if _render_pool is None:
+        workers = settings.RENDER_WORKERS or os.cpu_count() or 2
+        _render_pool = ProcessPoolExecutor(max_workers=workers)
+        logger.info(f"Render process pool started with {workers} workers")
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def cog_path(source: str, day: date) -> Path:
+    """Path of the daily COG written by the ingestion flows."""
+    return Path(settings.DATA_DIR) / source / f"{source}_{day.strftime('%Y%m%d')}.tif"
+
+
+def available_frames(source: str, start: date, end: date) -> List[Tuple[date, Path]]:
+    """List (date, path) for every day in [start, end] that has a COG on disk."""
+    frames = []
+    current = start
+    while current <= end:
+        path = cog_path(source, current)
+        if path.exists():
+            frames.append((current, path))
+        current += timedelta(days=1)
+    return frames
+
+
+def read_window(
+    path: Path,
+    bbox: Sequence[float],
+    width: int,
+    height: int,
+) -> np.ndarray:
+    """
+    Read bbox (W, S, E, N) from a single-band raster resampled to width x height.
+    Nodata becomes NaN. GDAL picks the closest overview for the output size.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.windows import from_bounds
+
+    west, south, east, north = bbox
+    with rasterio.open(path) as src:
+        window = from_bounds(west, south, east, north, src.transform)
+        data = src.read(
+            1,
+            window=window,
+            out_shape=(height, width),
+            resampling=Resampling.nearest,
+            boundless=True,
+            masked=True,
+        )
+    return data.astype(np.float32).filled(np.nan)
+
+
+def render_frame(
+    path: str,
+    bbox: Sequence[float],
+    width: int,
+    height: int,
+    style: str = "precipitation_style",
+) -> np.ndarray:
+    """Render one COG to an (H, W, 4) RGBA array. Runs inside the render pool."""
+    data = read_window(Path(path), bbox, width, height)
+    return apply_colormap(data, load_style(style))
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    buffer = BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+def encode_animation(frames: List[np.ndarray], fmt: str, fps: int) -> bytes:
+    """Encode RGBA frames as one animated WebP/APNG/GIF or an MP4."""
+    if not frames:
+        raise ValueError("No frames to encode")
+
+    duration_ms = int(1000 / max(fps, 1))
+    buffer = BytesIO()
+
+    if fmt == "mp4":
+        try:
+            import imageio.v3 as iio
+        except ImportError:
+            raise ImportError(
+                "MP4 output requires imageio with the ffmpeg plugin.\n"
+                "Install with: pip install imageio imageio-ffmpeg"
+            )
+        # H.264 has no alpha and needs even dimensions
+        rgb_frames = []
+        for rgba in frames:
+            height, width = rgba.shape[0] - rgba.shape[0] % 2, rgba.shape[1] - rgba.shape[1] % 2
+            image = Image.new("RGB", (rgba.shape[1], rgba.shape[0]), (255, 255, 255))
+            image.paste(Image.fromarray(rgba, mode="RGBA"), mask=Image.fromarray(rgba[..., 3]))
+            rgb_frames.append(np.asarray(image)[:height, :width])
+        iio.imwrite(buffer, np.stack(rgb_frames), extension=".mp4", fps=fps, codec="libx264")
+        return buffer.getvalue()
+
+    images = [Image.fromarray(rgba, mode="RGBA") for rgba in frames]
+    save_kwargs = {
+        "save_all": True,
+        "append_images": images[1:],
+        "duration": duration_ms,
+        "loop": 0,
+    }
+    if fmt == "webp":
+        images[0].save(buffer, format="WEBP", lossless=False, quality=80, method=4, **save_kwargs)
+    elif fmt == "apng":
+        images[0].save(buffer, format="PNG", disposal=1, **save_kwargs)
+    elif fmt == "gif":
+        images[0].save(buffer, format="GIF", disposal=2, optimize=False, **save_kwargs)
+    else:
+        raise ValueError(f"Unsupported animation format: {fmt}")
+    return buffer.getvalue()
@@ -0,0 +1,47 @@
+"""
+Per-day value statistics computed from the in-memory grid
+Processing computes these right before the COG is written, so validation does
+not have to re-open the file, and the numbers are stored in the ingestion
+manifest for the API (data-quality and legend-range endpoints).
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+# Values below this are invalid for the source (precipitation cannot be negative)
+VALID_MIN = {
+    "chirps": 0.0,
+    "merge": 0.0,
+    "precipitation": 0.0,
+}
+
+
+def array_stats(values, nodata: Optional[float] = None, valid_min: Optional[float] = None) -> Dict[str, float]:
+    """min/max/mean over valid cells, the valid fraction and the NaN count."""
+    values = np.asarray(values, dtype=np.float64)
+    nan_mask = np.isnan(values)
+    valid = ~nan_mask
+    if nodata is not None and not np.isnan(nodata):
+        valid &= values != nodata
+    if valid_min is not None:
+        with np.errstate(invalid="ignore"):
+            valid &= values >= valid_min
+
+    n_valid = int(valid.sum())
+    stats = {
+        "valid_fraction": n_valid / values.size if values.size else 0.0,
+        "nan_count": int(nan_mask.sum()),
+        "min": None,
+        "max": None,
+        "mean": None,
+    }
+    if n_valid:
+        selected = values[valid]
+        stats.update(min=float(selected.min()), max=float(selected.max()), mean=float(selected.mean()))
+    return stats
+
+
+def check_stats(stats: Dict[str, float], label: str = "grid"):
+    """Raise if the grid has no usable values (same rule validate_output applied)."""
+    if not stats.get("valid_fraction"):
+        raise ValueError(f"All values are invalid or null in {label}")
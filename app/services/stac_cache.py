@@ -0,0 +1,266 @@
+"""
+On-disk STAC search and signed-href caches for the NDVI flows
+Every NDVI batch searched the Planetary Computer catalog and signed every
+asset href, also on re-runs and retries of the same date range. Two caches
+remove those round trips:
+
+    DATA_DIR/.stac_cache/search/{key}.json   items and searched days of one search scope
+    DATA_DIR/.stac_cache/tokens.json         SAS token per storage container
+
+Searches are grouped by scope, (collections, bbox, query). Each scope file
+holds the unsigned items found so far and, per day, when that day was last
+searched. A date range is answered from the items intersecting it once every
+one of its days is covered, so re-runs, retries and batches that overlap or
+fall inside earlier ones skip the catalog; otherwise only the span of the
+uncovered days is searched. Days more than ``settled_days`` old stay covered
+for good, recent ones are searched again after ``ttl_seconds`` (late scenes
+still arrive). A warm cache needs no network at all and tests can replay
+stored responses offline. Ranges that are not plain "YYYY-MM-DD/YYYY-MM-DD"
+dates are passed to the catalog uncached.
+
+Signed URLs carry a SAS token valid for a whole storage container. The href
+cache signs one href per container, reads the token expiry from its ``se=``
+field and reuses the token for every other href of that container until it is
+``margin_seconds`` from expiring.
+
+    searches = StacSearchCache(Path(DATA_DIR) / ".stac_cache")
+    items = as_items(searches.search(open_catalog, ["modis-13Q1-061"], bbox, "2024-01-01/2024-01-31"))
+    sign = SignedHrefCache(planetary_computer.sign, Path(DATA_DIR) / ".stac_cache" / "tokens.json")
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIRNAME = ".stac_cache"
+
+
+def _write_json(path: Path, payload) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as fh:
+        json.dump(payload, fh)
+    os.replace(tmp, path)
+
+
+def _day_range(datetime_range: str) -> Optional[Tuple[date, date]]:
+    """(first, last) day of a "YYYY-MM-DD/YYYY-MM-DD" range; None for open ranges and timestamps."""
+    try:
+        start, end = (date.fromisoformat(part) for part in datetime_range.split("/"))
+    except ValueError:
+        return None
+    return (start, end) if start <= end else None
+
+
+def _item_days(item: dict) -> Optional[Tuple[date, date]]:
+    """Days spanned by an item (its start/end_datetime, or its datetime)."""
+    props = item.get("properties", {})
+    start = props.get("start_datetime") or props.get("datetime")
+    end = props.get("end_datetime") or props.get("datetime")
+    try:
+        return date.fromisoformat(start[:10]), date.fromisoformat(end[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def _intersects(item: dict, first: date, last: date) -> bool:
+    days = _item_days(item)
+    # Items without a usable date were returned for the range that was searched; keep them
+    return days is None or (days[0] <= last and days[1] >= first)
+
+
+class StacSearchCache:
+    """Items of STAC searches with per-day coverage, one JSON file per search scope."""
+
+    def __init__(self, cache_dir: Path, ttl_seconds: float = 6 * 3600, settled_days: int = 30):
+        self.cache_dir = Path(cache_dir) / "search"
+        self.ttl_seconds = ttl_seconds
+        self.settled_days = settled_days
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        collections: Sequence[str],
+        bbox: Sequence[float],
+        query: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        fields = {
+            "collections": sorted(collections),
+            "bbox": [round(float(v), 6) for v in bbox],
+            "query": query or {},
+        }
+        return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()[:32]
+
+    def get(self, key: str) -> Dict[str, dict]:
+        """{"days": {iso day: searched at}, "features": {item id: item}} of a scope."""
+        path = self.cache_dir / f"{key}.json"
+        try:
+            with open(path) as fh:
+                entry = json.load(fh)
+            if isinstance(entry.get("days"), dict) and isinstance(entry.get("features"), dict):
+                return entry
+            logger.warning(f"Ignoring STAC cache entry {path} in an old layout")
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable STAC cache entry {path}: {e}")
+        return {"days": {}, "features": {}}
+
+    def put(self, key: str, entry: Dict[str, dict]) -> None:
+        _write_json(self.cache_dir / f"{key}.json", entry)
+
+    def _covered(self, entry: Dict[str, dict], day: date, now: float) -> bool:
+        searched_at = entry["days"].get(day.isoformat())
+        if searched_at is None:
+            return False
+        return day < date.today() - timedelta(days=self.settled_days) or now - searched_at < self.ttl_seconds
+
+    @staticmethod
+    def _catalog_search(
+        open_catalog: Callable[[], Any],
+        collections: Sequence[str],
+        bbox: Sequence[float],
+        datetime_range: str,
+        query: Optional[Dict[str, Any]],
+    ) -> List[dict]:
+        kwargs = {"collections": list(collections), "bbox": list(bbox), "datetime": datetime_range}
+        if query:
+            kwargs["query"] = query
+        search = open_catalog().search(**kwargs)
+        return [item.to_dict(transform_hrefs=False) for item in search.items()]
+
+    def search(
+        self,
+        open_catalog: Callable[[], Any],
+        collections: Sequence[str],
+        bbox: Sequence[float],
+        datetime_range: str,
+        query: Optional[Dict[str, Any]] = None,
+    ) -> List[dict]:
+        """
+        Item dicts of the search, from the cache or from
+        ``open_catalog().search(...)`` (pystac_client) over the uncovered days.
+        """
+        span = _day_range(datetime_range)
+        if span is None:
+            return self._catalog_search(open_catalog, collections, bbox, datetime_range, query)
+        first, last = span
+        key = self.key(collections, bbox, query)
+        now = time.time()
+
+        with self._lock:
+            entry = self.get(key)
+            days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+            missing = [day for day in days if not self._covered(entry, day, now)]
+            if missing:
+                gap = (missing[0], missing[-1])
+                items = self._catalog_search(
+                    open_catalog, collections, bbox, f"{gap[0].isoformat()}/{gap[1].isoformat()}", query
+                )
+                # The search returns every item intersecting the gap: replace what was cached for it
+                entry = self.get(key)
+                entry["features"] = {
+                    item_id: item for item_id, item in entry["features"].items() if not _intersects(item, *gap)
+                }
+                entry["features"].update((item["id"], item) for item in items)
+                for i in range((gap[1] - gap[0]).days + 1):
+                    entry["days"][(gap[0] + timedelta(days=i)).isoformat()] = now
+                self.put(key, entry)
+                logger.info(
+                    f"STAC search {','.join(collections)} {gap[0]}/{gap[1]}: {len(items)} item(s) "
+                    f"({len(days) - len(missing)} of {len(days)} day(s) already cached)"
+                )
+
+        found = [item for item in entry["features"].values() if _intersects(item, first, last)]
+        if not missing:
+            logger.info(f"STAC search cache hit: {len(found)} item(s) for {','.join(collections)} {datetime_range}")
+        return found
+
+
+def as_items(dicts: List[dict]) -> list:
+    """pystac Items from cached item dicts."""
+    import pystac
+
+    return [pystac.Item.from_dict(d, preserve_dict=False) for d in dicts]
+
+
+# ---------------------------------------------------------------------------
+# Signed hrefs
+# ---------------------------------------------------------------------------
+
+def _container(href: str) -> Optional[str]:
+    """account host/container of an Azure blob href, None for anything else."""
+    parts = urlsplit(href)
+    if not parts.netloc.endswith(".blob.core.windows.net"):
+        return None
+    container = parts.path.lstrip("/").split("/", 1)[0]
+    return f"{parts.netloc}/{container}" if container else None
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """Epoch seconds of a SAS token's ``se`` (signed expiry) field."""
+    values = parse_qs(token).get("se")
+    if not values:
+        return None
+    try:
+        expiry = datetime.fromisoformat(values[0].replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    return expiry.timestamp()
+
+
+class SignedHrefCache:
+    """
+    ``sign(href)`` with SAS tokens reused per storage container until shortly
+    before their expiry. Thread-safe; tokens persist in ``path`` across runs.
+    """
+
+    def __init__(self, sign: Callable[[str], str], path: Optional[Path] = None, margin_seconds: float = 600):
+        self._sign = sign
+        self.path = Path(path) if path else None
+        self.margin_seconds = margin_seconds
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self.signed = 0
+        if self.path and self.path.exists():
+            try:
+                with open(self.path) as fh:
+                    self._tokens = {k: (v[0], float(v[1])) for k, v in json.load(fh).items()}
+            except (ValueError, TypeError, IndexError) as e:
+                logger.warning(f"Ignoring unreadable token cache {self.path}: {e}")
+
+    def _valid(self, container: str) -> Optional[str]:
+        entry = self._tokens.get(container)
+        if entry and entry[1] - self.margin_seconds > time.time():
+            return entry[0]
+        return None
+
+    def __call__(self, href: str) -> str:
+        container = _container(href)
+        if container is None:
+            return self._sign(href)
+        base = href.split("?", 1)[0]
+        with self._lock:
+            token = self._valid(container)
+            if token is None:
+                signed = self._sign(base)
+                self.signed += 1
+                token = urlsplit(signed).query
+                expiry = token_expiry(token)
+                if expiry is None:
+                    return signed
+                self._tokens[container] = (token, expiry)
+                if self.path:
+                    live = {k: v for k, v in self._tokens.items() if v[1] > time.time()}
+                    _write_json(self.path, {k: list(v) for k, v in live.items()})
+        return f"{base}?{token}"
@@ -0,0 +1,71 @@
+import os
+from datetime import date
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("netCDF4")
+pytest.importorskip("pydantic_settings")
+
+from app.services import accumulation  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(accumulation.settings, "DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_year(year, value, days=None):
+    times = pd.date_range(f"{year}-01-01", f"{year}-12-31", freq="D") if days is None else pd.to_datetime(days)
+    precip = xr.DataArray(
+        np.full((len(times), 2, 3), value, dtype=np.float32),
+        coords={"time": times, "latitude": [-10.0, -10.5], "longitude": [-50.0, -49.5, -49.0]},
+        dims=("time", "latitude", "longitude"),
+        name="precip",
+    )
+    path = accumulation.historical_file("chirps", year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    precip.to_dataset().to_netcdf(path)
+    accumulation.build_year("chirps", year)
+
+
+def test_accumulate_is_a_difference_of_prefix_sums_across_years_and_gaps(data_dir):
+    # 2021 is missing entirely; 2023 only has two days
+    _write_year(2020, 1.0)
+    _write_year(2022, 2.0)
+    _write_year(2023, 5.0, days=["2023-01-01", "2023-01-03"])
+    accumulation.build_checkpoints("chirps")
+
+    def total(start, end):
+        return float(accumulation.accumulate("chirps", start, end).values[0, 0])
+
+    assert total(date(2020, 1, 1), date(2020, 1, 10)) == pytest.approx(10.0)
+    assert total(date(2020, 12, 30), date(2022, 1, 2)) == pytest.approx(2 * 1.0 + 2 * 2.0)
+    # Days after the gap year still carry the running total from before it
+    assert accumulation.running_total("chirps", date(2022, 1, 1)).values[0, 0] == pytest.approx(366 + 2.0)
+    assert total(date(2021, 3, 1), date(2021, 6, 1)) == pytest.approx(0.0)
+    # Missing days inside a year contribute nothing
+    assert total(date(2023, 1, 2), date(2023, 1, 3)) == pytest.approx(5.0)
+    assert total(date(2020, 1, 1), date(2024, 6, 1)) == pytest.approx(366 + 365 * 2.0 + 10.0)
+    assert accumulation.running_total("chirps", date(2019, 12, 31)) is None
+
+
+def test_rebuilt_files_are_reopened_and_the_old_handle_closed(data_dir):
+    _write_year(2020, 1.0)
+    accumulation.build_checkpoints("chirps")
+    first = accumulation._open_latest(accumulation.checkpoint_file("chirps"))
+    version = accumulation.cube_version("chirps")
+
+    _write_year(2020, 3.0)
+    accumulation.build_checkpoints("chirps")
+    path = accumulation.checkpoint_file("chirps")
+    os.utime(path, (version + 10, version + 10))
+
+    second = accumulation._open_latest(path)
+    assert second is not first
+    assert accumulation.cube_version("chirps") == version + 10
+    assert float(second[accumulation.CHECKPOINT_VAR].values[0, 0, 0]) == pytest.approx(3 * 366)
+    assert accumulation._open_latest(path) is second
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pydantic_settings")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("rioxarray")
+
+from rasterio.transform import from_origin  # noqa: E402
+
+from app.services import aggregates, cog  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(aggregates.settings, "DATA_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_days(data_dir, source, start, n_days, value):
+    days = [start + timedelta(days=i) for i in range(n_days)]
+    for day in days:
+        path = data_dir / source / f"{source}_{day.strftime('%Y%m%d')}.tif"
+        cog.write_array(np.full((16, 16), value, dtype=np.float32), from_origin(-50, -10, 0.1, 0.1), path)
+    return days
+
+
+def _value(path):
+    with rasterio.open(path) as src:
+        return float(src.read(1, masked=True).mean()), src.tags()
+
+
+def test_touched_periods_cover_month_and_year_of_each_day():
+    periods = aggregates.touched_periods([date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 15)])
+    assert periods == {
+        ("monthly", date(2023, 12, 1)), ("annual", date(2023, 1, 1)),
+        ("monthly", date(2024, 1, 1)), ("annual", date(2024, 1, 1)),
+    }
+
+
+def test_compute_period_sums_days_and_builds_the_year_from_months(data_dir):
+    _write_days(data_dir, "chirps", date(2020, 1, 1), 31, 2.0)
+    _write_days(data_dir, "chirps", date(2020, 2, 1), 10, 1.0)
+
+    january = aggregates.compute_period("chirps", "monthly", date(2020, 1, 1))
+    february = aggregates.compute_period("chirps", "monthly", date(2020, 2, 1))
+    year = aggregates.compute_period("chirps", "annual", date(2020, 1, 1))
+
+    value, tags = _value(january)
+    assert value == pytest.approx(62.0)
+    assert (tags["days"], tags["complete"]) == ("31", "True")
+    value, tags = _value(february)
+    assert value == pytest.approx(10.0)
+    assert (tags["days"], tags["complete"]) == ("10", "False")
+    value, tags = _value(year)
+    assert value == pytest.approx(72.0)
+    assert tags["days"] == "41"
+    assert aggregates.compute_period("chirps", "monthly", date(2020, 3, 1)) is None
+
+
+def test_completing_a_month_refreshes_the_anomalies_of_earlier_years(data_dir):
+    aggregates.update_aggregates("chirps", _write_days(data_dir, "chirps", date(2020, 1, 1), 31, 1.0))
+    aggregates.update_aggregates("chirps", _write_days(data_dir, "chirps", date(2021, 1, 1), 31, 3.0))
+    anomaly_2020 = aggregates.aggregate_path("chirps", "monthly", date(2020, 1, 1), anomaly=True)
+    # Climatology of January over 2020 and 2021: (31 + 93) / 2 = 62
+    assert _value(anomaly_2020)[0] == pytest.approx(31 - 62)
+
+    written = aggregates.update_aggregates("chirps", _write_days(data_dir, "chirps", date(2022, 1, 1), 31, 5.0))
+
+    # 2022 moved the January climatology to (31 + 93 + 155) / 3 = 93
+    assert anomaly_2020 in written
+    value, tags = _value(anomaly_2020)
+    assert value == pytest.approx(31 - 93)
+    assert tags["climatology_years"] == "3"
+    assert _value(aggregates.aggregate_path("chirps", "monthly", date(2022, 1, 1), anomaly=True))[0] == pytest.approx(62)
@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+
+from app.services.backfill_planner import modis_period, plan_cds, plan_contiguous, plan_modis
+
+
+def _days(start, n):
+    return [start + timedelta(days=i) for i in range(n)]
+
+
+def test_cds_plan_aligns_to_months_without_overfetch():
+    # Jan 20 - Feb 10: a single contiguous slice would request months 01+02 x 22 days
+    missing = _days(date(2024, 1, 20), 22)
+
+    current = plan_contiguous(missing, 31, cross_product=True)
+    planned = plan_cds(missing, max_days=31)
+
+    assert current.requests == 1 and current.fetched == 42
+    assert [(b.start, b.end) for b in planned.batches] == [
+        (date(2024, 1, 20), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 10))
+    ]
+    assert planned.fetched == planned.missing == 22
+    assert planned.batches[1].request == {"year": ["2024"], "month": ["02"], "day": [f"{d:02d}" for d in range(1, 11)]}
+
+
+def test_cds_plan_merges_sparse_months_of_the_same_year():
+    missing = [date(2024, m, 15) for m in (1, 2, 3)] + [date(2025, 1, 15)]
+
+    plan = plan_cds(missing, max_days=31, bytes_per_day=10)
+
+    assert plan.requests == 2
+    assert plan.batches[0].request["month"] == ["01", "02", "03"]
+    assert plan.fetched == 4 and plan.est_bytes == 40
+
+
+def test_modis_plan_follows_composite_periods():
+    assert modis_period(date(2024, 1, 17)) == (date(2024, 1, 17), date(2024, 2, 1))
+    assert modis_period(date(2023, 12, 31)) == (date(2023, 12, 19), date(2023, 12, 31))
+
+    missing = _days(date(2024, 1, 10), 30)  # touches periods starting Jan 1, Jan 17 and Feb 2
+    plan = plan_modis(missing, max_composites=2)
+
+    assert [(b.start, b.end, b.fetched) for b in plan.batches] == [
+        (date(2024, 1, 1), date(2024, 2, 1), 2), (date(2024, 2, 2), date(2024, 2, 17), 1)
+    ]
+    assert plan.missing == 30
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.services.cds_scheduler import (  # noqa: E402
+    COMPLETED, FAILED, PENDING, CDSRequest, CDSRequestError, CDSScheduler,
+)
+
+
+class FakeCDS:
+    """Jobs complete after a number of polls; tracks how many are queued at once."""
+
+    def __init__(self, polls_until_done=2, failing=(), stuck=()):
+        self.polls_until_done = polls_until_done
+        self.failing = set(failing)
+        self.stuck = set(stuck)
+        self.jobs = {}
+        self.active = 0
+        self.peak = 0
+
+    async def submit(self, dataset, request):
+        job_id = f"job-{len(self.jobs)}"
+        self.jobs[job_id] = {"request": request, "polls": 0}
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return job_id
+
+    async def status(self, job_id):
+        job = self.jobs[job_id]
+        job["polls"] += 1
+        if job["polls"] < self.polls_until_done or job["request"]["name"] in self.stuck:
+            return PENDING
+        self.active -= 1
+        return FAILED if job["request"]["name"] in self.failing else COMPLETED
+
+    async def download(self, job_id, dest):
+        dest.write_text(self.jobs[job_id]["request"]["name"])
+
+
+def _requests(tmp_path, names):
+    return [CDSRequest(name, "dataset", {"name": name}, tmp_path / f"{name}.nc") for name in names]
+
+
+def test_scheduler_limits_active_requests_and_processes_each_download(tmp_path):
+    client = FakeCDS()
+    scheduler = CDSScheduler(client, max_active=2, poll_interval=0, retries=0)
+    processed = []
+
+    def process(request, path):
+        processed.append(path.read_text())
+        return request.key.upper()
+
+    outcomes = scheduler.run_sync(_requests(tmp_path, ["a", "b", "c", "d", "e"]), process)
+
+    assert client.peak == 2
+    assert sorted(processed) == ["a", "b", "c", "d", "e"]
+    assert [o.result for o in outcomes] == ["A", "B", "C", "D", "E"]
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_failed_request_is_retried_then_reported(tmp_path):
+    client = FakeCDS(polls_until_done=1, failing={"bad"})
+    scheduler = CDSScheduler(client, max_active=4, poll_interval=0, retries=1, retry_delay=0)
+
+    outcomes = asyncio.run(scheduler.run(_requests(tmp_path, ["ok", "bad"])))
+
+    by_key = {o.request.key: o for o in outcomes}
+    assert by_key["ok"].ok and by_key["ok"].path.read_text() == "ok"
+    assert not by_key["bad"].ok
+    assert len(client.jobs) == 3  # ok once, bad twice
+    assert not (tmp_path / "bad.nc").exists()
+
+
+def test_existing_target_is_not_requested_again(tmp_path):
+    client = FakeCDS()
+    (tmp_path / "a.nc").write_text("cached")
+
+    outcomes = CDSScheduler(client, poll_interval=0).run_sync(_requests(tmp_path, ["a"]))
+
+    assert outcomes[0].path == tmp_path / "a.nc"
+    assert client.jobs == {}
+
+
+def test_stuck_job_times_out_and_frees_its_slot(tmp_path):
+    client = FakeCDS(polls_until_done=1, stuck={"stuck"})
+    scheduler = CDSScheduler(client, max_active=1, poll_interval=0.01, retries=1, retry_delay=0, request_timeout=0.1)
+
+    outcomes = scheduler.run_sync(_requests(tmp_path, ["stuck", "ok"]))
+
+    by_key = {o.request.key: o for o in outcomes}
+    assert isinstance(by_key["stuck"].error, CDSRequestError)
+    assert "not completed after" in str(by_key["stuck"].error)
+    assert by_key["ok"].ok and by_key["ok"].path.read_text() == "ok"
+    assert len(client.jobs) == 3  # stuck twice, ok once
@@ -0,0 +1,64 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.services import cog  # noqa: E402
+
+
+def test_write_cogs_bounds_pending_jobs_and_reports_errors(monkeypatch):
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0, "threads": set()}
+
+    def fake_write_cog(da, path, profile):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            state["threads"].add(profile.num_threads)
+        time.sleep(0.01)
+        with lock:
+            state["active"] -= 1
+        if da == "bad":
+            raise ValueError("boom")
+        return path
+
+    monkeypatch.setattr(cog, "write_cog", fake_write_cog)
+    produced = []
+
+    def jobs():
+        for i in range(10):
+            produced.append(i)
+            yield ("bad" if i == 3 else "ok"), Path(f"day_{i}.tif")
+
+    results = dict(cog.write_cogs(jobs(), profile=cog.PROFILES["lzw"], workers=2))
+
+    assert len(results) == 10 and len(produced) == 10
+    assert isinstance(results[Path("day_3.tif")], ValueError)
+    assert all(err is None for path, err in results.items() if path != Path("day_3.tif"))
+    assert state["peak"] <= 2
+    assert state["threads"] == {"1"}
+
+
+def test_partial_granules_are_invisible_to_the_mosaic_glob(tmp_path, monkeypatch):
+    np = pytest.importorskip("numpy")
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    written = []
+    real_open = rasterio.open
+
+    def recording_open(path, mode="r", **kwargs):
+        if mode == "w":
+            written.append(Path(path).name)
+        return real_open(path, mode, **kwargs)
+
+    monkeypatch.setattr(rasterio, "open", recording_open)
+    path = cog.write_array(np.ones((16, 16), dtype=np.float32), from_origin(-50, -10, 0.1, 0.1), tmp_path / "chirps_20240101.tif")
+
+    assert written == ["chirps_20240101.tif.tmp"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [path.name]
+    with real_open(path) as src:
+        assert src.driver == "GTiff" and src.read(1).mean() == 1.0
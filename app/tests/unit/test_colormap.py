@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.colormap import parse_sld_colormap, apply_colormap
+
+SLD = """
+<StyledLayerDescriptor version="1.0.0" xmlns="http://www.opengis.net/sld">
+  <NamedLayer><UserStyle><FeatureTypeStyle><Rule><RasterSymbolizer>
+    <ColorMap>
+      <ColorMapEntry color="#FFFFFF" quantity="0" label="0" opacity="0"/>
+      <ColorMapEntry color="#000000" quantity="10" label="10"/>
+      <ColorMapEntry color="#FF0000" quantity="20"/>
+    </ColorMap>
+  </RasterSymbolizer></Rule></FeatureTypeStyle></UserStyle></NamedLayer>
+</StyledLayerDescriptor>
+"""
+
+
+def test_parse_sld_colormap():
+    cmap = parse_sld_colormap(SLD)
+    assert cmap["type"] == "ramp"
+    assert [e["quantity"] for e in cmap["entries"]] == [0, 10, 20]
+    assert cmap["entries"][0]["opacity"] == 0
+    assert cmap["entries"][2]["label"] == "20"
+
+
+def test_apply_colormap_ramp_interpolates_and_masks_nan():
+    cmap = parse_sld_colormap(SLD)
+    rgba = apply_colormap(np.array([[15.0, np.nan, 100.0]]), cmap)
+    assert rgba.shape == (1, 3, 4)
+    assert tuple(rgba[0, 0]) == (128, 0, 0, 255)
+    assert rgba[0, 1, 3] == 0
+    assert tuple(rgba[0, 2]) == (255, 0, 0, 255)
+
+
+def test_apply_colormap_intervals():
+    cmap = parse_sld_colormap(SLD)
+    cmap["type"] = "intervals"
+    rgba = apply_colormap(np.array([[5.0, 10.0, 25.0]]), cmap)
+    assert tuple(rgba[0, 0]) == (0, 0, 0, 255)
+    assert tuple(rgba[0, 1]) == (255, 0, 0, 255)
+    assert rgba[0, 2, 3] == 0
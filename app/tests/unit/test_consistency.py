@@ -0,0 +1,55 @@
+from datetime import date
+
+from app.services import consistency
+
+
+def test_diff_views_reports_each_mismatch(tmp_path):
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    for name in ("chirps_20240101.tif", "chirps_20240102.tif", "chirps_20240103.tif", "notes.txt"):
+        (mosaic_dir / name).write_bytes(b"")
+
+    granules = consistency.list_granules(mosaic_dir)
+    assert sorted(granules) == ["chirps_20240101.tif", "chirps_20240102.tif", "chirps_20240103.tif"]
+
+    indexed = {"chirps_20240101.tif", "chirps_20231231.tif"}
+    cube = {date(2024, 1, 1), date(2024, 1, 2), date(2023, 12, 30)}
+    report = consistency.diff_views("chirps", granules, "gpkg", indexed, cube)
+
+    assert not report.ok
+    assert report.missing_granules == ["chirps_20240102.tif", "chirps_20240103.tif"]
+    assert report.orphaned_rows == ["chirps_20231231.tif"]
+    assert report.missing_in_cube == [date(2024, 1, 3)]
+    assert report.cube_only == [date(2023, 12, 30)]
+
+
+def test_check_mosaic_with_geopackage_index(tmp_path):
+    from app.services import mosaic_index
+
+    mosaic_dir = tmp_path / "merge"
+    mosaic_dir.mkdir()
+    (mosaic_dir / "merge_20240101.tif").write_bytes(b"")
+    mosaic_index.build_index(mosaic_dir, bounds=(-75.0, -35.0, -34.0, 5.0))
+    (mosaic_dir / "merge_20240102.tif").write_bytes(b"")
+
+    report = consistency.check_mosaic(tmp_path, "merge")
+    assert report.index_kind == "gpkg"
+    assert report.missing_granules == ["merge_20240102.tif"]
+
+    delta = consistency.index_delta_paths(tmp_path, report)
+    mosaic_index.add_granules(mosaic_dir, delta, bounds=(-75.0, -35.0, -34.0, 5.0))
+    assert consistency.check_mosaic(tmp_path, "merge").ok
+
+
+def test_cube_files_include_backfill_partitions(tmp_path):
+    hist_dir = tmp_path / "temp_max_hist"
+    (hist_dir / "partitions").mkdir(parents=True)
+    (hist_dir / "historical.nc").write_bytes(b"")
+    (hist_dir / "partitions" / "20240102_20240103_2.nc").write_bytes(b"")
+    (hist_dir / "partitions" / "20230105_20230105_1.nc").write_bytes(b"")
+    (hist_dir / "partitions" / "20240201_20240201_3.nc.tmp").write_bytes(b"")
+
+    files, var = consistency.cube_files(tmp_path, "temp_max")
+
+    assert var == "temp_max"
+    assert [p.name for p in files] == ["historical.nc", "20230105_20230105_1.nc", "20240102_20240103_2.nc"]
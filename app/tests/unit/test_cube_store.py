@@ -0,0 +1,298 @@
+import subprocess
+import sys
+from contextlib import contextmanager
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.cube_store import _sample_indices  # noqa: E402
+
+# North-up 0.5 degree COG with its top-left corner at (-75, 6.5)
+TRANSFORM = SimpleNamespace(a=0.5, c=-75.0, e=-0.5, f=6.5)
+
+
+def test_cube_cells_map_to_cog_cells():
+    lats = np.array([-1.25, 6.25, 10.0])  # ascending cube latitude, last one outside
+    lons = np.array([-74.75, -70.25, -80.0])
+    rows, cols = _sample_indices(TRANSFORM, width=20, height=20, lats=lats, lons=lons)
+
+    assert rows.tolist() == [15, 0, -1]
+    assert cols.tolist() == [0, 9, -1]
+
+
+# ---------------------------------------------------------------------------
+# Year files (CHIRPS/MERGE)
+# ---------------------------------------------------------------------------
+
+LATS = np.arange(-3.25, 6.5, 0.5)   # ascending cell centres inside the COG
+LONS = np.arange(-74.75, -65.0, 0.5)
+
+
+@pytest.fixture
+def netcdf():
+    pytest.importorskip("pydantic_settings")
+    pytest.importorskip("xarray")
+    return pytest.importorskip("netCDF4")
+
+
+def _cog(path, value):
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    with rasterio.open(
+        path, "w", driver="GTiff", width=20, height=20, count=1, dtype="float32",
+        crs="EPSG:4326", transform=from_origin(-75.0, 6.5, 0.5, 0.5), nodata=-9999.0,
+    ) as dst:
+        dst.write(np.full((20, 20), value, dtype=np.float32), 1)
+    return path
+
+
+def _stored(netCDF4, path, var="precip"):
+    with netCDF4.Dataset(path) as nc:
+        t = nc["time"]
+        days = [d.date() for d in netCDF4.num2date(
+            t[:], t.units, only_use_cftime_datetimes=False, only_use_python_datetimes=True
+        )]
+        return days, [float(np.nanmean(nc[var][i])) for i in range(len(days))], nc.dimensions["time"].isunlimited()
+
+
+# Reads a NetCDF the way the API does and keeps it open (HDF5 file lock held);
+# every line on stdin asks it for the number of days it sees and the last day's mean
+HOLDER = """
+import sys
+import xarray as xr
+ds = xr.open_mfdataset([sys.argv[1]], combine="nested", concat_dim="time", engine="netcdf4", cache=False)
+for _ in iter(sys.stdin.readline, ""):
+    print(ds.sizes["time"], float(ds[sys.argv[2]].isel(time=-1).mean()), flush=True)
+"""
+
+
+@contextmanager
+def _held_open(path, var):
+    proc = subprocess.Popen(
+        [sys.executable, "-c", HOLDER, str(path), var], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    )
+
+    def query():
+        proc.stdin.write("\n")
+        proc.stdin.flush()
+        n, mean = proc.stdout.readline().split()
+        return int(n), float(mean)
+
+    try:
+        query()  # opened
+        yield query
+    finally:
+        proc.stdin.close()
+        proc.wait(timeout=30)
+
+
+def test_create_year_file_is_empty_unlimited_and_chunked_per_day(tmp_path, netcdf):
+    from app.services import cube_store
+
+    path = tmp_path / "brazil_chirps_2024.nc"
+    cube_store.create_year_file(path, "precip", LATS, LONS, {"units": "mm/day", "_FillValue": -1})
+
+    with netcdf.Dataset(path) as nc:
+        assert nc.dimensions["time"].isunlimited() and len(nc.dimensions["time"]) == 0
+        assert nc["precip"].chunking() == [1, len(LATS), len(LONS)]
+        assert nc["precip"].units == "mm/day"
+        np.testing.assert_allclose(nc["latitude"][:], LATS)
+    assert not path.with_name(path.name + ".tmp").exists()
+
+
+def test_make_appendable_converts_a_fixed_time_axis_once(tmp_path, netcdf):
+    import pandas as pd
+    import xarray as xr
+
+    from app.services import cube_store
+
+    path = tmp_path / "brazil_chirps_2023.nc"
+    values = np.arange(2 * len(LATS) * len(LONS), dtype=np.float32).reshape(2, len(LATS), len(LONS))
+    xr.Dataset(
+        {"precip": (("time", "latitude", "longitude"), values, {"units": "mm/day"})},
+        coords={"time": pd.to_datetime(["2023-01-01", "2023-01-02"]), "latitude": LATS, "longitude": LONS},
+    ).to_netcdf(path)
+
+    assert cube_store.make_appendable(path) is True
+    assert cube_store.make_appendable(path) is False
+    with xr.open_dataset(path) as ds:
+        np.testing.assert_array_equal(ds["precip"].values, values)
+        assert ds["precip"].attrs["units"] == "mm/day"
+    assert _stored(netcdf, path)[2]
+
+
+def test_append_year_appends_backfills_in_order_and_skips_duplicates(tmp_path, netcdf):
+    from app.services import cube_store
+
+    path = tmp_path / "brazil_chirps_2024.nc"
+    cube_store.create_year_file(path, "precip", LATS, LONS, {"units": "mm/day"})
+    cogs = {d: _cog(tmp_path / f"chirps_{d:%Y%m%d}.tif", float(d.day)) for d in (
+        date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3),
+    )}
+
+    written = cube_store.append_year(path, "precip", [(date(2024, 1, 2), cogs[date(2024, 1, 2)]),
+                                                      (date(2024, 1, 3), cogs[date(2024, 1, 3)])])
+    assert written == [date(2024, 1, 2), date(2024, 1, 3)]
+
+    # Out of order: appended, then the file is rewritten in time order and stays appendable
+    assert cube_store.append_year(path, "precip", [(date(2024, 1, 1), cogs[date(2024, 1, 1)])]) == [date(2024, 1, 1)]
+    assert cube_store.append_year(path, "precip", [(date(2024, 1, 2), cogs[date(2024, 1, 2)])]) == []
+
+    days, means, unlimited = _stored(netcdf, path)
+    assert days == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+    assert means == [1.0, 2.0, 3.0]
+    assert unlimited
+
+
+def test_append_year_while_the_api_holds_the_file_open(tmp_path, netcdf):
+    from app.services import cube_store
+
+    path = tmp_path / "brazil_chirps_2024.nc"
+    cube_store.create_year_file(path, "precip", LATS, LONS, {"units": "mm/day"})
+    cube_store.append_year(path, "precip", [(date(2024, 1, 1), _cog(tmp_path / "a.tif", 1.0))])
+
+    with _held_open(path, "precip") as reader:
+        written = cube_store.append_year(path, "precip", [(date(2024, 1, 2), _cog(tmp_path / "b.tif", 2.0))])
+        # The open handle keeps reading the version it opened
+        assert reader() == (1, 1.0)
+
+    assert written == [date(2024, 1, 2)]
+    assert _stored(netcdf, path)[:2] == ([date(2024, 1, 1), date(2024, 1, 2)], [1.0, 2.0])
+    assert not path.with_name(path.name + ".tmp").exists()
+
+
+def test_failed_append_leaves_the_year_file_untouched(tmp_path, netcdf):
+    from app.services import cube_store
+
+    path = tmp_path / "brazil_chirps_2024.nc"
+    cube_store.create_year_file(path, "precip", LATS, LONS, {"units": "mm/day"})
+    cube_store.append_year(path, "precip", [(date(2024, 1, 1), _cog(tmp_path / "a.tif", 1.0))])
+
+    with pytest.raises(Exception):
+        cube_store.append_year(path, "precip", [(date(2024, 1, 2), _cog(tmp_path / "b.tif", 2.0)),
+                                                (date(2024, 1, 3), tmp_path / "missing.tif")])
+
+    assert _stored(netcdf, path)[0] == [date(2024, 1, 1)]
+    assert not path.with_name(path.name + ".tmp").exists()
+
+
+def test_repair_goes_through_the_locked_year_appender(tmp_path, netcdf, monkeypatch):
+    from app.services import consistency, cube_store
+
+    hist_dir = tmp_path / "chirps_historical"
+    cube_store.create_year_file(hist_dir / "brazil_chirps_2024.nc", "precip", LATS, LONS, {"units": "mm/day"})
+    (tmp_path / "chirps").mkdir()
+    days = [date(2024, 1, 5), date(2025, 1, 1)]
+    for d in days:
+        _cog(tmp_path / "chirps" / f"chirps_{d:%Y%m%d}.tif", 7.0)
+    locked = []
+    real_locked = cube_store._locked
+
+    def spy(path):
+        locked.append(path.name)
+        return real_locked(path)
+
+    monkeypatch.setattr(cube_store, "_locked", spy)
+    report = consistency.ConsistencyReport("chirps", "gpkg", missing_in_cube=days)
+
+    assert consistency.repair_cube(tmp_path, report) == 2
+    assert {"brazil_chirps_2024.nc", "brazil_chirps_2025.nc"} <= set(locked)
+    for year, day in zip((2024, 2025), days):
+        stored, means, unlimited = _stored(netcdf, hist_dir / f"brazil_chirps_{year}.nc")
+        assert stored == [day] and means == [7.0] and unlimited
+
+
+# ---------------------------------------------------------------------------
+# Single-file stores (ERA5/NDVI)
+# ---------------------------------------------------------------------------
+
+def _days(days, value, lats=LATS):
+    import pandas as pd
+    import xarray as xr
+
+    return xr.DataArray(
+        np.full((len(days), len(lats), len(LONS)), value, dtype=np.float32),
+        coords={"time": pd.to_datetime([d.isoformat() for d in days]), "latitude": lats, "longitude": LONS},
+        dims=("time", "latitude", "longitude"),
+    )
+
+
+def test_append_history_appends_new_days_and_partitions_backfills(tmp_path, netcdf):
+    from app.services import consistency, cube_store
+
+    hist = tmp_path / "temp_max_hist" / "historical.nc"
+    created, _ = cube_store.append_history(hist, "temp_max", _days([date(2024, 1, 10), date(2024, 1, 11)], 1.0))
+    assert created == [date(2024, 1, 10), date(2024, 1, 11)]
+
+    appended, backfilled = cube_store.append_history(
+        hist, "temp_max", _days([date(2024, 1, 11), date(2024, 1, 12), date(2024, 1, 13)], 2.0)
+    )
+    assert (appended, backfilled) == ([date(2024, 1, 12), date(2024, 1, 13)], [])
+    days, means, unlimited = _stored(netcdf, hist, "temp_max")
+    assert days == [date(2024, 1, d) for d in (10, 11, 12, 13)]
+    assert means == [1.0, 1.0, 2.0, 2.0] and unlimited
+
+    appended, backfilled = cube_store.append_history(hist, "temp_max", _days([date(2024, 1, 5), date(2024, 1, 6)], 3.0))
+    assert (appended, backfilled) == ([], [date(2024, 1, 5), date(2024, 1, 6)])
+    partitions = sorted((hist.parent / consistency.PARTITION_DIRNAME).glob("*.nc"))
+    assert [p.name.split("_")[:2] for p in partitions] == [["20240105", "20240106"]]
+    # The main file is untouched; readers see the partition through history_files
+    assert _stored(netcdf, hist, "temp_max")[0][0] == date(2024, 1, 10)
+    assert date(2024, 1, 5) in consistency.cube_dates(consistency.history_files(hist))
+    # Days already in a partition are not written again
+    assert cube_store.append_history(hist, "temp_max", _days([date(2024, 1, 5)], 9.0)) == ([], [])
+
+
+def test_append_history_rejects_a_different_grid(tmp_path, netcdf):
+    from app.services import cube_store
+
+    hist = tmp_path / "temp_hist" / "historical.nc"
+    cube_store.append_history(hist, "temp", _days([date(2024, 1, 1)], 1.0))
+    with pytest.raises(ValueError, match="latitude"):
+        cube_store.append_history(hist, "temp", _days([date(2024, 1, 2)], 1.0, lats=LATS + 0.1))
+    assert _stored(netcdf, hist, "temp")[0] == [date(2024, 1, 1)]
+
+
+def test_append_history_while_the_api_holds_the_store_open(tmp_path, netcdf):
+    from app.services import cube_store
+
+    hist = tmp_path / "temp_max_hist" / "historical.nc"
+    cube_store.append_history(hist, "temp_max", _days([date(2024, 1, 10)], 1.0))
+
+    with _held_open(hist, "temp_max") as reader:
+        appended, _ = cube_store.append_history(hist, "temp_max", _days([date(2024, 1, 11), date(2024, 1, 12)], 2.0))
+        # Readers never see a half-appended store
+        assert reader() == (1, 1.0)
+
+    assert appended == [date(2024, 1, 11), date(2024, 1, 12)]
+    assert _stored(netcdf, hist, "temp_max")[:2] == (
+        [date(2024, 1, 10), date(2024, 1, 11), date(2024, 1, 12)], [1.0, 2.0, 2.0]
+    )
+    assert not hist.with_name(hist.name + ".tmp").exists()
+
+
+def test_compact_history_folds_partitions_in_order_without_duplicates(tmp_path, netcdf):
+    from app.services import consistency, cube_store
+
+    hist = tmp_path / "temp_min_hist" / "historical.nc"
+    cube_store.append_history(hist, "temp_min", _days([date(2024, 1, 10)], 1.0))
+    cube_store.append_history(hist, "temp_min", _days([date(2024, 1, 3)], 2.0))
+    cube_store.append_history(hist, "temp_min", _days([date(2024, 1, 1), date(2024, 1, 2)], 3.0))
+    # A partition overlapping a stored day (e.g. two concurrent backfills)
+    part_dir = hist.parent / consistency.PARTITION_DIRNAME
+    cube_store._publish(_days([date(2024, 1, 3)], 2.0).to_dataset(name="temp_min"),
+                        part_dir / "20240103_20240103_0.nc", "temp_min", cube_store.HISTORY_ENCODING)
+
+    assert cube_store.compact_history(hist, "temp_min") == 3
+    assert list(part_dir.glob("*.nc")) == []
+    days, means, unlimited = _stored(netcdf, hist, "temp_min")
+    assert days == [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3), date(2024, 1, 10)]
+    assert means == [3.0, 3.0, 2.0, 1.0] and unlimited
+    assert cube_store.compact_history(hist, "temp_min") == 0
+
+    # Compacted store keeps appending in place
+    assert cube_store.append_history(hist, "temp_min", _days([date(2024, 1, 11)], 4.0)) == ([date(2024, 1, 11)], [])
@@ -0,0 +1,134 @@
+import hashlib
+
+import pytest
+
+from app.services.downloader import DownloadError, part_path, stream_download, validator_path
+
+PAYLOAD = bytes(range(256)) * 40
+
+
+class FakeResponse:
+    def __init__(self, status_code, body, headers, fail_after=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("connection reset")
+            yield self.body[i:i + chunk_size]
+
+
+class RangeServer:
+    """Serves ``payload``, honouring Range requests guarded by If-Range."""
+
+    def __init__(self, ranges=True, payload=PAYLOAD, etag='"v1"'):
+        self.ranges = ranges
+        self.payload = payload
+        self.etag = etag
+        self.fail_after = None
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        headers = headers or {}
+        self.requests.append(headers)
+        fail_after, self.fail_after = self.fail_after, None
+        validators = {"ETag": self.etag} if self.etag else {}
+        if self.ranges and "Range" in headers and headers.get("If-Range") == self.etag:
+            start = int(headers["Range"].split("=")[1].rstrip("-"))
+            body = self.payload[start:]
+            return FakeResponse(206, body, {
+                "Content-Length": str(len(body)),
+                "Content-Range": f"bytes {start}-{len(self.payload) - 1}/{len(self.payload)}",
+                **validators,
+            }, fail_after)
+        return FakeResponse(200, self.payload, {"Content-Length": str(len(self.payload)), **validators}, fail_after)
+
+
+def _interrupted(server, dest, after=1000):
+    server.fail_after = after
+    with pytest.raises(ConnectionError):
+        stream_download("https://example.org/file.grib2", dest, session=server, chunk_size=100)
+    assert part_path(dest).stat().st_size == after
+
+
+def test_download_is_published_atomically(tmp_path):
+    dest = tmp_path / "file.grib2"
+    result = stream_download("https://example.org/file.grib2", dest, session=RangeServer(), chunk_size=100)
+
+    assert dest.read_bytes() == PAYLOAD
+    assert not part_path(dest).exists()
+    assert result.sha256 == hashlib.sha256(PAYLOAD).hexdigest()
+    assert result.resumed_from == 0
+
+
+def test_partial_file_is_resumed(tmp_path):
+    dest = tmp_path / "file.grib2"
+    server = RangeServer()
+    _interrupted(server, dest)
+    assert validator_path(dest).read_text() == '"v1"'
+
+    result = stream_download("https://example.org/file.grib2", dest, session=server)
+
+    assert server.requests[-1] == {"Range": "bytes=1000-", "If-Range": '"v1"'}
+    assert result.resumed_from == 1000
+    assert dest.read_bytes() == PAYLOAD
+    assert result.sha256 == hashlib.sha256(PAYLOAD).hexdigest()
+    assert not validator_path(dest).exists()
+
+
+def test_file_republished_between_attempts_restarts_from_zero(tmp_path):
+    dest = tmp_path / "file.grib2"
+    server = RangeServer()
+    _interrupted(server, dest)
+
+    # Same length, different content: If-Range no longer matches, the server sends it whole
+    republished = bytes(reversed(PAYLOAD))
+    server.payload, server.etag = republished, '"v2"'
+    result = stream_download("https://example.org/file.grib2", dest, session=server)
+
+    assert result.resumed_from == 0
+    assert dest.read_bytes() == republished
+
+
+def test_partial_file_without_a_validator_is_not_resumed(tmp_path):
+    dest = tmp_path / "file.grib2"
+    part_path(dest).write_bytes(PAYLOAD[:1000])
+    server = RangeServer()
+
+    result = stream_download("https://example.org/file.grib2", dest, session=server)
+
+    assert server.requests == [{}]
+    assert result.resumed_from == 0 and dest.read_bytes() == PAYLOAD
+
+
+def test_server_without_range_support_restarts(tmp_path):
+    dest = tmp_path / "file.tif"
+    server = RangeServer(ranges=False)
+    _interrupted(server, dest)
+
+    result = stream_download("https://example.org/file.tif", dest, session=server)
+
+    assert "Range" in server.requests[-1]
+    assert result.resumed_from == 0
+    assert dest.read_bytes() == PAYLOAD
+
+
+def test_digest_mismatch_is_rejected(tmp_path):
+    dest = tmp_path / "file.tif"
+    with pytest.raises(DownloadError):
+        stream_download("https://example.org/file.tif", dest, session=RangeServer(), expected_sha256="0" * 64)
+    assert not dest.exists()
+    assert not part_path(dest).exists()
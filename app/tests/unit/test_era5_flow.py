@@ -0,0 +1,104 @@
+import logging
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+xr = pytest.importorskip("xarray")
+pytest.importorskip("rioxarray")
+pytest.importorskip("netCDF4")
+pytest.importorskip("prefect")
+pytest.importorskip("cdsapi")
+pytest.importorskip("pydantic_settings")
+
+# The flows import settings as ``config.settings`` (they run from app/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.workflows.data_processing import era5_flow  # noqa: E402
+
+
+@pytest.fixture
+def flow_env(tmp_path, monkeypatch):
+    settings = era5_flow.get_settings()
+    monkeypatch.setattr(settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(era5_flow, "get_run_logger", lambda: logging.getLogger("test"))
+    return tmp_path
+
+
+def _cds_file(path, days, kelvin=300.0):
+    times = pd.to_datetime([d.isoformat() for d in days])
+    lats = np.arange(-10.0, -15.5, -0.5)
+    lons = np.arange(-55.0, -49.5, 0.5)
+    values = np.full((len(times), len(lats), len(lons)), kelvin, dtype=np.float32)
+    values += np.arange(len(times), dtype=np.float32)[:, None, None]
+    xr.Dataset(
+        {"t2m": (("valid_time", "lat", "lon"), values)},
+        coords={"valid_time": times, "lat": lats, "lon": lons},
+    ).to_netcdf(path)
+    return path
+
+
+def test_find_variable_falls_back_to_short_and_partial_names():
+    ds = xr.Dataset({"t2m": ("x", [1.0])})
+    assert era5_flow._find_variable(ds, "2m_temperature") == "t2m"
+    assert era5_flow._find_variable(xr.Dataset({"tp": ("x", [1.0])}), "tp") == "tp"
+    ds = xr.Dataset({"precipitation_total": ("x", [1.0])})
+    assert era5_flow._find_variable(ds, "total_precipitation") == "precipitation_total"
+    with pytest.raises(ValueError, match="not found"):
+        era5_flow._find_variable(xr.Dataset({"u10": ("x", [1.0])}), "surface_pressure")
+
+
+def test_normalize_renames_clips_selects_days_and_converts_units(flow_env):
+    days = [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)]
+    path = _cds_file(flow_env / "batch.nc", days)
+
+    batch = era5_flow.normalize_era5_batch(
+        path, "2m_temperature", "daily_maximum", [-11.0, -54.0, -13.0, -52.0], dates=[days[0], days[2]]
+    )
+
+    assert batch.dims == ("time", "latitude", "longitude")
+    assert batch.name == "temp_max"
+    assert list(pd.to_datetime(batch.time.values).date) == [days[0], days[2]]
+    np.testing.assert_allclose(batch.isel(time=1).values, 300.0 + 2 - 273.15, rtol=1e-5)
+    assert float(batch.latitude.min()) >= -13.0 and float(batch.latitude.max()) <= -11.0
+    assert float(batch.longitude.min()) >= -54.0 and float(batch.longitude.max()) <= -52.0
+
+
+def test_write_daily_geotiffs_keeps_written_days_when_one_fails(flow_env, monkeypatch):
+    days = [date(2024, 1, 1), date(2024, 1, 2)]
+    batch = era5_flow.normalize_era5_batch(
+        _cds_file(flow_env / "batch.nc", days), "2m_temperature", "daily_maximum", [-10.0, -55.0, -15.0, -50.0]
+    )
+    real_write_cogs = era5_flow.write_cogs
+
+    def failing_second_day(jobs, source=None):
+        jobs = list(jobs)
+        yield from real_write_cogs(jobs[:1], source=source)
+        yield jobs[1][1], OSError("disk full")
+
+    monkeypatch.setattr(era5_flow, "write_cogs", failing_second_day)
+    written, failed = era5_flow.write_daily_geotiffs(batch, "2m_temperature", "daily_maximum", days)
+
+    assert [p.name for p in written] == ["temp_max_20240101.tif"]
+    assert failed == [days[1]]
+    manifest = era5_flow.manifest_for("temp_max", str(flow_env))
+    assert manifest.get(days[0])["cog_path"] and not (manifest.get(days[1]) or {}).get("cog_path")
+
+
+def test_failed_history_append_still_returns_the_cogs(flow_env, monkeypatch):
+    days = [date(2024, 1, 1), date(2024, 1, 2)]
+    path = _cds_file(flow_env / "batch.nc", days)
+
+    def rejected(*args, **kwargs):
+        raise ValueError("grid mismatch")
+
+    monkeypatch.setattr(era5_flow, "append_to_historical_netcdf", rejected)
+    processed, errors = era5_flow.process_era5_batch.fn(
+        path, "2m_temperature", "daily_maximum", (-55.0, -15.0, -50.0, -10.0), days, days
+    )
+
+    assert [p.name for p in processed] == ["temp_max_20240101.tif", "temp_max_20240102.tif"]
+    assert errors == ["historical append failed: grid mismatch"]
@@ -0,0 +1,140 @@
+import logging
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("prefect")
+pytest.importorskip("rioxarray")
+pytest.importorskip("shapefile")
+pytest.importorskip("cdsapi")
+pytest.importorskip("pydantic_settings")
+
+# The flows import settings as ``config.settings`` (they run from app/)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.workflows.data_processing import flows, tasks  # noqa: E402
+from app.workflows.data_processing.schemas import DataSource  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def quiet_logger(monkeypatch):
+    for module in (flows, tasks):
+        monkeypatch.setattr(module, "get_run_logger", lambda: logging.getLogger("test"))
+
+
+class Future:
+    """Runs the task when its result is asked for, resolving future arguments first."""
+
+    def __init__(self, fn, args, on_result=None):
+        self.fn, self.args, self.on_result = fn, args, on_result
+
+    def result(self):
+        if self.on_result:
+            self.on_result()
+        return self.fn(*(a.result() if isinstance(a, Future) else a for a in self.args))
+
+
+class FakeTask:
+    def __init__(self, fn, on_submit=None, on_result=None):
+        self.fn, self.on_submit, self.on_result = fn, on_submit, on_result
+        self.calls = []
+
+    def submit(self, *args, **kwargs):
+        self.calls.append(args)
+        if self.on_submit:
+            self.on_submit()
+        return Future(self.fn, args, self.on_result)
+
+
+def test_list_remote_dates_reads_every_day_of_the_directory_index(monkeypatch):
+    index = "".join(
+        f'<a href="chirps-v3.0.{d:%Y.%m.%d}.tif">chirps-v3.0.{d:%Y.%m.%d}.tif</a>\n'
+        for d in (date(2024, 1, 31), date(2024, 2, 1), date(2024, 12, 31))
+    )
+    requested = []
+
+    def get(url, timeout):
+        requested.append(url)
+        return SimpleNamespace(status_code=200, text=index, raise_for_status=lambda: None)
+
+    monkeypatch.setattr(tasks, "http_session", lambda: SimpleNamespace(get=get))
+    url = tasks.listing_url(date(2024, 5, 1), DataSource.CHIRPS)
+
+    assert tasks.list_remote_dates.fn(DataSource.CHIRPS, url) == {date(2024, 1, 31), date(2024, 2, 1), date(2024, 12, 31)}
+    assert requested == ["https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/final/IMERGlate-v07/2024/"]
+
+    monkeypatch.setattr(tasks, "http_session", lambda: SimpleNamespace(get=lambda url, timeout: SimpleNamespace(status_code=404)))
+    assert tasks.list_remote_dates.fn(DataSource.CHIRPS, url) == set()
+
+
+def test_available_dates_fetches_each_remote_directory_once(monkeypatch):
+    days = [date(2023, 12, 30) + timedelta(days=i) for i in range(70)]
+    published = {d for d in days if d.day != 15}
+    listing = FakeTask(lambda source, url: {d for d in published if tasks.listing_url(d, source) == url})
+    monkeypatch.setattr(flows, "list_remote_dates", listing)
+
+    assert flows.available_dates(DataSource.CHIRPS, days) == [d for d in days if d.day != 15]
+    # CHIRPS is one directory per year
+    assert [url.rstrip("/").rsplit("/", 1)[-1] for _, url in listing.calls] == ["2023", "2024"]
+
+    listing.calls.clear()
+    flows.available_dates(DataSource.MERGE, days)
+    # MERGE is one directory per month
+    assert [url.rstrip("/").rsplit("/", 2)[-2:] for _, url in listing.calls] == [
+        ["2023", "12"], ["2024", "01"], ["2024", "02"], ["2024", "03"],
+    ]
+
+
+def test_ingestion_pipeline_bounds_days_in_flight_and_skips_failures(monkeypatch):
+    monkeypatch.setattr(flows.get_settings(), "MAX_IN_FLIGHT", 3)
+    state = {"in_flight": 0, "peak": 0}
+    days = [date(2024, 1, d) for d in range(1, 11)]
+
+    def download(day, source):
+        if day.day == 4:
+            raise OSError("connection reset")
+        return f"raw_{day:%d}"
+
+    def submitted():
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+
+    def collected():
+        state["in_flight"] -= 1
+
+    download_task = FakeTask(download)
+    monkeypatch.setattr(flows, "download_data", download_task)
+    monkeypatch.setattr(flows, "process_data", FakeTask(lambda raw, day, source: Path(f"/data/{raw}.tif")))
+    validate = FakeTask(lambda processed, day, source: day.day != 7, on_submit=submitted, on_result=collected)
+    monkeypatch.setattr(flows, "validate_output", validate)
+
+    paths = flows.run_ingestion_pipeline(days, DataSource.CHIRPS, bbox=None)
+
+    assert [p.name for p in paths] == [f"raw_{d:02d}.tif" for d in range(1, 11) if d not in (4, 7)]
+    assert [call[0] for call in download_task.calls] == days
+    assert state["peak"] == 3 and state["in_flight"] == 0
+
+
+def test_update_mosaic_falls_back_to_a_full_rebuild_when_harvesting_fails(monkeypatch):
+    def harvest(mosaic_dir, paths):
+        raise RuntimeError("GeoServer returned 500")
+
+    rebuild = FakeTask(lambda source: None)
+    aggregates = FakeTask(lambda source, days: [])
+    monkeypatch.setattr(flows, "harvest_mosaic_granules", FakeTask(harvest))
+    monkeypatch.setattr(flows, "refresh_mosaic_shapefile", rebuild)
+    monkeypatch.setattr(flows, "update_aggregate_mosaics", aggregates)
+
+    paths = [Path("/data/chirps/chirps_20240101.tif")]
+    flows.update_mosaic(Path("/data/chirps"), paths, DataSource.CHIRPS)
+
+    assert rebuild.calls == [(DataSource.CHIRPS,)]
+    assert aggregates.calls == [("chirps", [date(2024, 1, 1)])]
+
+    rebuild.calls.clear()
+    monkeypatch.setattr(flows, "harvest_mosaic_granules", FakeTask(lambda mosaic_dir, paths: len(paths)))
+    flows.update_mosaic(Path("/data/chirps"), paths, DataSource.CHIRPS)
+    assert rebuild.calls == []
@@ -0,0 +1,129 @@
+from datetime import date
+from io import BytesIO
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+pytest.importorskip("pydantic_settings")
+shapely_geometry = pytest.importorskip("shapely.geometry")
+
+from PIL import Image  # noqa: E402
+
+from app.services import georisk_render  # noqa: E402
+
+COLORS = ["#FF0000", "#00FF00", "#0000FF"]
+VALUES = np.array([[np.nan, -3.0, 0.0, 0.5, 1.0, 4.9], [5.0, 9.99, 10.0, 19.99, 20.0, 500.0]])
+
+
+def _reference(data, bounds, colors):
+    """What render_matplotlib's pcolormesh paints for each cell."""
+    matplotlib_colors = pytest.importorskip("matplotlib.colors")
+    cmap = matplotlib_colors.ListedColormap(colors)
+    norm = matplotlib_colors.BoundaryNorm(bounds, cmap.N, clip=False)
+    return (cmap(norm(np.ma.masked_invalid(data))) * 255).round().astype(np.uint8)
+
+
+@pytest.mark.parametrize("bounds, colors", [
+    # As sent by /georisk/cmaps: transparent class for [0, 1) prepended
+    ([0, 1, 5, 10, 20], ["#00000000"] + COLORS + ["#FFFF00"]),
+    ([1, 5, 10, 20], COLORS),
+    # More colors than bins: BoundaryNorm spreads the bins over the colormap
+    ([1, 5, 10], COLORS + ["#FFFF00", "#00FFFF"]),
+    ([1, 10], COLORS),
+])
+def test_lut_matches_the_matplotlib_colormap(bounds, colors):
+    np.testing.assert_array_equal(
+        georisk_render.apply_boundary_lut(VALUES, bounds, colors), _reference(VALUES, bounds, colors)
+    )
+
+
+@pytest.fixture
+def grid(monkeypatch):
+    # South-up grid (lats ascending), as decoded from the cube
+    lons = np.linspace(-60.0, -40.0, 21)
+    lats = np.linspace(-20.0, 0.0, 11)
+    precip = np.zeros((11, 21), dtype=np.float32)
+    precip[-1, :] = 15.0  # northernmost row
+    border = shapely_geometry.box(-55.0, -15.0, -45.0, -5.0)
+    monkeypatch.setattr(georisk_render, "load_accumulation", lambda *period: (lons, lats, precip))
+    monkeypatch.setattr(georisk_render, "load_border", lambda: border)
+    return lons, lats, precip
+
+
+def test_fast_render_is_the_lut_north_up_with_the_border_on_top(grid):
+    bounds, colors = [0, 1, 5, 10, 20], ["#00000000"] + COLORS + ["#FFFF00"]
+    png = georisk_render.render_cmap(bounds, colors, 200, "fast")
+    image = np.asarray(Image.open(BytesIO(png)).convert("RGBA"))
+
+    # dpi 200 -> every cell is 2x2 pixels
+    assert image.shape == (22, 42, 4)
+    expected = np.repeat(np.repeat(georisk_render.apply_boundary_lut(grid[2], bounds, colors)[::-1], 2, 0), 2, 1)
+    # Border box spans lon -55..-45 / lat -15..-5 -> pixel columns ~10..30, rows ~5..16
+    outside = np.ones(image.shape[:2], dtype=bool)
+    outside[3:18, 9:32] = False
+    np.testing.assert_array_equal(image[outside], expected[outside])
+    # 15 mm falls in [10, 20); the wet row is on top
+    assert (image[:2] == (255, 255, 0, 255)).all()
+    assert tuple(image[10, 20]) == (0, 0, 0, 0)
+    # The border is drawn in black over the transparent cells
+    assert (image[5:16, 10] == (0, 0, 0, 255)).all()
+
+
+def test_cube_accumulations_are_reread_when_the_cube_changes(monkeypatch):
+    xr = pytest.importorskip("xarray")
+    from app.services import accumulation
+
+    reads = []
+
+    def accumulate(source, start, end):
+        reads.append((source, start, end))
+        return xr.DataArray(
+            np.ones((2, 2), dtype=np.float64),
+            coords={"latitude": [-1.0, 0.0], "longitude": [-50.0, -49.0]},
+            dims=("latitude", "longitude"),
+        )
+
+    version = {"value": 1.0}
+    monkeypatch.setattr(accumulation, "accumulate", accumulate)
+    monkeypatch.setattr(accumulation, "cube_version", lambda source: version["value"])
+    georisk_render._load_accumulation.cache_clear()
+    period = ("chirps", date(2024, 1, 1), date(2024, 1, 31))
+
+    lons, lats, precip = georisk_render.load_accumulation(*period)
+    georisk_render.load_accumulation(*period)
+    assert precip.dtype == np.float32 and len(reads) == 1
+
+    version["value"] = 2.0
+    georisk_render.load_accumulation(*period)
+    assert len(reads) == 2
+    georisk_render._load_accumulation.cache_clear()
+
+
+def test_cmap_cache_is_keyed_on_the_cube_version(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.routers import georisk
+    from app.services import accumulation, raster_render
+    from app.services.cache import LRUCache
+
+    renders = []
+    version = {"value": 1.0}
+    monkeypatch.setattr(georisk, "cmap_cache", LRUCache(max_bytes=1024 * 1024))
+    monkeypatch.setattr(raster_render, "get_render_pool", lambda: None)
+    monkeypatch.setattr(georisk_render, "render_cmap", lambda *args: renders.append(args) or b"png")
+    monkeypatch.setattr(accumulation, "cube_version", lambda source: version["value"])
+    app = FastAPI()
+    app.include_router(georisk.router)
+    client = TestClient(app)
+    query = "/georisk/cmaps?renderer=fast&source=chirps&start_date=2024-01-01&end_date=2024-01-31"
+
+    assert client.get(query).headers["x-cache"] == "MISS"
+    assert client.get(query).headers["x-cache"] == "HIT"
+    # The cube is extended by the daily flow: the same period is rendered again
+    version["value"] = 2.0
+    assert client.get(query).headers["x-cache"] == "MISS"
+    assert len(renders) == 2
@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from app.services.geoserver_rest import (  # noqa: E402
+    CatalogSpec,
+    CatalogSync,
+    GeoServerRestClient,
+    MosaicSpec,
+    StyleSpec,
+)
+
+SLD = "<StyledLayerDescriptor><NamedLayer><Name>rain</Name></NamedLayer></StyledLayerDescriptor>"
+
+
+class FakeGeoServer:
+    """In-memory REST catalog: JSON resources by path, SLD bodies by style name."""
+
+    def __init__(self):
+        self.resources = {}
+        self.styles = {}
+        self.writes = []
+
+    def __call__(self, request):
+        path = request.url.path[len("/geoserver/rest"):]
+        if request.method == "GET":
+            return self._get(path)
+        self.writes.append((request.method, path))
+        body = request.content.decode()
+        if path == "/workspaces":
+            name = json.loads(body)["workspace"]["name"]
+            self.resources[f"/workspaces/{name}"] = {"workspace": {"name": name}}
+        elif path == "/styles":
+            self.styles[request.url.params["name"]] = body
+        elif path.startswith("/styles/"):
+            self.styles[path.split("/")[-1]] = body
+        elif path.endswith("/coveragestores"):
+            store = json.loads(body)["coverageStore"]
+            # GeoServer stores 'file://a/b' as 'file:/a/b'
+            store["url"] = "file:/" + store["url"].split("file:", 1)[1].strip("/")
+            self.resources[f"{path}/{store['name']}"] = {"coverageStore": store}
+            ws = path.split("/")[2]
+            self.resources[f"/layers/{ws}:{store['name']}"] = {"layer": {"defaultStyle": {"name": "raster"}}}
+        elif path.endswith("/coverages"):
+            coverage = json.loads(body)["coverage"]
+            self.resources[f"{path}/{coverage['name']}"] = {"coverage": coverage}
+        elif request.method == "PUT" and path in self.resources:
+            (kind, update), = json.loads(body).items()
+            self.resources[path][kind].update(update)
+        else:
+            return httpx.Response(404)
+        return httpx.Response(201)
+
+    def _get(self, path):
+        if path.startswith("/styles/") and path.endswith(".sld"):
+            sld = self.styles.get(path[len("/styles/"):-len(".sld")])
+            return httpx.Response(404) if sld is None else httpx.Response(200, text=sld)
+        resource = self.resources.get(path[:-len(".json")] if path.endswith(".json") else path)
+        return httpx.Response(404) if resource is None else httpx.Response(200, json=resource)
+
+
+def _spec(data_dir="/data/chirps", sld=SLD):
+    return CatalogSpec(
+        workspaces=["precip_ws"],
+        styles=[StyleSpec("rain", sld)],
+        mosaics=[MosaicSpec("precip_ws", "chirps", data_dir, title="CHIRPS", default_style="rain")],
+    )
+
+
+def _sync(server, spec, dry_run=False):
+    async def run():
+        client = GeoServerRestClient(
+            "http://geoserver.test/geoserver", ("admin", "secret"), transport=httpx.MockTransport(server)
+        )
+        async with client:
+            return await CatalogSync(client, dry_run=dry_run).run(spec)
+
+    return asyncio.run(run())
+
+
+def test_sync_creates_the_whole_catalog_on_an_empty_server():
+    server = FakeGeoServer()
+    changes = _sync(server, _spec())
+
+    assert changes == [
+        "create workspace precip_ws",
+        "create style rain",
+        "create store precip_ws:chirps",
+        "create coverage precip_ws:chirps",
+        "configure time dimension on precip_ws:chirps",
+        "set default style rain on precip_ws:chirps",
+    ]
+    store = server.resources["/workspaces/precip_ws/coveragestores/chirps"]["coverageStore"]
+    assert store["url"] == "file:/data/chirps"
+    coverage = server.resources["/workspaces/precip_ws/coveragestores/chirps/coverages/chirps"]["coverage"]
+    assert coverage["metadata"]["entry"][0]["dimensionInfo"]["attribute"] == "ingestion"
+    assert server.resources["/layers/precip_ws:chirps"]["layer"]["defaultStyle"]["name"] == "rain"
+    assert server.styles["rain"] == SLD
+
+
+def test_rerun_against_an_up_to_date_server_is_read_only():
+    server = FakeGeoServer()
+    _sync(server, _spec())
+    server.writes.clear()
+
+    assert _sync(server, _spec()) == []
+    assert server.writes == []
+
+
+def test_sync_updates_only_what_changed():
+    server = FakeGeoServer()
+    _sync(server, _spec())
+    server.writes.clear()
+
+    # Whitespace-only SLD differences are not a change
+    changes = _sync(server, _spec(data_dir="/srv/chirps", sld=SLD.replace("><", ">\n  <")))
+
+    assert changes == ["update store precip_ws:chirps url"]
+    assert server.writes == [("PUT", "/workspaces/precip_ws/coveragestores/chirps")]
+    store = server.resources["/workspaces/precip_ws/coveragestores/chirps"]["coverageStore"]
+    assert store["url"] == "file:///srv/chirps"
+
+    changes = _sync(server, _spec(data_dir="/srv/chirps", sld=SLD.replace("rain</Name>", "rainfall</Name>")))
+    assert changes == ["update style rain"]
+
+
+def test_dry_run_plans_changes_without_writing():
+    server = FakeGeoServer()
+    changes = _sync(server, _spec(), dry_run=True)
+
+    assert changes == [
+        "create workspace precip_ws",
+        "create style rain",
+        "create store precip_ws:chirps",
+        "create coverage precip_ws:chirps",
+        "enable time dimension on precip_ws:chirps",
+        "set default style rain on precip_ws:chirps",
+    ]
+    assert server.writes == []
+    assert server.resources == {} and server.styles == {}
+
+
+def test_failed_writes_raise():
+    def read_only(request):
+        return httpx.Response(404 if request.method == "GET" else 403, text="forbidden")
+
+    with pytest.raises(RuntimeError, match="403"):
+        _sync(read_only, CatalogSpec(workspaces=["precip_ws"]))
+
+
+def test_aggregate_mosaics_get_styles_scaled_to_their_period():
+    pytest.importorskip("pydantic_settings")
+    from app.services.colormap import parse_sld_colormap
+    from app.services.geoserver_rest import default_spec
+
+    spec = default_spec()
+    styles = {style.name: parse_sld_colormap(style.sld) for style in spec.styles}
+    top = {name: colormap["entries"][-1]["quantity"] for name, colormap in styles.items()}
+    by_layer = {mosaic.layer_name: mosaic.default_style for mosaic in spec.mosaics}
+
+    # Every mosaic has a style that is published with the catalog
+    assert all(style in styles for style in by_layer.values())
+    assert top["precipitation_style"] < top[by_layer["chirps_monthly"]] < top[by_layer["chirps_annual"]]
+    for layer in ("chirps_monthly_anomaly", "chirps_annual_anomaly", "temp_monthly_anomaly"):
+        entries = styles[by_layer[layer]]["entries"]
+        # Diverging around zero
+        assert entries[0]["quantity"] == -entries[-1]["quantity"] < 0
+    assert top[by_layer["chirps_monthly_anomaly"]] < top[by_layer["chirps_annual_anomaly"]]
@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import pytest
+
+for module in ("fastapi", "httpx", "xarray", "rioxarray", "geopandas", "dask.distributed", "PIL", "pydantic_settings"):
+    pytest.importorskip(module)
+
+np = pytest.importorskip("numpy")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from app.api.routers import map as map_router  # noqa: E402
+from app.services import legend  # noqa: E402
+from app.services.cache import LRUCache  # noqa: E402
+
+COLORMAP = {
+    "type": "intervals",
+    "entries": [
+        {"quantity": 0.0, "color": "#FFFFFF", "opacity": 0.0, "label": "0"},
+        {"quantity": 10.0, "color": "#FF0000", "opacity": 1.0, "label": "10"},
+        {"quantity": 20.0, "color": "#0000FF", "opacity": 1.0, "label": "20"},
+    ],
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(map_router, "legend_cache", LRUCache(max_bytes=1024 * 1024))
+    app = FastAPI()
+    app.include_router(map_router.router)
+    return TestClient(app)
+
+
+def test_legend_etag_round_trip(client):
+    first = client.get("/map/legend/precipitation_style")
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/png"
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and "max-age" in first.headers["cache-control"]
+
+    # Served from the cache with the same validator
+    again = client.get("/map/legend/precipitation_style")
+    assert again.content == first.content and again.headers["etag"] == etag
+
+    not_modified = client.get("/map/legend/precipitation_style", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b"" and not_modified.headers["etag"] == etag
+
+    stale = client.get("/map/legend/precipitation_style", headers={"If-None-Match": '"stale"'})
+    assert stale.status_code == 200 and stale.content == first.content
+
+    # Another rendering of the same style is another representation
+    svg = client.get("/map/legend/precipitation_style?format=svg&orientation=horizontal&width=300&height=40")
+    assert svg.status_code == 200
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+    assert svg.headers["etag"] != etag
+    assert client.get(
+        "/map/legend/precipitation_style", headers={"If-None-Match": svg.headers["etag"]}
+    ).status_code == 200
+
+
+def test_legend_rejects_bad_parameters(client):
+    assert client.get("/map/legend/no_such_style").status_code == 404
+    assert client.get("/map/legend/precipitation_style?format=gif").status_code == 400
+    assert client.get("/map/legend/precipitation_style?orientation=diagonal").status_code == 400
+    assert client.get("/map/legend/precipitation_style?width=5").status_code == 422
+
+
+def test_png_legend_gives_each_interval_an_equal_block_high_values_on_top():
+    image = np.asarray(Image.open(BytesIO(legend.render_png(COLORMAP, "vertical", 60, 100))).convert("RGBA"))
+
+    assert image.shape == (100, 60, 4)
+    assert (image[:50, 0] == (0, 0, 255, 255)).all()
+    assert (image[50:, 0] == (255, 0, 0, 255)).all()
+
+
+def test_svg_legend_draws_intervals_as_steps():
+    svg = legend.render_svg(COLORMAP, "horizontal", 200, 40).decode()
+
+    assert 'stop-color="#FFFFFF"' not in svg
+    assert svg.count('<stop offset="0.0000" stop-color="#FF0000"') == 1
+    assert svg.count('<stop offset="0.5000" stop-color="#FF0000"') == 1
+    assert svg.count('<stop offset="0.5000" stop-color="#0000FF"') == 1
+    assert svg.count('<stop offset="1.0000" stop-color="#0000FF"') == 1
+    # Interval labels sit on the upper edge of their block
+    assert '<text x="100.0" y="36" text-anchor="middle">10</text>' in svg
+    assert '<text x="199.0" y="36" text-anchor="middle">20</text>' in svg
@@ -0,0 +1,120 @@
+import os
+from datetime import date
+
+import pytest
+
+from app.services import manifest as manifest_module
+from app.services.manifest import Manifest, manifest_for
+
+
+def test_missing_and_missing_in_cube(tmp_path):
+    m = Manifest(tmp_path / "chirps.sqlite")
+    cog = tmp_path / "chirps_20240102.tif"
+    cog.write_bytes(b"cog")
+
+    m.record_cog(date(2024, 1, 2), cog, raw_url="https://example.org/a.tif")
+    m.mark_in_cube([date(2024, 1, 1), date(2024, 1, 2)])
+
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 1), date(2024, 1, 3)]
+    assert m.missing_in_cube(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 3)]
+
+    entry = m.get(date(2024, 1, 2))
+    assert entry["size"] == 3
+    assert entry["checksum"] == manifest_module.file_checksum(cog)
+    assert entry["in_cube"] is True
+    m.close()
+
+
+def test_record_cog_keeps_cube_flag_and_stats(tmp_path):
+    m = Manifest(tmp_path / "temp.sqlite")
+    cog = tmp_path / "temp_20240105.tif"
+    cog.write_bytes(b"x")
+
+    m.mark_in_cube([date(2024, 1, 5)])
+    m.record_cog(date(2024, 1, 5), cog, stats={"min": 1.0, "max": 3.0, "mean": 2.0, "valid_fraction": 0.5})
+    m.record_cog(date(2024, 1, 5), cog)
+
+    entry = m.get(date(2024, 1, 5))
+    assert entry["in_cube"] is True
+    assert (entry["min"], entry["max"], entry["valid_fraction"]) == (1.0, 3.0, 0.5)
+    m.close()
+
+
+def test_manifest_for_seeds_from_cog_directory(tmp_path):
+    mosaic_dir = tmp_path / "merge"
+    mosaic_dir.mkdir()
+    for day in ("20240101", "20240103"):
+        (mosaic_dir / f"merge_{day}.tif").write_bytes(b"")
+
+    m = manifest_for("merge", tmp_path)
+
+    assert m.db_path == tmp_path / ".manifest" / "merge.sqlite"
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 2)]
+    assert manifest_for("merge", tmp_path) is m
+    m.close()
+
+
+def test_cogs_changed_outside_the_flows_are_reconciled(tmp_path):
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    first, second = mosaic_dir / "chirps_20240101.tif", mosaic_dir / "chirps_20240102.tif"
+    first.write_bytes(b"")
+    second.write_bytes(b"")
+    m = manifest_for("chirps", tmp_path)
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 3)]
+
+    # Deleted by hand: downloaded again on the next run
+    second.unlink()
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 2), date(2024, 1, 3)]
+    assert m.get(date(2024, 1, 2))["cog_path"] is None
+
+    # Copied in by hand: picked up once the directory changes
+    (mosaic_dir / "chirps_20240103.tif").write_bytes(b"")
+    stat = mosaic_dir.stat()
+    os.utime(mosaic_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 2)]
+    m.close()
+
+
+def test_summary_weights_means_by_valid_fraction(tmp_path):
+    m = Manifest(tmp_path / "chirps.sqlite")
+    cog = tmp_path / "chirps.tif"
+    cog.write_bytes(b"x")
+    m.record_cog(date(2024, 1, 1), cog, stats={"min": 0.0, "max": 10.0, "mean": 2.0, "valid_fraction": 1.0, "nan_count": 0})
+    m.record_cog(date(2024, 1, 2), cog, stats={"min": 1.0, "max": 40.0, "mean": 8.0, "valid_fraction": 0.5, "nan_count": 7})
+    m.record_cog(date(2024, 1, 3), cog)
+
+    summary = m.summary(date(2024, 1, 1), date(2024, 1, 3))
+    assert summary["days"] == 2
+    assert (summary["min"], summary["max"]) == (0.0, 40.0)
+    assert summary["mean"] == pytest.approx(4.0)
+    assert [row["nan_count"] for row in m.stats_between(date(2024, 1, 1), date(2024, 1, 3))] == [0, 7]
+    m.close()
+
+
+def test_range_queries_only_stat_the_directory_between_external_changes(tmp_path, monkeypatch):
+    from app.services import consistency
+
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    (mosaic_dir / "chirps_20240101.tif").write_bytes(b"")
+    m = manifest_for("chirps", tmp_path)
+    scans = []
+    real_list_granules = consistency.list_granules
+    monkeypatch.setattr(consistency, "list_granules", lambda d: scans.append(d) or real_list_granules(d))
+
+    # A COG written by the flows moves the directory mtime the manifest expects
+    cog = mosaic_dir / "chirps_20240102.tif"
+    cog.write_bytes(b"x")
+    m.record_cog(date(2024, 1, 2), cog)
+    assert m.missing(date(2014, 1, 1), date(2024, 1, 2))[-1] == date(2023, 12, 31)
+    # Another process opening the same manifest is in step as well
+    assert Manifest(m.db_path, mosaic_dir=mosaic_dir).missing(date(2024, 1, 1), date(2024, 1, 2)) == []
+    assert scans == []
+
+    # The consistency flow forces a scan
+    (mosaic_dir / "chirps_20240101.tif").unlink()
+    assert m.reconcile(force=True) == 1
+    assert m.missing(date(2024, 1, 1), date(2024, 1, 2)) == [date(2024, 1, 1)]
+    assert len(scans) == 1
+    m.close()
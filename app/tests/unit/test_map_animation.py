@@ -0,0 +1,68 @@
+import pytest
+
+for module in ("fastapi", "httpx", "xarray", "rioxarray", "geopandas", "dask.distributed", "PIL", "pydantic_settings"):
+    pytest.importorskip(module)
+
+np = pytest.importorskip("numpy")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+
+from app.api.routers import map as map_router  # noqa: E402
+from app.services import cog, raster_render  # noqa: E402
+from app.services.cache import LRUCache  # noqa: E402
+
+BODY = {"start_date": "2024-01-01", "end_date": "2024-01-02", "bbox": [-50.0, -12.0, -48.0, -10.0]}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Frames render on the default thread pool so the patched DATA_DIR is seen
+    monkeypatch.setattr(raster_render.settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(raster_render, "get_render_pool", lambda: None)
+    monkeypatch.setattr(map_router, "animation_cache", LRUCache(max_bytes=1024 * 1024))
+    for day, value in (("20240101", 5.0), ("20240102", 40.0)):
+        values = np.full((20, 20), value, dtype=np.float32)
+        path = tmp_path / "chirps" / f"chirps_{day}.tif"
+        cog.write_array(values, from_origin(-50.0, -10.0, 0.1, 0.1), path, nodata=-9999.0)
+    app = FastAPI()
+    app.include_router(map_router.router)
+    return TestClient(app)
+
+
+def test_animation_renders_with_default_size(client):
+    response = client.post("/map/chirps/animation", json={**BODY, "format": "gif"})
+
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "image/gif"
+    assert response.content[:6] in (b"GIF87a", b"GIF89a")
+
+
+def test_animation_is_sent_in_binary_chunks(client, monkeypatch):
+    listed = []
+    available_frames = raster_render.available_frames
+    monkeypatch.setattr(raster_render, "available_frames", lambda *args: listed.append(args) or available_frames(*args))
+    first = client.post("/map/chirps/animation", json={**BODY, "format": "apng"})
+    again = client.post("/map/chirps/animation", json={**BODY, "format": "apng"})
+
+    assert first.headers["x-cache"] == "MISS" and again.headers["x-cache"] == "HIT"
+    assert again.content == first.content and len(listed) == 1
+    content = bytes(range(256)) * 10 + b"\n\n"
+    assert [len(c) for c in map_router.iter_chunks(content, 1000)] == [1000, 1000, 562]
+    assert b"".join(map_router.iter_chunks(content, 1000)) == content
+
+
+@pytest.mark.parametrize("field, value", [
+    ("width", None),
+    ("height", None),
+    ("fps", None),
+    ("width", 0),
+    ("height", 5000),
+    ("fps", -1),
+])
+def test_animation_size_and_rate_are_validated(client, field, value):
+    response = client.post("/map/chirps/animation", json={**BODY, field: value})
+
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][-1] == field
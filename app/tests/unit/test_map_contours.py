@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+for module in ("fastapi", "httpx", "xarray", "rioxarray", "geopandas", "dask.distributed", "shapely", "pydantic_settings"):
+    pytest.importorskip(module)
+
+np = pytest.importorskip("numpy")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from rasterio.transform import from_origin  # noqa: E402
+from shapely.geometry import shape  # noqa: E402
+
+from app.api.routers import map as map_router  # noqa: E402
+from app.services import cog, contours  # noqa: E402
+from app.services.cache import LRUCache  # noqa: E402
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(map_router.settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(map_router, "vector_cache", LRUCache(max_bytes=1024 * 1024))
+    contours.cached_bands.cache_clear()
+    app = FastAPI()
+    app.include_router(map_router.router)
+    return TestClient(app)
+
+
+def _write_day(data_dir, day, value, mtime=None):
+    path = data_dir / "chirps" / f"chirps_{day}.tif"
+    values = np.full((20, 20), value, dtype=np.float32)
+    values[:, :10] = 1.0  # below the first break: no polygon
+    cog.write_array(values, from_origin(-50.0, -10.0, 0.1, 0.1), path, nodata=-9999.0)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def _bands(response):
+    assert response.status_code == 200, response.text
+    return [(f["properties"]["lower"], f["properties"]["upper"]) for f in response.json()["features"]]
+
+
+def test_geojson_contours_follow_reingested_days(client, tmp_path):
+    path = _write_day(tmp_path, "20240101", 12.0)
+    query = "/map/chirps/contours?date=2024-01-01&breaks=5,10,20"
+
+    assert _bands(client.get(query)) == [(10.0, 20.0)]
+    geometry = shape(client.get(query).json()["features"][0]["geometry"])
+    assert geometry.bounds == pytest.approx((-49.0, -12.0, -48.0, -10.0))
+
+    # The day is reprocessed: neither cache may serve the old polygons
+    _write_day(tmp_path, "20240101", 25.0, mtime=path.stat().st_mtime + 10)
+    assert _bands(client.get(query)) == [(20.0, None)]
+
+    # Accumulations pick up a newly ingested day inside the range
+    accumulated = "/map/chirps/contours?date=2024-01-01&end_date=2024-01-02&breaks=5,10,20,30"
+    assert _bands(client.get(accumulated)) == [(20.0, 30.0)]
+    _write_day(tmp_path, "20240102", 10.0)
+    assert _bands(client.get(accumulated)) == [(30.0, None)]
+
+
+def test_contour_parameters_are_validated(client, tmp_path):
+    _write_day(tmp_path, "20240101", 12.0)
+
+    assert client.get("/map/chirps/contours?date=01-01-2024").status_code == 400
+    assert client.get("/map/chirps/contours?date=2024-01-02&end_date=2024-01-01").status_code == 400
+    assert client.get("/map/chirps/contours?date=2024-01-01&breaks=a,b").status_code == 400
+    assert client.get("/map/chirps/contours?date=2023-01-01&breaks=5,10").status_code == 404
+    assert client.get("/map/chirps/contours/3/2/4.mvt?date=2024-01-01").status_code in (200, 501)
+    assert client.get("/map/chirps/contours/3/8/8.mvt?date=2024-01-01").status_code == 400
+
+
+def test_mvt_tile_holds_the_bands_it_intersects(client, tmp_path):
+    mapbox_vector_tile = pytest.importorskip("mapbox_vector_tile")
+    _write_day(tmp_path, "20240101", 12.0)
+
+    # z=6 tile 22/33 covers lon -56.25..-50.6 (misses the data), 23/33 covers -50.6..-45
+    empty = client.get("/map/chirps/contours/6/22/33.mvt?date=2024-01-01&breaks=5,10,20")
+    tile = client.get("/map/chirps/contours/6/23/33.mvt?date=2024-01-01&breaks=5,10,20")
+
+    assert tile.status_code == 200
+    assert tile.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    features = mapbox_vector_tile.decode(tile.content)["isohyets"]["features"]
+    assert [(f["properties"]["lower"], f["properties"]["upper"]) for f in features] == [(10.0, 20.0)]
+    assert mapbox_vector_tile.decode(empty.content)["isohyets"]["features"] == []
@@ -0,0 +1,46 @@
+import pytest
+
+for module in ("fastapi", "httpx", "xarray", "rioxarray", "geopandas", "dask.distributed", "pydantic_settings"):
+    pytest.importorskip(module)
+
+from app.api.routers import map as map_router  # noqa: E402
+
+
+class FakeDataset:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def historical(tmp_path, monkeypatch):
+    year_file = tmp_path / "chirps_historical" / "brazil_chirps_2024.nc"
+    year_file.parent.mkdir()
+    year_file.write_bytes(b"1")
+    monkeypatch.setattr(map_router.settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(map_router.xr, "open_mfdataset", lambda *args, **kwargs: FakeDataset())
+    monkeypatch.setattr(map_router, "historical_datasets", {})
+    monkeypatch.setattr(map_router, "historical_signatures", {})
+    monkeypatch.setattr(map_router, "historical_leases", {})
+    monkeypatch.setattr(map_router, "historical_retired", {})
+    return year_file
+
+
+def test_reloaded_dataset_is_closed_once_its_last_query_releases_it(historical):
+    first = map_router.refresh_historical("chirps")
+    leased = map_router.acquire_historical("chirps")
+
+    historical.write_bytes(b"12")
+    second = map_router.refresh_historical("chirps")
+    assert second is not first and not first.closed
+
+    map_router.release_historical(leased)
+    assert first.closed
+
+    # Nobody holds the current one: a reload closes it right away
+    historical.write_bytes(b"123")
+    assert map_router.refresh_historical("chirps") is not second
+    assert second.closed
+    assert map_router.historical_leases == {} and map_router.historical_retired == {}
@@ -0,0 +1,34 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.merge_decoder import GridDef, grid_window  # noqa: E402
+
+# 0-360 grid, rows stored south -> north, 1 degree cells
+GRID = GridDef(ni=360, nj=11, lon_first=0.0, lat_first=-5.0, di=1.0, dj=1.0, j_positive=True)
+
+
+def test_window_wraps_longitudes_and_flips_rows():
+    window = grid_window(GRID, (-3.0, -2.0, 2.0, 1.0))
+
+    assert window.longitudes.tolist() == [-3.0, -2.0, -1.0, 0.0, 1.0, 2.0]
+    assert window.cols.tolist() == [357, 358, 359, 0, 1, 2]
+    assert window.latitudes.tolist() == [1.0, 0.0, -1.0, -2.0]
+    assert window.rows.tolist() == [6, 5, 4, 3]
+    assert window.transform == (-3.5, 1.0, 0.0, 1.5, 0.0, -1.0)
+
+
+def test_window_matches_sort_and_select():
+    values = np.arange(GRID.nj * GRID.ni, dtype=np.float32).reshape(GRID.nj, GRID.ni)
+    window = grid_window(GRID, (-3.0, -2.0, 2.0, 1.0))
+
+    lons = ((np.arange(GRID.ni) + 180.0) % 360.0) - 180.0
+    order = np.argsort(lons)
+    expected = values[:, order][:, (lons[order] >= -3) & (lons[order] <= 2)]
+    expected = expected[3:7][::-1]
+
+    np.testing.assert_array_equal(values[np.ix_(window.rows, window.cols)], expected)
+
+
+def test_window_is_cached_per_grid():
+    assert grid_window(GRID, (-3.0, -2.0, 2.0, 1.0)) is grid_window(GRID, (-3.0, -2.0, 2.0, 1.0))
@@ -0,0 +1,49 @@
+import sqlite3
+from datetime import date
+
+from app.services import mosaic_index
+
+BOUNDS = (-94.0, -53.0, -34.0, 25.0)
+
+
+def _touch(mosaic_dir, name):
+    path = mosaic_dir / name
+    path.write_bytes(b"")
+    return path
+
+
+def test_build_index_writes_geopackage_and_properties(tmp_path):
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    for day in ("20240101", "20240102", "20240103"):
+        _touch(mosaic_dir, f"chirps_{day}.tif")
+
+    db_path = mosaic_index.build_index(mosaic_dir, bounds=BOUNDS)
+
+    assert db_path == mosaic_dir / "chirps.gpkg"
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA application_id").fetchone()[0] == mosaic_index.GPKG_APPLICATION_ID
+        assert conn.execute("SELECT count(*) FROM rtree_chirps_the_geom").fetchone()[0] == 3
+        blob = conn.execute("SELECT the_geom FROM chirps LIMIT 1").fetchone()[0]
+    assert mosaic_index.decode_envelope(blob) == BOUNDS
+    assert "dbtype=geopkg" in (mosaic_dir / "datastore.properties").read_text()
+    assert "TypeName=chirps" in (mosaic_dir / "indexer.properties").read_text()
+
+    assert mosaic_index.granules_between(db_path, "chirps", date(2024, 1, 2), date(2024, 1, 3)) == [
+        "chirps_20240102.tif", "chirps_20240103.tif"
+    ]
+
+
+def test_add_granules_is_incremental(tmp_path):
+    mosaic_dir = tmp_path / "merge"
+    mosaic_dir.mkdir()
+    old = _touch(mosaic_dir, "merge_20240101.tif")
+    db_path = mosaic_index.build_index(mosaic_dir, bounds=BOUNDS)
+
+    new = _touch(mosaic_dir, "merge_20240102.tif")
+    old.unlink()
+    # Re-adding an existing granule replaces it rather than duplicating it
+    assert mosaic_index.add_granules(mosaic_dir, [new, new, old], bounds=BOUNDS) == 3
+
+    rows = mosaic_index.indexed_granules(db_path, "merge")
+    assert rows == [("merge_20240102.tif", "2024-01-02T00:00:00.000Z")]
@@ -0,0 +1,154 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.ndvi_tiles import StreamingComposite, TileGrid  # noqa: E402
+
+
+def test_tiles_cover_the_grid_exactly_once():
+    grid = TileGrid.from_resolution((-50.0, -20.0, -45.0, -17.0), 0.01, tile_size=128)
+
+    covered = np.zeros((grid.height, grid.width), dtype=int)
+    for tile in grid.tiles():
+        covered[tile.row_off:tile.row_off + tile.height, tile.col_off:tile.col_off + tile.width] += 1
+
+    assert (grid.height, grid.width) == (300, 500)
+    assert (covered == 1).all()
+    first = next(grid.tiles())
+    assert first.bounds == pytest.approx((-50.0, -18.28, -48.72, -17.0))
+    assert first.intersects((-49.0, -18.0, -40.0, -10.0))
+    assert not first.intersects((-48.0, -18.0, -40.0, -10.0))
+
+
+def test_streaming_composites_ignore_missing_scenes():
+    a = np.array([[0.1, np.nan], [0.5, np.nan]], dtype=np.float32)
+    b = np.array([[0.3, 0.2], [np.nan, np.nan]], dtype=np.float32)
+    c = np.array([[0.2, 0.4], [0.1, np.nan]], dtype=np.float32)
+
+    best = StreamingComposite((2, 2), "max")
+    median = StreamingComposite((2, 2), "median")
+    for scene in (a, b, c, np.full((2, 2), np.nan, dtype=np.float32)):
+        best.add(scene)
+        median.add(scene)
+
+    assert best.count == median.count == 3
+    np.testing.assert_allclose(best.result(), [[0.3, 0.4], [0.5, np.nan]])
+    np.testing.assert_allclose(median.result(), [[0.2, 0.3], [0.3, np.nan]])
+    assert StreamingComposite((2, 2)).result() is None
+
+
+def _write_cog(path, value, bounds, size=40):
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_bounds
+
+    data = np.full((size, size), value, dtype=np.int16)
+    with rasterio.open(
+        path, "w", driver="GTiff", width=size, height=size, count=1, dtype="int16",
+        crs="EPSG:4326", transform=from_bounds(*bounds, size, size), nodata=-3000,
+        tiled=True, blockxsize=16, blockysize=16,
+    ) as dst:
+        dst.write(data, 1)
+    return str(path)
+
+
+def _item(item_id, href, bounds, when="2024-01-01T00:00:00Z"):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(
+        id=item_id, bbox=list(bounds), datetime=None, properties={"start_datetime": when},
+        assets={"250m_16_days_NDVI": SimpleNamespace(href=href)},
+    )
+
+
+def test_build_composites_reads_local_cogs_concurrently_and_retries_per_asset(tmp_path, monkeypatch):
+    rasterio = pytest.importorskip("rasterio")
+    netCDF4 = pytest.importorskip("netCDF4")
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services import ndvi_tiles
+
+    west, east = (-50.0, -20.0, -48.0, -18.0), (-48.0, -20.0, -46.0, -18.0)
+    items = [
+        _item("west-low", _write_cog(tmp_path / "a.tif", 2000, west), west),
+        _item("west-high", _write_cog(tmp_path / "b.tif", 6000, west), west),
+        _item("east", _write_cog(tmp_path / "c.tif", 4000, east), east),
+        _item("broken", str(tmp_path / "missing.tif"), east),
+    ] + [_item(f"west-{i}", str(tmp_path / "a.tif"), west) for i in range(6)]
+
+    lock = threading.Lock()
+    state = {"opens": {}, "outstanding": 0, "peak": 0}
+    real_open = rasterio.open
+
+    def counting_open(path, *args, **kwargs):
+        with lock:
+            state["opens"][path] = state["opens"].get(path, 0) + 1
+        return real_open(path, *args, **kwargs)
+
+    class CountingPool(ThreadPoolExecutor):
+        """Reads submitted and not yet collected, i.e. arrays the composite may still hold."""
+
+        def submit(self, fn, *args, **kwargs):
+            future = super().submit(fn, *args, **kwargs)
+            with lock:
+                state["outstanding"] += 1
+                state["peak"] = max(state["peak"], state["outstanding"])
+            result = future.result
+
+            def collect(timeout=None):
+                try:
+                    return result(timeout)
+                finally:
+                    with lock:
+                        state["outstanding"] -= 1
+
+            future.result = collect
+            return future
+
+    monkeypatch.setattr(rasterio, "open", counting_open)
+    monkeypatch.setattr(ndvi_tiles, "ThreadPoolExecutor", CountingPool)
+    grid = ndvi_tiles.TileGrid.from_resolution((-50.0, -20.0, -46.0, -18.0), 0.1, tile_size=10)
+    out = tmp_path / "ndvi.nc"
+
+    days = ndvi_tiles.build_composites(items, grid, ndvi_tiles.MODIS, out, workers=2, retries=2, retry_delay=0)
+
+    assert [d.isoformat() for d in days] == ["2024-01-01"]
+    with netCDF4.Dataset(out) as nc:
+        ndvi = np.asarray(nc["ndvi"][0])
+    lon = grid.longitudes()
+    np.testing.assert_allclose(ndvi[:, lon < -48.05], 0.6, atol=1e-4)
+    np.testing.assert_allclose(ndvi[:, lon > -47.95], 0.4, atol=1e-4)
+    # The missing asset was tried retries + 1 times on each tile it covers, alone
+    east_tiles = sum(1 for tile in grid.tiles() if tile.intersects(east))
+    assert state["opens"][str(tmp_path / "missing.tif")] == 3 * east_tiles
+    # Reads are submitted lazily: never more than 2 x workers held at once
+    assert state["peak"] <= 4
+    assert state["outstanding"] == 0
+    assert not (tmp_path / "ndvi.nc.tmp").exists()
+
+
+def test_dates_without_a_usable_scene_are_dropped(tmp_path):
+    pytest.importorskip("rasterio")
+    netCDF4 = pytest.importorskip("netCDF4")
+    from app.services import ndvi_tiles
+
+    bounds = (-50.0, -20.0, -48.0, -18.0)
+    good = _write_cog(tmp_path / "a.tif", 5000, bounds)
+    missing = str(tmp_path / "missing.tif")
+    grid = ndvi_tiles.TileGrid.from_resolution(bounds, 0.1, tile_size=10)
+    out = tmp_path / "ndvi.nc"
+
+    days = ndvi_tiles.build_composites(
+        [_item("ok", good, bounds, "2024-01-01T00:00:00Z"), _item("bad", missing, bounds, "2024-01-02T00:00:00Z")],
+        grid, ndvi_tiles.MODIS, out, retries=0, retry_delay=0,
+    )
+    assert [d.isoformat() for d in days] == ["2024-01-01"]
+    with netCDF4.Dataset(out) as nc:
+        assert nc["time"][:].tolist() == [(days[0] - days[0].replace(year=1970, month=1, day=1)).days]
+        np.testing.assert_allclose(np.asarray(nc["ndvi"][0]), 0.5, atol=1e-4)
+
+    with pytest.raises(RuntimeError, match="All scenes failed"):
+        ndvi_tiles.build_composites(
+            [_item("bad", missing, bounds)], grid, ndvi_tiles.MODIS, tmp_path / "none.nc", retries=0, retry_delay=0,
+        )
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.tif", "ndvi.nc"]
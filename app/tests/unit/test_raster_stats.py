@@ -0,0 +1,21 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app.services.raster_stats import array_stats, check_stats  # noqa: E402
+
+
+def test_stats_skip_nodata_nan_and_negative_values():
+    values = np.array([[-9999.0, np.nan], [-1.0, 4.0], [2.0, 0.0]])
+    stats = array_stats(values, nodata=-9999.0, valid_min=0.0)
+
+    assert stats["nan_count"] == 1
+    assert stats["valid_fraction"] == pytest.approx(3 / 6)
+    assert (stats["min"], stats["max"], stats["mean"]) == (0.0, 4.0, 2.0)
+
+
+def test_empty_grid_fails_validation():
+    stats = array_stats(np.full((2, 2), np.nan))
+    assert stats["min"] is None
+    with pytest.raises(ValueError):
+        check_stats(stats, "chirps 2024-01-01")
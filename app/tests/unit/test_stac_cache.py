@@ -0,0 +1,125 @@
+import time
+from datetime import date, timedelta, datetime, timezone
+from types import SimpleNamespace
+
+from app.services import stac_cache
+from app.services.stac_cache import SignedHrefCache, StacSearchCache, token_expiry
+
+
+class FakeCatalog:
+    def __init__(self, features):
+        self.features = features
+        self.searches = []
+
+    def search(self, **kwargs):
+        self.searches.append(kwargs)
+        items = [SimpleNamespace(to_dict=lambda transform_hrefs=False, f=f: f) for f in self.features]
+        return SimpleNamespace(items=lambda: iter(items))
+
+
+def test_search_is_replayed_from_disk_without_opening_the_catalog(tmp_path):
+    catalog = FakeCatalog([{"id": "a"}, {"id": "b"}])
+    opened = []
+
+    def open_catalog():
+        opened.append(1)
+        return catalog
+
+    cache = StacSearchCache(tmp_path)
+    query = {"eo:cloud_cover": {"lt": 15}}
+    first = cache.search(open_catalog, ["sentinel-2-l2a"], [-50, -20, -45, -15], "2020-01-01/2020-01-31", query)
+    # Same search from a new process: key independent of list/dict construction
+    again = StacSearchCache(tmp_path).search(
+        lambda: 1 / 0, ("sentinel-2-l2a",), (-50.0, -20.0, -45.0, -15.0), "2020-01-01/2020-01-31", dict(query)
+    )
+
+    assert first == again == [{"id": "a"}, {"id": "b"}]
+    assert len(opened) == 1
+    assert catalog.searches[0]["query"] == query
+
+
+def test_recent_ranges_expire_after_ttl(tmp_path, monkeypatch):
+    catalog = FakeCatalog([{"id": "a"}])
+    cache = StacSearchCache(tmp_path, ttl_seconds=60, settled_days=30)
+    recent = f"{date.today() - timedelta(days=3)}/{date.today()}"
+    old = "2020-01-01/2020-01-31"
+    for rng in (recent, old):
+        cache.search(lambda: catalog, ["modis-13Q1-061"], [0, 0, 1, 1], rng)
+
+    later = time.time() + 3600
+    monkeypatch.setattr(stac_cache.time, "time", lambda: later)
+    for rng in (recent, old):
+        cache.search(lambda: catalog, ["modis-13Q1-061"], [0, 0, 1, 1], rng)
+
+    assert [s["datetime"] for s in catalog.searches] == [recent, old, recent]
+
+
+def _composite(item_id: str, start: str, end: str) -> dict:
+    return {"id": item_id, "properties": {"datetime": None, "start_datetime": f"{start}T00:00:00Z",
+                                          "end_datetime": f"{end}T23:59:59Z"}}
+
+
+class RangeCatalog(FakeCatalog):
+    """Answers a search with the features intersecting its date range, like the STAC API."""
+
+    def search(self, **kwargs):
+        first, last = (date.fromisoformat(d) for d in kwargs["datetime"].split("/"))
+        self.searches.append(kwargs)
+        found = [f for f in self.features if stac_cache._intersects(f, first, last)]
+        items = [SimpleNamespace(to_dict=lambda transform_hrefs=False, f=f: f) for f in found]
+        return SimpleNamespace(items=lambda: iter(items))
+
+
+def test_overlapping_and_sub_range_batches_only_search_uncovered_days(tmp_path):
+    # 16-day MODIS composites
+    catalog = RangeCatalog([
+        _composite("jan01", "2020-01-01", "2020-01-16"),
+        _composite("jan17", "2020-01-17", "2020-02-01"),
+        _composite("feb02", "2020-02-02", "2020-02-17"),
+    ])
+    cache = StacSearchCache(tmp_path)
+
+    def ids(rng):
+        return sorted(item["id"] for item in cache.search(lambda: catalog, ["modis-13Q1-061"], [0, 0, 1, 1], rng))
+
+    assert ids("2020-01-01/2020-01-31") == ["jan01", "jan17"]
+    # A retried sub-window and a re-planned batch inside the first need no search
+    assert ids("2020-01-10/2020-01-12") == ["jan01"]
+    assert ids("2020-01-20/2020-01-31") == ["jan17"]
+    # An overlapping batch only searches the days it adds
+    assert ids("2020-01-25/2020-02-05") == ["feb02", "jan17"]
+    assert [s["datetime"] for s in catalog.searches] == ["2020-01-01/2020-01-31", "2020-02-01/2020-02-05"]
+    # Another scope (query) is searched on its own
+    cache.search(lambda: catalog, ["modis-13Q1-061"], [0, 0, 1, 1], "2020-01-10/2020-01-12", {"x": 1})
+    assert len(catalog.searches) == 3
+
+
+def _sas(expiry: datetime) -> str:
+    return f"st=2024-01-01T00%3A00%3A00Z&se={expiry.strftime('%Y-%m-%dT%H:%M:%SZ')}&sp=rl&sig=abc"
+
+
+def test_signed_hrefs_reuse_the_container_token_until_expiry(tmp_path):
+    expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    calls = []
+
+    def sign(href):
+        calls.append(href)
+        return f"{href}?{_sas(expiry)}"
+
+    path = tmp_path / "tokens.json"
+    signer = SignedHrefCache(sign, path, margin_seconds=600)
+    a = signer("https://acct.blob.core.windows.net/modis/x/a.tif")
+    b = signer("https://acct.blob.core.windows.net/modis/y/b.tif")
+    signer("https://acct.blob.core.windows.net/other/c.tif")
+    assert len(calls) == 2
+    assert b == f"https://acct.blob.core.windows.net/modis/y/b.tif?{_sas(expiry)}"
+    assert token_expiry(a.split("?", 1)[1]) == int(expiry.timestamp())
+
+    # Persisted across processes; a token inside the margin is renewed
+    SignedHrefCache(sign, path)("https://acct.blob.core.windows.net/modis/z.tif")
+    assert len(calls) == 2
+    SignedHrefCache(sign, path, margin_seconds=7200)("https://acct.blob.core.windows.net/modis/z.tif")
+    assert len(calls) == 3
+
+    # Non-blob hrefs are passed to sign untouched
+    assert SignedHrefCache(lambda h: h + "!")("https://example.com/x.tif") == "https://example.com/x.tif!"
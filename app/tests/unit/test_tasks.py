@@ -0,0 +1,189 @@
+import logging
+import multiprocessing
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("prefect")
+pytest.importorskip("rioxarray")
+pytest.importorskip("shapefile")
+pytest.importorskip("pydantic_settings")
+
+from app.services import cog, mosaic_index  # noqa: E402
+from app.services.downloader import DownloadResult  # noqa: E402
+from app.services.manifest import manifest_for  # noqa: E402
+from app.workflows.data_processing import tasks  # noqa: E402
+from app.workflows.data_processing.schemas import DataSource  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tasks.settings, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(tasks, "get_run_logger", lambda: logging.getLogger("test"))
+    return tmp_path
+
+
+def test_republished_upstream_file_is_recorded_not_rejected(data_dir, monkeypatch, caplog):
+    day = date(2024, 5, 1)
+    manifest = manifest_for("merge", str(data_dir))
+    manifest.record_raw(day, "https://example.org/old", "a" * 64)
+    calls = []
+
+    def fake_download(url, dest, session=None, **kwargs):
+        calls.append(kwargs)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(b"reprocessed")
+        return DownloadResult(path=dest, size=11, sha256="b" * 64)
+
+    monkeypatch.setattr(tasks, "stream_download", fake_download)
+    with caplog.at_level(logging.WARNING):
+        path = tasks.download_data.fn(day, DataSource.MERGE)
+
+    assert path.read_bytes() == b"reprocessed"
+    assert calls == [{}]
+    assert manifest.get(day)["raw_checksum"] == "b" * 64
+    assert "upstream file changed" in caplog.text
+
+
+def test_rebuild_drops_only_the_shapefile_index_and_tops_up_the_geopackage(data_dir, monkeypatch):
+    np = pytest.importorskip("numpy")
+    from rasterio.transform import from_origin
+
+    mosaic_dir = data_dir / "chirps"
+    mosaic_dir.mkdir()
+    (mosaic_dir / "chirps_20240101.tif").write_bytes(b"")
+    mosaic_index.build_index(mosaic_dir, bounds=(-50.0, -11.6, -48.4, -10.0))
+    for suffix in (".shp", ".shx", ".dbf", ".prj", ".qix", ".properties"):
+        (mosaic_dir / f"chirps{suffix}").write_bytes(b"")
+    cog.write_array(np.ones((16, 16), dtype=np.float32), from_origin(-50, -10, 0.1, 0.1), mosaic_dir / "chirps_20240102.tif")
+
+    seen = geoserver(monkeypatch)
+    monkeypatch.setattr(tasks, "RELOAD_SETTLE_SECONDS", 0)
+    tasks.refresh_mosaic_shapefile.fn(DataSource.CHIRPS)
+
+    # Reload and GetCapabilities go through the one REST client
+    assert [(r.method, r.url.path) for r in seen] == [("POST", "/geoserver/rest/reload"), ("GET", "/geoserver/wms")]
+
+    assert sorted(p.name for p in mosaic_dir.iterdir()) == [
+        "chirps.gpkg", "chirps.properties", "chirps_20240101.tif", "chirps_20240102.tif",
+        "datastore.properties", "indexer.properties", "timeregex.properties",
+    ]
+    assert [name for name, _ in mosaic_index.indexed_granules(mosaic_dir / "chirps.gpkg", "chirps")] == [
+        "chirps_20240101.tif", "chirps_20240102.tif"
+    ]
+
+
+def geoserver(monkeypatch, handler=None):
+    """Serve the tasks' GeoServer client from ``handler`` (default: 200 for everything); returns the requests seen."""
+    httpx = pytest.importorskip("httpx")
+    from app.services import geoserver_rest
+
+    seen = []
+
+    def respond(request):
+        seen.append(request)
+        return (handler or (lambda r: httpx.Response(200)))(request)
+
+    monkeypatch.setattr(geoserver_rest, "client_from_settings", lambda *a, **kw: geoserver_rest.GeoServerRestClient(
+        "http://geoserver.test/geoserver", ("admin", "secret"), transport=httpx.MockTransport(respond),
+    ))
+    return seen
+
+
+@pytest.fixture
+def harvest_dir(data_dir, monkeypatch):
+    monkeypatch.setattr(tasks, "HARVEST_DIR", data_dir / ".harvest")
+    return data_dir / ".harvest"
+
+
+def _queue_batches(writer, batches):
+    for batch in range(batches):
+        tasks.queue_granules("chirps", [Path(f"/data/chirps/w{writer}_b{batch}_{i}.tif") for i in range(5)])
+
+
+def test_concurrent_writers_and_a_drainer_lose_no_paths(harvest_dir):
+    fork = multiprocessing.get_context("fork")
+    writers = [fork.Process(target=_queue_batches, args=(w, 40)) for w in range(4)]
+    for proc in writers:
+        proc.start()
+
+    drained = []
+    while any(proc.is_alive() for proc in writers):
+        drained += tasks._drain_queue("chirps")
+    for proc in writers:
+        proc.join()
+        assert proc.exitcode == 0
+    drained += tasks._drain_queue("chirps")
+
+    expected = {f"w{w}_b{b}_{i}.tif" for w in range(4) for b in range(40) for i in range(5)}
+    assert sorted(p.name for p in drained) == sorted(expected)
+    # Each writer's paths come out in the order it queued them
+    for w in range(4):
+        mine = [p.name for p in drained if p.name.startswith(f"w{w}_")]
+        assert mine == [f"w{w}_b{b}_{i}.tif" for b in range(40) for i in range(5)]
+
+
+def test_drain_deduplicates_and_empties_the_queue(harvest_dir):
+    a, b = Path("/data/chirps/a.tif"), Path("/data/chirps/b.tif")
+    tasks.queue_granules("chirps", [a, b])
+    tasks.queue_granules("chirps", [a])
+
+    assert tasks._drain_queue("chirps") == [a, b]
+    assert tasks._drain_queue("chirps") == []
+
+
+def test_harvest_defers_to_a_running_drainer_then_picks_up_late_paths(harvest_dir, tmp_path, monkeypatch):
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    first, late = mosaic_dir / "chirps_20240101.tif", mosaic_dir / "chirps_20240102.tif"
+    first.write_bytes(b"")
+    late.write_bytes(b"")
+    httpx = pytest.importorskip("httpx")
+    calls = []
+
+    def handler(request):
+        if request.method == "DELETE":
+            calls.append(("remove", request.url.params["filter"]))
+            return httpx.Response(404)  # Not indexed yet
+        granule = Path(request.content.decode().removeprefix("file://"))
+        calls.append(("harvest", granule.name))
+        if granule == first:
+            # Queued by another run while this one drains
+            tasks.queue_granules("chirps", [late])
+        return httpx.Response(201)
+
+    geoserver(monkeypatch, handler)
+
+    busy = tasks._locked(harvest_dir / "chirps.lock", blocking=False)
+    assert tasks.harvest_mosaic_granules.fn(mosaic_dir, [first]) == 0
+    assert calls == []
+    busy.close()
+
+    assert tasks.harvest_mosaic_granules.fn(mosaic_dir, []) == 2
+    assert calls == [
+        ("remove", f"location LIKE '%{first.name}'"), ("harvest", first.name),
+        ("remove", f"location LIKE '%{late.name}'"), ("harvest", late.name),
+    ]
+    assert tasks._drain_queue("chirps") == []
+
+
+def test_failed_harvest_requeues_the_unprocessed_paths(harvest_dir, tmp_path, monkeypatch):
+    mosaic_dir = tmp_path / "chirps"
+    mosaic_dir.mkdir()
+    paths = [mosaic_dir / f"chirps_2024010{d}.tif" for d in (1, 2, 3)]
+    for path in paths:
+        path.write_bytes(b"")
+
+    httpx = pytest.importorskip("httpx")
+
+    def handler(request):
+        if request.method == "POST" and request.content.decode().endswith(paths[1].name):
+            return httpx.Response(500, text="GeoServer returned 500")
+        return httpx.Response(200)
+
+    geoserver(monkeypatch, handler)
+
+    with pytest.raises(RuntimeError, match="500"):
+        tasks.harvest_mosaic_granules.fn(mosaic_dir, paths)
+    assert tasks._drain_queue("chirps") == paths[1:]
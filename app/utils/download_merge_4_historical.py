@@ -3,8 +3,11 @@ import xarray as xr
 from dask.distributed import Client, LocalCluster
 import fsspec
 from datetime import datetime, timedelta
+from pathlib import Path
 from tqdm import tqdm
 
+from app.services import merge_decoder
+
 # -------------------------
 # USER CONFIGURATION
 # -------------------------
@@ -51,6 +54,7 @@ def process_year(year: int):
     os.makedirs(temp_dir, exist_ok=True)
 
     datasets = []
+    local_paths = []
 
     for i in tqdm(range((end_date - start_date).days + 1), desc=f"📦 Processing {year}"):
         date = start_date + i * delta
@@ -68,6 +72,10 @@ def process_year(year: int):
             except Exception:
                 continue  # Skip missing files
 
+        local_paths.append(local_path)
+        if merge_decoder.ECCODES_AVAILABLE:
+            continue  # decoded in one batch below
+
         # Open and crop
         try:
             ds = xr.open_dataset(
@@ -99,6 +107,14 @@ def process_year(year: int):
         except Exception:
             continue
 
+    if merge_decoder.ECCODES_AVAILABLE and local_paths:
+        # One eccodes pass over the whole year; the crop index is computed once per grid
+        fields = merge_decoder.decode_many(local_paths, bbox, workers=MAX_CORES)
+        out_path = Path(OUTPUT_DIR) / f"brazil_merge_{year}.nc"
+        print(f"💾 Saving {out_path} ({len(fields)} days) ...")
+        merge_decoder.write_year_cube(fields, out_path)
+        return
+
     if not datasets:
         print(f"⚠️ No data found for {year}")
         return
@@ -0,0 +1,56 @@
+"""
+Prefix-sum Cube Maintenance
+Keeps the per-source cumulative precipitation cubes (app.services.accumulation)
+in step with the yearly historical NetCDFs, rebuilding only stale years.
+"""
+from typing import List, Optional
+from prefect import task, flow, get_run_logger
+from app.services import accumulation
+
+
+@task(retries=1, retry_delay_seconds=60)
+def update_cumsum_cube(source: str, years: Optional[List[int]] = None) -> List[int]:
+    """
+    Rebuild the cumulative cube for the given years (default: every stale year)
+    and refresh the yearly checkpoints.
+
+    Returns:
+        List of rebuilt years
+    """
+    logger = get_run_logger()
+
+    if years is None:
+        years = accumulation.stale_years(source)
+
+    if not years:
+        logger.info(f"✓ Cumulative cube for {source} is up to date")
+        return []
+
+    logger.info(f"Rebuilding cumulative cube for {source}: {years}")
+    for year in sorted(years):
+        accumulation.build_year(source, year)
+
+    # Checkpoints depend on every later year, so always rebuild them (one slice per year)
+    accumulation.build_checkpoints(source)
+    logger.info(f"✓ Cumulative cube for {source} updated ({len(years)} years)")
+    return sorted(years)
+
+
+@flow(name="update-cumsum-cubes")
+def cumsum_cube_flow(sources: Optional[List[str]] = None):
+    """Bring the cumulative cubes of all precipitation sources up to date."""
+    logger = get_run_logger()
+    sources = sources or list(accumulation.HISTORICAL_SOURCES)
+
+    results = {}
+    for source in sources:
+        try:
+            results[source] = update_cumsum_cube(source)
+        except Exception as e:
+            logger.error(f"✗ Failed to update cumulative cube for {source}: {e}")
+            results[source] = None
+    return results
+
+
+if __name__ == "__main__":
+    cumsum_cube_flow()
@@ -0,0 +1,71 @@
+"""
+Aggregate Mosaics Flow
+Keeps the monthly/annual accumulation and anomaly COGs (app.services.aggregates)
+in step with the daily mosaics, recomputing only the periods new days fall in.
+"""
+import re
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+from prefect import task, flow, get_run_logger
+from app.services import aggregates
+
+
+def dates_from_paths(paths: List[Path]) -> List[date]:
+    """Dates of daily granules named *_YYYYMMDD.tif."""
+    days = []
+    for path in paths:
+        match = re.search(r"_(\d{8})\.tif$", Path(path).name)
+        if match:
+            days.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+    return days
+
+
+@task(retries=1, retry_delay_seconds=60)
+def update_aggregate_mosaics(source: str, days: List[date]) -> List[Path]:
+    """Rebuild the aggregates touched by ``days`` and index the results."""
+    logger = get_run_logger()
+    if not days:
+        logger.info(f"No new {source} days, aggregates unchanged")
+        return []
+
+    periods = aggregates.touched_periods(days)
+    logger.info(f"Updating {len(periods)} {source} aggregate periods")
+    written = aggregates.update_aggregates(source, days)
+    if written:
+        aggregates.index_aggregates(written)
+    logger.info(f"✓ {source}: {len(written)} aggregate COGs written")
+    return written
+
+
+@flow(name="update-aggregate-mosaics")
+def aggregates_flow(
+    sources: Optional[List[str]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """Backfill or refresh aggregates over [start_date, end_date] (default: last 12 months)."""
+    logger = get_run_logger()
+    sources = sources or list(aggregates.AGGREGATES)
+    end_date = end_date or date.today()
+    start_date = start_date or (end_date.replace(day=1) - timedelta(days=365)).replace(day=1)
+
+    # One representative day per month is enough to touch every period
+    months = []
+    current = start_date.replace(day=1)
+    while current <= end_date:
+        months.append(current)
+        current = (current + timedelta(days=32)).replace(day=1)
+
+    results = {}
+    for source in sources:
+        try:
+            results[source] = update_aggregate_mosaics(source, months)
+        except Exception as e:
+            logger.error(f"✗ Failed to update {source} aggregates: {e}")
+            results[source] = None
+    return results
+
+
+if __name__ == "__main__":
+    aggregates_flow()
@@ -0,0 +1,70 @@
+"""
+Mosaic Consistency Flow
+Compares each mosaic's granule index, COG directory and historical cube
+(app.services.consistency) and repairs only what differs.
+"""
+from pathlib import Path
+from typing import List, Optional
+from prefect import task, flow, get_run_logger
+from app.config.settings import get_settings
+from app.services import consistency
+from app.services.manifest import manifest_for
+from .tasks import harvest_mosaic_granules
+
+
+@task
+def check_mosaic_consistency(name: str) -> consistency.ConsistencyReport:
+    logger = get_run_logger()
+    settings = get_settings()
+    # Full scan of the COG directory; the flows' range queries only stat it
+    changed = manifest_for(name, settings.DATA_DIR).reconcile(force=True)
+    if changed:
+        logger.info(f"✓ {name}: manifest caught up with {changed} COG(s) changed by hand")
+    report = consistency.check_mosaic(Path(settings.DATA_DIR), name)
+    logger.info(report.summary())
+    return report
+
+
+@task(retries=1, retry_delay_seconds=60)
+def repair_cube_gaps(report: consistency.ConsistencyReport) -> int:
+    logger = get_run_logger()
+    settings = get_settings()
+    written = consistency.repair_cube(Path(settings.DATA_DIR), report)
+    if written:
+        logger.info(f"✓ {report.mosaic}: appended {written} missing day(s) to the cube")
+    return written
+
+
+@flow(name="mosaic-consistency")
+def mosaic_consistency_flow(mosaics: Optional[List[str]] = None, repair: bool = True):
+    """
+    Check every mosaic and, if ``repair``, fix the delta: index rows are added or
+    removed through harvest_mosaic_granules (GeoPackage or GeoServer harvest) and
+    cube gaps are filled from the COGs.
+    """
+    logger = get_run_logger()
+    settings = get_settings()
+    data_dir = Path(settings.DATA_DIR)
+    mosaics = mosaics or [n for n in consistency.DEFAULT_MOSAICS if (data_dir / n).is_dir()]
+
+    reports = [check_mosaic_consistency(name) for name in mosaics]
+    if not repair:
+        return reports
+
+    for report in reports:
+        if report.ok:
+            continue
+        try:
+            delta = consistency.index_delta_paths(data_dir, report)
+            if delta and report.index_kind != "none":
+                harvest_mosaic_granules(data_dir / report.mosaic, delta)
+            if report.missing_in_cube:
+                repair_cube_gaps(report)
+        except Exception as e:
+            logger.error(f"✗ Repair failed for {report.mosaic}: {e}")
+
+    return reports
+
+
+if __name__ == "__main__":
+    mosaic_consistency_flow()
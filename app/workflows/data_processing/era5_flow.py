@@ -3,15 +3,25 @@ ERA5 Land Daily Flow - With Historical NetCDF Management
 """
 from datetime import date, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
-import cdsapi
+from typing import List, Dict, Optional, Tuple
 import xarray as xr
+import rioxarray
 import pandas as pd
 from prefect import flow, task, get_run_logger
 from .schemas import DataSource
+from .historical_flow import compact_historical_store
 from config.settings import get_settings
+from app.services import cube_store
+from app.services.backfill_planner import cds_request_fields, grid_bytes, plan_cds
+from app.services.cds_scheduler import CDSRequest, CDSScheduler, CdsApiClient
+from app.services.cog import write_cogs
+from app.services.manifest import manifest_for
+from app.services.raster_stats import VALID_MIN, array_stats
 
 
+CDS_DATASET = "derived-era5-land-daily-statistics"
+ERA5_LAND_RESOLUTION = 0.1  # degrees
+
 # Mapping from ERA5 variable and statistic to directory names
 VARIABLE_MAPPING = {
     "2m_temperature": {
@@ -64,56 +74,18 @@ def check_missing_dates(
     logger = get_run_logger()
     settings = get_settings()
     
-    # Generate list of requested dates
-    requested_dates = []
-    current = start_date
-    while current <= end_date:
-        requested_dates.append(current)
-        current += timedelta(days=1)
-    
-    logger.info(f"Checking for {len(requested_dates)} dates: {start_date} to {end_date}")
+    logger.info(f"Checking for {(end_date - start_date).days + 1} dates: {start_date} to {end_date}")
     
-    # Get directories
+    # The directory name is also the manifest key
     dir_name = get_output_directory(variable, daily_statistic, settings).name
-    geotiff_dir = Path(settings.DATA_DIR) / dir_name
-    hist_dir = Path(settings.DATA_DIR) / f"{dir_name}_hist"
-    hist_file = hist_dir / "historical.nc"
-    
-    # Check GeoTIFF files
-    existing_geotiff_dates = set()
-    if geotiff_dir.exists():
-        for tif_file in geotiff_dir.glob(f"{dir_name}_*.tif"):
-            try:
-                date_str = tif_file.stem.split('_')[-1]
-                file_date = pd.to_datetime(date_str, format='%Y%m%d').date()
-                existing_geotiff_dates.add(file_date)
-            except Exception as e:
-                logger.warning(f"Could not parse date from {tif_file.name}: {e}")
-    
-    logger.info(f"Found {len(existing_geotiff_dates)} existing GeoTIFF files")
-    
-    # Check historical NetCDF
-    existing_hist_dates = set()
-    if hist_file.exists():
-        try:
-            ds = xr.open_dataset(hist_file, chunks='auto')
-            var_short_name = dir_name
-            if var_short_name in ds.data_vars:
-                existing_hist_dates = set(pd.to_datetime(ds[var_short_name].time.values).date)
-                logger.info(f"Found {len(existing_hist_dates)} dates in historical NetCDF")
-            ds.close()
-        except Exception as e:
-            logger.warning(f"Could not read historical file: {e}")
-    else:
-        logger.info("Historical NetCDF does not exist yet")
     
-    # Calculate missing dates separately
-    requested_dates_set = set(requested_dates)
-    missing_geotiff = sorted(list(requested_dates_set - existing_geotiff_dates))
-    missing_historical = sorted(list(requested_dates_set - existing_hist_dates))
+    # Seeded from the GeoTIFFs and the historical cube on first use
+    manifest = manifest_for(dir_name, settings.DATA_DIR)
+    missing_geotiff = manifest.missing(start_date, end_date)
+    missing_historical = manifest.missing_in_cube(start_date, end_date)
     
     # Dates to download = union (missing from either source)
-    missing_download = sorted(list(set(missing_geotiff) | set(missing_historical)))
+    missing_download = sorted(set(missing_geotiff) | set(missing_historical))
     
     logger.info(f"Missing from GeoTIFF: {len(missing_geotiff)} dates")
     logger.info(f"Missing from historical: {len(missing_historical)} dates")
@@ -129,425 +101,247 @@ def check_missing_dates(
     }
 
 
-@task(retries=2, retry_delay_seconds=600, timeout_seconds=7200)
-def download_era5_land_daily_batch(
-    start_date: date,
-    end_date: date,
+def build_era5_request(
+    dates: List[date],
     variable: str,
     daily_statistic: str,
-    area: List[float],
-    convert_bbox: bool = False
-) -> Path:
-    """Download ERA5 Land Daily Statistics (pre-aggregated daily data)."""
-    logger = get_run_logger()
-    settings = get_settings()
-    
-    # Area should already be in CDS format [N, W, S, E]
-    cds_area = list(area)
-    
-    # Validate bbox: North must be > South
-    north, west, south, east = cds_area[0], cds_area[1], cds_area[2], cds_area[3]
-    
+    cds_area: List[float]
+) -> Dict:
+    """
+    CDS request covering ``dates`` (the year x month x day cross product of
+    them, see backfill_planner); area in CDS format [N, W, S, E].
+    """
+    north, west, south, east = cds_area
     if north <= south:
         raise ValueError(f"Invalid bbox: North ({north}) must be > South ({south})")
-    
     if west >= east:
         raise ValueError(f"Invalid bbox: West ({west}) must be < East ({east})")
+    if not dates:
+        raise ValueError("No dates to request")
     
-    logger.info(f"Using CDS bbox [N, W, S, E]: {cds_area}")
-    logger.info(f"  North: {north}, South: {south} (span: {north - south}°)")
-    logger.info(f"  West: {west}, East: {east} (span: {east - west}°)")
-    
-    # Validate dates - ERA5-Land has ~5-7 day lag
-    from datetime import date as dt
-    today = dt.today()
-    max_available_date = today - timedelta(days=7)
-    
-    if end_date > max_available_date:
-        logger.warning(f"End date {end_date} may not be available yet (max: ~{max_available_date})")
-        logger.warning(f"ERA5-Land typically has 5-7 day lag. Request may fail!")
-    
-    if start_date > end_date:
-        raise ValueError(f"Start date ({start_date}) must be <= end date ({end_date})")
-    
-    # Generate date list
-    dates = []
-    current = start_date
-    while current <= end_date:
-        dates.append(current)
-        current += timedelta(days=1)
-    
-    # Extract components
-    years = sorted(list(set([d.strftime("%Y") for d in dates])))
-    months = sorted(list(set([d.strftime("%m") for d in dates])))
-    days = sorted(list(set([d.strftime("%d") for d in dates])))
-    
-    # Prepare output path
-    raw_dir = Path(settings.DATA_DIR) / "raw" / "era5_land_daily"
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    
-    start_str = start_date.strftime("%Y%m%d")
-    end_str = end_date.strftime("%Y%m%d")
-    var_short = variable.replace("_", "")
-    output_path = raw_dir / f"{var_short}_{daily_statistic}_{start_str}_{end_str}.nc"
-    
-    if output_path.exists():
-        logger.info(f"Batch already downloaded: {output_path}")
-        return output_path
-    
-    # Build CDS request
-    request = {
+    return {
         "variable": [variable],
-        "year": years,
-        "month": months,
-        "day": days,
+        **cds_request_fields(dates),
         "daily_statistic": daily_statistic,
         "time_zone": "utc+00:00",
         "frequency": "6_hourly",
-        "area": cds_area
+        "area": list(cds_area)
     }
-    
-    logger.info(f"Downloading ERA5 Land Daily: {start_date} to {end_date}")
-    logger.info(f"Variable: {variable}, Statistic: {daily_statistic}")
-    logger.info("=" * 80)
-    logger.info("CDS API REQUEST:")
-    logger.info("=" * 80)
-    
-    import json
-    logger.info(json.dumps(request, indent=2, default=str))
-    
-    logger.info("=" * 80)
-    logger.info("REQUEST DETAILS:")
-    logger.info(f"  Dataset: derived-era5-land-daily-statistics")
-    logger.info(f"  Variable: {request['variable']}")
-    logger.info(f"  Daily statistic: {request['daily_statistic']}")
-    logger.info(f"  Time zone: {request['time_zone']}")
-    logger.info(f"  Frequency: {request['frequency']}")
-    logger.info(f"  Years: {request['year']}")
-    logger.info(f"  Months: {request['month']}")
-    logger.info(f"  Days: {request['day']}")
-    logger.info(f"  Area [N,W,S,E]: {request['area']}")
-    logger.info(f"  Area interpretation:")
-    logger.info(f"    North: {request['area'][0]}°")
-    logger.info(f"    West: {request['area'][1]}°")
-    logger.info(f"    South: {request['area'][2]}°")
-    logger.info(f"    East: {request['area'][3]}°")
-    logger.info("=" * 80)
-    
-    try:
-        client = cdsapi.Client()
-        logger.info("Submitting request to CDS...")
-        result = client.retrieve("derived-era5-land-daily-statistics", request)
-        result.download(str(output_path))
-        logger.info(f"✓ ERA5 Land Daily downloaded: {output_path}")
-        return output_path
-    except Exception as e:
-        logger.error(f"✗ Download failed: {e}")
-        if output_path.exists():
-            output_path.unlink()
-        raise
 
 
-@task
-def process_era5_land_daily_to_geotiff(
-    netcdf_path: Path,
-    variable: str,
-    daily_statistic: str,
-    bbox: tuple,
-    dates_to_process: Optional[List[date]] = None
-) -> List[Path]:
-    """
-    Convert ERA5 Land Daily NetCDF to daily GeoTIFFs.
-    Only processes dates specified in dates_to_process (if provided).
-    """
-    logger = get_run_logger()
-    settings = get_settings()
-    
-    output_dir = get_output_directory(variable, daily_statistic, settings)
-    logger.info(f"Saving {variable} ({daily_statistic}) to: {output_dir}")
-    
-    if dates_to_process:
-        logger.info(f"Processing only {len(dates_to_process)} specific dates")
-    
-    processed_paths = []
-    
-    try:
-        ds = xr.open_dataset(netcdf_path)
-        logger.info(f"NetCDF variables: {list(ds.data_vars)}")
-        
-        # Find the variable
-        var_name = None
-        if variable in ds.data_vars:
-            var_name = variable
-        else:
-            possible_names = [
-                variable,
-                variable.replace("_", ""),
-                "t2m", "2t", "temperature_2m",
-                *[v for v in ds.data_vars if any(part in v for part in variable.split("_"))]
-            ]
-            for name in possible_names:
-                if name in ds.data_vars:
-                    var_name = name
-                    break
-        
-        if not var_name:
-            raise ValueError(f"Variable '{variable}' not found. Available: {list(ds.data_vars)}")
-        
-        da = ds[var_name]
-        
-        # Convert bbox format if needed
-        if isinstance(bbox, list):
-            bbox = (bbox[1], bbox[2], bbox[3], bbox[0])  # [W, S, E, N]
-        
-        # Find time dimension
-        time_dim = None
-        for possible_time_dim in ['time', 'valid_time', 'datetime']:
-            if possible_time_dim in da.dims:
-                time_dim = possible_time_dim
-                break
-        
-        if time_dim:
-            time_values = da[time_dim].values
-        else:
-            time_values = [date.today()]
-        
-        # Process each day
-        for time_val in time_values:
-            if time_dim and time_dim in da.dims:
-                daily_data = da.sel({time_dim: time_val})
-            else:
-                daily_data = da
-            
-            # Convert time to date
-            if isinstance(time_val, (pd.Timestamp, date)):
-                day_date = pd.Timestamp(time_val).date()
-            else:
-                try:
-                    day_date = pd.Timestamp(time_val).date()
-                except:
-                    day_date = date.today()
-            
-            # Skip if not in dates_to_process (if specified)
-            if dates_to_process and day_date not in dates_to_process:
-                logger.debug(f"Skipping {day_date} (already exists)")
-                continue
-            
-            # Rename coordinates
-            coord_mapping = {}
-            for coord in daily_data.dims:
-                coord_lower = coord.lower()
-                if coord_lower in ['longitude', 'lon', 'long']:
-                    coord_mapping[coord] = 'x'
-                elif coord_lower in ['latitude', 'lat']:
-                    coord_mapping[coord] = 'y'
-            
-            if coord_mapping:
-                daily_data = daily_data.rename(coord_mapping)
-            
-            # Convert temperature from Kelvin to Celsius
-            if "temperature" in variable.lower() or "t2m" in var_name.lower():
-                daily_data = daily_data - 273.15
-            
-            daily_data = daily_data.rio.write_crs("EPSG:4326")
-            
-            try:
-                daily_data = daily_data.rio.clip_box(*bbox)
-            except Exception as e:
-                logger.warning(f"Could not clip to bbox: {e}")
-            
-            output_path = output_dir / f"{output_dir.name}_{day_date.strftime('%Y%m%d')}.tif"
-            
-            daily_data.rio.to_raster(output_path, driver="COG", compress="LZW")
-            processed_paths.append(output_path)
-            logger.info(f"✓ Processed: {day_date} -> {output_path.name}")
-        
-        logger.info(f"✓ Successfully processed {len(processed_paths)} days")
-        return processed_paths
-        
-    except Exception as e:
-        logger.error(f"✗ Failed to process: {e}")
-        raise
+def era5_batch_path(start_date: date, end_date: date, variable: str, daily_statistic: str, settings) -> Path:
+    """Where a downloaded batch is kept until it has been processed."""
+    raw_dir = Path(settings.DATA_DIR) / "raw" / "era5_land_daily"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    start_str = start_date.strftime("%Y%m%d")
+    end_str = end_date.strftime("%Y%m%d")
+    var_short = variable.replace("_", "")
+    return raw_dir / f"{var_short}_{daily_statistic}_{start_str}_{end_str}.nc"
 
 
-@task
-def append_to_historical_netcdf(
-    source_netcdf: Path,
+def _find_variable(ds: xr.Dataset, variable: str) -> str:
+    """Name of ``variable`` in a CDS NetCDF (short names differ from request names)."""
+    if variable in ds.data_vars:
+        return variable
+    possible_names = [
+        variable.replace("_", ""),
+        "t2m", "2t", "temperature_2m",
+        *[v for v in ds.data_vars if any(part in v for part in variable.split("_"))]
+    ]
+    for name in possible_names:
+        if name in ds.data_vars:
+            return name
+    raise ValueError(f"Variable '{variable}' not found. Available: {list(ds.data_vars)}")
+
+
+def normalize_era5_batch(
+    netcdf_path: Path,
     variable: str,
     daily_statistic: str,
     bbox: tuple,
-    dates_to_append: Optional[List[date]] = None
-) -> Path:
+    dates: Optional[List[date]] = None
+) -> xr.DataArray:
     """
-    Append processed daily data directly from source NetCDF to historical NetCDF.
-    Only appends dates specified in dates_to_append (if provided).
+    Load one downloaded batch as a (time, latitude, longitude) array in output
+    units, clipped to bbox and restricted to ``dates``. The daily GeoTIFFs and
+    the historical store are both sliced from this one in-memory array.
     """
     logger = get_run_logger()
     settings = get_settings()
-    
     dir_name = get_output_directory(variable, daily_statistic, settings).name
-    hist_dir_name = f"{dir_name}_hist"
-    hist_dir = Path(settings.DATA_DIR) / hist_dir_name
-    hist_dir.mkdir(parents=True, exist_ok=True)
-    
-    hist_file = hist_dir / "historical.nc"
-    logger.info(f"Appending data from {source_netcdf.name} to {hist_file}")
     
-    if dates_to_append:
-        logger.info(f"Appending only {len(dates_to_append)} specific dates")
-    
-    try:
-        # Open source NetCDF
-        ds = xr.open_dataset(source_netcdf)
-        logger.info(f"Source NetCDF variables: {list(ds.data_vars)}")
-        
-        # Find the variable
-        var_name = None
-        if variable in ds.data_vars:
-            var_name = variable
-        else:
-            possible_names = [
-                variable,
-                variable.replace("_", ""),
-                "t2m", "2t", "temperature_2m",
-                *[v for v in ds.data_vars if any(part in v for part in variable.split("_"))]
-            ]
-            for name in possible_names:
-                if name in ds.data_vars:
-                    var_name = name
-                    break
-        
-        if not var_name:
-            raise ValueError(f"Variable '{variable}' not found. Available: {list(ds.data_vars)}")
-        
+    with xr.open_dataset(netcdf_path) as ds:
+        logger.info(f"NetCDF variables: {list(ds.data_vars)}")
+        var_name = _find_variable(ds, variable)
         da = ds[var_name]
         
-        # Find time dimension
-        time_dim = None
-        for possible_time_dim in ['time', 'valid_time', 'datetime']:
-            if possible_time_dim in da.dims:
-                time_dim = possible_time_dim
-                break
-        
+        time_dim = next((d for d in ['time', 'valid_time', 'datetime'] if d in da.dims), None)
         if not time_dim:
             raise ValueError(f"No time dimension found in {da.dims}")
         
         # Standardize dimension names
-        coord_mapping = {}
+        coord_mapping = {time_dim: 'time'} if time_dim != 'time' else {}
         for coord in da.dims:
             coord_lower = coord.lower()
             if coord_lower in ['longitude', 'lon', 'long']:
                 coord_mapping[coord] = 'longitude'
             elif coord_lower in ['latitude', 'lat']:
                 coord_mapping[coord] = 'latitude'
-        
         if coord_mapping:
             da = da.rename(coord_mapping)
         
-        # Rename time dimension to 'time'
-        if time_dim != 'time':
-            da = da.rename({time_dim: 'time'})
+        if dates:
+            da = da.sel(time=da.time.isin(pd.to_datetime(sorted(set(dates)))))
         
-        # Convert temperature from Kelvin to Celsius
-        if "temperature" in variable.lower() or "t2m" in var_name.lower():
-            logger.info("Converting temperature from Kelvin to Celsius")
-            da = da - 273.15
-        
-        # Clip to bbox
+        # Clip the whole time axis at once, before reading values
         if isinstance(bbox, list):
             bbox = (bbox[1], bbox[2], bbox[3], bbox[0])  # [W, S, E, N]
-        
+        da = da.rio.set_spatial_dims(x_dim='longitude', y_dim='latitude').rio.write_crs("EPSG:4326")
         try:
-            # Clip using coordinate selection
-            west, south, east, north = bbox
-            da = da.sel(
-                longitude=slice(west, east),
-                latitude=slice(north, south)  # Note: latitude is typically descending
-            )
-            logger.info(f"Clipped to bbox: {bbox}")
+            da = da.rio.clip_box(*bbox)
         except Exception as e:
             logger.warning(f"Could not clip to bbox: {e}. Using full extent.")
         
-        # Rename variable to standardized name
-        var_short_name = dir_name  # temp_max, temp_min, temp
-        da.name = var_short_name
-        da.attrs.update({
-            'long_name': f'{variable} {daily_statistic}',
-            'units': 'degrees_celsius' if 'temp' in var_short_name else 'unknown',
-            'source': 'ERA5-Land',
-            'statistic': daily_statistic
-        })
-        
-        # Get dates from new data
-        new_dates = set(pd.to_datetime(da.time.values).date)
-        logger.info(f"Source NetCDF contains {len(new_dates)} dates")
-        
-        # Filter to only dates_to_append if specified
-        if dates_to_append:
-            dates_to_append_set = set(dates_to_append)
-            da = da.sel(time=da.time.isin([pd.Timestamp(d) for d in dates_to_append_set]))
-            new_dates = dates_to_append_set & new_dates
-            logger.info(f"Filtered to {len(new_dates)} dates to append")
-        
-        # Append to existing or create new
-        if hist_file.exists():
-            logger.info("Historical file exists, checking for duplicates...")
-            try:
-                existing_data = xr.open_dataset(hist_file, chunks='auto')
-                existing_da = existing_data[var_short_name]
-                
-                existing_dates = set(pd.to_datetime(existing_da.time.values).date)
-                dates_to_add = new_dates - existing_dates
-                
-                if not dates_to_add:
-                    logger.info("All dates already exist in historical file")
-                    existing_data.close()
-                    ds.close()
-                    return hist_file
-                
-                logger.info(f"Adding {len(dates_to_add)} new dates (skipping {len(new_dates - dates_to_add)} duplicates)")
-                
-                # Filter new data to only new dates
-                da_filtered = da.sel(time=da.time.isin([pd.Timestamp(d) for d in dates_to_add]))
-                
-                # Combine existing and new data
-                combined = xr.concat([existing_da, da_filtered], dim='time').sortby('time')
-                existing_data.close()
-                
-            except Exception as e:
-                logger.warning(f"Could not append to existing file: {e}. Creating new file.")
-                combined = da
-        else:
-            logger.info("Creating new historical file")
-            combined = da
-        
-        ds.close()
-        
-        # Convert to Dataset
-        hist_ds = combined.to_dataset()
-        
-        # Efficient chunking: 1 day per chunk, 20x20 spatial chunks
-        encoding = {
-            var_short_name: {
-                'chunksizes': (1, 20, 20),
-                'zlib': True,
-                'complevel': 5,
-                'dtype': 'float32'
-            }
-        }
-        
-        logger.info("Saving with chunks: time=1, lat=20, lon=20")
-        hist_ds.to_netcdf(hist_file, mode='w', encoding=encoding, engine='netcdf4')
-        
-        logger.info(f"✓ Historical file updated: {hist_file}")
-        logger.info(f"  Time range: {combined.time.min().values} to {combined.time.max().values}")
-        logger.info(f"  Total days: {len(combined.time)}")
-        
-        return hist_file
-        
+        da = da.load()
+    
+    # Convert temperature from Kelvin to Celsius
+    if "temperature" in variable.lower() or "t2m" in var_name.lower():
+        da = da - 273.15
+    
+    da.name = dir_name  # temp_max, temp_min, temp
+    da.attrs.update({
+        'long_name': f'{variable} {daily_statistic}',
+        'units': 'degrees_celsius' if 'temp' in dir_name else 'unknown',
+        'source': 'ERA5-Land',
+        'statistic': daily_statistic
+    })
+    logger.info(f"Normalized {da.sizes['time']} day(s) from {netcdf_path.name}: {dict(da.sizes)}")
+    return da
+
+
+def write_daily_geotiffs(
+    batch: xr.DataArray,
+    variable: str,
+    daily_statistic: str,
+    dates_to_process: List[date]
+) -> Tuple[List[Path], List[date]]:
+    """
+    Write one COG per requested day of a normalized batch (on the COG write
+    pool). Returns (COGs written, days that failed); a failed day does not
+    discard the ones already written and recorded in the manifest.
+    """
+    logger = get_run_logger()
+    settings = get_settings()
+    
+    output_dir = get_output_directory(variable, daily_statistic, settings)
+    manifest = manifest_for(output_dir.name, settings.DATA_DIR)
+    logger.info(f"Saving {variable} ({daily_statistic}) to: {output_dir}")
+    
+    wanted = set(dates_to_process)
+    pending = {}
+    
+    def jobs():
+        for i, day_date in enumerate(pd.to_datetime(batch.time.values).date):
+            if day_date not in wanted:
+                continue
+            daily_data = batch.isel(time=i).rename({'longitude': 'x', 'latitude': 'y'})
+            output_path = output_dir / f"{output_dir.name}_{day_date.strftime('%Y%m%d')}.tif"
+            stats = array_stats(
+                daily_data.values, nodata=daily_data.rio.nodata,
+                valid_min=VALID_MIN.get(output_dir.name),
+            )
+            pending[output_path] = (day_date, stats)
+            yield daily_data, output_path
+    
+    processed_paths, failed = [], []
+    for output_path, error in write_cogs(jobs(), source=output_dir.name):
+        day_date, stats = pending.pop(output_path)
+        if error:
+            logger.error(f"✗ Failed to write {output_path.name}: {error}")
+            failed.append(day_date)
+            continue
+        manifest.record_cog(day_date, output_path, stats=stats)
+        processed_paths.append(output_path)
+        logger.info(f"✓ Processed: {day_date} -> {output_path.name}")
+    
+    logger.info(f"✓ Successfully processed {len(processed_paths)} days")
+    return sorted(processed_paths), sorted(failed)
+
+
+def append_to_historical_netcdf(
+    batch: xr.DataArray,
+    variable: str,
+    daily_statistic: str,
+    dates_to_append: List[date]
+) -> Path:
+    """Append the requested days of a normalized batch to the historical store."""
+    logger = get_run_logger()
+    settings = get_settings()
+    
+    dir_name = get_output_directory(variable, daily_statistic, settings).name
+    hist_file = Path(settings.DATA_DIR) / f"{dir_name}_hist" / "historical.nc"
+    manifest = manifest_for(dir_name, settings.DATA_DIR)
+    
+    da = batch.drop_vars('spatial_ref', errors='ignore')
+    da = da.sel(time=da.time.isin(pd.to_datetime(sorted(set(dates_to_append)))))
+    new_dates = set(pd.to_datetime(da.time.values).date)
+    logger.info(f"Appending {len(new_dates)} dates to {hist_file}")
+    
+    # Only the new days are written: appended in place, or to a backfill partition
+    appended, backfilled = cube_store.append_history(hist_file, dir_name, da)
+    logger.info(f"✓ Historical store updated: {hist_file}")
+    logger.info(f"  Appended {len(appended)} day(s), {len(backfilled)} backfilled to a partition")
+    
+    manifest.mark_in_cube(new_dates)
+    return hist_file
+
+
+@task
+def process_era5_batch(
+    netcdf_path: Path,
+    variable: str,
+    daily_statistic: str,
+    bbox: tuple,
+    geotiff_dates: List[date],
+    historical_dates: List[date]
+) -> Tuple[List[Path], List[str]]:
+    """
+    Normalize a downloaded batch once, then write the missing daily GeoTIFFs
+    and append the missing days to the historical store from the same array.
+    Returns (GeoTIFFs written, errors): failed GeoTIFFs or a failed historical
+    append are reported in errors, so the COGs already written still reach the
+    mosaics.
+    """
+    logger = get_run_logger()
+    
+    try:
+        batch = normalize_era5_batch(
+            netcdf_path, variable, daily_statistic, bbox,
+            dates=sorted(set(geotiff_dates) | set(historical_dates))
+        )
     except Exception as e:
-        logger.error(f"✗ Failed to append to historical: {e}")
+        logger.error(f"✗ Failed to process: {e}")
         raise
+    
+    processed, errors = [], []
+    if geotiff_dates:
+        processed, failed = write_daily_geotiffs(batch, variable, daily_statistic, geotiff_dates)
+        if failed:
+            errors.append(f"{len(failed)} GeoTIFF(s) failed: {', '.join(str(d) for d in failed)}")
+    else:
+        logger.info("  Skipping GeoTIFF processing (all exist)")
+    
+    if historical_dates:
+        try:
+            hist_file = append_to_historical_netcdf(batch, variable, daily_statistic, historical_dates)
+            logger.info(f"✓ Updated historical: {hist_file}")
+        except Exception as e:
+            logger.error(f"✗ Failed to append to the historical store: {e}")
+            errors.append(f"historical append failed: {e}")
+    else:
+        logger.info("  Skipping historical append (all exist)")
+    
+    return processed, errors
 
 
 @task
@@ -572,9 +366,13 @@ def era5_land_daily_flow(
     batch_days: int = 31,
     variables_config: Optional[List[Dict[str, str]]] = None,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
+    end_date: Optional[date] = None,
+    dry_run: bool = False
 ):
-    """ERA5 Land Daily processing with historical NetCDF management."""
+    """
+    ERA5 Land Daily processing with historical NetCDF management.
+    With dry_run, only logs the planned CDS requests (count, over-fetch, bytes).
+    """
     logger = get_run_logger()
     settings = get_settings()
     
@@ -593,6 +391,10 @@ def era5_land_daily_flow(
     
     logger.info(f"Processing from {start_date} to {end_date}")
     all_processed = []
+    batch_errors: Dict[tuple, List[str]] = {}
+    cds_requests: List[CDSRequest] = []
+    batch_dates: Dict[tuple, tuple] = {}
+    bytes_per_day = grid_bytes(settings.latam_bbox_cds, ERA5_LAND_RESOLUTION)
     
     for var_config in variables_config:
         variable = var_config['variable']
@@ -626,100 +428,75 @@ def era5_land_daily_flow(
             logger.info(f"✓ All data already exists for {variable} - {statistic}")
             continue
         
-        # Group missing dates into contiguous batches
-        date_batches = []
-        if len(missing_download) > 0:
-            current_batch_start = missing_download[0]
-            current_batch_end = missing_download[0]
-            
-            for i in range(1, len(missing_download)):
-                if missing_download[i] == current_batch_end + timedelta(days=1):
-                    current_batch_end = missing_download[i]
-                else:
-                    date_batches.append((current_batch_start, current_batch_end))
-                    current_batch_start = missing_download[i]
-                    current_batch_end = missing_download[i]
-            
-            date_batches.append((current_batch_start, current_batch_end))
-        
-        if not date_batches:
-            logger.info(f"✓ No batches to process for {variable} - {statistic}")
+        # Month-aligned CDS requests (no cross-product over-fetch), at most batch_days each
+        plan = plan_cds(missing_download, max_days=batch_days, bytes_per_day=bytes_per_day)
+        logger.info(plan.report())
+        if dry_run:
             continue
         
-        logger.info(f"Organized into {len(date_batches)} download batch(es)")
+        for batch in plan.batches:
+            key = (variable, statistic, batch.start, batch.end)
+            cds_requests.append(CDSRequest(
+                key=key,
+                dataset=CDS_DATASET,
+                request=build_era5_request(batch.dates, variable, statistic, settings.latam_bbox_cds),
+                target=era5_batch_path(batch.start, batch.end, variable, statistic, settings)
+            ))
+            # Which dates need GeoTIFF processing / historical appending?
+            batch_dates[key] = (
+                [d for d in batch.dates if d in missing_geotiff],
+                [d for d in batch.dates if d in missing_historical]
+            )
+    
+    def process_batch(request: CDSRequest, batch_path: Path) -> List[Path]:
+        variable, statistic, batch_start, batch_end = request.key
+        geotiff_dates, hist_dates = batch_dates[request.key]
+        logger.info(f"\nProcessing batch: {variable} - {statistic} {batch_start} to {batch_end}")
+        logger.info(f"  Will process {len(geotiff_dates)} GeoTIFFs")
+        logger.info(f"  Will append {len(hist_dates)} to historical")
+        
+        # Normalize once, then GeoTIFFs and historical from the same array
+        processed, errors = process_era5_batch(
+            netcdf_path=batch_path,
+            variable=variable,
+            daily_statistic=statistic,
+            bbox=settings.latam_bbox_raster,
+            geotiff_dates=geotiff_dates,
+            historical_dates=hist_dates
+        )
+        if errors:
+            # Keep the raw batch so a rerun can finish it without a new CDS request
+            batch_errors[request.key] = errors
+            logger.error(f"✗ Batch {batch_start} to {batch_end} incomplete ({'; '.join(errors)}); kept {batch_path.name}")
+        else:
+            cleanup_raw_files(batch_path)
+            logger.info(f"✓ Completed batch: {batch_start} to {batch_end}")
+        return processed
+    
+    if cds_requests:
+        # Requests for all variables are queued at the CDS together; each batch is
+        # processed as soon as its download lands
+        logger.info(f"Submitting {len(cds_requests)} CDS request(s), up to {settings.CDS_MAX_ACTIVE} at a time")
+        scheduler = CDSScheduler(CdsApiClient())
+        for outcome in scheduler.run_sync(cds_requests, process_batch):
+            variable, statistic, batch_start, batch_end = outcome.request.key
+            if outcome.ok:
+                all_processed.extend(outcome.result)
+            else:
+                logger.error(f"✗ Failed batch {variable} - {statistic} {batch_start} to {batch_end}: {outcome.error}")
+        for (variable, statistic, batch_start, batch_end), errors in sorted(batch_errors.items()):
+            logger.error(f"✗ Incomplete batch {variable} - {statistic} {batch_start} to {batch_end}: {'; '.join(errors)}")
         
-        # Process each batch of missing dates
-        for batch_start, batch_end in date_batches:
-            current_start = batch_start
-            while current_start <= batch_end:
-                current_end = min(current_start + timedelta(days=batch_days - 1), batch_end)
-                
-                # Get the specific dates in this chunk
-                chunk_dates = []
-                d = current_start
-                while d <= current_end:
-                    chunk_dates.append(d)
-                    d += timedelta(days=1)
-                
-                # Which dates need GeoTIFF processing?
-                geotiff_dates_in_chunk = [d for d in chunk_dates if d in missing_geotiff]
-                
-                # Which dates need historical appending?
-                hist_dates_in_chunk = [d for d in chunk_dates if d in missing_historical]
-                
-                try:
-                    logger.info(f"\nDownloading batch: {current_start} to {current_end}")
-                    logger.info(f"  Will process {len(geotiff_dates_in_chunk)} GeoTIFFs")
-                    logger.info(f"  Will append {len(hist_dates_in_chunk)} to historical")
-                    
-                    # Download batch
-                    batch_path = download_era5_land_daily_batch(
-                        start_date=current_start,
-                        end_date=current_end,
-                        variable=variable,
-                        daily_statistic=statistic,
-                        area=settings.latam_bbox_cds
-                    )
-                    
-                    # Process to GeoTIFFs (only missing dates)
-                    if geotiff_dates_in_chunk:
-                        processed = process_era5_land_daily_to_geotiff(
-                            netcdf_path=batch_path,
-                            variable=variable,
-                            daily_statistic=statistic,
-                            bbox=settings.latam_bbox_raster,
-                            dates_to_process=geotiff_dates_in_chunk
-                        )
-                        all_processed.extend(processed)
-                    else:
-                        logger.info("  Skipping GeoTIFF processing (all exist)")
-                    
-                    # Append to historical NetCDF (only missing dates)
-                    if hist_dates_in_chunk:
-                        hist_file = append_to_historical_netcdf(
-                            source_netcdf=batch_path,
-                            variable=variable,
-                            daily_statistic=statistic,
-                            bbox=settings.latam_bbox_raster,
-                            dates_to_append=hist_dates_in_chunk
-                        )
-                        logger.info(f"✓ Updated historical: {hist_file}")
-                    else:
-                        logger.info("  Skipping historical append (all exist)")
-                    
-                    # Clean up raw file
-                    cleanup_raw_files(batch_path)
-                    
-                    logger.info(f"✓ Completed batch: {current_start} to {current_end}")
-                    
-                except Exception as e:
-                    logger.error(f"✗ Failed batch {current_start} to {current_end}: {e}")
-                
-                current_start = current_end + timedelta(days=1)
+        # Fold any backfill partitions written above into the stores
+        for variable, statistic in sorted({key[:2] for key in batch_dates}):
+            dir_name = get_output_directory(variable, statistic, settings).name
+            compact_historical_store(dir_name, dir_name)
     
     # Refresh GeoServer mosaics
     if all_processed:
-        from .tasks import refresh_mosaic_shapefile
+        from .tasks import harvest_mosaic_granules
+        from .aggregates_flow import update_aggregate_mosaics, dates_from_paths
+        from app.services.aggregates import AGGREGATES
         from collections import defaultdict
         
         files_by_dir = defaultdict(list)
@@ -732,9 +509,15 @@ def era5_land_daily_flow(
         for dir_path, files in files_by_dir.items():
             logger.info(f"Refreshing {dir_path.name}: {len(files)} files")
             try:
-                refresh_mosaic_shapefile(DataSource.ERA5)
+                harvest_mosaic_granules(dir_path, files)
             except Exception as e:
-                logger.error(f"Failed to refresh mosaic: {e}")
+                logger.error(f"Failed to harvest granules into {dir_path.name}: {e}")
+
+            if dir_path.name in AGGREGATES:
+                try:
+                    update_aggregate_mosaics(dir_path.name, dates_from_paths(files))
+                except Exception as e:
+                    logger.error(f"Failed to update {dir_path.name} aggregates: {e}")
         
         logger.info(f"\n✓ Successfully processed {len(all_processed)} total files")
     
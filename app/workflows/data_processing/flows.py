@@ -1,16 +1,22 @@
+from collections import deque
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
 from prefect import flow, get_run_logger
 from pathlib import Path
 from .tasks import (
-    check_data_availability,
+    list_remote_dates,
+    listing_url,
     download_data,
     process_data,
     validate_output,
-    refresh_mosaic_shapefile
+    refresh_mosaic_shapefile,
+    harvest_mosaic_granules
 )
 from .schemas import DataSource
+from .aggregates_flow import update_aggregate_mosaics, dates_from_paths
+from .historical_flow import update_historical
 from config.settings import get_settings
+from app.services.manifest import manifest_for
 import cdsapi
 
 
@@ -23,6 +29,80 @@ from prefect.blocks.notifications import SlackWebhook
 def merge_daily_flow(...):
     ...
 """
+def update_mosaic(mosaic_dir: Path, processed_paths: list, source: DataSource):
+    """
+    Harvest the new granules (falling back to a full index rebuild if that
+    fails) and refresh the monthly/annual aggregates they fall in.
+    """
+    logger = get_run_logger()
+    if not processed_paths:
+        logger.info(f"No new {source.value} granules, mosaic unchanged")
+        return
+    try:
+        harvest_mosaic_granules.submit(mosaic_dir, processed_paths).result()
+    except Exception as e:
+        logger.warning(f"Incremental harvest failed ({e}), rebuilding the {source.value} mosaic index")
+        refresh_mosaic_shapefile.submit(source).result()
+
+    try:
+        update_aggregate_mosaics.submit(source.value, dates_from_paths(processed_paths)).result()
+    except Exception as e:
+        logger.error(f"Failed to update {source.value} aggregates: {e}")
+
+def missing_dates(mosaic_dir: Path, source: DataSource, start_date: date, end_date: date) -> list:
+    """Days in [start_date, end_date] without a local COG (one manifest range query)."""
+    return manifest_for(source.value, mosaic_dir.parent).missing(start_date, end_date)
+
+
+def available_dates(source: DataSource, days: list) -> list:
+    """
+    Filter ``days`` to those published remotely, one index fetch per remote
+    directory (per year for CHIRPS, per month for MERGE).
+    """
+    urls = sorted({listing_url(d, source) for d in days})
+    listings = [list_remote_dates.submit(source, url) for url in urls]
+    published = set()
+    for future in listings:
+        published |= future.result()
+    return [d for d in days if d in published]
+
+
+def run_ingestion_pipeline(days: list, source: DataSource, bbox) -> list:
+    """
+    download -> process -> validate for every day, with at most MAX_IN_FLIGHT
+    days in the pipeline. Downloads are throttled per host inside download_data
+    and processing runs in the CPU pool, so the next downloads overlap with
+    processing and validation of earlier days.
+    """
+    logger = get_run_logger()
+    settings = get_settings()
+    processed_paths = []
+    in_flight = deque()
+
+
+    def drain_one():
+        day, processed, validated = in_flight.popleft()
+        try:
+            if validated.result():
+                processed_paths.append(processed.result())
+        except Exception as e:
+            logger.error(f"✗ {source.value} {day}: {e}")
+
+    for day in days:
+        if len(in_flight) >= settings.MAX_IN_FLIGHT:
+            drain_one()
+        raw = download_data.submit(day, source)
+        processed = process_data.submit(raw, day, source, bbox=bbox)
+        validated = validate_output.submit(processed, day, source)
+        in_flight.append((day, processed, validated))
+
+    while in_flight:
+        drain_one()
+
+    logger.info(f"✓ {source.value}: {len(processed_paths)}/{len(days)} days ingested")
+    return sorted(processed_paths)
+
+
 @flow(
     name="process-chirps-daily",
     description="Daily check and download of CHIRPS precipitation data for all missing days in the previous year until the last month",
@@ -32,35 +112,22 @@ def merge_daily_flow(...):
 def chirps_daily_flow(source: DataSource = DataSource.CHIRPS):
     logger = get_run_logger()
     settings = get_settings()
-    processed_paths = []
-    raw_dir = Path(settings.DATA_DIR) / "raw"
     mosaic_dir = Path(settings.DATA_DIR) / source.value
-    # Setup mosaic store
-    #setup_mosaic.submit(mosaic_dir, source).result()
+    # The mosaic store is provisioned by `python -m app.services.geoserver_rest`
     # Define date range
     today = date.today()
     last_month_end = today.replace(day=1) - timedelta(days=1)
     start_date = last_month_end - relativedelta(years=10) + timedelta(days=1)
-    current_date = start_date
-
-    while current_date <= last_month_end:
-        output_path = mosaic_dir / f"{source.value}_{current_date.strftime('%Y%m%d')}.tif"
-        if output_path.exists():
-            logger.info(f"File already exists locally: {output_path}, skipping download and processing")
-        else:
-            is_available = check_data_availability.submit(current_date, source).result()
-            if is_available:
-                raw_path = download_data.submit(current_date, source).result()
-                processed_path = process_data.submit(
-                    raw_path, current_date, source, bbox=settings.latam_bbox_raster
-                ).result()
-                if validate_output.submit(processed_path).result():
-                    processed_paths.append(processed_path)
-            else:
-                logger.warning(f"Data not available for {current_date}, skipping")
-        current_date += timedelta(days=1)
-
-    refresh_mosaic_shapefile.submit(source).result()
+
+    todo = missing_dates(mosaic_dir, source, start_date, last_month_end)
+    logger.info(f"{len(todo)} {source.value} days missing locally between {start_date} and {last_month_end}")
+    days = available_dates(source, todo)
+    if len(days) < len(todo):
+        logger.warning(f"{len(todo) - len(days)} days not available on the server, skipping")
+
+    processed_paths = run_ingestion_pipeline(days, source, settings.latam_bbox_raster)
+    update_mosaic(mosaic_dir, processed_paths, source)
+    update_historical(source.value, dates_from_paths(processed_paths), start_date, last_month_end)
 
     return processed_paths if processed_paths else None
 
@@ -73,43 +140,25 @@ def chirps_daily_flow(source: DataSource = DataSource.CHIRPS):
 def merge_daily_flow(source: DataSource = DataSource.MERGE):
     logger = get_run_logger()
     settings = get_settings()
-    processed_paths = []
-    raw_dir = Path(settings.DATA_DIR) / "raw"
     mosaic_dir = Path(settings.DATA_DIR) / source.value
-    # Setup mosaic store
-    #setup_mosaic.submit(mosaic_dir, source).result()
+    # The mosaic store is provisioned by `python -m app.services.geoserver_rest`
     # Define date range
     # Start: first day of previous month
     today = date.today()
-
-    start_date = (today.replace(day=1) - relativedelta(months=1)) 
-
+    start_date = (today.replace(day=1) - relativedelta(months=1))
     # End: yesterday
     end_date = today - timedelta(days=1)
 
+    todo = missing_dates(mosaic_dir, source, start_date, end_date)
+    logger.info(f"{len(todo)} {source.value} days missing locally between {start_date} and {end_date}")
+    days = available_dates(source, todo)
+    if len(days) < len(todo):
+        logger.warning(f"{len(todo) - len(days)} days not available on the server yet, skipping")
 
-    current_date = start_date
-    while current_date <= end_date:
-        output_path = mosaic_dir / f"{source.value}_{current_date.strftime('%Y%m%d')}.tif"
-        if output_path.exists():
-            logger.info(f"File already exists locally: {output_path}, skipping download and processing")
-        else:
-            #is_available = check_data_availability.submit(current_date, source).result()
-            is_available = True
-            if is_available:
-                raw_path = download_data.submit(current_date, source).result()
-                processed_path = process_data.submit(
-                    raw_path, current_date, source, bbox=settings.latam_bbox_raster
-                ).result()
-                if validate_output.submit(processed_path).result():
-                    processed_paths.append(processed_path)
-            else:
-                logger.warning(f"Data not available for {current_date}, skipping")
-
-        current_date += timedelta(days=1)
+    processed_paths = run_ingestion_pipeline(days, source, settings.latam_bbox_raster)
     # Reindex mosaic
-    #recalculate_time.submit(mosaic_dir, source).result()
-    refresh_mosaic_shapefile.submit(source).result()
+    update_mosaic(mosaic_dir, processed_paths, source)
+    update_historical(source.value, dates_from_paths(processed_paths), start_date, end_date)
 
     return processed_paths if processed_paths else None
 
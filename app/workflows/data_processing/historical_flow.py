@@ -0,0 +1,79 @@
+"""
+Historical Cube Append
+Appends validated CHIRPS/MERGE days to the yearly historical NetCDFs the API
+reads (app.services.cube_store), then refreshes the cumulative cubes of the
+years that changed. ERA5/NDVI append to their single-file stores themselves
+and compact the backfill partitions at the end of a run.
+"""
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+from prefect import task, get_run_logger
+from app.config.settings import get_settings
+from app.services import cube_store
+from app.services.manifest import manifest_for
+from .accumulation_flow import update_cumsum_cube
+
+
+@task(retries=1, retry_delay_seconds=60)
+def append_to_historical_cube(
+    source: str,
+    days: List[date],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> List[date]:
+    """
+    Append ``days`` plus any day in [start_date, end_date] that has a COG but
+    is not in the cube yet (per the manifest). Returns the days written.
+    """
+    logger = get_run_logger()
+    settings = get_settings()
+    manifest = manifest_for(source, settings.DATA_DIR)
+    mosaic_dir = Path(settings.DATA_DIR) / source
+
+    todo = set(days)
+    if start_date and end_date:
+        have_cog = manifest.cog_dates(start_date, end_date)
+        todo |= {d for d in manifest.missing_in_cube(start_date, end_date) if d in have_cog}
+    if not todo:
+        logger.info(f"✓ {source} historical cube is up to date")
+        return []
+
+    pairs = [(d, mosaic_dir / f"{source}_{d.strftime('%Y%m%d')}.tif") for d in sorted(todo)]
+    pairs = [(d, p) for d, p in pairs if p.exists()]
+    written = cube_store.append_days(source, pairs, settings.DATA_DIR)
+    # Days already present count as in the cube too
+    manifest.mark_in_cube([d for d, _ in pairs])
+    logger.info(f"✓ {source}: appended {len(written)} day(s) to the historical cube")
+    return written
+
+
+def update_historical(source: str, days: List[date], start_date: date, end_date: date):
+    """Append to the historical cube and rebuild the affected cumulative years."""
+    logger = get_run_logger()
+    try:
+        written = append_to_historical_cube.submit(source, days, start_date, end_date).result()
+    except Exception as e:
+        logger.error(f"✗ Failed to append {source} days to the historical cube: {e}")
+        return
+    if written:
+        try:
+            update_cumsum_cube.submit(source, sorted({d.year for d in written})).result()
+        except Exception as e:
+            logger.error(f"✗ Failed to update the {source} cumulative cube: {e}")
+
+
+@task
+def compact_historical_store(name: str, var: str) -> int:
+    """Fold the backfill partitions of {name}_hist/historical.nc back into it."""
+    logger = get_run_logger()
+    settings = get_settings()
+    hist_file = Path(settings.DATA_DIR) / f"{name}_hist" / "historical.nc"
+    try:
+        merged = cube_store.compact_history(hist_file, var)
+    except Exception as e:
+        logger.error(f"✗ Failed to compact {hist_file}: {e}")
+        return 0
+    if merged:
+        logger.info(f"✓ {name}: compacted {merged} backfill partition(s)")
+    return merged
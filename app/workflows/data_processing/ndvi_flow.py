@@ -6,16 +6,19 @@ Uses Microsoft Planetary Computer for BOTH Sentinel-2 and MODIS
 from datetime import date, timedelta
 from pathlib import Path
 from typing import List, Dict, Optional
-import numpy as np
 import xarray as xr
 import pandas as pd
-import rasterio
-from rasterio.windows import from_bounds
-from rasterio.warp import reproject, Resampling, calculate_default_transform
-from rasterio.transform import from_bounds as transform_from_bounds
 from prefect import flow, task, get_run_logger
 from .schemas import DataSource
+from .historical_flow import compact_historical_store
 from config.settings import get_settings
+from app.services import cube_store
+from app.services.backfill_planner import MODIS_PERIOD_DAYS, grid_bytes, plan_contiguous, plan_modis
+from app.services.cog import write_cogs
+from app.services.manifest import manifest_for
+from app.services.ndvi_tiles import MODIS, SENTINEL2, TileGrid, build_composites
+from app.services.raster_stats import VALID_MIN, array_stats
+from app.services.stac_cache import CACHE_DIRNAME, SignedHrefCache, StacSearchCache, as_items
 
 # Microsoft Planetary Computer imports (FREE, NO AUTH!)
 try:
@@ -26,6 +29,25 @@ except ImportError:
     PLANETARY_COMPUTER_AVAILABLE = False
 
 
+STAC_API_URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+
+
+def open_stac_catalog():
+    """Planetary Computer catalog; items come back unsigned and are signed per href."""
+    return pystac_client.Client.open(STAC_API_URL)
+
+
+def stac_caches(settings):
+    """(search cache, href signer) under DATA_DIR/.stac_cache."""
+    cache_dir = Path(settings.DATA_DIR) / CACHE_DIRNAME
+    searches = StacSearchCache(
+        cache_dir,
+        ttl_seconds=settings.STAC_CACHE_TTL_HOURS * 3600,
+        settled_days=settings.STAC_CACHE_SETTLED_DAYS,
+    )
+    return searches, SignedHrefCache(planetary_computer.sign, cache_dir / "tokens.json")
+
+
 # Mapping from NDVI source to directory names
 SOURCE_MAPPING = {
     "sentinel2": "ndvi_s2",
@@ -57,53 +79,16 @@ def check_missing_dates(
     logger = get_run_logger()
     settings = get_settings()
     
-    # Generate list of requested dates
-    requested_dates = []
-    current = start_date
-    while current <= end_date:
-        requested_dates.append(current)
-        current += timedelta(days=1)
+    logger.info(f"Checking for {(end_date - start_date).days + 1} dates: {start_date} to {end_date}")
     
-    logger.info(f"Checking for {len(requested_dates)} dates: {start_date} to {end_date}")
-    
-    # Get directories
+    # The directory name is also the manifest key
     dir_name = get_output_directory(source, settings).name
-    geotiff_dir = Path(settings.DATA_DIR) / dir_name
-    hist_dir = Path(settings.DATA_DIR) / f"{dir_name}_hist"
-    hist_file = hist_dir / "historical.nc"
-    
-    # Check GeoTIFF files
-    existing_geotiff_dates = set()
-    if geotiff_dir.exists():
-        for tif_file in geotiff_dir.glob(f"{dir_name}_*.tif"):
-            try:
-                date_str = tif_file.stem.split('_')[-1]
-                file_date = pd.to_datetime(date_str, format='%Y%m%d').date()
-                existing_geotiff_dates.add(file_date)
-            except Exception as e:
-                logger.warning(f"Could not parse date from {tif_file.name}: {e}")
     
-    logger.info(f"Found {len(existing_geotiff_dates)} existing GeoTIFF files")
-    
-    # Check historical NetCDF
-    existing_hist_dates = set()
-    if hist_file.exists():
-        try:
-            ds = xr.open_dataset(hist_file, chunks='auto')
-            if 'ndvi' in ds.data_vars:
-                existing_hist_dates = set(pd.to_datetime(ds['ndvi'].time.values).date)
-                logger.info(f"Found {len(existing_hist_dates)} dates in historical NetCDF")
-            ds.close()
-        except Exception as e:
-            logger.warning(f"Could not read historical file: {e}")
-    else:
-        logger.info("Historical NetCDF does not exist yet")
-    
-    # Calculate missing dates
-    requested_dates_set = set(requested_dates)
-    missing_geotiff = sorted(list(requested_dates_set - existing_geotiff_dates))
-    missing_historical = sorted(list(requested_dates_set - existing_hist_dates))
-    missing_download = sorted(list(set(missing_geotiff) | set(missing_historical)))
+    # Seeded from the GeoTIFFs and the historical cube on first use
+    manifest = manifest_for(dir_name, settings.DATA_DIR)
+    missing_geotiff = manifest.missing(start_date, end_date)
+    missing_historical = manifest.missing_in_cube(start_date, end_date)
+    missing_download = sorted(set(missing_geotiff) | set(missing_historical))
     
     logger.info(f"Missing from GeoTIFF: {len(missing_geotiff)} dates")
     logger.info(f"Missing from historical: {len(missing_historical)} dates")
@@ -165,199 +150,40 @@ def download_sentinel2_batch(
     logger.info("=" * 80)
     
     try:
-        # Connect to Planetary Computer
-        catalog = pystac_client.Client.open(
-            "https://planetarycomputer.microsoft.com/api/stac/v1",
-            modifier=planetary_computer.sign_inplace
-        )
-        
-        # Search for Sentinel-2 data
-        search = catalog.search(
-            collections=["sentinel-2-l2a"],
-            bbox=bbox,
-            datetime=f"{start_date.isoformat()}/{end_date.isoformat()}",
+        # Search Planetary Computer (cached on disk; the catalog is only opened on a miss)
+        searches, signer = stac_caches(settings)
+        items = as_items(searches.search(
+            open_stac_catalog,
+            ["sentinel-2-l2a"],
+            bbox,
+            f"{start_date.isoformat()}/{end_date.isoformat()}",
             query={"eo:cloud_cover": {"lt": max_cloud_cover}}
-        )
-        
-        items = list(search.items())
+        ))
         logger.info(f"Found {len(items)} Sentinel-2 scenes")
         
         if len(items) == 0:
             raise ValueError("No Sentinel-2 products found")
         
-        # Limit scenes
-        max_scenes = 50
-        if len(items) > max_scenes:
-            items = sorted(items, key=lambda x: x.datetime, reverse=True)[:max_scenes]
-        
-        # Process each image
-        ndvi_data_list = []
-        time_list = []
-        
-        # Define common grid from bbox at ~10m resolution
-        # Calculate grid dimensions based on bbox
-        lat_range = north - south
-        lon_range = east - west
-        
-        # Approximate 10m in degrees (varies by latitude, but good enough)
-        # At equator: 1 degree ≈ 111km, 10m ≈ 0.00009 degrees
-        resolution = 0.0001  # ~10m
-        
-        n_lat = int(lat_range / resolution)
-        n_lon = int(lon_range / resolution)
-        
-        # Limit grid size to prevent memory issues
-        max_pixels = 50000  # Max 50k pixels per dimension
-        if n_lat > max_pixels:
-            n_lat = max_pixels
-            logger.warning(f"Limiting latitude pixels to {max_pixels}")
-        if n_lon > max_pixels:
-            n_lon = max_pixels
-            logger.warning(f"Limiting longitude pixels to {max_pixels}")
-        
-        # Create common grid
-        lats = np.linspace(north, south, n_lat)
-        lons = np.linspace(west, east, n_lon)
-        
-        # Create transform for common grid
-        common_transform = transform_from_bounds(west, south, east, north, n_lon, n_lat)
-        
-        logger.info(f"Common grid: {n_lat} x {n_lon} pixels")
+        # Common grid at ~10m (capped at 50k pixels per side), composited tile by tile
+        grid = TileGrid.from_resolution(
+            (west, south, east, north), 0.0001, max_pixels=50000, tile_size=settings.NDVI_TILE_SIZE
+        )
+        logger.info(f"Common grid: {grid.height} x {grid.width} pixels")
         logger.info(f"Grid covers: {west:.2f}°W to {east:.2f}°E, {south:.2f}°S to {north:.2f}°N")
         
-        for i, item in enumerate(items):
-            logger.info(f"Processing scene {i+1}/{len(items)}: {item.id}")
-            
-            try:
-                # Get signed URLs
-                nir_href = planetary_computer.sign(item.assets["B08"].href)
-                red_href = planetary_computer.sign(item.assets["B04"].href)
-                
-                # Read and reproject NIR band
-                with rasterio.open(nir_href) as src:
-                    # Log scene info for debugging
-                    scene_bounds = src.bounds
-                    
-                    # Calculate intersection of scene with requested bbox
-                    intersect_west = max(west, scene_bounds.left)
-                    intersect_south = max(south, scene_bounds.bottom)
-                    intersect_east = min(east, scene_bounds.right)
-                    intersect_north = min(north, scene_bounds.top)
-                    
-                    # Check if there's actual intersection
-                    if intersect_west >= intersect_east or intersect_south >= intersect_north:
-                        logger.warning(f"  Scene doesn't intersect bbox, skipping")
-                        continue
-                    
-                    # Read the intersection area
-                    window = from_bounds(intersect_west, intersect_south, 
-                                        intersect_east, intersect_north, 
-                                        src.transform)
-                    
-                    # Check window validity
-                    if window.width <= 0 or window.height <= 0:
-                        logger.warning(f"  Invalid window size, skipping")
-                        continue
-                    
-                    nir_src = src.read(1, window=window).astype(np.float32)
-                    src_transform = src.window_transform(window)
-                    src_crs = src.crs
-                    
-                    # Skip if empty
-                    if nir_src.size == 0:
-                        logger.warning(f"  Scene has no data, skipping")
-                        continue
-                    
-                    # Reproject to common grid
-                    nir = np.empty((n_lat, n_lon), dtype=np.float32)
-                    reproject(
-                        source=nir_src,
-                        destination=nir,
-                        src_transform=src_transform,
-                        src_crs=src_crs,
-                        dst_transform=common_transform,
-                        dst_crs=src_crs,
-                        resampling=Resampling.bilinear
-                    )
-                
-                # Read and reproject Red band
-                with rasterio.open(red_href) as src:
-                    scene_bounds = src.bounds
-                    
-                    # Calculate intersection
-                    intersect_west = max(west, scene_bounds.left)
-                    intersect_south = max(south, scene_bounds.bottom)
-                    intersect_east = min(east, scene_bounds.right)
-                    intersect_north = min(north, scene_bounds.top)
-                    
-                    if intersect_west >= intersect_east or intersect_south >= intersect_north:
-                        logger.warning(f"  Red band doesn't intersect bbox, skipping")
-                        continue
-                    
-                    window = from_bounds(intersect_west, intersect_south,
-                                        intersect_east, intersect_north,
-                                        src.transform)
-                    
-                    red_src = src.read(1, window=window).astype(np.float32)
-                    src_transform = src.window_transform(window)
-                    src_crs = src.crs
-                    
-                    # Reproject to common grid
-                    red = np.empty((n_lat, n_lon), dtype=np.float32)
-                    reproject(
-                        source=red_src,
-                        destination=red,
-                        src_transform=src_transform,
-                        src_crs=src_crs,
-                        dst_transform=common_transform,
-                        dst_crs=src_crs,
-                        resampling=Resampling.bilinear
-                    )
-                
-                # Calculate NDVI
-                denominator = nir + red
-                ndvi = np.where(denominator != 0, (nir - red) / denominator, np.nan)
-                ndvi = np.clip(ndvi, -1, 1)
-                
-                # Check if we got any valid data
-                if np.all(np.isnan(ndvi)):
-                    logger.warning(f"  All NDVI values are NaN, skipping")
-                    continue
-                
-                ndvi_data_list.append(ndvi)
-                time_list.append(item.datetime)
-                
-                valid_pct = 100 * np.sum(~np.isnan(ndvi)) / ndvi.size
-                logger.info(f"  ✓ Processed successfully ({valid_pct:.1f}% valid pixels)")
-                
-            except Exception as e:
-                logger.error(f"  Failed to process scene: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
-                continue
-        
-        if len(ndvi_data_list) == 0:
-            raise RuntimeError("All scenes failed to process")
-        
-        # Create dataset
-        ndvi_array = np.stack(ndvi_data_list)
-        
-        ds = xr.Dataset(
-            {'ndvi': (['time', 'latitude', 'longitude'], ndvi_array)},
-            coords={
-                'time': pd.to_datetime(time_list),
-                'latitude': lats,
-                'longitude': lons,
-            },
+        days = build_composites(
+            items, grid, SENTINEL2, output_path,
+            method=settings.NDVI_COMPOSITE,
+            sign=signer,
+            workers=settings.NDVI_READ_WORKERS,
+            retries=settings.NDVI_READ_RETRIES,
             attrs={
                 'source': 'Sentinel-2 L2A',
                 'resolution': '10m',
                 'provider': 'Microsoft Planetary Computer'
             }
         )
-        
-        ds.to_netcdf(output_path)
-        logger.info(f"✓ Sentinel-2 NDVI saved: {output_path}")
+        logger.info(f"✓ Sentinel-2 NDVI saved: {output_path} ({len(days)} dates)")
         
         return output_path
         
@@ -407,122 +233,37 @@ def download_modis_batch(
     logger.info("=" * 80)
     
     try:
-        catalog = pystac_client.Client.open(
-            "https://planetarycomputer.microsoft.com/api/stac/v1",
-            modifier=planetary_computer.sign_inplace
-        )
-        
-        search = catalog.search(
-            collections=["modis-13Q1-061"],
-            bbox=bbox,
-            datetime=f"{start_date.isoformat()}/{end_date.isoformat()}"
-        )
-        
-        items = list(search.items())
+        searches, signer = stac_caches(settings)
+        items = as_items(searches.search(
+            open_stac_catalog,
+            ["modis-13Q1-061"],
+            bbox,
+            f"{start_date.isoformat()}/{end_date.isoformat()}"
+        ))
         logger.info(f"Found {len(items)} MODIS composites")
         
         if len(items) == 0:
             raise ValueError("No MODIS data found")
         
-        ndvi_data_list = []
-        time_list = []
-        
-        # Define common grid from bbox at ~250m resolution for MODIS
-        lat_range = north - south
-        lon_range = east - west
-        
-        # 250m resolution in degrees
-        resolution = 0.0025  # ~250m
-        
-        n_lat = int(lat_range / resolution)
-        n_lon = int(lon_range / resolution)
-        
-        # Limit grid size
-        max_pixels = 20000
-        if n_lat > max_pixels:
-            n_lat = max_pixels
-        if n_lon > max_pixels:
-            n_lon = max_pixels
-        
-        # Create common grid
-        lats = np.linspace(north, south, n_lat)
-        lons = np.linspace(west, east, n_lon)
-        
-        common_transform = transform_from_bounds(west, south, east, north, n_lon, n_lat)
-        
-        logger.info(f"Common grid: {n_lat} x {n_lon} pixels (~250m)")
-        
-        for i, item in enumerate(items):
-            logger.info(f"Processing composite {i+1}/{len(items)}")
-            
-            try:
-                ndvi_href = planetary_computer.sign(item.assets["250m_16_days_NDVI"].href)
-                
-                with rasterio.open(ndvi_href) as src:
-                    window = from_bounds(west, south, east, north, src.transform)
-                    ndvi_src = src.read(1, window=window).astype(np.float32)
-                    src_transform = src.window_transform(window)
-                    src_crs = src.crs
-                    
-                    # Skip if empty
-                    if ndvi_src.size == 0:
-                        logger.warning(f"  Composite has no data in bbox, skipping")
-                        continue
-                    
-                    # Reproject to common grid
-                    ndvi_raw = np.empty((n_lat, n_lon), dtype=np.float32)
-                    reproject(
-                        source=ndvi_src,
-                        destination=ndvi_raw,
-                        src_transform=src_transform,
-                        src_crs=src_crs,
-                        dst_transform=common_transform,
-                        dst_crs=src_crs,
-                        resampling=Resampling.bilinear
-                    )
-                
-                # Scale MODIS NDVI
-                ndvi = ndvi_raw * 0.0001
-                ndvi = np.where((ndvi < -1) | (ndvi > 1), np.nan, ndvi)
-                
-                # Check for valid data
-                if np.all(np.isnan(ndvi)):
-                    logger.warning(f"  All values are NaN, skipping")
-                    continue
-                
-                ndvi_data_list.append(ndvi)
-                time_list.append(item.datetime)
-                
-                valid_pct = 100 * np.sum(~np.isnan(ndvi)) / ndvi.size
-                logger.info(f"  ✓ Processed successfully ({valid_pct:.1f}% valid pixels)")
-                
-            except Exception as e:
-                logger.error(f"  Failed: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
-                continue
-        
-        if len(ndvi_data_list) == 0:
-            raise RuntimeError("All composites failed")
-        
-        ndvi_array = np.stack(ndvi_data_list)
-        
-        ds = xr.Dataset(
-            {'ndvi': (['time', 'latitude', 'longitude'], ndvi_array)},
-            coords={
-                'time': pd.to_datetime(time_list),
-                'latitude': lats,
-                'longitude': lons,
-            },
+        # Common grid at ~250m (capped at 20k pixels per side), composited tile by tile
+        grid = TileGrid.from_resolution(
+            (west, south, east, north), 0.0025, max_pixels=20000, tile_size=settings.NDVI_TILE_SIZE
+        )
+        logger.info(f"Common grid: {grid.height} x {grid.width} pixels (~250m)")
+        
+        days = build_composites(
+            items, grid, MODIS, output_path,
+            method=settings.NDVI_COMPOSITE,
+            sign=signer,
+            workers=settings.NDVI_READ_WORKERS,
+            retries=settings.NDVI_READ_RETRIES,
             attrs={
                 'source': 'MODIS MOD13Q1',
                 'resolution': '250m',
                 'provider': 'Microsoft Planetary Computer'
             }
         )
-        
-        ds.to_netcdf(output_path)
-        logger.info(f"✓ MODIS NDVI saved: {output_path}")
+        logger.info(f"✓ MODIS NDVI saved: {output_path} ({len(days)} dates)")
         
         return output_path
         
@@ -545,7 +286,8 @@ def process_ndvi_to_geotiff(
     settings = get_settings()
     
     output_dir = get_output_directory(source, settings)
-    processed_paths = []
+    manifest = manifest_for(output_dir.name, settings.DATA_DIR)
+    pending = {}
     
     try:
         ds = xr.open_dataset(netcdf_path)
@@ -554,38 +296,58 @@ def process_ndvi_to_geotiff(
         if isinstance(bbox, list):
             bbox = (bbox[1], bbox[2], bbox[3], bbox[0])
         
-        for time_val in da.time.values:
-            daily_data = da.sel(time=time_val)
-            day_date = pd.Timestamp(time_val).date()
-            
-            if dates_to_process and day_date not in dates_to_process:
+        # Slices are read here, in this thread (NetCDF reads are not thread-safe);
+        # only the COG writes run on the pool
+        def jobs():
+            for time_val in da.time.values:
+                day_date = pd.Timestamp(time_val).date()
+                if dates_to_process and day_date not in dates_to_process:
+                    continue
+                daily_data = da.sel(time=time_val)
+                
+                # Rename coords for rasterio
+                coord_mapping = {}
+                for coord in daily_data.dims:
+                    coord_lower = coord.lower()
+                    if coord_lower in ['longitude', 'lon']:
+                        coord_mapping[coord] = 'x'
+                    elif coord_lower in ['latitude', 'lat']:
+                        coord_mapping[coord] = 'y'
+                
+                if coord_mapping:
+                    daily_data = daily_data.rename(coord_mapping)
+                
+                daily_data = daily_data.rio.write_crs("EPSG:4326")
+                
+                try:
+                    daily_data = daily_data.rio.clip_box(*bbox)
+                except Exception as e:
+                    logger.warning(f"Could not clip: {e}")
+                
+                daily_data = daily_data.load()
+                output_path = output_dir / f"{output_dir.name}_{day_date.strftime('%Y%m%d')}.tif"
+                stats = array_stats(
+                    daily_data.values, nodata=daily_data.rio.nodata,
+                    valid_min=VALID_MIN.get(output_dir.name),
+                )
+                pending[output_path] = (day_date, stats)
+                yield daily_data, output_path
+        
+        processed_paths, failed = [], []
+        for output_path, error in write_cogs(jobs(), source=output_dir.name):
+            day_date, stats = pending.pop(output_path)
+            if error:
+                logger.error(f"✗ Failed to write {output_path.name}: {error}")
+                failed.append(day_date)
                 continue
-            
-            # Rename coords for rasterio
-            coord_mapping = {}
-            for coord in daily_data.dims:
-                coord_lower = coord.lower()
-                if coord_lower in ['longitude', 'lon']:
-                    coord_mapping[coord] = 'x'
-                elif coord_lower in ['latitude', 'lat']:
-                    coord_mapping[coord] = 'y'
-            
-            if coord_mapping:
-                daily_data = daily_data.rename(coord_mapping)
-            
-            daily_data = daily_data.rio.write_crs("EPSG:4326")
-            
-            try:
-                daily_data = daily_data.rio.clip_box(*bbox)
-            except Exception as e:
-                logger.warning(f"Could not clip: {e}")
-            
-            output_path = output_dir / f"{output_dir.name}_{day_date.strftime('%Y%m%d')}.tif"
-            daily_data.rio.to_raster(output_path, driver="COG", compress="LZW")
+            manifest.record_cog(day_date, output_path, stats=stats)
             processed_paths.append(output_path)
             logger.info(f"✓ Processed: {day_date}")
+        ds.close()
         
-        return processed_paths
+        if failed:
+            raise RuntimeError(f"{len(failed)} GeoTIFF(s) failed: {', '.join(str(d) for d in sorted(failed))}")
+        return sorted(processed_paths)
         
     except Exception as e:
         logger.error(f"✗ Failed to process: {e}")
@@ -607,6 +369,7 @@ def append_to_historical_netcdf(
     hist_dir = Path(settings.DATA_DIR) / f"{dir_name}_hist"
     hist_dir.mkdir(parents=True, exist_ok=True)
     hist_file = hist_dir / "historical.nc"
+    manifest = manifest_for(dir_name, settings.DATA_DIR)
     
     try:
         ds = xr.open_dataset(source_netcdf)
@@ -626,42 +389,14 @@ def append_to_historical_netcdf(
         
         # Filter dates
         if dates_to_append:
-            da = da.sel(time=da.time.isin([pd.Timestamp(d) for d in dates_to_append]))
-        
-        # Append or create
-        if hist_file.exists():
-            existing = xr.open_dataset(hist_file, chunks='auto')
-            existing_dates = set(pd.to_datetime(existing['ndvi'].time.values).date)
-            new_dates = set(pd.to_datetime(da.time.values).date)
-            dates_to_add = new_dates - existing_dates
-            
-            if dates_to_add:
-                da_filtered = da.sel(time=da.time.isin([pd.Timestamp(d) for d in dates_to_add]))
-                combined = xr.concat([existing['ndvi'], da_filtered], dim='time').sortby('time')
-            else:
-                logger.info("All dates exist")
-                existing.close()
-                ds.close()
-                return hist_file
-            
-            existing.close()
-        else:
-            combined = da
+            da = da.sel(time=da.time.isin(pd.to_datetime(sorted(dates_to_append))))
         
+        # Only the new days are written: appended in place, or to a backfill partition
+        da = da.load()
         ds.close()
-        
-        hist_ds = combined.to_dataset(name='ndvi')
-        encoding = {
-            'ndvi': {
-                'chunksizes': (1, 20, 20),
-                'zlib': True,
-                'complevel': 5,
-                'dtype': 'float32'
-            }
-        }
-        
-        hist_ds.to_netcdf(hist_file, mode='w', encoding=encoding, engine='netcdf4')
-        logger.info(f"✓ Historical updated: {hist_file}")
+        appended, backfilled = cube_store.append_history(hist_file, 'ndvi', da)
+        manifest.mark_in_cube(pd.to_datetime(da.time.values).date)
+        logger.info(f"✓ Historical updated: {hist_file} (+{len(appended)} appended, {len(backfilled)} backfilled)")
         
         return hist_file
         
@@ -692,11 +427,13 @@ def ndvi_data_flow(
     batch_days: int = 16,
     sources: Optional[List[str]] = None,
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
+    end_date: Optional[date] = None,
+    dry_run: bool = False
 ):
     """
     NDVI data processing flow.
     100% FREE - NO AUTHENTICATION REQUIRED!
+    With dry_run, only logs the planned download batches.
     """
     logger = get_run_logger()
     settings = get_settings()
@@ -738,85 +475,77 @@ def ndvi_data_flow(
             logger.info(f"✓ All data exists for {source}")
             continue
         
-        # Group into batches
-        date_batches = []
-        if missing_download:
-            current_start = missing_download[0]
-            current_end = missing_download[0]
+        # MODIS batches follow the 16-day composite periods; Sentinel-2 is daily
+        if source == 'modis':
+            plan = plan_modis(
+                missing_download, max(1, batch_days // MODIS_PERIOD_DAYS),
+                grid_bytes(settings.latam_bbox_cds, 0.0025, max_pixels=20000)
+            )
+        else:
+            plan = plan_contiguous(missing_download, batch_days)
+        logger.info(plan.report())
+        if dry_run:
+            continue
+        
+        # Process batches
+        for batch in plan.batches:
+            geotiff_dates = [d for d in batch.dates if d in missing_geotiff]
+            hist_dates = [d for d in batch.dates if d in missing_historical]
             
-            for i in range(1, len(missing_download)):
-                if missing_download[i] == current_end + timedelta(days=1):
-                    current_end = missing_download[i]
+            try:
+                logger.info(f"\nBatch: {batch.start} to {batch.end}")
+            
+                # Download
+                if source == 'sentinel2':
+                    batch_path = download_sentinel2_batch(
+                        batch.start, batch.end,
+                        settings.latam_bbox_cds, 15.0
+                    )
+                elif source == 'modis':
+                    batch_path = download_modis_batch(
+                        batch.start, batch.end,
+                        settings.latam_bbox_cds
+                    )
                 else:
-                    date_batches.append((current_start, current_end))
-                    current_start = missing_download[i]
-                    current_end = missing_download[i]
+                    logger.error(f"Unknown source: {source}")
+                    continue
+            
+                # Process GeoTIFFs
+                if geotiff_dates:
+                    processed = process_ndvi_to_geotiff(
+                        batch_path, source,
+                        settings.latam_bbox_raster,
+                        geotiff_dates
+                    )
+                    all_processed.extend(processed)
+            
+                # Append to historical
+                if hist_dates:
+                    append_to_historical_netcdf(
+                        batch_path, source,
+                        settings.latam_bbox_raster,
+                        hist_dates
+                    )
+            
+                cleanup_raw_files(batch_path)
+                logger.info(f"✓ Completed batch")
             
-            date_batches.append((current_start, current_end))
+            except Exception as e:
+                logger.error(f"✗ Failed batch: {e}")
         
-        # Process batches
-        for batch_start, batch_end in date_batches:
-            current_start = batch_start
-            while current_start <= batch_end:
-                current_end = min(current_start + timedelta(days=batch_days - 1), batch_end)
-                
-                chunk_dates = []
-                d = current_start
-                while d <= current_end:
-                    chunk_dates.append(d)
-                    d += timedelta(days=1)
-                
-                geotiff_dates = [d for d in chunk_dates if d in missing_geotiff]
-                hist_dates = [d for d in chunk_dates if d in missing_historical]
-                
-                try:
-                    logger.info(f"\nBatch: {current_start} to {current_end}")
-                    
-                    # Download
-                    if source == 'sentinel2':
-                        batch_path = download_sentinel2_batch(
-                            current_start, current_end,
-                            settings.latam_bbox_cds, 15.0
-                        )
-                    elif source == 'modis':
-                        batch_path = download_modis_batch(
-                            current_start, current_end,
-                            settings.latam_bbox_cds
-                        )
-                    else:
-                        logger.error(f"Unknown source: {source}")
-                        continue
-                    
-                    # Process GeoTIFFs
-                    if geotiff_dates:
-                        processed = process_ndvi_to_geotiff(
-                            batch_path, source,
-                            settings.latam_bbox_raster,
-                            geotiff_dates
-                        )
-                        all_processed.extend(processed)
-                    
-                    # Append to historical
-                    if hist_dates:
-                        append_to_historical_netcdf(
-                            batch_path, source,
-                            settings.latam_bbox_raster,
-                            hist_dates
-                        )
-                    
-                    cleanup_raw_files(batch_path)
-                    logger.info(f"✓ Completed batch")
-                    
-                except Exception as e:
-                    logger.error(f"✗ Failed batch: {e}")
-                
-                current_start = current_end + timedelta(days=1)
+        compact_historical_store(get_output_directory(source, settings).name, 'ndvi')
     
     # Refresh mosaics
     if all_processed:
         try:
-            from .tasks import refresh_mosaic_shapefile
-            refresh_mosaic_shapefile(DataSource.NDVI)
+            from .tasks import harvest_mosaic_granules
+            from collections import defaultdict
+
+            files_by_dir = defaultdict(list)
+            for path in all_processed:
+                files_by_dir[path.parent].append(path)
+            for dir_path, files in files_by_dir.items():
+                harvest_mosaic_granules(dir_path, files)
         except Exception as e:
             logger.error(f"Failed to refresh mosaic: {e}")
     
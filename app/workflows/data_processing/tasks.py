@@ -1,101 +1,48 @@
 import shapefile
 from datetime import datetime, date
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, List, Optional, Set, Tuple
 import requests
-import fsspec
 import rioxarray
 import xarray as xr
 from prefect import task, get_run_logger
 from .schemas import DataSource
 from app.config.settings import get_settings
+from app.services import cog, merge_decoder, mosaic_index, raster_stats
+from app.services.geoserver_rest import GeoServerRestClient, run_sync
+from app.services.downloader import shared_session, stream_download
+from app.services.manifest import manifest_for
+import asyncio
 import os
-import tempfile
-import time
-import cdsapi
-import cdsapi
+import re
+import fcntl
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
 
-c = cdsapi.Client()
 settings = get_settings()
 
 def is_success(status_code: int) -> bool:
     return status_code in (200, 201, 202)
 
-@task(retries=2, retry_delay_seconds=60)
-def setup_mosaic(mosaic_dir: Path, source: DataSource):
-    """Set up a GeoServer ImageMosaic store for the given source."""
-    logger = get_run_logger()
-    mosaic_dir.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Mosaic folder ready at {mosaic_dir}")
-
-    # Create indexer.properties if missing
-    indexer_file = mosaic_dir / "indexer.properties"
-    if not indexer_file.exists():
-        indexer_content = f"""\
-TimeAttribute=ingestion
-TimeRegex={source.value}_(\\d{{8}})
-TimeFormat=yyyyMMdd
-"""
-        indexer_file.write_text(indexer_content)
-        logger.info(f"indexer.properties created at {indexer_file}")
-    else:
-        logger.info(f"indexer.properties already exists at {indexer_file}")
-
-    # Create ImageMosaic store in GeoServer
-    geoserver_store_url = (
-        f"http://{settings.GEOSERVER_HOST}:{settings.GEOSERVER_PORT}/geoserver/rest/workspaces/"
-        f"{settings.GEOSERVER_WORKSPACE}/coveragestores/{source.value}_final/external.imagemosaic"
-    )
-    data = f"{mosaic_dir.resolve()}"
-    headers = {"Content-Type": "text/plain"}
-    response = requests.post(
-        geoserver_store_url,
-        data=data,
-        headers=headers,
-        auth=(settings.GEOSERVER_ADMIN_USER, settings.GEOSERVER_ADMIN_PASSWORD)
-    )
-    if is_success(response.status_code):
-        logger.info(f"GeoServer ImageMosaic store created for {source.value}")
-    elif response.status_code == 400 and "already exists" in response.text:
-        logger.info(f"Mosaic store already exists for {source.value}")
-    else:
-        raise ValueError(f"Failed to create mosaic store: {response.status_code} - {response.text}")
-
-    # Ensure time dimension is enabled
-    coverages_url = (
-        f"http://{settings.GEOSERVER_HOST}:{settings.GEOSERVER_PORT}/geoserver/rest/workspaces/"
-        f"{settings.GEOSERVER_WORKSPACE}/coveragestores/{source.value}_final/coverages.json"
-    )
-    response = requests.get(
-        coverages_url,
-        auth=(settings.GEOSERVER_ADMIN_USER, settings.GEOSERVER_ADMIN_PASSWORD)
-    )
-    response.raise_for_status()
-    coverages = response.json().get("coverages", {}).get("coverage", [])
-    for cov in coverages:
-        cov_name = cov["name"]
-        cov_url = (
-            f"http://{settings.GEOSERVER_HOST}:{settings.GEOSERVER_PORT}/geoserver/rest/workspaces/"
-            f"{settings.GEOSERVER_WORKSPACE}/coveragestores/{source.value}_final/coverages/{cov_name}.json"
-        )
-        payload = {
-            "coverage": {
-                "metadata": {
-                    "entry": [
-                        {"@key": "time", "dimensionInfo": {"enabled": True, "presentation": "LIST"}}
-                    ]
-                }
-            }
-        }
-        resp = requests.put(
-            cov_url,
-            json=payload,
-            auth=(settings.GEOSERVER_ADMIN_USER, settings.GEOSERVER_ADMIN_PASSWORD)
-        )
-        if is_success(resp.status_code):
-            logger.info(f"Time dimension enabled for coverage '{cov_name}'")
-        else:
-            logger.warning(f"Failed to enable time dimension for '{cov_name}': {resp.status_code} - {resp.text}")
+
+# One semaphore per remote host, shared by every task thread in this process
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(settings.DOWNLOADS_PER_HOST)
+        return _host_slots[host]
+
+
+def http_session() -> requests.Session:
+    """Keep-alive session whose connection pool is shared by all task threads."""
+    return shared_session(pool_maxsize=settings.MAX_IN_FLIGHT)
 
 @task(retries=3, retry_delay_seconds=60)
 def check_data_availability(date: date, source: DataSource) -> bool:
@@ -107,17 +54,12 @@ def check_data_availability(date: date, source: DataSource) -> bool:
         logger.info(f"Data already available locally for {date} at {local_path}")
         return True
 
-    # Fallback: check remote server
-    if source == DataSource.CHIRPS:
-        url = f"https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/final/IMERGlate-v07/{date.year}/chirps-v3.0.{date.strftime('%Y.%m.%d')}.tif"
-    elif source == DataSource.MERGE:
-        url = f"https://ftp.cptec.inpe.br/modelos/tempo/MERGE/GPM/DAILY/{date.year}/{date.strftime('%m')}/MERGE_CPTEC_{date.strftime('%Y%m%d')}.grib2"
-
-    else:
-        raise ValueError(f"Unsupported data source: {source}")
+    # Fallback: check remote server (backfills use list_remote_dates instead)
+    url = remote_url(date, source)
 
     try:
-        response = requests.head(url, timeout=10)
+        with host_slot(url):
+            response = http_session().head(url, timeout=10)
         if is_success(response.status_code):
             logger.info(f"Data available on server for {date} at {url}")
             return True
@@ -127,125 +69,188 @@ def check_data_availability(date: date, source: DataSource) -> bool:
         logger.error(f"Availability check failed: {str(e)}")
         raise
 
-@task(retries=3, retry_delay_seconds=300)
-def download_data(date: date, source: DataSource) -> Path:
-    """Download the raw data file to a temporary location"""
-    logger = get_run_logger()
+def remote_url(date: date, source: DataSource) -> str:
     if source == DataSource.CHIRPS:
-        url = f"https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/final/IMERGlate-v07/{date.year}/chirps-v3.0.{date.strftime('%Y.%m.%d')}.tif"
-        suffix = ".tif"
+        return f"https://data.chc.ucsb.edu/products/CHIRPS/v3.0/daily/final/IMERGlate-v07/{date.year}/chirps-v3.0.{date.strftime('%Y.%m.%d')}.tif"
     elif source == DataSource.MERGE:
-        url = f"https://ftp.cptec.inpe.br/modelos/tempo/MERGE/GPM/DAILY/{date.year}/{date.strftime('%m')}/MERGE_CPTEC_{date.strftime('%Y%m%d')}.grib2"
-        suffix = ".grib2"
+        return f"https://ftp.cptec.inpe.br/modelos/tempo/MERGE/GPM/DAILY/{date.year}/{date.strftime('%m')}/MERGE_CPTEC_{date.strftime('%Y%m%d')}.grib2"
+    raise ValueError(f"Unsupported data source: {source}")
 
-    else:
-        raise ValueError(f"Unsupported data source: {source}")
+
+# Directory index per remote folder: CHIRPS is organised by year, MERGE by month
+LISTING_PATTERNS = {
+    DataSource.CHIRPS: re.compile(r"chirps-v3\.0\.(\d{4})\.(\d{2})\.(\d{2})\.tif\b"),
+    DataSource.MERGE: re.compile(r"MERGE_CPTEC_(\d{4})(\d{2})(\d{2})\.grib2\b"),
+}
+
+
+def listing_url(date: date, source: DataSource) -> str:
+    return remote_url(date, source).rsplit("/", 1)[0] + "/"
+
+
+@task(retries=3, retry_delay_seconds=60)
+def list_remote_dates(source: DataSource, url: str) -> Set[date]:
+    """Dates published in one remote directory (see listing_url), from a single index fetch."""
+    logger = get_run_logger()
+    with host_slot(url):
+        response = http_session().get(url, timeout=30)
+    if response.status_code == 404:
+        logger.info(f"No remote directory {url}")
+        return set()
+    response.raise_for_status()
+
+    found = {date(int(y), int(m), int(d)) for y, m, d in LISTING_PATTERNS[source].findall(response.text)}
+    logger.info(f"{source.value} {url}: {len(found)} files on server")
+    return found
+
+
+@task(retries=3, retry_delay_seconds=300)
+def download_data(date: date, source: DataSource) -> Path:
+    """
+    Stream the raw file into the download spool. A partial file from a failed
+    attempt is resumed on retry, and the file only appears under its final
+    name once its size has been verified. The providers publish no checksums,
+    so the digest recorded in the manifest is only compared to log
+    republished files (e.g. MERGE reprocessing), never to reject them.
+    """
+    logger = get_run_logger()
+    url = remote_url(date, source)
+    dest = Path(settings.DATA_DIR) / ".downloads" / source.value / url.rsplit("/", 1)[-1]
+    manifest = manifest_for(source.value, settings.DATA_DIR)
+    entry = manifest.get(date) or {}
 
     try:
-        # Use temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            temp_path = Path(temp_file.name)
-            logger.info(f"Downloading from {url} to temporary file {temp_path}")
-            with fsspec.open(url) as remote_file:
-                temp_file.write(remote_file.read())
-        return temp_path
+        # At most DOWNLOADS_PER_HOST transfers per server, over one shared pool
+        with host_slot(url):
+            logger.info(f"Downloading from {url} to {dest}")
+            result = stream_download(url, dest, session=http_session())
+        if result.resumed_from:
+            logger.info(f"Resumed {dest.name} from byte {result.resumed_from}")
+        previous = entry.get("raw_checksum")
+        if previous and previous != result.sha256:
+            logger.warning(f"{source.value} {date}: upstream file changed since the last download (sha256 {previous[:12]} -> {result.sha256[:12]})")
+        manifest.record_raw(date, url, result.sha256)
+        return result.path
     except Exception as e:
         logger.error(f"Download failed: {str(e)}")
         raise
 
-@task
-def process_data(
+def _process_raster(
     input_path: Path,
     date: date,
     source: DataSource,
-    bbox: Tuple[float, float, float, float]
-) -> Path:
-    """Crop data to the specified bounding box, save as TIFF, and delete raw file"""
-    logger = get_run_logger()
-    output_path = Path(settings.DATA_DIR) / f"{source.value}" / f"{source.value}_{date.strftime('%Y%m%d')}.tif"
+    bbox: Tuple[float, float, float, float],
+    output_path: Path,
+) -> Tuple[Path, Dict]:
+    """
+    Crop the raw file to the bbox, validate it in memory and write it as a COG.
+    Pure CPU/IO work with no Prefect context, so it can run in the process
+    pool. Returns the COG path and the day's value statistics. The raw file is
+    always deleted.
+    """
+    log = logging.getLogger(__name__)
+    valid_min = raster_stats.VALID_MIN.get(source.value)
     try:
         # Load and clip data
         if source == DataSource.CHIRPS:
             ds = rioxarray.open_rasterio(input_path)
+        elif source == DataSource.MERGE and merge_decoder.ECCODES_AVAILABLE:
+            # Direct eccodes read; crop/longitude wrap/flip are one cached index
+            field = merge_decoder.decode_file(input_path, bbox)
+            log.info(f"Decoded {source.value} on {date}: {field.short_name} {field.values.shape}")
+            stats = raster_stats.array_stats(field.values, valid_min=valid_min)
+            raster_stats.check_stats(stats, f"{source.value} {date}")
+            return merge_decoder.write_cog(field, output_path), stats
         elif source == DataSource.MERGE:
-                    ds = xr.open_dataset(input_path, engine="cfgrib")
-                    
-                    # --- Standard Longitude Correction ---
-                    # This corrects the 0-360 longitude range to -180-180
-                    ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby('longitude')
-                    # ds = ds.sortby("latitude") # This line can be uncommented if you want to explicitly sort lat
-
-                    # --- Variable Selection Logic ---
-                    possible_vars = ["prec", "rdp", "pr"]
-                    selected_var = None
-                    for var in possible_vars: 
-                        if var in ds.data_vars:
-                            selected_var = var
-                            break
-                    if selected_var is None:
-                        raise ValueError(f"No precipitation variable found in {ds.data_vars.keys()}")
-                    
-                    logger.info(f"Selected variable for {source.value} on {date}: {selected_var}")
-
-                    # --- Select the variable and assign CRS ---
-                    # Now 'ds' is the DataArray containing your precipitation data
-                    ds = ds[selected_var].rio.write_crs("EPSG:4326")
-                    
-                    # -----------------------------------------------------------------
-                    # 🚨 FIX FOR INVERTED IMAGE (VERTICAL FLIP) 
-                    # -----------------------------------------------------------------
-                    # The DataArray variable is now 'ds' (overwriting the Dataset variable)
-                    if ds.latitude.values[0] < ds.latitude.values[-1]:
-                        # If latitudes are increasing (South -> North), reverse the order 
-                        # This flips the array data to ensure North-Up orientation for the raster
-                        ds = ds.sel(latitude=slice(None, None, -1)) 
-                        logger.info("Flipped latitude axis to ensure North-Up raster orientation.")
-                    # -----------------------------------------------------------------
-                    
-                    # Your next step would be to save 'ds' to a file:
-                    # ds.rio.to_raster(output_path)
+            ds = xr.open_dataset(input_path, engine="cfgrib")
 
+            # --- Standard Longitude Correction ---
+            # This corrects the 0-360 longitude range to -180-180
+            ds = ds.assign_coords(longitude=(((ds.longitude + 180) % 360) - 180)).sortby('longitude')
+
+            # --- Variable Selection Logic ---
+            possible_vars = ["prec", "rdp", "pr"]
+            selected_var = None
+            for var in possible_vars:
+                if var in ds.data_vars:
+                    selected_var = var
+                    break
+            if selected_var is None:
+                raise ValueError(f"No precipitation variable found in {ds.data_vars.keys()}")
+
+            log.info(f"Selected variable for {source.value} on {date}: {selected_var}")
+            ds = ds[selected_var].rio.write_crs("EPSG:4326")
+
+            # If latitudes are increasing (South -> North), flip to North-Up
+            if ds.latitude.values[0] < ds.latitude.values[-1]:
+                ds = ds.sel(latitude=slice(None, None, -1))
         else:
             raise ValueError(f"Unsupported data source: {source}")
 
         ds = ds.rio.clip_box(*bbox)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        #ds.rio.to_raster(output_path, driver="GTiff")
-
-        #Convert to a Cloud-Optimized GeoTIFF (COG)
-        #A COG is the preferred GeoTIFF format for web visualization as it is more efficient for GeoServer
-        #Python
-
-        # 4Write the COG file
-        ds.rio.to_raster(
-            output_path,
-            driver="COG",
-            tiled=True,
-            compress="LZW",
-            overview_level=5 # or another level
-        )
-
-        logger.info(f"Processed TIFF saved to {output_path}")
+        # Validated before writing, from the grid already in memory
+        stats = raster_stats.array_stats(ds.values, nodata=ds.rio.nodata, valid_min=valid_min)
+        raster_stats.check_stats(stats, f"{source.value} {date}")
 
+        # Cloud-Optimized GeoTIFF is the preferred format for GeoServer
+        return cog.write_cog(ds, output_path, source=source.value), stats
+    finally:
         # Delete temporary raw file
         if input_path.exists():
             input_path.unlink()
-            logger.info(f"Deleted temporary raw file: {input_path}")
 
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """CPU pool for decoding/cropping, shared by all process_data task runs."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=settings.PROCESS_WORKERS)
+        return _process_pool
+
+
+@task
+def process_data(
+    input_path: Path,
+    date: date,
+    source: DataSource,
+    bbox: Tuple[float, float, float, float]
+) -> Path:
+    """Crop data to the specified bounding box, save as TIFF, and delete raw file"""
+    logger = get_run_logger()
+    output_path = Path(settings.DATA_DIR) / f"{source.value}" / f"{source.value}_{date.strftime('%Y%m%d')}.tif"
+    try:
+        # The task thread only waits; decoding runs in the process pool
+        output_path, stats = get_process_pool().submit(
+            _process_raster, input_path, date, source, bbox, output_path
+        ).result()
+        manifest_for(source.value, settings.DATA_DIR).record_cog(date, output_path, stats=stats)
+        logger.info(f"Processed TIFF saved to {output_path} (valid {stats['valid_fraction']:.1%})")
         return output_path
     except Exception as e:
         logger.error(f"Processing failed: {str(e)}")
-        # Ensure temp file is deleted on failure
-        if input_path.exists():
-            input_path.unlink()
-            logger.info(f"Deleted temporary raw file on failure: {input_path}")
         raise
 
 @task
-def validate_output(output_path: Path) -> bool:
-    """Verify the processed TIFF file meets requirements"""
+def validate_output(output_path: Path, date: Optional[date] = None, source: Optional[DataSource] = None) -> bool:
+    """
+    Verify the processed TIFF file meets requirements. When the day's stats
+    were recorded during processing they are used as-is; the file is only
+    re-read for COGs without a manifest entry.
+    """
     logger = get_run_logger()
     try:
+        if date is not None and source is not None:
+            entry = manifest_for(source.value, settings.DATA_DIR).get(date)
+            if entry and entry["valid_fraction"] is not None:
+                raster_stats.check_stats(entry, str(output_path))
+                logger.info(f"Validated TIFF at {output_path} from recorded stats")
+                return True
+
         ds = rioxarray.open_rasterio(output_path)
         if ds.rio.crs is None:
             raise ValueError("Missing CRS in TIFF")
@@ -261,34 +266,183 @@ def validate_output(output_path: Path) -> bool:
 
 @task(retries=2, retry_delay_seconds=60)
 def refresh_mosaic_shapefile(source: DataSource):
+    """
+    Full rebuild: drop the shapefile index (a GeoPackage index is topped up
+    from disk instead) and reload the whole GeoServer catalog.
+    Prefer harvest_mosaic_granules for routine ingestion; this is the fallback.
+    """
     logger = get_run_logger()
-    #remove indexers .shp
     mosaic_dir = Path(settings.DATA_DIR)/source.value
-    for f in mosaic_dir.glob(f"{source.value}.*"):
+    _rebuild_mosaic_index(mosaic_dir, logger)
+
+
+# Sidecars of a shapefile mosaic index, regenerated by GeoServer on reload.
+# A GeoPackage index ({name}.gpkg, which datastore.properties points at) is
+# kept and topped up from disk instead.
+SHAPEFILE_INDEX_SUFFIXES = (".shp", ".shx", ".dbf", ".prj", ".cpg", ".qix", ".fix")
+RELOAD_SETTLE_SECONDS = 3
+
+
+def _rebuild_mosaic_index(mosaic_dir: Path, logger):
+    #remove indexers .shp
+    for suffix in SHAPEFILE_INDEX_SUFFIXES:
+        f = mosaic_dir / f"{mosaic_dir.name}{suffix}"
+        if not f.exists():
+            continue
         try:
             f.unlink()
         except Exception as e:
             logger.error(f"❌ Failed to delete {f}: {e}")
 
-    # Reload GeoServer
+    if mosaic_index.index_path(mosaic_dir).exists():
+        mosaic_index.build_index(mosaic_dir)
+
+    # Reload GeoServer, then request the capabilities so the mosaic index is re-read
     logger.info("Reloading GeoServer...")
-    reload_url = f"{settings.geoserver_local_url}/rest/reload"
-    resp = requests.post(reload_url, auth=(settings.GEOSERVER_ADMIN_USER, settings.GEOSERVER_ADMIN_PASSWORD))
-    if resp.status_code == 200:
-        logger.info("GeoServer reload triggered.")
-    else:
-        logger.error(f"❌ Failed to reload GeoServer: {resp.status_code} {resp.text}")
 
-    time.sleep(3)  # Give GeoServer a moment
+    async def reload(client: GeoServerRestClient):
+        try:
+            await client.reload()
+            logger.info("GeoServer reload triggered.")
+        except Exception as e:
+            logger.error(f"❌ Failed to reload GeoServer: {e}")
+        await asyncio.sleep(RELOAD_SETTLE_SECONDS)  # Give GeoServer a moment
+        logger.info("Triggering WMS GetCapabilities...")
+        return await client.http.get(
+            f"{settings.geoserver_local_url}/wms",
+            params={
+                "service": "WMS", "version": "1.3.0", "request": "GetCapabilities",
+                "layers": f"{settings.GEOSERVER_WORKSPACE}:{mosaic_dir.name}",
+            },
+        )
 
-    # Trigger WMS GetCapabilities for the mosaic
-    logger.info("Triggering WMS GetCapabilities...")
-    cap_url = f"{settings.geoserver_local_url}/wms?service=WMS&version=1.3.0&request=GetCapabilities&layers={settings.GEOSERVER_WORKSPACE}:{source.value}"
-    resp = requests.get(cap_url)
+    resp = run_sync(reload)
     if resp.status_code == 200:
         logger.info("GetCapabilities request successful — mosaic index refreshed.")
     else:
         logger.error(f"❌Failed to fetch GetCapabilities: {resp.status_code} {resp.text}")
-        raise
+        raise RuntimeError(f"GetCapabilities failed for {mosaic_dir.name}: {resp.status_code}")
+
+
+# ---------------------------------------------------------------------------
+# Incremental granule harvesting
+# ---------------------------------------------------------------------------
+# Each mosaic has a spool file of pending granule paths under DATA_DIR/.harvest.
+# Callers append to it and then try to become the (single) drainer; if another
+# process is already draining, the new paths are picked up by its next pass, so
+# concurrent refresh requests collapse into one stream of REST calls.
+
+HARVEST_DIR = Path(settings.DATA_DIR) / ".harvest"
+
+
+def _locked(path: Path, blocking: bool = True):
+    """Open ``path`` with an exclusive flock; returns the file or None if busy."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fh = open(path, "a+")
+    flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+    try:
+        fcntl.flock(fh, flags)
+    except BlockingIOError:
+        fh.close()
+        return None
+    return fh
+
+
+def queue_granules(store: str, paths: List[Path]):
+    """Append granule paths to the mosaic's pending queue."""
+    fh = _locked(HARVEST_DIR / f"{store}.queue")
+    try:
+        fh.write("".join(f"{Path(p).resolve()}\n" for p in paths))
+        fh.flush()
+    finally:
+        fh.close()
+
+
+def _drain_queue(store: str) -> List[Path]:
+    fh = _locked(HARVEST_DIR / f"{store}.queue")
+    try:
+        fh.seek(0)
+        lines = fh.read().splitlines()
+        fh.seek(0)
+        fh.truncate()
+    finally:
+        fh.close()
+    # Keep first-seen order, drop duplicates
+    return [Path(p) for p in dict.fromkeys(line for line in lines if line.strip())]
+
+
+def _harvest_pending(store: str, coverage: str, pending: List[Path], logger) -> int:
+    """
+    Apply drained paths over one REST client: any previous entry for a path is
+    removed, then it is harvested if the file still exists. On failure the
+    unprocessed paths are put back so a retry picks them up.
+    """
+    workspace = settings.GEOSERVER_WORKSPACE
+
+    async def apply(client: GeoServerRestClient) -> int:
+        for i, granule in enumerate(pending):
+            try:
+                await client.remove_granules(workspace, store, coverage, granule.name)
+                if granule.exists():
+                    await client.harvest_granule(workspace, store, granule)
+                    logger.info(f"✓ Harvested {granule.name} into {store}")
+                else:
+                    logger.info(f"✓ Removed stale granule {granule.name} from {store}")
+            except Exception as e:
+                queue_granules(store, pending[i:])
+                logger.error(f"✗ Incremental harvest failed for {store}: {e}")
+                raise
+        return len(pending)
+
+    return run_sync(apply) if pending else 0
+
+
+@task(retries=2, retry_delay_seconds=60)
+def harvest_mosaic_granules(mosaic_dir: Path, paths: List[Path], store: Optional[str] = None) -> int:
+    """
+    Update an existing ImageMosaic granule by granule instead of rebuilding it.
+
+    Paths that exist are harvested (any previous entry for the same file is
+    removed first, so replaced COGs are not indexed twice); paths that no longer
+    exist are removed from the index. The store and coverage default to the
+    mosaic directory name, which is also the index/layer name. Mosaics with a
+    GeoPackage index (app.services.mosaic_index) are updated directly instead.
+
+    Returns:
+        Number of granules updated by this call (0 if another run drained the queue)
+    """
+    logger = get_run_logger()
+    mosaic_dir = Path(mosaic_dir)
+    store = store or mosaic_dir.name
+    coverage = mosaic_dir.name
+
+    # GeoPackage-indexed mosaics are updated in place; GeoServer reads the index per request
+    if mosaic_index.index_exists(mosaic_dir):
+        updated = mosaic_index.add_granules(mosaic_dir, paths)
+        logger.info(f"✓ {store}: {updated} granules written to {mosaic_index.index_path(mosaic_dir).name}")
+        return updated
+
+    if paths:
+        queue_granules(store, paths)
+
+    updated = 0
+    while True:
+        drain_lock = _locked(HARVEST_DIR / f"{store}.lock", blocking=False)
+        if drain_lock is None:
+            logger.info(f"Harvest for {store} already running; queued {len(paths)} granules for it")
+            return updated
+
+        try:
+            updated += _harvest_pending(store, coverage, _drain_queue(store), logger)
+        finally:
+            drain_lock.close()
+
+        # Paths queued while we held the lock would otherwise wait for the next run
+        if not (HARVEST_DIR / f"{store}.queue").stat().st_size:
+            break
+
+    logger.info(f"✓ {store}: {updated} granules updated without a catalog reload")
+    return updated
+
 
 #zm pedra estrada de teerra 1km